@@ -185,7 +185,47 @@ def create_app(config_name='default'):
             )
             _abort(403)
 
+    # Compiled per-role permission sets for User.has_permission()
+    from app.permission_cache import init_permission_cache
+    init_permission_cache(app)
+
+    # Cached UserIdentity snapshots returned by the Flask-Login user_loader
+    from app.identity_cache import init_identity_cache
+    init_identity_cache(app)
+
+    # Optional per-tenant dashboard snapshots (see app/dashboard_stats.py)
+    from app.dashboard_stats import init_dashboard_cache
+    init_dashboard_cache(app)
+
+    # Serialized POS catalogs per tenant, warehouse and version (see app/pos/catalog.py)
+    from app.pos.catalog import init_catalog_cache
+    init_catalog_cache(app)
+
+    # Per-tenant barcode/code index for product lookups (see app/product_index.py)
+    from app.product_index import init_product_index
+    init_product_index(app)
+
+    # Shared per-tenant report results, invalidated on commit (see app/report_cache.py)
+    from app.report_cache import init_report_cache, report_cache_cli
+    init_report_cache(app)
+    app.cli.add_command(report_cache_cli)
+
+    # Arabic-aware full-text search documents (see app/search_index.py)
+    from app.search_index import search_index_cli
+    app.cli.add_command(search_index_cli)
+
+    # Daily sales/purchase rollups kept current on commit (see app/rollups.py)
+    from app.rollups import rollups_cli
+    app.cli.add_command(rollups_cli)
+
+    # Background jobs: DB-backed queue run by `flask jobs worker` (see app/jobs.py)
+    from app.jobs import jobs_cli
+    app.cli.add_command(jobs_cli)
+
     # ─── License Enforcement ──────────────────────────────────────────────
+    from app.license_cache import init_license_cache
+    init_license_cache(app)
+
     @app.before_request
     def check_license():
         from flask_login import current_user
@@ -208,18 +248,13 @@ def create_app(config_name='default'):
                 or endpoint.startswith('payment.')):
             return None
 
-        # Check license via tenant_id (direct query — avoids company intermediary)
-        from app.models_license import License
+        # Check license via tenant_id (cached per tenant — see app/license_cache.py)
+        from app.license_cache import get_license_status
         tenant_id = getattr(current_user, 'tenant_id', None)
         if not tenant_id:
             return None  # No tenant context — allow (backward compat)
 
-        lic = License.query.filter_by(tenant_id=tenant_id).first()
-
-        if not lic:
-            return redirect(url_for('billing.upgrade'))
-
-        if not lic.is_active():
+        if not get_license_status(tenant_id).is_active():
             return redirect(url_for('billing.upgrade'))
 
         return None
@@ -235,33 +270,18 @@ def create_app(config_name='default'):
             '_': gettext
         }
 
+    # Company/currency settings: loaded once per request (see app/company_settings.py)
+    from app.company_settings import get_company_settings, init_company_settings_cache
+    init_company_settings_cache(app)
+
     # Add context processor for currency
     @app.context_processor
     def inject_currency():
         """Inject currency information into all templates"""
-        from app.models import Company
         from flask_babel import gettext
 
-        try:
-            # Use tenant-aware query (auto-filtered by current tenant)
-            company = Company.query.first()
-            if company and company.currency:
-                currency_code = company.currency
-            else:
-                # Fall back to the current tenant's currency setting
-                currency_code = 'SAR'
-                if has_request_context():
-                    tenant = getattr(g, 'current_tenant', None)
-                    if tenant and tenant.currency:
-                        currency_code = tenant.currency
-                currency_code = currency_code or app.config.get('DEFAULT_CURRENCY', 'SAR')
-        except Exception:
-            # Fallback if database is not available
-            currency_code = 'SAR'
-
-        # Get currency info from config
-        currency_info = app.config['CURRENCIES'].get(currency_code, {})
-        currency_symbol = currency_info.get('symbol', 'ر.س')
+        settings = get_company_settings()
+        currency_code = settings.currency_code
 
         # Translate currency name based on code
         currency_name_map = {
@@ -280,19 +300,11 @@ def create_app(config_name='default'):
         currency_name = gettext(currency_name_key)
 
         # Determine symbol position based on current language
-        lang = session.get('language', 'ar')
-        if lang == 'en':
-            # English (LTR): symbol on the left  e.g. "€ 1,234.56"
-            currency_prefix = currency_symbol + ' '
-            currency_suffix = ''
-        else:
-            # Arabic (RTL): symbol on the right  e.g. "1,234.56 €"
-            currency_prefix = ''
-            currency_suffix = ' ' + currency_symbol
+        currency_prefix, currency_suffix = settings.symbol_affixes(session.get('language', 'ar'))
 
         return {
             'currency_code': currency_code,
-            'currency_symbol': currency_symbol,
+            'currency_symbol': settings.currency_symbol,
             'currency_name': currency_name,
             'currency_prefix': currency_prefix,
             'currency_suffix': currency_suffix,
@@ -302,31 +314,7 @@ def create_app(config_name='default'):
     @app.template_filter('currency')
     def currency_filter(value):
         """Format number with currency symbol - position depends on current language"""
-        from app.models import Company
-
-        try:
-            company = Company.query.first()
-            if company and company.currency:
-                currency_code = company.currency
-                currency_info = app.config['CURRENCIES'].get(currency_code, {})
-                currency_symbol = currency_info.get('symbol', 'ر.س')
-            else:
-                currency_symbol = 'ر.س'
-        except:
-            currency_symbol = 'ر.س'
-
-        lang = session.get('language', 'ar')
-        try:
-            amount = f"{float(value):,.2f}"
-            if lang == 'en':
-                return f"{currency_symbol} {amount}"
-            else:
-                return f"{amount} {currency_symbol}"
-        except (ValueError, TypeError):
-            if lang == 'en':
-                return f"{currency_symbol} 0.00"
-            else:
-                return f"0.00 {currency_symbol}"
+        return get_company_settings().format_amount(value, session.get('language', 'ar'))
 
     # Stripe Unix timestamp → readable date string
     @app.template_filter('strftime')
@@ -396,6 +384,12 @@ def create_app(config_name='default'):
         status['checks']['stripe_configured'] = (
             'ok' if stripe_key and not stripe_key.startswith('sk_test_your') else 'not configured'
         )
+        # Hit/miss counters of the process-local caches (per worker)
+        status['caches'] = {
+            name: ext.stats()
+            for name, ext in app.extensions.items()
+            if name.endswith('_cache') and hasattr(ext, 'stats')
+        }
         return jsonify(status), http_code
 
     return app
@@ -8,6 +8,7 @@ from app.models_accounting import Account, JournalEntry, JournalEntryItem, Payme
 from app.models import Customer, Supplier
 from app.utils.accounting_helper import create_payment_journal_entry
 from app.utils.bank_helper import create_bank_transaction
+from app.utils.document_numbers import next_number
 from datetime import datetime, date
 
 # ==================== دليل الحسابات ====================
@@ -116,18 +117,7 @@ def add_journal_entry():
     if request.method == 'POST':
         try:
             # Generate entry number
-            today = datetime.utcnow()
-            prefix = f'JE{today.year}{today.month:02d}{today.day:02d}'
-
-            last_entry = JournalEntry.query.filter(
-                JournalEntry.entry_number.like(f'{prefix}%')
-            ).order_by(JournalEntry.id.desc()).first()
-
-            if last_entry:
-                last_num = int(last_entry.entry_number[-4:])
-                entry_number = f'{prefix}{(last_num + 1):04d}'
-            else:
-                entry_number = f'{prefix}0001'
+            entry_number = next_number('manual_journal_entry')
 
             # Create journal entry
             entry = JournalEntry(
@@ -505,16 +495,7 @@ def add_bank_account():
 
                     # Generate entry number
                     today = datetime.utcnow()
-                    prefix = f'JE{today.year}{today.month:02d}'
-                    last_entry = JournalEntry.query.filter(
-                        JournalEntry.entry_number.like(f'{prefix}%')
-                    ).order_by(JournalEntry.id.desc()).first()
-
-                    if last_entry:
-                        last_num = int(last_entry.entry_number[-4:])
-                        entry_number = f'{prefix}{(last_num + 1):04d}'
-                    else:
-                        entry_number = f'{prefix}0001'
+                    entry_number = next_number('journal_entry', when=today)
 
                     # Create journal entry for opening balance
                     entry = JournalEntry(
@@ -234,7 +234,8 @@ def change_password():
         new_password = request.form.get('new_password')
         confirm_password = request.form.get('confirm_password')
         
-        if not current_user.check_password(current_password):
+        user = current_user.get_user()
+        if not user.check_password(current_password):
             flash('كلمة المرور الحالية غير صحيحة', 'danger')
             return redirect(url_for('auth.change_password'))
         
@@ -242,7 +243,7 @@ def change_password():
             flash('كلمة المرور الجديدة غير متطابقة', 'danger')
             return redirect(url_for('auth.change_password'))
         
-        current_user.set_password(new_password)
+        user.set_password(new_password)
         db.session.commit()
         
         log_security_event(current_user.id, 'password_change', 'User changed password', 'info')
@@ -2,6 +2,7 @@ from flask import render_template, redirect, url_for, flash, request, send_file,
 from flask_login import login_required, current_user
 from app.backup import bp
 from app.auth.decorators import permission_required
+from app.jobs import enqueue, job_handler, queued_response, report_progress, wants_background
 from app import db
 import os
 import subprocess
@@ -44,89 +45,117 @@ def index():
     
     return render_template('backup/index.html', backups=backups, settings=settings)
 
+def write_backup(created_by, progress=None):
+    """
+    Write backups/backup_<timestamp>.zip (PostgreSQL pg_dump + uploads +
+    config); returns (filename, path, pg_dump_ok).  ``progress(percent,
+    message)`` is called between the steps.
+    """
+    progress = progress or (lambda percent, message: None)
+    basedir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+    backup_dir = os.path.join(basedir, 'backups')
+
+    if not os.path.exists(backup_dir):
+        os.makedirs(backup_dir)
+
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    backup_filename = f'backup_{timestamp}.zip'
+    backup_path = os.path.join(backup_dir, backup_filename)
+    sql_dump_path = os.path.join(backup_dir, f'db_{timestamp}.sql')
+
+    # --- PostgreSQL dump ---
+    db_url = current_app.config.get('SQLALCHEMY_DATABASE_URI', '')
+    pg_dump_ok = False
+    if 'postgresql' in db_url:
+        progress(10, 'pg_dump')
+        try:
+            import urllib.parse
+            parsed = urllib.parse.urlparse(db_url)
+            pg_env = os.environ.copy()
+            pg_env['PGPASSWORD'] = parsed.password or ''
+
+            # Try full path first (Windows), then fallback to PATH
+            pg_dump_candidates = [
+                r'C:\Program Files\PostgreSQL\16\bin\pg_dump.exe',
+                r'C:\Program Files\PostgreSQL\15\bin\pg_dump.exe',
+                r'C:\Program Files\PostgreSQL\17\bin\pg_dump.exe',
+                'pg_dump',
+            ]
+            pg_dump_exe = None
+            for candidate in pg_dump_candidates:
+                if os.path.exists(candidate) or candidate == 'pg_dump':
+                    pg_dump_exe = candidate
+                    break
+
+            if pg_dump_exe:
+                pg_dump_cmd = [
+                    pg_dump_exe,
+                    '-h', parsed.hostname or 'localhost',
+                    '-p', str(parsed.port or 5432),
+                    '-U', parsed.username or 'postgres',
+                    '-d', parsed.path.lstrip('/'),
+                    '-f', sql_dump_path,
+                    '--no-password'
+                ]
+                result = subprocess.run(pg_dump_cmd, env=pg_env, capture_output=True, timeout=120)
+                if result.returncode == 0:
+                    pg_dump_ok = True
+        except Exception as pg_err:
+            pg_dump_ok = False
+
+    progress(60, 'archive')
+    with zipfile.ZipFile(backup_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        # Add SQL dump
+        if pg_dump_ok and os.path.exists(sql_dump_path):
+            zipf.write(sql_dump_path, 'database_dump.sql')
+            os.remove(sql_dump_path)
+
+        # Backup uploads folder
+        uploads_dir = os.path.join(basedir, 'uploads')
+        if os.path.exists(uploads_dir):
+            for root, dirs, files in os.walk(uploads_dir):
+                for file in files:
+                    file_path = os.path.join(root, file)
+                    arcname = os.path.relpath(file_path, basedir)
+                    zipf.write(file_path, arcname)
+
+        # Backup config file
+        config_path = os.path.join(basedir, 'config.py')
+        if os.path.exists(config_path):
+            zipf.write(config_path, 'config.py')
+
+        backup_info = {
+            'created_at': datetime.now().isoformat(),
+            'created_by': created_by,
+            'database': 'PostgreSQL' if pg_dump_ok else 'skipped',
+            'version': '2.0'
+        }
+        zipf.writestr('backup_info.json', json.dumps(backup_info, indent=2, ensure_ascii=False))
+
+    return backup_filename, backup_path, pg_dump_ok
+
+
+@job_handler('backup')
+def run_backup_job(job, params):
+    """Background variant of create_backup; the archive is the job result"""
+    backup_filename, backup_path, pg_dump_ok = write_backup(
+        params.get('created_by'), progress=lambda percent, message: report_progress(job.id, percent, message))
+    if not pg_dump_ok:
+        report_progress(job.id, 100, 'files only, pg_dump not available')
+    return backup_path, backup_filename, 'application/zip'
+
+
 @bp.route('/create', methods=['POST'])
 @login_required
 @permission_required('settings.manage')
 def create_backup():
     """Create a new backup (PostgreSQL pg_dump + uploads)"""
-    try:
-        basedir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-        backup_dir = os.path.join(basedir, 'backups')
-
-        if not os.path.exists(backup_dir):
-            os.makedirs(backup_dir)
-
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_filename = f'backup_{timestamp}.zip'
-        backup_path = os.path.join(backup_dir, backup_filename)
-        sql_dump_path = os.path.join(backup_dir, f'db_{timestamp}.sql')
+    if wants_background():
+        job = enqueue('backup', {'created_by': current_user.username}, title='backup')
+        return queued_response(job)
 
-        # --- PostgreSQL dump ---
-        db_url = current_app.config.get('SQLALCHEMY_DATABASE_URI', '')
-        pg_dump_ok = False
-        if 'postgresql' in db_url:
-            try:
-                import urllib.parse
-                parsed = urllib.parse.urlparse(db_url)
-                pg_env = os.environ.copy()
-                pg_env['PGPASSWORD'] = parsed.password or ''
-
-                # Try full path first (Windows), then fallback to PATH
-                pg_dump_candidates = [
-                    r'C:\Program Files\PostgreSQL\16\bin\pg_dump.exe',
-                    r'C:\Program Files\PostgreSQL\15\bin\pg_dump.exe',
-                    r'C:\Program Files\PostgreSQL\17\bin\pg_dump.exe',
-                    'pg_dump',
-                ]
-                pg_dump_exe = None
-                for candidate in pg_dump_candidates:
-                    if os.path.exists(candidate) or candidate == 'pg_dump':
-                        pg_dump_exe = candidate
-                        break
-
-                if pg_dump_exe:
-                    pg_dump_cmd = [
-                        pg_dump_exe,
-                        '-h', parsed.hostname or 'localhost',
-                        '-p', str(parsed.port or 5432),
-                        '-U', parsed.username or 'postgres',
-                        '-d', parsed.path.lstrip('/'),
-                        '-f', sql_dump_path,
-                        '--no-password'
-                    ]
-                    result = subprocess.run(pg_dump_cmd, env=pg_env, capture_output=True, timeout=120)
-                    if result.returncode == 0:
-                        pg_dump_ok = True
-            except Exception as pg_err:
-                pg_dump_ok = False
-
-        with zipfile.ZipFile(backup_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            # Add SQL dump
-            if pg_dump_ok and os.path.exists(sql_dump_path):
-                zipf.write(sql_dump_path, 'database_dump.sql')
-                os.remove(sql_dump_path)
-
-            # Backup uploads folder
-            uploads_dir = os.path.join(basedir, 'uploads')
-            if os.path.exists(uploads_dir):
-                for root, dirs, files in os.walk(uploads_dir):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        arcname = os.path.relpath(file_path, basedir)
-                        zipf.write(file_path, arcname)
-
-            # Backup config file
-            config_path = os.path.join(basedir, 'config.py')
-            if os.path.exists(config_path):
-                zipf.write(config_path, 'config.py')
-
-            backup_info = {
-                'created_at': datetime.now().isoformat(),
-                'created_by': current_user.username,
-                'database': 'PostgreSQL' if pg_dump_ok else 'skipped',
-                'version': '2.0'
-            }
-            zipf.writestr('backup_info.json', json.dumps(backup_info, indent=2, ensure_ascii=False))
+    try:
+        backup_filename, _backup_path, pg_dump_ok = write_backup(current_user.username)
 
         if pg_dump_ok:
             flash(f'تم انشاء النسخة الاحتياطية بنجاح (مع قاعدة البيانات): {backup_filename}', 'success')
@@ -3,7 +3,9 @@ from flask_login import login_required, current_user
 from app.auth.decorators import permission_required
 from app.banking import bp
 from app import db
-from app.models import BankAccount, BankTransaction, Company
+from app.models import BankAccount, BankTransaction
+from app.company_settings import get_company_settings
+from app.utils.document_numbers import next_number
 from datetime import datetime, timedelta
 from sqlalchemy import func, or_
 import json
@@ -52,17 +54,7 @@ def add_bank():
             # Create opening balance transaction if > 0
             if opening_balance > 0:
                 # Generate transaction number
-                today = datetime.utcnow()
-                prefix = f'BT{today.year}{today.month:02d}{today.day:02d}'
-                last_transaction = BankTransaction.query.filter(
-                    BankTransaction.transaction_number.like(f'{prefix}%')
-                ).order_by(BankTransaction.id.desc()).first()
-                
-                if last_transaction:
-                    last_num = int(last_transaction.transaction_number[-4:])
-                    transaction_number = f'{prefix}{(last_num + 1):04d}'
-                else:
-                    transaction_number = f'{prefix}0001'
+                transaction_number = next_number('bank_transaction')
                 
                 opening_transaction = BankTransaction(
                     transaction_number=transaction_number,
@@ -86,8 +78,7 @@ def add_bank():
             flash(f'خطأ في إضافة الحساب البنكي - Error: {str(e)}', 'error')
     
     # Get company for currency
-    company = Company.query.first()
-    currency = company.currency if company else 'SAR'
+    currency = get_company_settings().currency_code
     
     return render_template('banking/add_bank.html', currency=currency)
 
@@ -154,17 +145,7 @@ def add_manual_transaction():
             bank_account = BankAccount.query.get_or_404(bank_account_id)
 
             # Generate transaction number
-            today = datetime.utcnow()
-            prefix = f'BT{today.year}{today.month:02d}{today.day:02d}'
-            last_transaction = BankTransaction.query.filter(
-                BankTransaction.transaction_number.like(f'{prefix}%')
-            ).order_by(BankTransaction.id.desc()).first()
-
-            if last_transaction:
-                last_num = int(last_transaction.transaction_number[-4:])
-                transaction_number = f'{prefix}{(last_num + 1):04d}'
-            else:
-                transaction_number = f'{prefix}0001'
+            transaction_number = next_number('bank_transaction')
 
             # Update bank balance
             if transaction_type == 'deposit':
@@ -231,8 +212,7 @@ def edit_bank(id):
             flash(f'خطأ في تحديث الحساب البنكي - Error: {str(e)}', 'error')
 
     # Get company for currency
-    company = Company.query.first()
-    currency = company.currency if company else 'SAR'
+    currency = get_company_settings().currency_code
 
     return render_template('banking/edit_bank.html', bank=bank, currency=currency)
 
@@ -5,6 +5,7 @@ from datetime import datetime, timedelta
 from app import db
 from app.billing import bp
 from app.models_license import License
+from app.license_cache import invalidate_license
 
 
 @bp.route('/upgrade')
@@ -43,6 +44,7 @@ def activate_plan(plan):
 
     lic.status = 'active'
     db.session.commit()
+    invalidate_license(lic.tenant_id)
 
     flash('تم تفعيل الخطة بنجاح! 🎉', 'success')
     return redirect(url_for('main.index'))
@@ -162,6 +164,7 @@ def change_plan(new_plan):
     old_plan = lic.plan
     lic.plan = new_plan
     db.session.commit()
+    invalidate_license(lic.tenant_id)
 
     current_app.logger.info(
         f'Plan changed — tenant={lic.tenant_id} '
@@ -0,0 +1,167 @@
+"""
+Company Settings
+================
+
+Request-scoped (and optionally tenant-scoped TTL) access to the current
+company and its currency settings.
+
+Templates call the ``currency`` filter once per money cell and every page
+runs the ``inject_currency`` context processor, each of which used to issue
+its own ``Company.query.first()``.  They now share one CompanySettings object
+per request:
+
+    * get_company_settings() - currency code/name/symbol and tax rate.
+      Memoized on ``g`` and, when COMPANY_SETTINGS_CACHE_TTL > 0, in a
+      process-local per-tenant TTL cache.
+    * get_company() - the ORM Company row, memoized on ``g`` only (ORM
+      instances must not outlive their session).
+
+Company insert/update/delete events invalidate both levels.
+"""
+
+from flask import current_app, g, has_app_context, has_request_context
+from sqlalchemy import event
+
+from app.models import Company
+from app.utils.cache_helper import MISSING, TTLCache
+
+
+class CompanySettings:
+    """Session-independent summary of the current company's display settings"""
+
+    __slots__ = ('tenant_id', 'company_id', 'currency_code', 'currency_name',
+                 'currency_symbol', 'tax_rate')
+
+    def __init__(self, tenant_id, company_id, currency_code, currency_name,
+                 currency_symbol, tax_rate):
+        self.tenant_id = tenant_id
+        self.company_id = company_id
+        self.currency_code = currency_code
+        self.currency_name = currency_name
+        self.currency_symbol = currency_symbol
+        self.tax_rate = tax_rate
+
+    def symbol_affixes(self, lang):
+        """
+        Return (prefix, suffix) for amounts in ``lang``.
+
+        English (LTR): symbol on the left   e.g. "€ 1,234.56"
+        Arabic (RTL):  symbol on the right  e.g. "1,234.56 €"
+        """
+        if lang == 'en':
+            return self.currency_symbol + ' ', ''
+        return '', ' ' + self.currency_symbol
+
+    def format_amount(self, value, lang):
+        """Format ``value`` with two decimals and the currency symbol"""
+        try:
+            amount = f"{float(value):,.2f}"
+        except (ValueError, TypeError):
+            amount = '0.00'
+        prefix, suffix = self.symbol_affixes(lang)
+        return f"{prefix}{amount}{suffix}"
+
+    def __repr__(self):
+        return f'<CompanySettings tenant={self.tenant_id} currency={self.currency_code}>'
+
+
+def _current_tenant_id():
+    if has_request_context():
+        return getattr(g, 'current_tenant_id', None)
+    return None
+
+
+def get_company():
+    """Return the current tenant's Company (or None), memoized for the request"""
+    if not has_request_context():
+        return Company.query.first()
+    company = g.get('_company', MISSING)
+    if company is MISSING:
+        company = Company.query.first()
+        g._company = company
+    return company
+
+
+def _build_settings(tenant_id):
+    config = current_app.config
+    try:
+        company = get_company()
+    except Exception:
+        # Fallback if database is not available
+        company = None
+
+    if company and company.currency:
+        currency_code = company.currency
+    else:
+        # Fall back to the current tenant's currency setting
+        tenant = getattr(g, 'current_tenant', None) if has_request_context() else None
+        currency_code = (tenant.currency if tenant and tenant.currency else None) \
+            or config.get('DEFAULT_CURRENCY', 'SAR')
+
+    currency_info = config['CURRENCIES'].get(currency_code, {})
+    return CompanySettings(
+        tenant_id=tenant_id,
+        company_id=company.id if company else None,
+        currency_code=currency_code,
+        currency_name=currency_info.get('name', currency_code),
+        currency_symbol=currency_info.get('symbol', 'ر.س'),
+        tax_rate=company.tax_rate if company and company.tax_rate is not None
+        else config.get('DEFAULT_TAX_RATE', 15.0),
+    )
+
+
+def get_company_settings():
+    """Return the CompanySettings of the current tenant, loading them at most once per request"""
+    if has_request_context():
+        settings = g.get('_company_settings')
+        if settings is not None:
+            return settings
+
+    tenant_id = _current_tenant_id()
+    cache = get_company_settings_cache()
+    if cache is not None and tenant_id is not None:
+        settings = cache.get(tenant_id)
+        if settings is MISSING:
+            settings = _build_settings(tenant_id)
+            cache.set(tenant_id, settings)
+    else:
+        settings = _build_settings(tenant_id)
+
+    if has_request_context():
+        g._company_settings = settings
+    return settings
+
+
+def init_company_settings_cache(app):
+    """Create the per-tenant settings cache (disabled when the TTL is 0)"""
+    ttl = app.config.get('COMPANY_SETTINGS_CACHE_TTL', 0)
+    if ttl and ttl > 0:
+        app.extensions['company_settings_cache'] = TTLCache(
+            max_size=app.config.get('COMPANY_SETTINGS_CACHE_SIZE', 1024), ttl=ttl
+        )
+
+
+def get_company_settings_cache():
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('company_settings_cache')
+
+
+def invalidate_company_settings(tenant_id=None):
+    """Drop cached settings for ``tenant_id`` (all tenants when None) and the request memo"""
+    cache = get_company_settings_cache()
+    if cache is not None:
+        if tenant_id is None:
+            cache.clear()
+        else:
+            cache.delete(tenant_id)
+    if has_app_context():
+        g.pop('_company_settings', None)
+        g.pop('_company', None)
+
+
+@event.listens_for(Company, 'after_insert')
+@event.listens_for(Company, 'after_update')
+@event.listens_for(Company, 'after_delete')
+def _invalidate_on_change(mapper, connection, target):
+    invalidate_company_settings(target.tenant_id)
@@ -0,0 +1,166 @@
+"""
+Dashboard Aggregates
+====================
+
+All numbers of the main dashboard (main.index) computed with a handful of
+GROUP BY queries instead of per-product and per-invoice Python loops:
+
+    * record counts                    one query of scalar subqueries
+    * stock per product                one GROUP BY (low stock + inventory value)
+    * sales / purchases per month and
+      cost of goods sold this month    the daily rollups (app/rollups.py)
+    * top products, expenses           one query each
+
+Queries run through the ORM, so the tenant filter of app/tenant_mixin.py
+applies to every table involved.
+
+The result is a plain, picklable snapshot.  When DASHBOARD_CACHE_TTL > 0 it
+is cached per tenant and day for that many seconds (the dashboard may then
+lag behind new documents by up to that window); 0 computes it on every
+request.
+"""
+
+from datetime import date
+
+from flask import current_app, g, has_app_context, has_request_context
+from sqlalchemy import and_, case, func
+
+from app import db
+from app.models import (Customer, Expense, Product, SalesInvoice, SalesInvoiceItem, Supplier,
+                        Warehouse)
+from app.rollups import PURCHASE_KINDS, SALES_KINDS, monthly_rollups
+from app.summaries import last_months, monthly_totals, stock_per_product
+from app.utils.cache_helper import MISSING, TTLCache
+
+ARABIC_MONTHS = ['يناير', 'فبراير', 'مارس', 'أبريل', 'مايو', 'يونيو',
+                 'يوليو', 'أغسطس', 'سبتمبر', 'أكتوبر', 'نوفمبر', 'ديسمبر']
+
+CHART_MONTHS = 6
+
+
+def _record_counts():
+    def active_count(model):
+        return (db.session.query(func.count(model.id))
+                .filter(model.is_active == True)
+                .scalar_subquery())
+
+    row = db.session.query(
+        active_count(Product), active_count(Customer),
+        active_count(Supplier), active_count(Warehouse),
+    ).one()
+    return {
+        'total_products': row[0],
+        'total_customers': row[1],
+        'total_suppliers': row[2],
+        'total_warehouses': row[3],
+    }
+
+
+def _stock_stats():
+    """Low stock product count and inventory value of tracked products"""
+    per_product = stock_per_product(Product.is_active == True,
+                                    Product.track_inventory == True)
+    low_stock, inventory_value = db.session.query(
+        func.coalesce(func.sum(case(
+            (and_(per_product.c.min_stock != 0,
+                  per_product.c.quantity <= per_product.c.min_stock), 1),
+            else_=0,
+        )), 0),
+        func.coalesce(func.sum(per_product.c.quantity * per_product.c.cost_price), 0),
+    ).one()
+    return int(low_stock), float(inventory_value)
+
+
+def _top_products(first_day, limit=5):
+    rows = (db.session.query(Product.name,
+                             func.sum(SalesInvoiceItem.quantity).label('total_qty'))
+            .join(SalesInvoiceItem).join(SalesInvoice)
+            .filter(SalesInvoice.status != 'cancelled',
+                    SalesInvoice.invoice_date >= first_day)
+            .group_by(Product.id, Product.name)
+            .order_by(func.sum(SalesInvoiceItem.quantity).desc())
+            .limit(limit)
+            .all())
+    return [(name, qty) for name, qty in rows]
+
+
+def compute_dashboard_stats(today=None):
+    """
+    Compute the dashboard snapshot for the current tenant.
+
+    Returns a dict with ``stats`` (scalar figures), ``chart_labels``,
+    ``sales_chart_data``, ``purchases_chart_data`` and ``top_products``.
+    """
+    today = today or date.today()
+    first_day = today.replace(day=1)
+    months = last_months(today, CHART_MONTHS)
+    since = date(months[0][0], months[0][1], 1)
+
+    sales = monthly_rollups(SALES_KINDS, since)
+    purchases = monthly_totals(PURCHASE_KINDS, since)
+
+    # "This month" keeps counting documents dated later in the month (or after it)
+    current = (today.year, today.month)
+    sales_this_month = sum(t.total_amount for k, t in sales.items() if k >= current)
+    cogs_this_month = sum(t.cogs for k, t in sales.items() if k >= current)
+    purchases_this_month = sum(v for k, v in purchases.items() if k >= current)
+
+    low_stock, inventory_value = _stock_stats()
+    expenses_this_month = db.session.query(func.sum(Expense.amount)).filter(
+        Expense.expense_date >= first_day,
+        Expense.status != 'cancelled'
+    ).scalar() or 0
+
+    stats = _record_counts()
+    stats.update({
+        'low_stock_products': low_stock,
+        'sales_this_month': sales_this_month,
+        'purchases_this_month': purchases_this_month,
+        'profit_this_month': sales_this_month - cogs_this_month,
+        'inventory_value': inventory_value,
+        'expenses_this_month': expenses_this_month,
+    })
+
+    return {
+        'stats': stats,
+        'chart_labels': [ARABIC_MONTHS[m - 1] for _, m in months],
+        'sales_chart_data': [sales[k].total_amount if k in sales else 0.0 for k in months],
+        'purchases_chart_data': [purchases.get(k, 0.0) for k in months],
+        'top_products': _top_products(first_day),
+    }
+
+
+def init_dashboard_cache(app):
+    """Create the per-application dashboard snapshot cache from config"""
+    cache = TTLCache(
+        max_size=app.config.get('DASHBOARD_CACHE_SIZE', 1024),
+        ttl=app.config.get('DASHBOARD_CACHE_TTL', 0),
+    )
+    app.extensions['dashboard_cache'] = cache
+    return cache
+
+
+def get_dashboard_cache():
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('dashboard_cache')
+
+
+def get_dashboard_stats(today=None):
+    """
+    Return the dashboard snapshot of the current tenant, served from the
+    per-tenant cache when DASHBOARD_CACHE_TTL > 0.
+    """
+    today = today or date.today()
+    cache = get_dashboard_cache()
+    if cache is None or cache.ttl <= 0:
+        return compute_dashboard_stats(today)
+
+    tenant_id = getattr(g, 'current_tenant_id', None) if has_request_context() else None
+    key = (tenant_id, today)
+    snapshot = cache.get(key)
+    if snapshot is MISSING:
+        snapshot = compute_dashboard_stats(today)
+        cache.set(key, snapshot)
+    return snapshot
+
@@ -0,0 +1,179 @@
+"""
+User Identity Cache
+===================
+
+Flask-Login calls the user_loader on every request.  Loading the ORM User
+joined-loads its role and every Role.permissions row, which is a heavy
+multi-join for what is usually a small AJAX call.
+
+Instead the loader returns a UserIdentity: a slotted, read-only snapshot of
+the columns requests actually need (id, tenant, flags, language, ...) plus
+the compiled permission frozenset of the user's role.  Snapshots are cached
+per process and invalidated when:
+
+    * the User row is updated or deleted (profile edits, lock/unlock,
+      login bookkeeping, role changes) - via ORM events
+    * role permissions change - via the permission version stamp
+      (see app/permission_cache.py)
+
+Reading any other attribute (e.g. ``current_user.role`` or
+``current_user.check_password``) transparently loads the full ORM User once
+per request.  Routes that mutate the user call ``current_user.get_user()``
+and modify the returned ORM instance.
+"""
+
+from flask import current_app, g, has_app_context, has_request_context
+from sqlalchemy import event
+
+from app import db
+from app.models import User
+from app.permission_cache import get_permissions_version, get_role_permissions
+from app.utils.cache_helper import MISSING, TTLCache
+
+_SNAPSHOT_COLUMNS = (
+    'id', 'tenant_id', 'username', 'full_name', 'full_name_en', 'is_active',
+    'is_admin', 'is_super_admin', 'language', 'branch_id', 'role_id',
+    'must_change_password', 'account_locked_until',
+)
+
+
+class UserIdentity:
+    """Read-only stand-in for the logged-in User used as ``current_user``"""
+
+    __slots__ = _SNAPSHOT_COLUMNS + ('permission_names', 'permissions_version')
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, row, permission_names, permissions_version):
+        for name in _SNAPSHOT_COLUMNS:
+            object.__setattr__(self, name, getattr(row, name))
+        object.__setattr__(self, 'permission_names', permission_names)
+        object.__setattr__(self, 'permissions_version', permissions_version)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(
+            f'UserIdentity is read-only; use current_user.get_user().{name} = ... instead'
+        )
+
+    def __getattr__(self, name):
+        # Only reached for attributes that are not part of the snapshot
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.get_user(), name)
+
+    def __eq__(self, other):
+        if isinstance(other, (UserIdentity, User)):
+            return self.id == other.id
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(('user', self.id))
+
+    def __repr__(self):
+        return f'<UserIdentity {self.username}>'
+
+    def get_id(self):
+        return str(self.id)
+
+    def get_user(self):
+        """Return the full ORM User, loaded at most once per request"""
+        if not has_request_context():
+            return User.query.get(self.id)
+        users = g.setdefault('_orm_users', {})
+        if self.id not in users:
+            users[self.id] = User.query.get(self.id)
+        return users[self.id]
+
+    @property
+    def display_name(self):
+        """Return name based on current session language"""
+        from flask import session
+        lang = session.get('language', 'ar')
+        if lang == 'en' and self.full_name_en:
+            return self.full_name_en
+        return self.full_name or self.username
+
+    def has_permission(self, permission_name):
+        """Check if user has a specific permission"""
+        if self.is_admin:
+            return True
+        return permission_name in self.permission_names
+
+    def has_any_permission(self, *permission_names):
+        """Check if user has any of the specified permissions"""
+        if self.is_admin:
+            return True
+        return not self.permission_names.isdisjoint(permission_names)
+
+    def has_all_permissions(self, *permission_names):
+        """Check if user has all of the specified permissions"""
+        if self.is_admin:
+            return True
+        if not self.role_id:
+            return False
+        return self.permission_names.issuperset(permission_names)
+
+
+def _load_identity(user_id):
+    # Column-only query: no joined role/permissions, no tenant criteria
+    # (the tenant check is done by load_identity for hits and misses alike)
+    row = (db.session.query(*[getattr(User, c) for c in _SNAPSHOT_COLUMNS])
+           .filter(User.id == user_id)
+           .execution_options(skip_tenant_filter=True)
+           .first())
+    if row is None:
+        return None
+    version = get_permissions_version()
+    return UserIdentity(row, get_role_permissions(row.role_id), version)
+
+
+def load_identity(user_id):
+    """
+    Return the cached UserIdentity for ``user_id`` or None.
+
+    Mirrors the tenant isolation of the previous ``User.query.get``: when a
+    tenant is active for the request, users of other tenants are not loaded.
+    """
+    cache = get_identity_cache()
+    identity = cache.get(user_id) if cache is not None else MISSING
+    if identity is MISSING or identity.permissions_version != get_permissions_version():
+        identity = _load_identity(user_id)
+        if identity is None:
+            return None
+        if cache is not None:
+            cache.set(user_id, identity)
+
+    tenant_id = getattr(g, 'current_tenant_id', None) if has_request_context() else None
+    if tenant_id is not None and identity.tenant_id != tenant_id:
+        return None
+    return identity
+
+
+def init_identity_cache(app):
+    """Create the per-application identity cache from config"""
+    cache = TTLCache(
+        max_size=app.config.get('IDENTITY_CACHE_SIZE', 4096),
+        ttl=app.config.get('IDENTITY_CACHE_TTL', 60),
+    )
+    app.extensions['identity_cache'] = cache
+    return cache
+
+
+def get_identity_cache():
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('identity_cache')
+
+
+def invalidate_identity(user_id):
+    """Drop the cached identity of ``user_id``"""
+    cache = get_identity_cache()
+    if cache is not None:
+        cache.delete(user_id)
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_on_change(mapper, connection, target):
+    invalidate_identity(target.id)
@@ -8,7 +8,12 @@ from app.models_sales import SalesInvoiceItem, QuotationItem
 from app.models_purchases import PurchaseInvoiceItem, PurchaseOrderItem, PurchaseReturnItem
 from app.models_pos import POSOrderItem
 from app.auth.decorators import permission_required, any_permission_required
+from app.company_settings import get_company_settings
+from app.product_index import MAX_LOOKUP_CODES, lookup_products
+from app.search_index import apply_search, clamp_limit
+from app.summaries import product_summary
 from app.tenant_mixin import TenantMixin
+from app.utils.stock_ledger import StockLedger
 from datetime import datetime
 import os
 from werkzeug.utils import secure_filename
@@ -52,11 +57,7 @@ def products():
     query = Product.query
 
     if search:
-        query = query.filter(
-            (Product.name.contains(search)) |
-            (Product.code.contains(search)) |
-            (Product.barcode.contains(search))
-        )
+        query = apply_search(query, Product, 'product', search)
 
     if category_id:
         query = query.filter_by(category_id=category_id)
@@ -68,42 +69,13 @@ def products():
     categories = Category.query.filter_by(is_active=True).all()
 
     # Get company settings for currency
-    from app.models import Company
-    from flask import current_app
-    company = Company.query.first()
-    currency_code = company.currency if company else current_app.config.get('DEFAULT_CURRENCY', 'SAR')
-    currency_symbol = current_app.config['CURRENCIES'].get(currency_code, {}).get('symbol', 'ر.س')
-    currency_name = current_app.config['CURRENCIES'].get(currency_code, {}).get('name', 'ريال سعودي')
+    settings = get_company_settings()
+    currency_code = settings.currency_code
+    currency_symbol = settings.currency_symbol
+    currency_name = settings.currency_name
 
     # --- Dashboard summary data ---
-    all_products = Product.query.all()
-    total_products   = len(all_products)
-    active_products  = sum(1 for p in all_products if p.is_active)
-    inactive_products = total_products - active_products
-
-    low_stock_count = 0
-    out_of_stock_count = 0
-    total_stock_value = 0.0
-    for p in all_products:
-        if not p.is_active:
-            continue
-        stock_qty = p.get_stock()
-        total_stock_value += stock_qty * (p.cost_price or 0)
-        if stock_qty <= 0:
-            out_of_stock_count += 1
-        elif p.min_stock and stock_qty <= p.min_stock:
-            low_stock_count += 1
-
-    # Category distribution (name → product count)
-    cat_labels, cat_data = [], []
-    for cat in Category.query.filter_by(is_active=True).all():
-        count = Product.query.filter_by(category_id=cat.id, is_active=True).count()
-        if count > 0:
-            cat_labels.append(cat.name)
-            cat_data.append(count)
-
-    # Stock status distribution
-    in_stock_count = active_products - low_stock_count - out_of_stock_count
+    summary = product_summary()
 
     return render_template('inventory/products.html',
                          products=products,
@@ -113,15 +85,66 @@ def products():
                          currency_symbol=currency_symbol,
                          currency_name=currency_name,
                          currency_code=currency_code,
-                         total_products=total_products,
-                         active_products=active_products,
-                         inactive_products=inactive_products,
-                         low_stock_count=low_stock_count,
-                         out_of_stock_count=out_of_stock_count,
-                         in_stock_count=in_stock_count,
-                         total_stock_value=total_stock_value,
-                         cat_labels=cat_labels,
-                         cat_data=cat_data)
+                         **summary)
+
+@bp.route('/api/products/summary')
+@login_required
+@permission_required('inventory.products.view')
+def products_summary():
+    """Product counts, stock status and category chart data (API endpoint)"""
+    return jsonify(product_summary())
+
+@bp.route('/api/lookup', methods=['GET', 'POST'])
+@login_required
+@any_permission_required('inventory.products.view', 'pos.access',
+                         'sales.invoices.add', 'purchases.invoices.add')
+def lookup_product():
+    """
+    Resolve scanned barcodes or product codes (API endpoint).
+
+    GET ?code=<code> (repeatable) or POST {"codes": [...]} for scanner
+    batches; returns {"products": {code: product or null}}.
+    """
+    if request.method == 'POST':
+        codes = (request.get_json(silent=True) or {}).get('codes') or []
+    else:
+        codes = request.args.getlist('code')
+    if not isinstance(codes, list) or not codes:
+        return jsonify({'success': False, 'error': 'No codes given'}), 400
+    if len(codes) > MAX_LOOKUP_CODES:
+        return jsonify({'success': False,
+                        'error': f'At most {MAX_LOOKUP_CODES} codes per request'}), 413
+
+    results = lookup_products(str(code) for code in codes)
+    return jsonify({'products': {code: entry._asdict() if entry else None
+                                 for code, entry in results.items()}})
+
+@bp.route('/api/products/search')
+@login_required
+@any_permission_required('inventory.products.view', 'pos.access',
+                         'sales.invoices.add', 'purchases.invoices.add')
+def search_products():
+    """
+    Ranked product autocomplete (API endpoint).
+
+    GET ?q=<text>&limit=<n>; matches name, English name, code, barcode and
+    SKU of active products, Arabic letter variants and diacritics ignored.
+    """
+    search = request.args.get('q', '').strip()
+    if not search:
+        return jsonify({'products': []})
+    limit = clamp_limit(request.args.get('limit', type=int))
+    query = apply_search(Product.query.filter(Product.is_active == True), Product, 'product', search)
+    products = query.order_by(Product.name).limit(limit).all()
+    return jsonify({'products': [{
+        'id': p.id,
+        'code': p.code,
+        'barcode': p.barcode,
+        'name': p.name,
+        'name_en': p.name_en,
+        'price': p.selling_price or 0.0,
+        'tax_rate': p.tax_rate,
+    } for p in products]})
 
 @bp.route('/products/add', methods=['GET', 'POST'])
 @login_required
@@ -245,34 +268,17 @@ def add_product():
             db.session.flush()  # Get product ID before adding stock
 
             # Add initial stock for each warehouse
-            stock_added = False
+            ledger = StockLedger('initial_stock', product.id,
+                                 notes='رصيد افتتاحي عند إضافة المنتج')
             for key in request.form.keys():
                 if key.startswith('warehouse_'):
                     warehouse_id = int(key.split('_')[1])
                     quantity = request.form.get(key, 0, type=float)
 
                     if quantity > 0:
-                        stock = Stock(
-                            product_id=product.id,
-                            warehouse_id=warehouse_id,
-                            quantity=quantity,
-                            available_quantity=quantity
-                        )
-                        db.session.add(stock)
-
-                        # Create stock movement record
-                        movement = StockMovement(
-                            product_id=product.id,
-                            warehouse_id=warehouse_id,
-                            movement_type='in',
-                            quantity=quantity,
-                            reference_type='initial_stock',
-                            reference_id=product.id,
-                            notes='رصيد افتتاحي عند إضافة المنتج',
-                            user_id=current_user.id
-                        )
-                        db.session.add(movement)
-                        stock_added = True
+                        ledger.add(product.id, warehouse_id, quantity)
+            ledger.post()
+            stock_added = bool(ledger.lines)
 
             db.session.commit()
 
@@ -528,12 +534,10 @@ def stock():
     warehouses = Warehouse.query.filter_by(is_active=True).all()
 
     # Get company settings for currency
-    from app.models import Company
-    from flask import current_app
-    company = Company.query.first()
-    currency_code = company.currency if company else current_app.config.get('DEFAULT_CURRENCY', 'EUR')
-    currency_symbol = current_app.config['CURRENCIES'].get(currency_code, {}).get('symbol', '€')
-    currency_name = current_app.config['CURRENCIES'].get(currency_code, {}).get('name', 'يورو')
+    settings = get_company_settings()
+    currency_code = settings.currency_code
+    currency_symbol = settings.currency_symbol
+    currency_name = settings.currency_name
 
     return render_template('inventory/stock.html',
                          stocks=stocks,
@@ -668,61 +672,25 @@ def stock_transfer():
                 flash(_('Cannot transfer to the same warehouse'), 'danger')
                 return redirect(url_for('inventory.stock_transfer'))
 
-            # Get source stock
-            from_stock = Stock.query.filter_by(
-                product_id=product_id,
-                warehouse_id=from_warehouse_id
-            ).first()
-
-            if not from_stock or from_stock.available_quantity < quantity:
+            from_warehouse = Warehouse.query.get_or_404(from_warehouse_id)
+            to_warehouse = Warehouse.query.get_or_404(to_warehouse_id)
+
+            ledger = StockLedger('transfer')
+            ledger.add(product_id, from_warehouse_id, -quantity,
+                       notes=f'نقل إلى مستودع {to_warehouse.name}. {notes or ""}')
+            ledger.add(product_id, to_warehouse_id, quantity,
+                       notes=f'نقل من مستودع {from_warehouse.name}. {notes or ""}')
+
+            # Check the locked source row
+            from_stock = ledger.lock().get((int(product_id), int(from_warehouse_id)))
+            available = ((from_stock.quantity or 0) - (from_stock.reserved_quantity or 0)
+                         - (from_stock.damaged_quantity or 0)) if from_stock else 0
+            if available < quantity:
+                db.session.rollback()
                 flash(_('Insufficient quantity available'), 'danger')
                 return redirect(url_for('inventory.stock_transfer'))
 
-            # Get or create destination stock
-            to_stock = Stock.query.filter_by(
-                product_id=product_id,
-                warehouse_id=to_warehouse_id
-            ).first()
-
-            if not to_stock:
-                to_stock = Stock(
-                    product_id=product_id,
-                    warehouse_id=to_warehouse_id,
-                    quantity=0,
-                    reserved_quantity=0,
-                    available_quantity=0
-                )
-                db.session.add(to_stock)
-
-            # Update stocks
-            from_stock.quantity -= quantity
-            from_stock.available_quantity -= quantity
-            to_stock.quantity += quantity
-            to_stock.available_quantity += quantity
-
-            # Create stock movements
-            out_movement = StockMovement(
-                product_id=product_id,
-                warehouse_id=from_warehouse_id,
-                movement_type='out',
-                quantity=quantity,
-                reference_type='transfer',
-                notes=f'نقل إلى مستودع {to_stock.warehouse.name}. {notes or ""}',
-                created_by=current_user.id
-            )
-
-            in_movement = StockMovement(
-                product_id=product_id,
-                warehouse_id=to_warehouse_id,
-                movement_type='in',
-                quantity=quantity,
-                reference_type='transfer',
-                notes=f'نقل من مستودع {from_stock.warehouse.name}. {notes or ""}',
-                created_by=current_user.id
-            )
-
-            db.session.add(out_movement)
-            db.session.add(in_movement)
+            ledger.post()
             db.session.commit()
 
             flash(_('Stock transferred successfully'), 'success')
@@ -827,14 +795,15 @@ def add_damaged_inventory():
             damage_type = request.form.get('damage_type')
             notes = request.form.get('notes')
 
-            # Get product and stock
+            # Get product and lock its stock row
             product = Product.query.get_or_404(product_id)
-            stock = Stock.query.filter_by(
-                product_id=product_id,
-                warehouse_id=warehouse_id
-            ).first()
+            ledger = StockLedger('damaged', notes=f'{_("Damaged inventory")}: {reason}')
+            ledger.add(product_id, warehouse_id, -quantity, movement_type='damaged',
+                       damaged=quantity)
+            stock = ledger.lock().get((product_id, warehouse_id))
 
             if not stock or stock.quantity < quantity:
+                db.session.rollback()
                 flash(_('Insufficient quantity in stock'), 'error')
                 return redirect(url_for('inventory.add_damaged_inventory'))
 
@@ -855,23 +824,9 @@ def add_damaged_inventory():
             db.session.add(damaged)
             db.session.flush()  # Get the ID without committing
 
-            # Update stock
-            stock.quantity -= quantity
-            stock.damaged_quantity = (stock.damaged_quantity or 0) + quantity
-            stock.available_quantity = stock.quantity - stock.reserved_quantity - stock.damaged_quantity
-
-            # Create stock movement
-            movement = StockMovement(
-                product_id=product_id,
-                warehouse_id=warehouse_id,
-                movement_type='damaged',
-                quantity=-quantity,  # Negative for outgoing
-                reference_type='damaged',
-                reference_id=damaged.id,
-                notes=f'{_("Damaged inventory")}: {reason}',
-                user_id=current_user.id
-            )
-            db.session.add(movement)
+            # Update stock and record the movement
+            ledger.reference_id = damaged.id
+            ledger.post()
 
             db.session.commit()
 
@@ -897,17 +852,12 @@ def delete_damaged_inventory(id):
     damaged = DamagedInventory.query.get_or_404(id)
 
     try:
-        # Get stock
-        stock = Stock.query.filter_by(
-            product_id=damaged.product_id,
-            warehouse_id=damaged.warehouse_id
-        ).first()
-
-        if stock:
-            # Restore stock
-            stock.quantity += damaged.quantity
-            stock.damaged_quantity = max(0, (stock.damaged_quantity or 0) - damaged.quantity)
-            stock.available_quantity = stock.quantity - stock.reserved_quantity - stock.damaged_quantity
+        # Restore stock
+        ledger = StockLedger('damaged_delete', damaged.id,
+                             notes=f'{_("Damaged inventory")}: {damaged.reason}')
+        ledger.add(damaged.product_id, damaged.warehouse_id, damaged.quantity,
+                   damaged=-damaged.quantity)
+        ledger.post(create_missing=False)
 
         # Delete damaged record
         db.session.delete(damaged)
@@ -0,0 +1,330 @@
+"""
+Background Jobs
+===============
+
+Heavy work (PDF/Excel exports, backups) can run outside the web worker: the
+request stores a row in ``jobs`` and returns at once, and a separate
+process, ``flask jobs worker``, claims queued rows and runs them.  The queue
+is the database itself, so a single box needs no broker:
+
+    * a job is claimed with a compare-and-set UPDATE (status 'queued' ->
+      'running'), so two workers never run the same job
+    * handlers call report_progress(), which also refreshes heartbeat_at;
+      running jobs whose heartbeat is older than JOBS_STALE_AFTER seconds
+      (their worker was killed) are queued again, up to JOBS_MAX_ATTEMPTS runs
+    * result files are written under JOBS_RESULT_DIR/<job id>/, served by
+      /jobs/<id>/download and removed by ``flask jobs purge``
+
+Handlers are registered per kind and return ``(path, filename, mimetype)``
+of their result file, or None:
+
+    @job_handler('backup')
+    def run_backup(job, params):
+        ...
+
+Export views opt in with @background_export (below the permission
+decorators) and are queued when called with background=1, or by default
+when JOBS_ENABLED is set (background=0 then runs them inline).
+"""
+
+import json
+import os
+import shutil
+import signal
+import socket
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+
+import click
+from flask import (current_app, flash, g, get_flashed_messages, jsonify, redirect, request,
+                   url_for)
+from flask.cli import AppGroup
+from flask_login import current_user, login_user
+from sqlalchemy import select, update
+from werkzeug.http import parse_options_header
+from werkzeug.utils import secure_filename
+
+from app import db
+from app.models import Job, User
+from app.tenant_mixin import TenantMixin
+
+JOB_HANDLERS = {}
+
+DEFAULT_POLL_INTERVAL = 2.0
+DEFAULT_STALE_AFTER = 3600
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_RESULT_TTL_DAYS = 7
+
+
+class JobError(Exception):
+    """A job failure whose message is shown to the user as is"""
+
+
+def job_handler(kind):
+    """Register ``func(job, params)`` as the handler of ``kind`` jobs"""
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def current_job_id():
+    """Id of the job being run by this worker, None in web requests"""
+    return g.get('current_job_id')
+
+
+# ---------------------------------------------------------------------------
+# Queueing (web side)
+# ---------------------------------------------------------------------------
+
+def enqueue(kind, params=None, title=None, user_id=None, tenant_id=None):
+    """Queue a ``kind`` job for the current user and tenant and commit it"""
+    if user_id is None and current_user and current_user.is_authenticated:
+        user_id = current_user.id
+    if tenant_id is None:
+        tenant_id = TenantMixin.get_current_tenant_id()
+    job = Job(kind=kind, params=json.dumps(params or {}, ensure_ascii=False), title=title,
+              user_id=user_id, tenant_id=tenant_id, status='queued')
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def wants_background():
+    """background=1|0 from the request, else JOBS_ENABLED"""
+    flag = request.values.get('background')
+    if flag in ('1', 'true'):
+        return True
+    if flag in ('0', 'false'):
+        return False
+    return bool(current_app.config.get('JOBS_ENABLED'))
+
+
+def queued_response(job):
+    """202 with the job as JSON for API clients, else a redirect to its status page"""
+    status_url = url_for('main.job_status', job_id=job.id)
+    if request.args.get('format') == 'json' or request.accept_mimetypes.best == 'application/json':
+        response = jsonify(dict(job.to_dict(), status_url=status_url))
+        response.status_code = 202
+        return response
+    flash('تمت إضافة المهمة إلى قائمة الانتظار، سيكون الملف جاهزاً للتحميل عند اكتمالها', 'info')
+    return redirect(status_url)
+
+
+def background_export(view):
+    """Queue a GET export view as an 'export' job when the request asks for it"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if current_job_id() is not None or not wants_background():
+            return view(*args, **kwargs)
+        query = request.args.to_dict(flat=False)
+        query.pop('background', None)
+        if query.get('format') == ['json']:  # asks for the queued job as JSON
+            del query['format']
+        job = enqueue('export', {'path': request.path, 'args': query}, title=request.endpoint)
+        return queued_response(job)
+    return wrapper
+
+
+# ---------------------------------------------------------------------------
+# Running (worker side)
+# ---------------------------------------------------------------------------
+
+def result_file(job, filename):
+    """Path for a result file of ``job``; its directory is created"""
+    directory = os.path.join(current_app.config['JOBS_RESULT_DIR'], str(job.id))
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, secure_filename(filename) or 'result')
+
+
+def report_progress(job_id, percent, message=None):
+    """Record progress (and a heartbeat) outside the handler's transaction"""
+    values = {'progress': max(0, min(int(percent), 100)), 'heartbeat_at': datetime.utcnow()}
+    if message is not None:
+        values['message'] = message[:256]
+    with db.engine.begin() as connection:
+        connection.execute(update(Job.__table__).where(Job.__table__.c.id == job_id).values(**values))
+
+
+def claim_next(worker):
+    """Mark the oldest queued job as running for ``worker``; returns its id or None"""
+    jobs = Job.__table__
+    while True:
+        job_id = db.session.execute(
+            select(jobs.c.id).where(jobs.c.status == 'queued').order_by(jobs.c.id).limit(1)
+        ).scalar()
+        if job_id is None:
+            db.session.rollback()
+            return None
+        now = datetime.utcnow()
+        claimed = db.session.execute(
+            update(jobs)
+            .where(jobs.c.id == job_id, jobs.c.status == 'queued')
+            .values(status='running', worker=worker, started_at=now, heartbeat_at=now,
+                    progress=0, attempts=jobs.c.attempts + 1)
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            return job_id
+        # Another worker took it first
+
+
+def requeue_stale():
+    """Queue again the running jobs whose worker stopped reporting; returns how many"""
+    config = current_app.config
+    jobs = Job.__table__
+    cutoff = datetime.utcnow() - timedelta(seconds=config.get('JOBS_STALE_AFTER', DEFAULT_STALE_AFTER))
+    max_attempts = config.get('JOBS_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+    stale = (jobs.c.status == 'running') & (jobs.c.heartbeat_at < cutoff)
+
+    requeued = db.session.execute(
+        update(jobs).where(stale, jobs.c.attempts < max_attempts)
+        .values(status='queued', worker=None, message='worker stopped, queued again')
+    ).rowcount
+    db.session.execute(
+        update(jobs).where(stale, jobs.c.attempts >= max_attempts)
+        .values(status='failed', error='worker stopped responding', finished_at=datetime.utcnow())
+    )
+    db.session.commit()
+    return requeued
+
+
+def _finish(job_id, **values):
+    values['finished_at'] = datetime.utcnow()
+    db.session.execute(update(Job.__table__).where(Job.__table__.c.id == job_id).values(**values))
+    db.session.commit()
+
+
+def run_job(job_id):
+    """Run one claimed job and record its outcome; returns True when it succeeded"""
+    job = db.session.get(Job, job_id)
+    kind = job.kind
+    g.current_job_id = job_id
+    try:
+        handler = JOB_HANDLERS.get(kind)
+        if handler is None:
+            raise JobError(f'no handler for {kind!r} jobs')
+        result = handler(job, job.parameters)
+    except Exception as exc:
+        db.session.rollback()
+        current_app.logger.exception('Job %s (%s) failed', job_id, kind)
+        _finish(job_id, status='failed', error=str(exc) or exc.__class__.__name__)
+        return False
+    finally:
+        g.pop('current_job_id', None)
+
+    db.session.rollback()
+    values = {'status': 'done', 'progress': 100, 'error': None}
+    if result:
+        values['result_path'], values['result_name'], values['result_mimetype'] = result
+    _finish(job_id, **values)
+    return True
+
+
+def work(burst=False, max_jobs=None):
+    """
+    Claim and run jobs until stopped (SIGTERM/SIGINT finish the current job
+    first); with ``burst`` stop once the queue is empty.  Returns the number
+    of jobs run.
+    """
+    worker = f'{socket.gethostname()}:{os.getpid()}'
+    poll = current_app.config.get('JOBS_POLL_INTERVAL', DEFAULT_POLL_INTERVAL)
+    stopping = []
+
+    if not burst:
+        def stop(signum, frame):
+            stopping.append(signum)
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+    processed = 0
+    while not stopping:
+        requeue_stale()
+        job_id = claim_next(worker)
+        if job_id is None:
+            if burst:
+                break
+            time.sleep(poll)
+            continue
+        run_job(job_id)
+        db.session.remove()
+        processed += 1
+        if max_jobs and processed >= max_jobs:
+            break
+    return processed
+
+
+def purge_jobs(days):
+    """Delete finished jobs older than ``days`` and their result directories"""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    jobs = Job.query.filter(Job.status.in_(('done', 'failed')), Job.finished_at < cutoff).all()
+    for job in jobs:
+        shutil.rmtree(os.path.join(current_app.config['JOBS_RESULT_DIR'], str(job.id)),
+                      ignore_errors=True)
+        db.session.delete(job)
+    db.session.commit()
+    return len(jobs)
+
+
+# ---------------------------------------------------------------------------
+# Handlers
+# ---------------------------------------------------------------------------
+
+@job_handler('export')
+def run_export(job, params):
+    """Run a GET export view as the user who queued it; the attachment is the result"""
+    app = current_app._get_current_object()
+    user = db.session.get(User, job.user_id) if job.user_id else None
+    report_progress(job.id, 5, 'running')
+
+    with app.test_request_context(params['path'], query_string=params.get('args') or {}):
+        g.current_tenant_id = job.tenant_id
+        g.current_job_id = job.id
+        if user is not None:
+            login_user(user)
+        if request.url_rule is None:
+            raise JobError(f"unknown export {params['path']}")
+
+        view = app.view_functions[request.url_rule.endpoint]
+        response = app.make_response(view(**request.view_args))
+        disposition, options = parse_options_header(response.headers.get('Content-Disposition', ''))
+        if response.status_code != 200 or disposition != 'attachment':
+            messages = [message for _category, message in get_flashed_messages(with_categories=True)]
+            raise JobError('; '.join(messages) or f'export failed ({response.status})')
+
+        filename = options.get('filename') or f'export_{job.id}'
+        path = result_file(job, filename)
+        report_progress(job.id, 50, 'writing')
+        try:
+            with open(path, 'wb') as out:
+                for chunk in response.iter_encoded():
+                    out.write(chunk)
+        finally:
+            response.close()
+        return path, filename, response.mimetype
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+jobs_cli = AppGroup('jobs', help='Run and maintain background jobs.')
+
+
+@jobs_cli.command('worker')
+@click.option('--burst', is_flag=True, help='Exit once the queue is empty.')
+@click.option('--max-jobs', type=int, help='Exit after running this many jobs.')
+def worker_command(burst, max_jobs):
+    """Run queued jobs (start one or more next to gunicorn)."""
+    processed = work(burst=burst, max_jobs=max_jobs)
+    click.echo(f'{processed} jobs run')
+
+
+@jobs_cli.command('purge')
+@click.option('--days', type=int, help='Age of finished jobs to delete (default: JOBS_RESULT_TTL_DAYS).')
+def purge_command(days):
+    """Delete old finished jobs and their result files."""
+    if days is None:
+        days = current_app.config.get('JOBS_RESULT_TTL_DAYS', DEFAULT_RESULT_TTL_DAYS)
+    click.echo(f'{purge_jobs(days)} jobs deleted')
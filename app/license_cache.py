@@ -0,0 +1,124 @@
+"""
+License Status Cache
+====================
+
+Per-tenant cache of the license state used by the check_license
+before_request hook, so authenticated page views and AJAX calls do not
+query the licenses table on every request.
+
+Each entry stores the license status together with its precomputed expiry
+timestamp.  A cached 'active' status whose end_date has passed is treated as
+a miss, so License.is_active() still runs once to persist the 'expired'
+status.
+
+Invalidation:
+    * automatic - License after_insert / after_update / after_delete events
+    * explicit  - invalidate_license(tenant_id) from the Stripe webhook
+      handlers, billing routes and super-admin actions
+"""
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+
+from app.models_license import License
+from app.utils.cache_helper import MISSING, TTLCache
+from app.utils.datetime_helper import utcnow
+
+
+class LicenseStatus:
+    """Session-independent summary of a tenant's License row"""
+
+    __slots__ = ('tenant_id', 'exists', 'status', 'expires_at')
+
+    def __init__(self, tenant_id, exists, status=None, expires_at=None):
+        self.tenant_id = tenant_id
+        self.exists = exists
+        self.status = status
+        self.expires_at = expires_at
+
+    @classmethod
+    def from_license(cls, tenant_id, lic):
+        if lic is None:
+            return cls(tenant_id, exists=False)
+        return cls(tenant_id, exists=True, status=lic.status, expires_at=lic.end_date)
+
+    def is_expired(self, now=None):
+        return self.expires_at is not None and self.expires_at < (now or utcnow())
+
+    def is_active(self, now=None):
+        return self.exists and self.status == 'active' and not self.is_expired(now)
+
+    def __repr__(self):
+        return f'<LicenseStatus tenant={self.tenant_id} status={self.status}>'
+
+
+class LicenseCache:
+    """Tenant id -> LicenseStatus, backed by a TTLCache"""
+
+    def __init__(self, max_size=1024, ttl=30):
+        self._cache = TTLCache(max_size=max_size, ttl=ttl)
+
+    def get_status(self, tenant_id):
+        """Return the LicenseStatus of ``tenant_id``, loading it on a miss"""
+        status = self._cache.get(tenant_id)
+        if status is not MISSING and not (status.status == 'active' and status.is_expired()):
+            return status
+
+        lic = License.query.filter_by(tenant_id=tenant_id).first()
+        if lic is not None:
+            # Persists status='expired' when end_date has passed
+            lic.is_active()
+        status = LicenseStatus.from_license(tenant_id, lic)
+        self._cache.set(tenant_id, status)
+        return status
+
+    def invalidate(self, tenant_id):
+        self._cache.delete(tenant_id)
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        return self._cache.stats()
+
+
+def init_license_cache(app):
+    """Create the per-application license cache from config"""
+    cache = LicenseCache(
+        max_size=app.config.get('LICENSE_CACHE_SIZE', 1024),
+        ttl=app.config.get('LICENSE_CACHE_TTL', 30),
+    )
+    app.extensions['license_cache'] = cache
+    return cache
+
+
+def get_license_cache():
+    """Return the license cache of the current app, or None outside an app context"""
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('license_cache')
+
+
+def get_license_status(tenant_id):
+    """Cached LicenseStatus for ``tenant_id`` (falls back to a direct query without an app cache)"""
+    cache = get_license_cache()
+    if cache is None:
+        lic = License.query.filter_by(tenant_id=tenant_id).first()
+        if lic is not None:
+            lic.is_active()
+        return LicenseStatus.from_license(tenant_id, lic)
+    return cache.get_status(tenant_id)
+
+
+def invalidate_license(tenant_id):
+    """Drop the cached license status of ``tenant_id``"""
+    cache = get_license_cache()
+    if cache is not None and tenant_id is not None:
+        cache.invalidate(tenant_id)
+
+
+@event.listens_for(License, 'after_insert')
+@event.listens_for(License, 'after_update')
+@event.listens_for(License, 'after_delete')
+def _invalidate_on_change(mapper, connection, target):
+    invalidate_license(target.tenant_id)
@@ -1,13 +1,16 @@
-from flask import render_template, redirect, url_for, flash, request, make_response, after_this_request
+from flask import render_template, redirect, url_for, flash, request, make_response, after_this_request, jsonify, current_app, abort, send_file
 from flask_login import login_required, current_user
+from flask_babel import gettext as _
 from app.auth.decorators import permission_required
 from app.main import bp
 from app import db
 from app.models import *
-from sqlalchemy import func
+from app.dashboard_stats import get_dashboard_stats
+from app.search_index import search_documents
 from datetime import datetime, timedelta, date
-import calendar
 import json
+import os
+import time
 from pathlib import Path
 
 @bp.after_request
@@ -25,21 +28,9 @@ def add_cache_headers(response):
 def index():
     """Dashboard - Main page"""
 
-    # Get statistics
-    stats = {
-        'total_products': Product.query.filter_by(is_active=True).count(),
-        'total_customers': Customer.query.filter_by(is_active=True).count(),
-        'total_suppliers': Supplier.query.filter_by(is_active=True).count(),
-        'low_stock_products': 0,
-        'total_warehouses': Warehouse.query.filter_by(is_active=True).count(),
-    }
-
-    # Calculate low stock products
-    products = Product.query.filter_by(is_active=True, track_inventory=True).all()
-    for product in products:
-        current_stock = product.get_stock()
-        if product.min_stock and current_stock <= product.min_stock:
-            stats['low_stock_products'] += 1
+    # Aggregated figures (a few GROUP BY queries, optionally cached per tenant)
+    dashboard = get_dashboard_stats()
+    stats = dict(dashboard['stats'])
 
     # Get recent sales
     recent_sales = SalesInvoice.query.order_by(SalesInvoice.created_at.desc()).limit(5).all()
@@ -47,99 +38,6 @@ def index():
     # Get recent purchases
     recent_purchases = PurchaseInvoice.query.order_by(PurchaseInvoice.created_at.desc()).limit(5).all()
 
-    # Sales this month
-    today = date.today()
-    first_day = today.replace(day=1)
-
-    sales_this_month = db.session.query(func.sum(SalesInvoice.total_amount)).filter(
-        SalesInvoice.invoice_date >= first_day,
-        SalesInvoice.status != 'cancelled'
-    ).scalar() or 0
-
-    # Purchases this month
-    purchases_this_month = db.session.query(func.sum(PurchaseInvoice.total_amount)).filter(
-        PurchaseInvoice.invoice_date >= first_day,
-        PurchaseInvoice.status != 'cancelled'
-    ).scalar() or 0
-
-    # Calculate COGS (Cost of Goods Sold) this month
-    sales_invoices = SalesInvoice.query.filter(
-        SalesInvoice.invoice_date >= first_day,
-        SalesInvoice.status != 'cancelled'
-    ).all()
-
-    cogs_this_month = 0
-    for invoice in sales_invoices:
-        for item in invoice.items:
-            cogs_this_month += item.product.cost_price * item.quantity
-
-    # Calculate profit this month (Sales - COGS)
-    profit_this_month = sales_this_month - cogs_this_month
-
-    stats['sales_this_month'] = sales_this_month
-    stats['purchases_this_month'] = purchases_this_month
-    stats['profit_this_month'] = profit_this_month
-
-    # Get sales data for last 6 months
-    sales_chart_data = []
-    purchases_chart_data = []
-    chart_labels = []
-
-    for i in range(5, -1, -1):
-        # Correct month arithmetic — timedelta(days=30*i) is inaccurate
-        # because months have 28-31 days, causing duplicate or skipped months.
-        raw_month = today.month - i
-        if raw_month <= 0:
-            target_year = today.year - 1
-            target_month = raw_month + 12
-        else:
-            target_year = today.year
-            target_month = raw_month
-        month_start = date(target_year, target_month, 1)
-
-        # Get last day of month
-        last_day = calendar.monthrange(month_start.year, month_start.month)[1]
-        month_end = month_start.replace(day=last_day)
-
-        # Sales for this month
-        month_sales = db.session.query(func.sum(SalesInvoice.total_amount)).filter(
-            SalesInvoice.invoice_date >= month_start,
-            SalesInvoice.invoice_date <= month_end,
-            SalesInvoice.status != 'cancelled'
-        ).scalar() or 0
-
-        # Purchases for this month
-        month_purchases = db.session.query(func.sum(PurchaseInvoice.total_amount)).filter(
-            PurchaseInvoice.invoice_date >= month_start,
-            PurchaseInvoice.invoice_date <= month_end,
-            PurchaseInvoice.status != 'cancelled'
-        ).scalar() or 0
-
-        sales_chart_data.append(float(month_sales))
-        purchases_chart_data.append(float(month_purchases))
-
-        # Arabic month names
-        arabic_months = ['يناير', 'فبراير', 'مارس', 'أبريل', 'مايو', 'يونيو',
-                        'يوليو', 'أغسطس', 'سبتمبر', 'أكتوبر', 'نوفمبر', 'ديسمبر']
-        chart_labels.append(arabic_months[month_start.month - 1])
-
-    # Get top selling products
-    top_products = db.session.query(
-        Product.name,
-        func.sum(SalesInvoiceItem.quantity).label('total_qty')
-    ).join(SalesInvoiceItem).join(SalesInvoice).filter(
-        SalesInvoice.status != 'cancelled',
-        SalesInvoice.invoice_date >= first_day
-    ).group_by(Product.id).order_by(func.sum(SalesInvoiceItem.quantity).desc()).limit(5).all()
-
-    # Calculate inventory value
-    inventory_value = 0
-    for product in products:
-        stock_qty = product.get_stock()
-        inventory_value += stock_qty * product.cost_price
-
-    stats['inventory_value'] = inventory_value
-
     # Get bank accounts data
     bank_accounts = BankAccount.query.filter_by(is_active=True).all()
     total_bank_balance = sum(acc.current_balance for acc in bank_accounts)
@@ -155,21 +53,14 @@ def index():
     # Get active warehouses for convert modal
     warehouses = Warehouse.query.filter_by(is_active=True).all()
 
-    # Get expenses this month
-    expenses_this_month = db.session.query(func.sum(Expense.amount)).filter(
-        Expense.expense_date >= first_day,
-        Expense.status != 'cancelled'
-    ).scalar() or 0
-    stats['expenses_this_month'] = expenses_this_month
-
     return render_template('main/index.html',
                          stats=stats,
                          recent_sales=recent_sales,
                          recent_purchases=recent_purchases,
-                         sales_chart_data=sales_chart_data,
-                         purchases_chart_data=purchases_chart_data,
-                         chart_labels=chart_labels,
-                         top_products=top_products,
+                         sales_chart_data=dashboard['sales_chart_data'],
+                         purchases_chart_data=dashboard['purchases_chart_data'],
+                         chart_labels=dashboard['chart_labels'],
+                         top_products=dashboard['top_products'],
                          bank_accounts=bank_accounts,
                          recent_bank_transactions=recent_bank_transactions,
                          recent_quotations=recent_quotations,
@@ -179,5 +70,102 @@ def index():
 def about():
     return render_template('main/about.html')
 
+# Global search: entity type -> (permission needed to see it, link to a hit)
+SEARCH_TARGETS = {
+    'product': ('inventory.products.view',
+                lambda hit: url_for('inventory.products', search=hit.subtitle)),
+    'customer': ('sales.customers.view',
+                 lambda hit: url_for('sales.customers', search=hit.subtitle)),
+    'supplier': ('purchases.suppliers.view',
+                 lambda hit: url_for('purchases.supplier_details', id=hit.entity_id)),
+    'sales_invoice': ('sales.invoices.view',
+                      lambda hit: url_for('sales.invoice_details', id=hit.entity_id)),
+    'purchase_invoice': ('purchases.invoices.view',
+                         lambda hit: url_for('purchases.invoice_details', id=hit.entity_id)),
+    'journal_entry': ('accounting.transactions.view',
+                      lambda hit: url_for('accounting.journal_entry_details', id=hit.entity_id)),
+}
+
+def _search_labels():
+    return {
+        'product': _('Products'),
+        'customer': _('Customers'),
+        'supplier': _('Suppliers'),
+        'sales_invoice': _('Sales Invoices'),
+        'purchase_invoice': _('Purchase Invoices'),
+        'journal_entry': _('Journal Entries'),
+    }
 
-
+@bp.route('/search')
+@login_required
+def search():
+    """
+    Search every entity type the user may view.
+
+    GET ?q=<text>[&type=<entity type>...][&limit=<n>]; renders a results
+    page, or with format=json returns the hits for the navbar typeahead.
+    One query on the search index, never on the entity tables.
+    """
+    query = request.args.get('q', '').strip()
+    types = [entity_type for entity_type, (permission, _link) in SEARCH_TARGETS.items()
+             if current_user.has_permission(permission)]
+    requested = request.args.getlist('type')
+    if requested:
+        types = [entity_type for entity_type in types if entity_type in requested]
+    max_results = current_app.config.get('SEARCH_RESULTS_LIMIT', 20)
+    limit = max(1, min(request.args.get('limit', max_results, type=int), max_results))
+
+    started = time.perf_counter()
+    hits = []
+    if len(query) >= current_app.config.get('SEARCH_MIN_QUERY_LENGTH', 2):
+        hits = search_documents(query, types, limit)
+    took_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    labels = _search_labels()
+    results = [{
+        'type': hit.entity_type,
+        'label': labels[hit.entity_type],
+        'id': hit.entity_id,
+        'title': hit.title,
+        'subtitle': hit.subtitle,
+        'date': hit.doc_date.date().isoformat() if hit.doc_date else None,
+        'url': SEARCH_TARGETS[hit.entity_type][1](hit),
+    } for hit in hits]
+
+    if request.args.get('format') == 'json':
+        return jsonify({'query': query, 'results': results, 'took_ms': took_ms})
+    return render_template('main/search.html', query=query, results=results, took_ms=took_ms)
+
+
+def _own_job(job_id):
+    """A job of the current tenant queued by the current user (or any, for admins)"""
+    job = Job.query.get_or_404(job_id)
+    if job.user_id != current_user.id and not current_user.is_admin:
+        abort(404)
+    return job
+
+
+@bp.route('/jobs/<int:job_id>')
+@login_required
+def job_status(job_id):
+    """
+    Status of a background job (app/jobs.py); with format=json returns it
+    for polling, otherwise renders a page that polls until it finishes.
+    """
+    job = _own_job(job_id)
+    data = dict(job.to_dict(), download_url=url_for('main.job_download', job_id=job.id)
+                if job.status == 'done' and job.result_path else None)
+    if request.args.get('format') == 'json':
+        return jsonify(data)
+    return render_template('main/job.html', job=job, data=data)
+
+
+@bp.route('/jobs/<int:job_id>/download')
+@login_required
+def job_download(job_id):
+    """Result file of a finished job"""
+    job = _own_job(job_id)
+    if job.status != 'done' or not job.result_path or not os.path.exists(job.result_path):
+        abort(404)
+    return send_file(job.result_path, as_attachment=True, download_name=job.result_name,
+                     mimetype=job.result_mimetype)
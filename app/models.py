@@ -62,14 +62,32 @@ class User(UserMixin, db.Model):
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+    def get_user(self):
+        """Return the ORM User (counterpart of UserIdentity.get_user)"""
+        return self
+
+    @property
+    def permission_names(self):
+        """Frozenset of the role's permission names (compiled once per role and version)"""
+        from app.permission_cache import get_permissions_version, get_role_permissions
+        version = get_permissions_version()
+        stamp = (version, self.role_id)
+        cached = self.__dict__.get('_permission_names')
+        if cached is None or cached[0] != stamp:
+            # Reuse the eagerly joined role when it is already loaded
+            role = self.__dict__.get('role')
+            cached = (stamp, get_role_permissions(self.role_id, role))
+            self.__dict__['_permission_names'] = cached
+        return cached[1]
+
     def has_permission(self, permission_name):
         """Check if user has a specific permission"""
         if self.is_admin:
             return True
-        if not self.role:
+        if not self.role_id:
             return False
         try:
-            return any(p.name == permission_name for p in self.role.permissions)
+            return permission_name in self.permission_names
         except Exception as e:
             # Log the error and return False
             print(f"Error checking permission: {e}")
@@ -79,13 +97,17 @@ class User(UserMixin, db.Model):
         """Check if user has any of the specified permissions"""
         if self.is_admin:
             return True
-        return any(self.has_permission(p) for p in permission_names)
+        if not self.role_id:
+            return False
+        return not self.permission_names.isdisjoint(permission_names)
 
     def has_all_permissions(self, *permission_names):
         """Check if user has all of the specified permissions"""
         if self.is_admin:
             return True
-        return all(self.has_permission(p) for p in permission_names)
+        if not self.role_id:
+            return False
+        return self.permission_names.issuperset(permission_names)
 
     def is_account_locked(self):
         """Check if account is currently locked"""
@@ -306,7 +328,9 @@ class Branch(db.Model):
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    # Cached read-only snapshot; see app/identity_cache.py
+    from app.identity_cache import load_identity
+    return load_identity(int(user_id))
 
 # Import Tenant model first
 from app.models_tenant import Tenant
@@ -317,8 +341,11 @@ from app.models_sales import Customer, SalesInvoice, SalesInvoiceItem, Quotation
 from app.models_purchases import Supplier, PurchaseOrder, PurchaseOrderItem, PurchaseInvoice, PurchaseInvoiceItem, PurchaseReturn, PurchaseReturnItem
 from app.models_accounting import Account, JournalEntry, JournalEntryItem, Payment, BankAccount, CostCenter, BankTransaction, Expense
 from app.models_hr import Employee, Department, Position, Attendance, Leave, LeaveType, Payroll
-from app.models_pos import POSSession, POSOrder, POSOrderItem
-from app.models_settings import SystemSettings, AccountingSettings
+from app.models_pos import POSSession, POSSettlementAccrual, POSOrder, POSOrderItem
+from app.models_settings import SystemSettings, AccountingSettings, DocumentSequence
 from app.models_crm import Lead, Interaction, Opportunity, Task, Campaign, Contact
 from app.models_license import License
+from app.models_search import SearchDocument
+from app.models_jobs import Job
 
+from app.models_rollups import DailyRollup
@@ -0,0 +1,65 @@
+from datetime import datetime
+import json
+
+from app import db
+
+
+class Job(db.Model):
+    """A unit of background work run by ``flask jobs worker`` (see app/jobs.py)"""
+    __tablename__ = 'jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    # Multi-Tenant Support
+    tenant_id = db.Column(db.Integer, db.ForeignKey('tenants.id'), nullable=True, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+
+    kind = db.Column(db.String(50), nullable=False)  # export, backup
+    params = db.Column(db.Text, nullable=False, default='{}')  # JSON
+    title = db.Column(db.String(256))
+
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    progress = db.Column(db.Integer, default=0)  # percent
+    message = db.Column(db.String(256))
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, default=0)
+    worker = db.Column(db.String(64))  # host:pid of the worker running it
+
+    # Result file on disk
+    result_path = db.Column(db.String(512))
+    result_name = db.Column(db.String(256))
+    result_mimetype = db.Column(db.String(128))
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)  # last claim or progress report
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_jobs_status_created', 'status', 'created_at'),
+    )
+
+    @property
+    def parameters(self):
+        return json.loads(self.params or '{}')
+
+    @property
+    def is_finished(self):
+        return self.status in ('done', 'failed')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'title': self.title,
+            'status': self.status,
+            'progress': self.progress or 0,
+            'message': self.message,
+            'error': self.error,
+            'result_name': self.result_name,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} {self.status}>'
@@ -61,11 +61,8 @@ def check_license(tenant_id):
     if not tenant_id:
         return False
 
-    lic = License.query.filter_by(tenant_id=tenant_id).first()
-
-    if not lic:
-        return False
-
-    # is_active() also auto-marks the license as 'expired' when end_date passes
-    return lic.is_active()
+    # Cached per tenant; a miss runs is_active(), which also auto-marks the
+    # license as 'expired' when end_date passes
+    from app.license_cache import get_license_status
+    return get_license_status(tenant_id).is_active()
 
@@ -25,6 +25,7 @@ class POSSession(db.Model):
     total_sales = db.Column(db.Float, default=0.0)
     total_cash = db.Column(db.Float, default=0.0)
     total_card = db.Column(db.Float, default=0.0)
+    order_count = db.Column(db.Integer, default=0)  # running totals, see app/pos/totals.py
 
     status = db.Column(db.String(20), default='open')  # open, closed
 
@@ -43,6 +44,32 @@ class POSSession(db.Model):
     def __repr__(self):
         return f'<POSSession {self.session_number}>'
 
+class POSSettlementAccrual(db.Model):
+    """POS deposits not yet posted to the bank (deferred settlement, see app/pos/settlement.py)"""
+    __tablename__ = 'pos_settlement_accruals'
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    # Multi-Tenant Support
+    tenant_id = db.Column(db.Integer, db.ForeignKey('tenants.id'), nullable=True, index=True)
+
+    session_id = db.Column(db.Integer, db.ForeignKey('pos_sessions.id'), nullable=False)
+    payment_method = db.Column(db.String(20), nullable=False)
+    bank_account_id = db.Column(db.Integer, db.ForeignKey('bank_accounts.id'), nullable=False)
+
+    amount = db.Column(db.Float, nullable=False, default=0.0)  # accrued, not yet posted
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+
+    settlements = db.Column(db.Integer, nullable=False, default=0)  # postings made so far
+    settled_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('session_id', 'payment_method', name='uq_pos_accrual_session_method'),
+    )
+
+    def __repr__(self):
+        return f'<POSSettlementAccrual {self.session_id} {self.payment_method}: {self.amount}>'
+
 class POSOrder(db.Model):
     __tablename__ = 'pos_orders'
 
@@ -74,9 +101,13 @@ class POSOrder(db.Model):
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-    # Unique constraint: order_number + tenant_id
+    # Idempotency key generated by the terminal (offline sync, /pos/sync)
+    client_uuid = db.Column(db.String(36))
+
+    # Unique constraints: order_number + tenant_id, client_uuid + tenant_id
     __table_args__ = (
         db.UniqueConstraint('order_number', 'tenant_id', name='uq_pos_order_number_tenant'),
+        db.UniqueConstraint('client_uuid', 'tenant_id', name='uq_pos_order_client_uuid_tenant'),
     )
 
     session = db.relationship('POSSession', backref='orders')
@@ -104,6 +135,8 @@ class POSOrderItem(db.Model):
     tax_rate = db.Column(db.Float, default=15.0)
     tax_amount = db.Column(db.Float, default=0.0)
     total = db.Column(db.Float, default=0.0)
+    # Product cost price when the sale was written (NULL: unknown, use the current one)
+    unit_cost = db.Column(db.Float)
 
     product = db.relationship('Product')
 
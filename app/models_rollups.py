@@ -0,0 +1,32 @@
+from datetime import datetime
+
+from app import db
+
+
+class DailyRollup(db.Model):
+    """Per-day invoice totals of one tenant, warehouse and kind (see app/rollups.py)"""
+    __tablename__ = 'daily_rollups'
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    # Multi-Tenant Support
+    tenant_id = db.Column(db.Integer, db.ForeignKey('tenants.id'), nullable=True)
+
+    day = db.Column(db.Date, nullable=False)
+    warehouse_id = db.Column(db.Integer, db.ForeignKey('warehouses.id'))
+    kind = db.Column(db.String(20), nullable=False)  # sales, pos, purchases
+
+    doc_count = db.Column(db.Integer, nullable=False, default=0)
+    subtotal = db.Column(db.Float, nullable=False, default=0.0)
+    tax_amount = db.Column(db.Float, nullable=False, default=0.0)
+    total_amount = db.Column(db.Float, nullable=False, default=0.0)
+    cogs = db.Column(db.Float, nullable=False, default=0.0)
+
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('tenant_id', 'kind', 'day', 'warehouse_id', name='uq_daily_rollups_key'),
+    )
+
+    def __repr__(self):
+        return f'<DailyRollup {self.kind} {self.day} warehouse={self.warehouse_id}>'
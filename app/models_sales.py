@@ -126,6 +126,8 @@ class SalesInvoiceItem(db.Model):
     tax_rate = db.Column(db.Float, default=15.0)
     tax_amount = db.Column(db.Float, default=0.0)
     total = db.Column(db.Float, default=0.0)
+    # Product cost price when the sale was written (NULL: unknown, use the current one)
+    unit_cost = db.Column(db.Float)
 
     product = db.relationship('Product')
 
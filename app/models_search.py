@@ -0,0 +1,31 @@
+from datetime import datetime
+from app import db
+
+
+class SearchDocument(db.Model):
+    """Normalized search text of one searchable row (see app/search_index.py)"""
+    __tablename__ = 'search_documents'
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    # Multi-Tenant Support
+    tenant_id = db.Column(db.Integer, db.ForeignKey('tenants.id'), nullable=True)
+
+    entity_type = db.Column(db.String(20), nullable=False)  # product, customer, sales_invoice, ...
+    entity_id = db.Column(db.Integer, nullable=False)
+    content = db.Column(db.Text, nullable=False, default='')  # normalize()d field values
+
+    # Shown and ranked by the global search without loading the entity
+    title = db.Column(db.String(256))
+    subtitle = db.Column(db.String(256))
+    doc_date = db.Column(db.DateTime)
+
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('entity_type', 'entity_id', name='uq_search_document_entity'),
+        db.Index('ix_search_documents_tenant_type', 'tenant_id', 'entity_type'),
+    )
+
+    def __repr__(self):
+        return f'<SearchDocument {self.entity_type} {self.entity_id}>'
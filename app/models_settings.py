@@ -90,3 +90,27 @@ class AccountingSettings(db.Model):
     def __repr__(self):
         return f'<AccountingSettings {self.id}>'
 
+
+class DocumentSequence(db.Model):
+    """
+    Per-tenant document number counter (see app/utils/document_numbers.py)
+
+    One row per (tenant, series, period); ``last_value`` is the last number
+    handed out.  tenant_id is 0 for documents created without a tenant so
+    the unique key never contains NULL.
+    """
+    __tablename__ = 'document_sequences'
+
+    id = db.Column(db.Integer, primary_key=True)
+    tenant_id = db.Column(db.Integer, nullable=False, default=0)
+    series = db.Column(db.String(32), nullable=False)
+    period = db.Column(db.String(16), nullable=False, default='')
+    last_value = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('tenant_id', 'series', 'period', name='uq_document_sequence'),
+    )
+
+    def __repr__(self):
+        return f'<DocumentSequence {self.series}/{self.period}: {self.last_value}>'
@@ -6,6 +6,7 @@ from datetime import timedelta
 from app import db
 from app.payment import bp
 from app.models_license import License
+from app.license_cache import invalidate_license
 from app.utils.datetime_helper import utcfromtimestamp, utcnow
 
 
@@ -101,6 +102,7 @@ def success():
                 lic.start_date = utcnow()
                 lic.end_date = _get_local_license_end_date(plan or lic.plan)
                 db.session.commit()
+                invalidate_license(lic.tenant_id)
 
         except stripe.StripeError as e:
             current_app.logger.error(f'Stripe session retrieval error: {e}')
@@ -152,6 +154,7 @@ def _handle_successful_payment(session):
     lic.end_date = _get_local_license_end_date(plan)
 
     db.session.commit()
+    invalidate_license(lic.tenant_id)
     current_app.logger.info(
         f'Webhook: License activated — tenant={tenant_id} plan={plan} '
         f'customer={customer_id} subscription={subscription_id}'
@@ -188,6 +191,7 @@ def _handle_failed_payment(event):
 
     lic.status = 'suspended'
     db.session.commit()
+    invalidate_license(lic.tenant_id)
     current_app.logger.warning(
         f'Webhook: Payment failed (attempt #{attempt_count}) — '
         f'subscription={subscription_id} customer={customer_id} '
@@ -230,6 +234,7 @@ def _handle_payment_succeeded(event):
     lic.status   = 'active'
     lic.end_date = new_end
     db.session.commit()
+    invalidate_license(lic.tenant_id)
     current_app.logger.info(
         f'Webhook: Payment succeeded — subscription={subscription_id} '
         f'tenant={lic.tenant_id}. License renewed until {new_end.date()}.'
@@ -254,6 +259,7 @@ def _handle_subscription_deleted(event):
     if lic:
         lic.status = 'expired'
         db.session.commit()
+        invalidate_license(lic.tenant_id)
         current_app.logger.info(
             f'Webhook: Subscription cancelled — '
             f'subscription={subscription_id} customer={customer_id} tenant={lic.tenant_id}.'
@@ -0,0 +1,95 @@
+"""
+Role Permission Cache
+=====================
+
+Each role's permission names are compiled once into an immutable frozenset
+and cached per process, so User.has_permission() and the permission
+decorators are O(1) set lookups instead of a linear scan over
+``role.permissions`` on every call.
+
+The cache carries a version stamp.  Routes that change roles or their
+permissions (settings.add_role, edit_role, delete_role,
+update_role_permissions) call bump_permissions_version(), which
+invalidates every compiled set in this worker immediately.  Other
+Gunicorn workers pick up the change within PERMISSION_CACHE_TTL seconds.
+settings.add_permission does not bump: a new permission belongs to no
+role until update_role_permissions grants it.
+"""
+
+import threading
+
+from flask import current_app, has_app_context
+
+from app import db
+from app.utils.cache_helper import MISSING, TTLCache
+
+_version_lock = threading.Lock()
+_version = 0
+
+
+def get_permissions_version():
+    """Current permission version stamp of this process"""
+    return _version
+
+
+def bump_permissions_version():
+    """Invalidate every compiled permission set (call after changing roles/permissions)"""
+    global _version
+    with _version_lock:
+        _version += 1
+    cache = get_permission_cache()
+    if cache is not None:
+        cache.clear()
+    return _version
+
+
+def init_permission_cache(app):
+    """Create the per-application role permission cache from config"""
+    cache = TTLCache(
+        max_size=app.config.get('PERMISSION_CACHE_SIZE', 1024),
+        ttl=app.config.get('PERMISSION_CACHE_TTL', 60),
+    )
+    app.extensions['permission_cache'] = cache
+    return cache
+
+
+def get_permission_cache():
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('permission_cache')
+
+
+def _load_permission_names(role_id):
+    from app.models import Permission, RolePermission
+    rows = (db.session.query(Permission.name)
+            .join(RolePermission, RolePermission.permission_id == Permission.id)
+            .filter(RolePermission.role_id == role_id)
+            .all())
+    return frozenset(name for (name,) in rows)
+
+
+def get_role_permissions(role_id, role=None):
+    """
+    Return the frozenset of permission names granted to ``role_id``.
+
+    When the Role instance is already loaded its (eagerly joined)
+    ``permissions`` collection is used instead of issuing a query.
+    """
+    if role_id is None:
+        return frozenset()
+
+    cache = get_permission_cache()
+    key = (role_id, _version)
+    if cache is not None:
+        names = cache.get(key)
+        if names is not MISSING:
+            return names
+
+    if role is not None:
+        names = frozenset(p.name for p in role.permissions)
+    else:
+        names = _load_permission_names(role_id)
+
+    if cache is not None:
+        cache.set(key, names)
+    return names
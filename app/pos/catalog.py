@@ -0,0 +1,171 @@
+"""
+POS Catalog
+===========
+
+Compact product catalog of a POS terminal, served by ``pos.catalog``
+instead of rendering every sellable product into ``pos.index``.
+
+Each product is one array in ``FIELDS`` order; ``stock`` is the quantity
+in the session warehouse (null for products that do not track inventory
+or have no stock row there):
+
+    {"version": "1737630000123456.42", "full": true,
+     "fields": ["id", "code", "barcode", "name", "price", "tax_rate", "stock", "image"],
+     "products": [[7, "P7", "6281000000007", "Tea", 4.5, 15.0, 120.0, null], ...],
+     "removed": []}
+
+The version is "<last change>.<product rows>": the latest
+``Product.updated_at`` / ``Stock.last_updated`` of the warehouse in
+microseconds since the epoch, and the number of product rows.  It is read
+with one query per request and serves as the ETag, so an unchanged
+catalog costs that query and a 304.
+
+A terminal that holds version V asks for ``?since=V`` and gets only the
+products changed after V (``full`` false), with products that stopped
+being sellable listed in ``removed``.  Changes are selected with a small
+overlap before V so rows committed out of timestamp order are not missed;
+applying a product twice is harmless.  When product rows were deleted
+since V the delta cannot express it and a full catalog is returned.
+
+Serialized bodies (plain and gzip) are cached per tenant, warehouse and
+version in ``app.extensions['catalog_cache']``; the version is part of
+the key, so entries never go stale and the TTL only bounds memory.
+"""
+
+import gzip
+import json
+from datetime import datetime, timedelta
+
+from flask import current_app, has_app_context
+from sqlalchemy import and_, case, func, or_
+
+from app import db
+from app.models import Product, Stock
+from app.utils.cache_helper import MISSING, TTLCache
+
+FIELDS = ('id', 'code', 'barcode', 'name', 'price', 'tax_rate', 'stock', 'image')
+
+EPOCH = datetime(1970, 1, 1)
+
+# Rows changed this long before the client's version are sent again
+DELTA_OVERLAP = timedelta(seconds=2)
+
+
+class CatalogBody:
+    """One serialized catalog response"""
+
+    __slots__ = ('etag', 'data', 'gzipped')
+
+    def __init__(self, etag, data):
+        self.etag = etag
+        self.data = data
+        self.gzipped = gzip.compress(data, compresslevel=6)
+
+
+def _timestamp(value):
+    return (value - EPOCH) // timedelta(microseconds=1) if value else 0
+
+
+def catalog_version(warehouse_id):
+    """Return the catalog version of ``warehouse_id`` (one query)"""
+    row = db.session.query(
+        db.session.query(func.max(Product.updated_at)).scalar_subquery(),
+        db.session.query(func.count(Product.id)).scalar_subquery(),
+        db.session.query(func.max(Stock.last_updated))
+        .filter(Stock.warehouse_id == warehouse_id).scalar_subquery(),
+    ).one()
+    return f'{max(_timestamp(row[0]), _timestamp(row[2]))}.{row[1]}'
+
+
+def parse_version(version):
+    """Return ``(changed_at, product_rows)`` of a version string, or None"""
+    try:
+        timestamp, count = (version or '').split('.')
+        return EPOCH + timedelta(microseconds=int(timestamp)), int(count)
+    except ValueError:
+        return None
+
+
+def catalog_etag(warehouse_id, version, since=None):
+    return f'catalog-{warehouse_id}-{version}-{since or "full"}'
+
+
+def _delta_is_complete(since):
+    """True when no product row was deleted after ``since``"""
+    changed_at, count = since
+    current, created = db.session.query(
+        func.count(Product.id),
+        func.sum(case((Product.created_at > changed_at, 1), else_=0)),
+    ).one()
+    return current == count + (created or 0)
+
+
+def build_catalog(warehouse_id, version, since=None):
+    """
+    Serialize the catalog of ``warehouse_id`` at ``version``, the full
+    list or, with ``since`` (a version string), the changes after it.
+    """
+    parsed = parse_version(since) if since else None
+    if parsed is not None and not _delta_is_complete(parsed):
+        parsed = None
+
+    query = (db.session.query(Product.id, Product.code, Product.barcode, Product.name,
+                              Product.selling_price, Product.tax_rate, Product.track_inventory,
+                              Stock.quantity, Product.image, Product.is_active,
+                              Product.is_sellable)
+             .outerjoin(Stock, and_(Stock.product_id == Product.id,
+                                    Stock.warehouse_id == warehouse_id)))
+    if parsed is None:
+        query = query.filter(Product.is_active == True, Product.is_sellable == True)
+    else:
+        cutoff = parsed[0] - DELTA_OVERLAP
+        query = query.filter(or_(Product.updated_at >= cutoff, Stock.last_updated >= cutoff))
+
+    products, removed = [], []
+    for (product_id, code, barcode, name, price, tax_rate, track_inventory, quantity, image,
+         is_active, is_sellable) in query.order_by(Product.name, Product.id):
+        if not (is_active and is_sellable):
+            removed.append(product_id)
+            continue
+        products.append([product_id, code, barcode, name, price or 0.0, tax_rate,
+                         quantity if track_inventory else None, image])
+
+    payload = {
+        'version': version,
+        'full': parsed is None,
+        'fields': FIELDS,
+        'products': products,
+        'removed': removed,
+    }
+    data = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return CatalogBody(catalog_etag(warehouse_id, version, since), data)
+
+
+def init_catalog_cache(app):
+    """Create the per-application serialized catalog cache from config"""
+    cache = TTLCache(
+        max_size=app.config.get('POS_CATALOG_CACHE_SIZE', 256),
+        ttl=app.config.get('POS_CATALOG_CACHE_TTL', 300),
+    )
+    app.extensions['catalog_cache'] = cache
+    return cache
+
+
+def get_catalog_cache():
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('catalog_cache')
+
+
+def get_catalog(tenant_id, warehouse_id, version, since=None):
+    """Return the CatalogBody for ``version``, built once per tenant and warehouse"""
+    cache = get_catalog_cache()
+    if cache is None or cache.ttl <= 0:
+        return build_catalog(warehouse_id, version, since)
+
+    key = (tenant_id, warehouse_id, version, since)
+    body = cache.get(key)
+    if body is MISSING:
+        body = build_catalog(warehouse_id, version, since)
+        cache.set(key, body)
+    return body
@@ -0,0 +1,228 @@
+"""
+POS Checkout
+============
+
+Batched placement of POS orders, shared by ``pos.create_order`` (one cart)
+and ``pos.sync`` (a queue of orders a terminal recorded while offline).
+
+For a batch of carts, whatever its size:
+
+    * one IN (...) query each for sessions (row-locked) and products
+    * one locking query for the stock rows (StockLedger)
+    * one counter update for the order numbers and one for the invoice
+      numbers (unless numbers were assigned beforehand)
+    * batched INSERTs of orders and invoices, and one executemany each for
+      order items, invoice items and stock movements
+    * one executemany UPDATE of the running session totals
+
+Carts are validated in order against the locked stock quantities.  A cart
+asking for more than is left of a tracked product gets ``error`` set and is
+skipped; the others are placed.  Nothing is committed here.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from app import db
+from app.models import (Customer, POSOrder, POSOrderItem, POSSession, Product, SalesInvoice,
+                        SalesInvoiceItem)
+from app.pos.settlement import record_deposits
+from app.pos.totals import add_orders_to_totals
+from app.utils.document_numbers import next_numbers
+from app.utils.stock_ledger import StockLedger
+
+DEFAULT_TAX_RATE = 15.0
+
+
+class Cart:
+    """
+    One order to place: the create-order payload and, once placed, the
+    created ``order`` and ``invoice`` (or the ``error`` that rejected it).
+    """
+
+    def __init__(self, data, order_number=None, client_uuid=None):
+        self.data = data
+        self.order_number = order_number
+        self.client_uuid = client_uuid
+        self.session = None
+        self.order = None
+        self.invoice = None
+        self.error = None
+        # (product_id, quantity, unit_price, total) per line
+        self.lines = [
+            (int(item['productId']), float(item['quantity']), float(item['price']),
+             float(item['price']) * float(item['quantity']))
+            for item in data['items']
+        ]
+
+
+def get_or_create_default_customer():
+    """Get or create default walk-in customer"""
+    default_customer = Customer.query.filter_by(code='WALK-IN').first()
+
+    if not default_customer:
+        default_customer = Customer(
+            code='WALK-IN',
+            name='عميل افتراضي',
+            name_en='Walk-in Customer',
+            phone='0000000000',
+            email='walkin@default.com',
+            is_active=True
+        )
+        db.session.add(default_customer)
+        db.session.flush()  # committed with the caller's document
+
+    return default_customer.id
+
+
+def _validate(carts, products, stocks):
+    """Set ``error`` on carts the locked stock cannot cover; return the others"""
+    remaining = {key: stock.quantity or 0 for key, stock in stocks.items()}
+    accepted = []
+    for cart in carts:
+        if cart.error:
+            continue
+        warehouse_id = cart.session.warehouse_id
+        requested = {}
+        for product_id, quantity, _price, _total in cart.lines:
+            requested[product_id] = requested.get(product_id, 0) + quantity
+        for product_id, qty_requested in requested.items():
+            product = products.get(product_id)
+            if product and product.track_inventory:
+                available = remaining.get((product_id, warehouse_id), 0)
+                if qty_requested > available:
+                    cart.error = (f'الكمية المطلوبة من "{product.name}" ({qty_requested}) '
+                                  f'تتجاوز المخزون المتاح ({available})')
+                    break
+        if cart.error:
+            continue
+        for product_id, qty_requested in requested.items():
+            key = (product_id, warehouse_id)
+            if key in remaining:
+                remaining[key] -= qty_requested
+        accepted.append(cart)
+    return accepted
+
+
+def place_orders(carts, tenant_id, user_id):
+    """
+    Place ``carts`` in the current transaction.
+
+    Returns:
+        The carts that were placed (``order``/``invoice`` set); rejected
+        carts have ``error`` set instead.
+    """
+    session_ids = {int(cart.data['session_id']) for cart in carts}
+    # Locked and re-read: a session closing meanwhile either waits for this
+    # batch (and settles its accruals) or is seen closed here
+    sessions = {s.id: s for s in POSSession.query.filter(POSSession.id.in_(session_ids))
+                .populate_existing().with_for_update()}
+    for cart in carts:
+        cart.session = sessions.get(int(cart.data['session_id']))
+        if cart.session is None:
+            cart.error = 'Session not found'
+
+    default_customer_id = None
+    if any(not cart.error and not cart.data.get('customer_id') for cart in carts):
+        default_customer_id = get_or_create_default_customer()
+
+    products = {p.id: p for p in Product.query.filter(
+        Product.id.in_({line[0] for cart in carts for line in cart.lines})
+    )}
+    ledger = StockLedger('pos_order', tenant_id=tenant_id, user_id=user_id)
+    for cart in carts:
+        if not cart.error:
+            for product_id, quantity, _price, _total in cart.lines:
+                ledger.add(product_id, cart.session.warehouse_id, -quantity)
+    accepted = _validate(carts, products, ledger.lock())
+    if not accepted:
+        return []
+
+    # Numbers are taken only for accepted carts, so rejected ones leave no gap
+    unnumbered = [cart for cart in accepted if not cart.order_number]
+    for cart, number in zip(unnumbered, next_numbers('pos_order', len(unnumbered),
+                                                     tenant_id=tenant_id)):
+        cart.order_number = number
+    invoice_numbers = next_numbers('sales_invoice', len(accepted), tenant_id=tenant_id)
+
+    for cart in accepted:
+        data = cart.data
+        cart.order = POSOrder(
+            order_number=cart.order_number,
+            session_id=cart.session.id,
+            customer_id=data.get('customer_id'),
+            subtotal=data['subtotal'],
+            discount_amount=data['discount_amount'],
+            tax_amount=data['tax_amount'],
+            total_amount=data['total_amount'],
+            payment_method=data['payment_method'],
+            cash_amount=data['cash_amount'],
+            card_amount=data['card_amount'],
+            change_amount=max(0, data['cash_amount'] - data['total_amount']) if data['payment_method'] == 'cash' else 0,
+            status='completed',
+            client_uuid=cart.client_uuid,
+            tenant_id=tenant_id
+        )
+    db.session.add_all([cart.order for cart in accepted])
+    db.session.flush()
+
+    today = datetime.utcnow().date()
+    for cart, invoice_number in zip(accepted, invoice_numbers):
+        data = cart.data
+        cart.invoice = SalesInvoice(
+            invoice_number=invoice_number,
+            invoice_date=today,
+            customer_id=data.get('customer_id') or default_customer_id,
+            warehouse_id=cart.session.warehouse_id,
+            bank_account_id=cart.session.bank_account_id,  # Link to session's bank account
+            subtotal=data['subtotal'],
+            discount_amount=data['discount_amount'],
+            tax_amount=data['tax_amount'],
+            total_amount=data['total_amount'],
+            paid_amount=data['total_amount'],  # Fully paid in POS
+            remaining_amount=0.0,
+            notes=f'Invoice from POS - Order {cart.order_number}',
+            pos_order_id=cart.order.id,
+            user_id=user_id,
+            tenant_id=tenant_id,
+            status='paid'
+        )
+    db.session.add_all([cart.invoice for cart in accepted])
+    db.session.flush()
+
+    # Order items, invoice items and stock movements: one executemany each
+    order_items, invoice_items = [], []
+    ledger.lines = []
+    for cart in accepted:
+        for product_id, quantity, price, total in cart.lines:
+            product = products.get(product_id)
+            tax_rate = product.tax_rate if product else DEFAULT_TAX_RATE
+            unit_cost = product.cost_price if product else None
+            order_items.append(dict(
+                order_id=cart.order.id, product_id=product_id, quantity=quantity,
+                unit_price=price, unit_cost=unit_cost, total=total, tenant_id=tenant_id,
+            ))
+            invoice_items.append(dict(
+                invoice_id=cart.invoice.id, product_id=product_id,
+                description=product.name if product else '',
+                quantity=quantity, unit_price=price, unit_cost=unit_cost,
+                discount_percentage=0.0, discount_amount=0.0,
+                tax_rate=tax_rate, tax_amount=total * (tax_rate / 100),
+                total=total, tenant_id=tenant_id,
+            ))
+            ledger.add(product_id, cart.session.warehouse_id, -quantity,
+                       notes=f'Sale from POS - Order {cart.order_number}',
+                       reference_id=cart.order.id)
+    db.session.execute(insert(POSOrderItem), order_items)
+    db.session.execute(insert(SalesInvoiceItem), invoice_items)
+
+    # Update stock (products without a stock row in the warehouse are not tracked there)
+    ledger.post(create_missing=False)
+
+    add_orders_to_totals(accepted)
+
+    # Bank deposits: per order, or accrued per session (POS_BANK_SETTLEMENT)
+    record_deposits(accepted, tenant_id)
+
+    return accepted
@@ -3,48 +3,20 @@ from flask_login import login_required, current_user
 from flask_babel import gettext as _
 from app.pos import bp
 from app import db
-from app.models import POSSession, POSOrder, POSOrderItem, Product, Customer, Warehouse, Company, BankAccount
-from app.models import SalesInvoice, SalesInvoiceItem, Stock, StockMovement
+from app.models import POSSession, POSOrder, POSOrderItem, Product, Customer, Warehouse, BankAccount
+from app.models import SalesInvoice, SalesInvoiceItem
 from app.utils.bank_helper import create_bank_transaction, reverse_bank_transaction
+from app.utils.document_numbers import next_number, release_blocks
+from app.pos.catalog import catalog_etag, catalog_version, get_catalog
+from app.pos.checkout import Cart, get_or_create_default_customer, place_orders
+from app.pos.settlement import settle_session
+from app.pos.totals import reconcile_session_totals, session_totals
 from app.auth.decorators import permission_required, any_permission_required
+from app.company_settings import get_company, get_company_settings
 from app.tenant_mixin import TenantMixin
 from datetime import datetime
-
-def _generate_invoice_number():
-    """Generate unique invoice number for POS sales"""
-    today = datetime.utcnow()
-    prefix = f'INV{today.year}{today.month:02d}'
-    last_invoice = SalesInvoice.query.filter(
-        SalesInvoice.invoice_number.like(f'{prefix}%')
-    ).order_by(SalesInvoice.id.desc()).first()
-
-    if last_invoice:
-        last_num = int(last_invoice.invoice_number[-4:])
-        invoice_number = f'{prefix}{(last_num + 1):04d}'
-    else:
-        invoice_number = f'{prefix}0001'
-
-    return invoice_number
-
-def _get_or_create_default_customer():
-    """Get or create default walk-in customer"""
-    # Try to find existing default customer
-    default_customer = Customer.query.filter_by(code='WALK-IN').first()
-
-    if not default_customer:
-        # Create default walk-in customer
-        default_customer = Customer(
-            code='WALK-IN',
-            name='عميل افتراضي',
-            name_en='Walk-in Customer',
-            phone='0000000000',
-            email='walkin@default.com',
-            is_active=True
-        )
-        db.session.add(default_customer)
-        db.session.commit()
-
-    return default_customer.id
+from sqlalchemy.exc import IntegrityError
+import uuid
 
 @bp.route('/')
 @login_required
@@ -60,43 +32,63 @@ def index():
     if not open_session:
         return redirect(url_for('pos.open_session'))
 
-    products = Product.query.filter_by(is_active=True, is_sellable=True).all()
     customers = Customer.query.filter_by(is_active=True).all()
 
     # Get company settings for currency and tax
-    company = Company.query.first()
-    currency_code = company.currency if company else current_app.config.get('DEFAULT_CURRENCY', 'SAR')
-    currency_symbol = current_app.config['CURRENCIES'].get(currency_code, {}).get('symbol', 'ر.س')
+    company = get_company()
+    settings = get_company_settings()
+    currency_code = settings.currency_code
+    currency_symbol = settings.currency_symbol
     tax_rate = company.tax_rate if company else 15.0
 
     return render_template('pos/index.html',
                          pos_session=open_session,
-                         products=products,
                          customers=customers,
                          company=company,
                          currency_code=currency_code,
                          currency_symbol=currency_symbol,
                          tax_rate=tax_rate)
 
+@bp.route('/catalog')
+@login_required
+@permission_required('pos.access')
+def catalog():
+    """Compact product catalog of the session warehouse (see app/pos/catalog.py)"""
+    session_id = request.args.get('session_id', type=int)
+    query = POSSession.query.filter_by(status='open')
+    if session_id:
+        query = query.filter_by(id=session_id)
+    else:
+        query = query.filter_by(cashier_id=current_user.id)
+    pos_session = query.first()
+    if pos_session is None:
+        return jsonify({'success': False, 'error': 'No open session'}), 404
+
+    warehouse_id = pos_session.warehouse_id
+    since = request.args.get('since') or None
+    version = catalog_version(warehouse_id)
+
+    etag = catalog_etag(warehouse_id, version, since)
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        body = get_catalog(TenantMixin.get_current_tenant_id(), warehouse_id, version, since)
+        if request.accept_encodings['gzip']:
+            response = current_app.response_class(body.gzipped, mimetype='application/json')
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response = current_app.response_class(body.data, mimetype='application/json')
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
+
 @bp.route('/open-session', methods=['GET', 'POST'])
 @login_required
 @permission_required('pos.sessions.open')
 def open_session():
     """Open new POS session"""
     if request.method == 'POST':
-        # Generate session number
-        today = datetime.utcnow()
-        prefix = f'POS{today.year}{today.month:02d}{today.day:02d}'
-        last_session = POSSession.query.filter(
-            POSSession.session_number.like(f'{prefix}%')
-        ).order_by(POSSession.id.desc()).first()
-
-        if last_session:
-            last_num = int(last_session.session_number[-3:])
-            session_number = f'{prefix}{(last_num + 1):03d}'
-        else:
-            session_number = f'{prefix}001'
-
         # Get tenant_id from TenantMixin (uses g.current_tenant_id or current_user.tenant_id)
         tenant_id = TenantMixin.get_current_tenant_id()
 
@@ -104,6 +96,9 @@ def open_session():
         if tenant_id is None and hasattr(current_user, 'tenant_id'):
             tenant_id = current_user.tenant_id
 
+        # Generate session number
+        session_number = next_number('pos_session', tenant_id=tenant_id)
+
         session = POSSession(
             session_number=session_number,
             cashier_id=current_user.id,
@@ -138,12 +133,13 @@ def close_session(id):
     session.closing_time = datetime.utcnow()
     session.closing_balance = request.form.get('closing_balance', 0, type=float)
     session.status = 'closed'
+    release_blocks(('pos_session', session.id))
     
-    # Calculate totals
-    orders = POSOrder.query.filter_by(session_id=session.id, status='completed').all()
-    session.total_sales = sum(order.total_amount for order in orders)
-    session.total_cash = sum(order.cash_amount for order in orders)
-    session.total_card = sum(order.card_amount for order in orders)
+    # Reconcile the running totals with the orders (one aggregate query)
+    reconcile_session_totals(session)
+
+    # Post the deposits accrued under deferred settlement
+    settle_session(session)
     
     db.session.commit()
     
@@ -161,9 +157,9 @@ def sessions():
     )
 
     # Get company settings for currency
-    company = Company.query.first()
-    currency_code = company.currency if company else current_app.config.get('DEFAULT_CURRENCY', 'SAR')
-    currency_symbol = current_app.config['CURRENCIES'].get(currency_code, {}).get('symbol', 'ر.س')
+    settings = get_company_settings()
+    currency_code = settings.currency_code
+    currency_symbol = settings.currency_symbol
 
     return render_template('pos/sessions.html', sessions=sessions, currency_symbol=currency_symbol)
 
@@ -175,14 +171,22 @@ def session_details(id):
     pos_session = POSSession.query.get_or_404(id)
 
     # Get company settings for currency
-    company = Company.query.first()
-    currency_code = company.currency if company else current_app.config.get('DEFAULT_CURRENCY', 'SAR')
-    currency_symbol = current_app.config['CURRENCIES'].get(currency_code, {}).get('symbol', 'ر.س')
+    settings = get_company_settings()
+    currency_code = settings.currency_code
+    currency_symbol = settings.currency_symbol
 
     return render_template('pos/session_details.html',
                          pos_session=pos_session,
                          currency_symbol=currency_symbol)
 
+@bp.route('/session/<int:id>/totals')
+@login_required
+@permission_required('pos.access')
+def session_totals_api(id):
+    """Running totals of a session for the X-report (API endpoint)"""
+    pos_session = POSSession.query.get_or_404(id)
+    return jsonify(session_totals(pos_session))
+
 @bp.route('/delete-session/<int:id>', methods=['POST'])
 @login_required
 @permission_required('pos.sessions.close')
@@ -219,19 +223,6 @@ def create_order():
     try:
         data = request.get_json()
 
-        # Generate order number
-        today = datetime.utcnow()
-        prefix = f'ORD{today.year}{today.month:02d}{today.day:02d}'
-        last_order = POSOrder.query.filter(
-            POSOrder.order_number.like(f'{prefix}%')
-        ).order_by(POSOrder.id.desc()).first()
-
-        if last_order:
-            last_num = int(last_order.order_number[-4:])
-            order_number = f'{prefix}{(last_num + 1):04d}'
-        else:
-            order_number = f'{prefix}0001'
-
         # Get tenant_id from TenantMixin (uses g.current_tenant_id or current_user.tenant_id)
         tenant_id = TenantMixin.get_current_tenant_id()
 
@@ -239,151 +230,19 @@ def create_order():
         if tenant_id is None and hasattr(current_user, 'tenant_id'):
             tenant_id = current_user.tenant_id
 
-        # Create order
-        order = POSOrder(
-            order_number=order_number,
-            session_id=data['session_id'],
-            customer_id=data.get('customer_id'),
-            subtotal=data['subtotal'],
-            discount_amount=data['discount_amount'],
-            tax_amount=data['tax_amount'],
-            total_amount=data['total_amount'],
-            payment_method=data['payment_method'],
-            cash_amount=data['cash_amount'],
-            card_amount=data['card_amount'],
-            change_amount=max(0, data['cash_amount'] - data['total_amount']) if data['payment_method'] == 'cash' else 0,
-            status='completed',
-            tenant_id=tenant_id
+        # Generate order number (optionally from a block reserved for the session)
+        order_number = next_number(
+            'pos_order', tenant_id=tenant_id,
+            block_scope=('pos_session', int(data['session_id'])),
+            block_size=current_app.config.get('POS_NUMBER_BLOCK_SIZE', 0),
         )
 
-        db.session.add(order)
-        db.session.flush()
-
-        # Add order items
-        session = POSSession.query.get(data['session_id'])
-
-        # ── Stock pre-validation for POS ─────────────────────────────────
-        from app.models_inventory import Product as ProductModel
-        for item_data in data['items']:
-            product = ProductModel.query.get(item_data['productId'])
-            if product and product.track_inventory and session:
-                qty_requested = float(item_data['quantity'])
-                stock_check = Stock.query.filter_by(
-                    product_id=item_data['productId'],
-                    warehouse_id=session.warehouse_id
-                ).first()
-                available = stock_check.quantity if stock_check else 0
-                if qty_requested > available:
-                    db.session.rollback()
-                    return jsonify({
-                        'success': False,
-                        'error': f'الكمية المطلوبة من "{product.name}" ({qty_requested}) تتجاوز المخزون المتاح ({available})'
-                    }), 400
-        # ─────────────────────────────────────────────────────────────────
-
-        for item_data in data['items']:
-            item = POSOrderItem(
-                order_id=order.id,
-                product_id=item_data['productId'],
-                quantity=item_data['quantity'],
-                unit_price=item_data['price'],
-                total=item_data['price'] * item_data['quantity'],
-                tenant_id=tenant_id
-            )
-            db.session.add(item)
-
-            # Update stock
-            stock = Stock.query.filter_by(
-                product_id=item_data['productId'],
-                warehouse_id=session.warehouse_id
-            ).first()
-
-            if stock:
-                stock.quantity -= item_data['quantity']
-
-                # Create stock movement
-                movement = StockMovement(
-                    product_id=item_data['productId'],
-                    warehouse_id=session.warehouse_id,
-                    movement_type='out',
-                    quantity=item_data['quantity'],
-                    reference_type='pos_order',
-                    reference_id=order.id,
-                    notes=f'Sale from POS - Order {order_number}',
-                    user_id=current_user.id,
-                    tenant_id=tenant_id
-                )
-                db.session.add(movement)
-
-        # ✅ Create Sales Invoice automatically
-        invoice_number = _generate_invoice_number()
-
-        # Get customer_id or use default walk-in customer
-        customer_id = data.get('customer_id')
-        if not customer_id:
-            customer_id = _get_or_create_default_customer()
-
-        invoice = SalesInvoice(
-            invoice_number=invoice_number,
-            invoice_date=datetime.utcnow().date(),
-            customer_id=customer_id,
-            warehouse_id=session.warehouse_id,
-            bank_account_id=session.bank_account_id,  # Link to session's bank account
-            subtotal=data['subtotal'],
-            discount_amount=data['discount_amount'],
-            tax_amount=data['tax_amount'],
-            total_amount=data['total_amount'],
-            paid_amount=data['total_amount'],  # Fully paid in POS
-            remaining_amount=0.0,  # No remaining amount
-            notes=f'Invoice from POS - Order {order_number}',
-            pos_order_id=order.id,
-            user_id=current_user.id,
-            tenant_id=tenant_id,  # ✅ Add tenant_id
-            status='paid'  # Automatically mark as paid
-        )
-
-        db.session.add(invoice)
-        db.session.flush()
-
-        # Add invoice items from POS order items
-        for item_data in data['items']:
-            product = Product.query.get(item_data['productId'])
-            item_total = item_data['price'] * item_data['quantity']
-
-            # Calculate tax for this item
-            tax_rate = product.tax_rate if product else 15.0
-            item_tax = item_total * (tax_rate / 100)
-
-            invoice_item = SalesInvoiceItem(
-                invoice_id=invoice.id,
-                product_id=item_data['productId'],
-                description=product.name if product else '',
-                quantity=item_data['quantity'],
-                unit_price=item_data['price'],
-                discount_percentage=0.0,
-                discount_amount=0.0,
-                tax_rate=tax_rate,
-                tax_amount=item_tax,
-                total=item_total,
-                tenant_id=tenant_id  # ✅ Add tenant_id
-            )
-            db.session.add(invoice_item)
-
-        # Update bank account balance if session has bank_account_id
-        if session.bank_account_id:
-            try:
-                bank_transaction = create_bank_transaction(
-                    bank_account_id=session.bank_account_id,
-                    transaction_type='deposit',
-                    amount=data['total_amount'],
-                    reference_type='pos_order',
-                    reference_id=order.id,
-                    description=f'POS Sales - Order {order_number}'
-                )
-                if not bank_transaction:
-                    print(f"Warning: Bank transaction was not created for POS order {order_number}")
-            except Exception as be:
-                print(f"Bank transaction error for POS order {order_number}: {str(be)}")
+        cart = Cart(data, order_number=order_number)
+        place_orders([cart], tenant_id, current_user.id)
+        if cart.error:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': cart.error}), 400
+        order, invoice = cart.order, cart.invoice
 
         db.session.commit()
 
@@ -392,7 +251,7 @@ def create_order():
             'order_id': order.id,
             'order_number': order.order_number,
             'invoice_id': invoice.id,
-            'invoice_number': invoice_number
+            'invoice_number': invoice.invoice_number
         })
 
     except Exception as e:
@@ -402,6 +261,121 @@ def create_order():
             'message': str(e)
         }), 400
 
+SYNC_ORDER_FIELDS = ('session_id', 'items', 'subtotal', 'discount_amount', 'tax_amount',
+                     'total_amount', 'payment_method', 'cash_amount', 'card_amount')
+
+
+def _sync_result(client_uuid, status, order=None, invoice=None, error=None):
+    result = {'client_uuid': client_uuid, 'status': status}
+    if order is not None:
+        result.update(order_id=order.id, order_number=order.order_number,
+                      invoice_id=invoice.id if invoice else None,
+                      invoice_number=invoice.invoice_number if invoice else None)
+    if error:
+        result['error'] = error
+    return result
+
+
+@bp.route('/sync', methods=['POST'])
+@login_required
+@permission_required('pos.orders.create')
+def sync_orders():
+    """
+    Apply a batch of orders queued by an offline terminal.
+
+    Body: {"orders": [<create-order payload> + "client_uuid"]}.  Each order
+    is identified by its client-generated UUID; orders already received
+    (same UUID) are reported as duplicates instead of being placed again,
+    so a terminal can safely resend a batch.  All new orders are placed in
+    one transaction and every order gets a result, in request order:
+    created, duplicate or rejected (with ``error``).
+    """
+    data = request.get_json(silent=True) or {}
+    orders = data.get('orders')
+    if not isinstance(orders, list):
+        return jsonify({'success': False, 'message': 'orders must be a list'}), 400
+    max_orders = current_app.config.get('POS_SYNC_MAX_ORDERS', 500)
+    if len(orders) > max_orders:
+        return jsonify({'success': False,
+                        'message': f'At most {max_orders} orders per sync'}), 400
+
+    tenant_id = TenantMixin.get_current_tenant_id()
+    if tenant_id is None and hasattr(current_user, 'tenant_id'):
+        tenant_id = current_user.tenant_id
+
+    results = [None] * len(orders)
+    carts, positions, seen = [], {}, {}
+    for index, order_data in enumerate(orders):
+        client_uuid = order_data.get('client_uuid') if isinstance(order_data, dict) else None
+        try:
+            client_uuid = str(uuid.UUID(str(client_uuid)))
+        except ValueError:
+            results[index] = _sync_result(client_uuid, 'rejected', error='Invalid client_uuid')
+            continue
+        if client_uuid in seen:
+            seen[client_uuid].append(index)
+            continue
+        seen[client_uuid] = [index]
+        missing = [field for field in SYNC_ORDER_FIELDS if field not in order_data]
+        if missing:
+            results[index] = _sync_result(client_uuid, 'rejected',
+                                          error='Missing fields: ' + ', '.join(missing))
+            continue
+        try:
+            cart = Cart(order_data, client_uuid=client_uuid)
+        except (KeyError, TypeError, ValueError) as e:
+            results[index] = _sync_result(client_uuid, 'rejected', error=f'Invalid items: {e}')
+            continue
+        carts.append(cart)
+        positions[client_uuid] = index
+
+    try:
+        # Orders already received, found through the (client_uuid, tenant_id) unique index
+        existing = {}
+        if carts:
+            existing = {o.client_uuid: o for o in POSOrder.query.filter(
+                POSOrder.client_uuid.in_([cart.client_uuid for cart in carts])
+            )}
+        invoices = {}
+        if existing:
+            invoices = {i.pos_order_id: i for i in SalesInvoice.query.filter(
+                SalesInvoice.pos_order_id.in_([o.id for o in existing.values()])
+            )}
+        for cart in carts:
+            order = existing.get(cart.client_uuid)
+            if order is not None:
+                results[positions[cart.client_uuid]] = _sync_result(
+                    cart.client_uuid, 'duplicate', order, invoices.get(order.id))
+
+        new_carts = [cart for cart in carts if cart.client_uuid not in existing]
+        if new_carts:
+            place_orders(new_carts, tenant_id, current_user.id)
+        # Collected before commit, which expires the new orders and invoices
+        for cart in new_carts:
+            if cart.error:
+                result = _sync_result(cart.client_uuid, 'rejected', error=cart.error)
+            else:
+                result = _sync_result(cart.client_uuid, 'created', cart.order, cart.invoice)
+            results[positions[cart.client_uuid]] = result
+        db.session.commit()
+    except IntegrityError:
+        # The same order arrived concurrently through another request
+        db.session.rollback()
+        return jsonify({'success': False,
+                        'message': 'Orders were submitted concurrently, retry the sync'}), 409
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    # Repeats of a UUID within the batch report the first occurrence as a duplicate
+    for client_uuid, indexes in seen.items():
+        first = results[indexes[0]]
+        status = 'rejected' if first['status'] == 'rejected' else 'duplicate'
+        for index in indexes[1:]:
+            results[index] = dict(first, status=status)
+
+    return jsonify({'success': True, 'results': results})
+
 @bp.route('/print-receipt/<int:order_id>')
 @login_required
 @permission_required('pos.access')
@@ -410,11 +384,12 @@ def print_receipt(order_id):
     order = POSOrder.query.get_or_404(order_id)
 
     # Get company settings
-    company = Company.query.first()
+    company = get_company()
+    settings = get_company_settings()
 
     # Get currency settings
-    currency_code = company.currency if company else current_app.config.get('DEFAULT_CURRENCY', 'SAR')
-    currency_symbol = current_app.config['CURRENCIES'].get(currency_code, {}).get('symbol', 'ر.س')
+    currency_code = settings.currency_code
+    currency_symbol = settings.currency_symbol
 
     return render_template('pos/receipt.html',
                          order=order,
@@ -457,7 +432,7 @@ def create_quotation():
         # Get customer_id or use default walk-in customer
         customer_id = data.get('customer_id')
         if not customer_id:
-            customer_id = _get_or_create_default_customer()
+            customer_id = get_or_create_default_customer()
 
         # Create quotation
         quotation = Quotation(
@@ -531,9 +506,10 @@ def print_quotation(quotation_id):
     quotation = Quotation.query.get_or_404(quotation_id)
 
     # Get company settings for currency
-    company = Company.query.first()
-    currency_code = company.currency if company else current_app.config.get('DEFAULT_CURRENCY', 'SAR')
-    currency_symbol = current_app.config['CURRENCIES'].get(currency_code, {}).get('symbol', 'ر.س')
+    company = get_company()
+    settings = get_company_settings()
+    currency_code = settings.currency_code
+    currency_symbol = settings.currency_symbol
 
     return render_template('pos/quotation.html',
                          quotation=quotation,
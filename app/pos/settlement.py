@@ -0,0 +1,171 @@
+"""
+POS Bank Settlement
+===================
+
+How POS sales reach the session's bank account, chosen by
+POS_BANK_SETTLEMENT:
+
+    per_order   one create_bank_transaction() per order (default).  Every
+                sale updates the same BankAccount and Account rows.
+    deferred    orders only add to a per-session, per-payment-method
+                accrual row (one UPDATE ``amount = amount + :x``).  The
+                accruals are posted as one bank transaction each when the
+                session closes, and, if POS_SETTLEMENT_INTERVAL (minutes)
+                is set, by the first checkout after an accrual has waited
+                that long.  Orders placed in a session that is already
+                closed (an offline terminal syncing late) are posted per
+                order, as no close is left to settle them.
+
+A settlement claims an accrual with ``UPDATE ... SET amount = amount - :x,
+settlements = settlements + 1 WHERE settlements = :seen``, before posting
+it.  Orders accrued meanwhile stay on the row, and two concurrent
+settlements cannot post the same amount twice.
+"""
+
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import bindparam, update
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import POSSettlementAccrual
+from app.utils.bank_helper import create_bank_transaction
+
+PER_ORDER = 'per_order'
+DEFERRED = 'deferred'
+
+
+def settlement_mode():
+    return current_app.config.get('POS_BANK_SETTLEMENT', PER_ORDER)
+
+
+def record_deposits(carts, tenant_id=None):
+    """Book the deposits of placed carts according to the settlement mode"""
+    carts = [cart for cart in carts if cart.session.bank_account_id]
+    if not carts:
+        return
+    if settlement_mode() == DEFERRED:
+        accruing = [cart for cart in carts if cart.session.status == 'open']
+        if accruing:
+            accrue_deposits(accruing, tenant_id)
+        post_order_deposits([cart for cart in carts if cart.session.status != 'open'])
+    else:
+        post_order_deposits(carts)
+
+
+def post_order_deposits(carts):
+    """One bank transaction per order"""
+    for cart in carts:
+        try:
+            bank_transaction = create_bank_transaction(
+                bank_account_id=cart.session.bank_account_id,
+                transaction_type='deposit',
+                amount=cart.data['total_amount'],
+                reference_type='pos_order',
+                reference_id=cart.order.id,
+                description=f'POS Sales - Order {cart.order_number}'
+            )
+            if not bank_transaction:
+                current_app.logger.warning('Bank transaction was not created for POS order %s',
+                                           cart.order_number)
+        except Exception:
+            current_app.logger.exception('Bank transaction error for POS order %s',
+                                         cart.order_number)
+
+
+def _create_accruals(connection, rows):
+    """Insert zero accrual rows, tolerating concurrent inserts of the same key"""
+    table = POSSettlementAccrual.__table__
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        connection.execute(insert(table).on_conflict_do_nothing(), rows)
+        return
+    for row in rows:
+        try:
+            with connection.begin_nested():
+                connection.execute(table.insert().values(**row))
+        except IntegrityError:
+            pass
+
+
+def accrue_deposits(carts, tenant_id=None):
+    """Add the carts' totals to their session accruals, settling the ones that are due"""
+    accrued = {}
+    for cart in carts:
+        key = (cart.session.id, cart.order.payment_method or 'cash')
+        amount, count, bank_account_id = accrued.get(key, (0.0, 0, cart.session.bank_account_id))
+        accrued[key] = (amount + cart.data['total_amount'], count + 1, bank_account_id)
+
+    connection = db.session.connection()
+    now = datetime.utcnow()
+    _create_accruals(connection, [
+        dict(tenant_id=tenant_id, session_id=session_id, payment_method=method,
+             bank_account_id=bank_account_id, amount=0.0, order_count=0,
+             settlements=0, settled_at=now)
+        for (session_id, method), (_amount, _count, bank_account_id) in accrued.items()
+    ])
+    table = POSSettlementAccrual.__table__
+    connection.execute(
+        update(table)
+        .where(table.c.session_id == bindparam('b_session_id'),
+               table.c.payment_method == bindparam('b_method'))
+        .values(amount=table.c.amount + bindparam('b_amount'),
+                order_count=table.c.order_count + bindparam('b_count')),
+        [dict(b_session_id=session_id, b_method=method, b_amount=amount, b_count=count)
+         for (session_id, method), (amount, count, _bank_account_id) in accrued.items()]
+    )
+
+    interval = current_app.config.get('POS_SETTLEMENT_INTERVAL', 0)
+    if interval > 0:
+        due = _pending().filter(
+            POSSettlementAccrual.session_id.in_({key[0] for key in accrued}),
+            POSSettlementAccrual.settled_at <= now - timedelta(minutes=interval),
+        )
+        for accrual in due.all():
+            _settle(accrual, now)
+
+
+def settle_session(pos_session):
+    """Post every pending accrual of ``pos_session``; returns the bank transactions"""
+    accruals = _pending().filter(POSSettlementAccrual.session_id == pos_session.id).all()
+    now = datetime.utcnow()
+    transactions = [_settle(accrual, now, pos_session.session_number) for accrual in accruals]
+    return [transaction for transaction in transactions if transaction is not None]
+
+
+def _pending():
+    """Accrual rows (as plain rows, never stale ORM objects) with unposted orders"""
+    return (db.session.query(POSSettlementAccrual.id, POSSettlementAccrual.session_id,
+                             POSSettlementAccrual.payment_method,
+                             POSSettlementAccrual.bank_account_id, POSSettlementAccrual.amount,
+                             POSSettlementAccrual.order_count, POSSettlementAccrual.settlements)
+            .filter(POSSettlementAccrual.order_count > 0))
+
+
+def _settle(accrual, now, session_number=None):
+    """Claim the amount read in ``accrual`` and post it as one bank deposit"""
+    amount, count = accrual.amount, accrual.order_count
+    table = POSSettlementAccrual.__table__
+    claimed = db.session.connection().execute(
+        update(table)
+        .where(table.c.id == accrual.id, table.c.settlements == accrual.settlements)
+        .values(amount=table.c.amount - amount, order_count=table.c.order_count - count,
+                settlements=table.c.settlements + 1, settled_at=now)
+    ).rowcount
+    if not claimed:
+        return None  # settled concurrently
+
+    label = session_number or accrual.session_id
+    return create_bank_transaction(
+        bank_account_id=accrual.bank_account_id,
+        transaction_type='deposit',
+        amount=amount,
+        reference_type='pos_session',
+        reference_id=accrual.session_id,
+        description=f'POS Sales - Session {label} ({accrual.payment_method}, {count} orders)'
+    )
@@ -0,0 +1,87 @@
+"""
+POS Session Totals
+==================
+
+Running sales figures of a POS session (sales, cash, card, order count),
+kept on the ``pos_sessions`` row so the X-report and the close of a long
+shift do not load every order of the session.
+
+    * add_orders_to_totals(carts)   called by place_orders: one UPDATE
+                                    ``SET total = total + :amount`` per
+                                    session, in the order's transaction,
+                                    so concurrent terminals cannot lose an
+                                    increment
+    * reconcile_session_totals(s)   re-derives the figures from the
+                                    completed orders with one aggregate
+                                    query (run at close)
+    * session_totals(s)             the figures as a dict (X-report)
+
+``total_cash`` is the cash tendered, as before: the sum of
+``POSOrder.cash_amount``.
+"""
+
+from sqlalchemy import bindparam, func, update
+
+from app import db
+from app.models import POSOrder, POSSession
+
+TOTAL_COLUMNS = ('total_sales', 'total_cash', 'total_card', 'order_count')
+
+
+def add_orders_to_totals(carts):
+    """Add placed carts (``order`` set) to the running totals of their sessions"""
+    increments = {}
+    for cart in carts:
+        order = cart.order
+        sales, cash, card, count = increments.get(cart.session.id, (0.0, 0.0, 0.0, 0))
+        increments[cart.session.id] = (sales + (order.total_amount or 0),
+                                       cash + (order.cash_amount or 0),
+                                       card + (order.card_amount or 0),
+                                       count + 1)
+    if not increments:
+        return
+
+    table = POSSession.__table__
+    statement = (update(table)
+                 .where(table.c.id == bindparam('session_id'))
+                 .values(total_sales=func.coalesce(table.c.total_sales, 0) + bindparam('sales'),
+                         total_cash=func.coalesce(table.c.total_cash, 0) + bindparam('cash'),
+                         total_card=func.coalesce(table.c.total_card, 0) + bindparam('card'),
+                         order_count=func.coalesce(table.c.order_count, 0) + bindparam('count')))
+    db.session.connection().execute(statement, [
+        dict(session_id=session_id, sales=sales, cash=cash, card=card, count=count)
+        for session_id, (sales, cash, card, count) in increments.items()
+    ])
+    for cart in carts:
+        db.session.expire(cart.session, TOTAL_COLUMNS)
+
+
+def reconcile_session_totals(pos_session):
+    """Recompute the totals of ``pos_session`` from its completed orders (one query)"""
+    count, sales, cash, card = db.session.query(
+        func.count(POSOrder.id),
+        func.coalesce(func.sum(POSOrder.total_amount), 0.0),
+        func.coalesce(func.sum(POSOrder.cash_amount), 0.0),
+        func.coalesce(func.sum(POSOrder.card_amount), 0.0),
+    ).filter(POSOrder.session_id == pos_session.id, POSOrder.status == 'completed').one()
+    pos_session.order_count = count
+    pos_session.total_sales = sales
+    pos_session.total_cash = cash
+    pos_session.total_card = card
+    return session_totals(pos_session)
+
+
+def session_totals(pos_session):
+    """X-report figures of ``pos_session`` from its running totals"""
+    total_cash = pos_session.total_cash or 0.0
+    return {
+        'session_id': pos_session.id,
+        'session_number': pos_session.session_number,
+        'status': pos_session.status,
+        'order_count': pos_session.order_count or 0,
+        'total_sales': pos_session.total_sales or 0.0,
+        'total_cash': total_cash,
+        'total_card': pos_session.total_card or 0.0,
+        'opening_balance': pos_session.opening_balance or 0.0,
+        'expected_cash': (pos_session.opening_balance or 0.0) + total_cash,
+    }
@@ -0,0 +1,211 @@
+"""
+Product Lookup Index
+====================
+
+Per-tenant in-memory hash index of active products by barcode and by code,
+used by ``/inventory/api/lookup`` so a scanned code resolves with two dict
+lookups instead of a ``LIKE`` query or the browser's full product list.
+
+Codes are unique per tenant; barcodes are not (migration 7da640fe5dae
+dropped that constraint), so a barcode shared by several active products
+resolves to the one with the lowest id, whatever order they were indexed
+or edited in.
+
+An index is built lazily, with one query, on the first lookup of a tenant
+and kept in ``app.extensions['product_index']`` (a TTLCache keyed by
+tenant id).
+
+Keeping it current:
+    * Product after_insert / after_update / after_delete events record the
+      changed rows on the session; they are applied to the index when the
+      session commits and dropped when it rolls back, so an index never
+      shows uncommitted products
+    * invalidate_product_index(tenant_id) for bulk UPDATEs or scripts
+
+Each Gunicorn worker owns its own indexes; changes made in another worker
+become visible after at most PRODUCT_INDEX_TTL seconds.
+"""
+
+import threading
+from typing import NamedTuple, Optional
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from app import db
+from app.models import Product
+from app.tenant_mixin import TenantMixin
+from app.utils.cache_helper import MISSING, TTLCache
+
+_PENDING_KEY = 'product_index_changes'
+
+# Codes accepted per /inventory/api/lookup request
+MAX_LOOKUP_CODES = 1000
+
+
+class ProductEntry(NamedTuple):
+    """Lookup result: the columns a scanner or invoice line needs"""
+    id: int
+    code: str
+    barcode: Optional[str]
+    name: str
+    price: float
+    tax_rate: float
+    is_sellable: bool
+    track_inventory: bool
+
+    @classmethod
+    def from_product(cls, product):
+        return cls(product.id, product.code, product.barcode, product.name,
+                   product.selling_price or 0.0, product.tax_rate,
+                   bool(product.is_sellable), bool(product.track_inventory))
+
+
+class ProductIndex:
+    """Active products of one tenant by barcode and by code"""
+
+    def __init__(self, entries=()):
+        self._by_id = {}
+        self._by_barcode = {}
+        self._by_code = {}
+        self._lock = threading.Lock()
+        for entry in entries:
+            self.put(entry)
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def put(self, entry):
+        with self._lock:
+            self._remove(entry.id)
+            self._by_id[entry.id] = entry
+            self._by_code[entry.code] = entry
+            if entry.barcode:
+                self._by_barcode.setdefault(entry.barcode, set()).add(entry.id)
+
+    def remove(self, product_id):
+        with self._lock:
+            self._remove(product_id)
+
+    def _remove(self, product_id):
+        entry = self._by_id.pop(product_id, None)
+        if entry is None:
+            return
+        if self._by_code.get(entry.code) is entry:
+            del self._by_code[entry.code]
+        if entry.barcode:
+            ids = self._by_barcode.get(entry.barcode)
+            if ids is not None:
+                ids.discard(product_id)
+                if not ids:
+                    del self._by_barcode[entry.barcode]
+
+    def lookup(self, code):
+        """Return the entry whose barcode (lowest id first), or else code, equals ``code``"""
+        code = (code or '').strip()
+        with self._lock:
+            ids = self._by_barcode.get(code)
+            if ids:
+                return self._by_id[min(ids)]
+            return self._by_code.get(code)
+
+
+def build_product_index():
+    """Load the active products of the current tenant (one query)"""
+    rows = (db.session.query(Product.id, Product.code, Product.barcode, Product.name,
+                             Product.selling_price, Product.tax_rate, Product.is_sellable,
+                             Product.track_inventory)
+            .filter(Product.is_active == True)
+            .order_by(Product.id))
+    return ProductIndex(
+        ProductEntry(id, code, barcode, name, price or 0.0, tax_rate, bool(sellable), bool(tracked))
+        for id, code, barcode, name, price, tax_rate, sellable, tracked in rows
+    )
+
+
+def init_product_index(app):
+    """Create the per-application product index cache from config"""
+    cache = TTLCache(
+        max_size=app.config.get('PRODUCT_INDEX_SIZE', 256),
+        ttl=app.config.get('PRODUCT_INDEX_TTL', 300),
+    )
+    app.extensions['product_index'] = cache
+    return cache
+
+
+def get_product_index_cache():
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('product_index')
+
+
+def get_product_index(tenant_id=None):
+    """Return the ProductIndex of ``tenant_id`` (default: the current tenant)"""
+    if tenant_id is None:
+        tenant_id = TenantMixin.get_current_tenant_id()
+    cache = get_product_index_cache()
+    if cache is None:
+        return build_product_index()
+    index = cache.get(tenant_id)
+    if index is MISSING:
+        index = build_product_index()
+        cache.set(tenant_id, index)
+    return index
+
+
+def lookup_products(codes, tenant_id=None):
+    """Resolve scanned codes; returns ``{code: ProductEntry or None}``"""
+    index = get_product_index(tenant_id)
+    return {code: index.lookup(code) for code in codes}
+
+
+def invalidate_product_index(tenant_id=None):
+    """Drop the index of ``tenant_id`` (every tenant when None)"""
+    cache = get_product_index_cache()
+    if cache is None:
+        return
+    if tenant_id is None:
+        cache.clear()
+    else:
+        cache.delete(tenant_id)
+
+
+def _record_change(target, entry):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_PENDING_KEY, {})[target.id] = (target.tenant_id, entry)
+
+
+@event.listens_for(Product, 'after_insert')
+@event.listens_for(Product, 'after_update')
+def _record_write(mapper, connection, target):
+    _record_change(target, ProductEntry.from_product(target) if target.is_active else None)
+
+
+@event.listens_for(Product, 'after_delete')
+def _record_delete(mapper, connection, target):
+    _record_change(target, None)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+    changes = session.info.pop(_PENDING_KEY, None)
+    cache = get_product_index_cache()
+    if not changes or cache is None:
+        return
+    for product_id, (tenant_id, entry) in changes.items():
+        index = cache.get(tenant_id)
+        if index is MISSING:
+            continue  # built from the committed rows on the next lookup
+        if entry is None:
+            index.remove(product_id)
+        else:
+            index.put(entry)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_changes(session, previous_transaction):
+    # A rolled back SAVEPOINT keeps the pending changes of its outer transaction
+    if not previous_transaction.nested:
+        session.info.pop(_PENDING_KEY, None)
@@ -3,10 +3,12 @@ from flask_login import login_required, current_user
 from flask_babel import gettext as _
 from app.purchases import bp
 from app import db
-from app.models import Supplier, PurchaseInvoice, PurchaseInvoiceItem, Product, Warehouse, Stock, StockMovement, BankAccount
+from app.models import Supplier, PurchaseInvoice, PurchaseInvoiceItem, Product, Warehouse, BankAccount
 from app.utils.accounting_helper import create_purchase_invoice_journal_entry
 from app.utils.bank_helper import create_bank_transaction, reverse_bank_transaction
+from app.utils.stock_ledger import StockLedger
 from app.auth.decorators import permission_required, any_permission_required
+from app.company_settings import get_company_settings
 from datetime import datetime
 
 @bp.route('/suppliers')
@@ -113,7 +115,6 @@ def edit_supplier(id):
 @permission_required('purchases.invoices.view')
 def invoices():
     """List all purchase invoices"""
-    from app.models import Company
     from flask import current_app
     from datetime import date, timedelta
     import calendar
@@ -173,10 +174,7 @@ def invoices():
         month_data.append(round(total, 2))
 
     # Currency
-    company = Company.query.first()
-    currency_symbol = current_app.config['CURRENCIES'].get(
-        company.currency if company else 'EUR', {}
-    ).get('symbol', '€')
+    currency_symbol = get_company_settings().currency_symbol
 
     return render_template('purchases/invoices.html',
                          invoices=invoices,
@@ -287,11 +285,10 @@ def add_invoice():
     products = Product.query.filter_by(is_active=True, is_purchasable=True).all()
 
     # Get company settings for currency
-    from app.models import Company
     from flask import current_app
-    company = Company.query.first()
-    currency_code = company.currency if company else current_app.config.get('DEFAULT_CURRENCY', 'SAR')
-    currency_symbol = current_app.config['CURRENCIES'].get(currency_code, {}).get('symbol', 'ر.س')
+    settings = get_company_settings()
+    currency_code = settings.currency_code
+    currency_symbol = settings.currency_symbol
 
     return render_template('purchases/add_invoice.html',
                          suppliers=suppliers,
@@ -328,7 +325,15 @@ def confirm_invoice(id):
             invoice.paid_amount = invoice.total_amount
             invoice.remaining_amount = 0
 
-            # Add stock for each item
+            # Lock the stock rows first so the weighted average below sees
+            # quantities no concurrent document can change before commit
+            ledger = StockLedger('purchase_invoice', invoice.id,
+                                 notes=f'Purchase Invoice No. {invoice.invoice_number}')
+            for item in invoice.items:
+                ledger.add(item.product_id, invoice.warehouse_id, item.quantity)
+            ledger.lock()
+
+            received = {}
             for item in invoice.items:
                 # Update product cost price (weighted average)
                 product = Product.query.get(item.product_id)
@@ -339,7 +344,7 @@ def confirm_invoice(id):
                     unit_cost = (item_subtotal - item_discount) / item.quantity
 
                     # Update cost price with weighted average
-                    current_stock = product.get_stock()
+                    current_stock = product.get_stock() + received.get(item.product_id, 0)
                     if current_stock > 0:
                         # Weighted average: (old_cost * old_qty + new_cost * new_qty) / total_qty
                         total_cost = (product.cost_price * current_stock) + (unit_cost * item.quantity)
@@ -348,36 +353,10 @@ def confirm_invoice(id):
                     else:
                         # No existing stock, use new cost
                         product.cost_price = unit_cost
+                received[item.product_id] = received.get(item.product_id, 0) + item.quantity
 
-                # Get or create stock record
-                stock = Stock.query.filter_by(
-                    product_id=item.product_id,
-                    warehouse_id=invoice.warehouse_id
-                ).first()
-
-                if not stock:
-                    stock = Stock(
-                        product_id=item.product_id,
-                        warehouse_id=invoice.warehouse_id,
-                        quantity=0
-                    )
-                    db.session.add(stock)
-
-                # Add quantity
-                stock.quantity += item.quantity
-
-                # Create stock movement record
-                movement = StockMovement(
-                    product_id=item.product_id,
-                    warehouse_id=invoice.warehouse_id,
-                    movement_type='in',
-                    quantity=item.quantity,
-                    reference_type='purchase_invoice',
-                    reference_id=invoice.id,
-                    notes=f'Purchase Invoice No. {invoice.invoice_number}',
-                    user_id=current_user.id
-                )
-                db.session.add(movement)
+            # Add stock (missing stock records are created)
+            ledger.post()
 
             # Update supplier balance
             invoice.supplier.current_balance += invoice.total_amount
@@ -420,11 +399,10 @@ def confirm_invoice(id):
             return redirect(url_for('purchases.invoice_details', id=id))
 
     # Get company settings for currency
-    from app.models import Company
     from flask import current_app
-    company = Company.query.first()
-    currency_code = company.currency if company else current_app.config.get('DEFAULT_CURRENCY', 'SAR')
-    currency_symbol = current_app.config['CURRENCIES'].get(currency_code, {}).get('symbol', 'ر.س')
+    settings = get_company_settings()
+    currency_code = settings.currency_code
+    currency_symbol = settings.currency_symbol
 
     return render_template('purchases/confirm_invoice.html',
                          invoice=invoice,
@@ -448,27 +426,11 @@ def cancel_invoice(id):
             invoice.status = 'cancelled'
 
             # Remove stock for each item
+            ledger = StockLedger('purchase_invoice_cancel', invoice.id,
+                                 notes=f'Cancel Purchase Invoice No. {invoice.invoice_number}')
             for item in invoice.items:
-                stock = Stock.query.filter_by(
-                    product_id=item.product_id,
-                    warehouse_id=invoice.warehouse_id
-                ).first()
-
-                if stock:
-                    stock.quantity -= item.quantity
-
-                    # Create stock movement record
-                    movement = StockMovement(
-                        product_id=item.product_id,
-                        warehouse_id=invoice.warehouse_id,
-                        movement_type='out',
-                        quantity=item.quantity,
-                        reference_type='purchase_invoice_cancel',
-                        reference_id=invoice.id,
-                        notes=f'Cancel Purchase Invoice No. {invoice.invoice_number}',
-                        user_id=current_user.id
-                    )
-                    db.session.add(movement)
+                ledger.add(item.product_id, invoice.warehouse_id, -item.quantity)
+            ledger.post(create_missing=False)
 
             # Update supplier balance
             invoice.supplier.current_balance -= invoice.total_amount
@@ -518,27 +480,11 @@ def delete_invoice(id):
         try:
             # If invoice was confirmed, remove stock and update supplier balance
             if invoice.status == 'confirmed':
+                ledger = StockLedger('purchase_invoice_delete', invoice.id,
+                                     notes=f'حذف فاتورة مشتريات رقم {invoice.invoice_number}')
                 for item in invoice.items:
-                    stock = Stock.query.filter_by(
-                        product_id=item.product_id,
-                        warehouse_id=invoice.warehouse_id
-                    ).first()
-
-                    if stock:
-                        stock.quantity -= item.quantity
-
-                        # Create stock movement record
-                        movement = StockMovement(
-                            product_id=item.product_id,
-                            warehouse_id=invoice.warehouse_id,
-                            movement_type='out',
-                            quantity=item.quantity,
-                            reference_type='purchase_invoice_delete',
-                            reference_id=invoice.id,
-                            notes=f'حذف فاتورة مشتريات رقم {invoice.invoice_number}',
-                            user_id=current_user.id
-                        )
-                        db.session.add(movement)
+                    ledger.add(item.product_id, invoice.warehouse_id, -item.quantity)
+                ledger.post(create_missing=False)
 
                 # Update supplier balance
                 invoice.supplier.current_balance -= invoice.total_amount
@@ -0,0 +1,338 @@
+"""
+Report Result Cache
+===================
+
+Grouped report aggregates (sales by product / customer, purchases by
+supplier, profit and loss) are cached per (tenant, report, filters) in a
+small SQLite file, REPORT_CACHE_PATH, shared by every Gunicorn worker on
+the box.  A report declares the tables it reads once, at import time, and
+wraps its computation:
+
+    register_report('sales_by_product', Product, SalesInvoice, SalesInvoiceItem)
+    ...
+    results = cached_report('sales_by_product',
+                            {'start_date': start_date, 'end_date': end_date},
+                            query.all)
+
+Invalidation is driven by writes, not by time:
+
+    * after_flush records the (tenant, table) pairs a session inserted,
+      updated or deleted, ORM bulk INSERT / UPDATE / DELETE statements
+      included;
+      after_commit bumps their version in the store and drops the entries
+      reading them, after_soft_rollback forgets them
+    * an entry keeps the versions of its tables as they were *before* the
+      report ran and is served only while they are unchanged, so a commit
+      racing with the computation never leaves a stale result behind
+    * rows without a tenant (or written outside a tenant) bump the
+      all-tenants version of their table, which every entry checks
+
+REPORT_CACHE_TTL only bounds the age of an entry, for writes that bypass
+the ORM (raw SQL, other programs).  Requests without a tenant are never
+cached.  Hits and misses are counted per report in the same file, so
+/health and ``flask report-cache stats`` show them for all workers.
+"""
+
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from itertools import chain
+
+import click
+from flask import current_app, has_app_context
+from flask.cli import AppGroup
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.tenant_mixin import TenantMixin
+from app.utils.cache_helper import MISSING
+
+_PENDING_KEY = 'report_cache_writes'
+
+# Version row bumped by writes whose tenant is unknown
+ALL_TENANTS = 0
+
+# report name -> tables it reads, and the union of them
+REPORT_TABLES = {}
+_WATCHED_TABLES = set()
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS entries ('
+    ' tenant_id INTEGER NOT NULL, report TEXT NOT NULL, params TEXT NOT NULL,'
+    ' tables TEXT NOT NULL, versions TEXT NOT NULL, created_at REAL NOT NULL,'
+    ' value BLOB NOT NULL, PRIMARY KEY (tenant_id, report, params))',
+    'CREATE TABLE IF NOT EXISTS table_versions ('
+    ' tenant_id INTEGER NOT NULL, table_name TEXT NOT NULL, version INTEGER NOT NULL,'
+    ' PRIMARY KEY (tenant_id, table_name))',
+    'CREATE TABLE IF NOT EXISTS report_stats ('
+    ' report TEXT PRIMARY KEY, hits INTEGER NOT NULL DEFAULT 0,'
+    ' misses INTEGER NOT NULL DEFAULT 0)',
+)
+
+
+def register_report(report, *models):
+    """Declare the tables of ``models`` as the inputs of ``report``"""
+    tables = tuple(sorted({model.__table__.name for model in models}))
+    REPORT_TABLES[report] = tables
+    _WATCHED_TABLES.update(tables)
+    return tables
+
+
+class ReportCacheStore:
+    """
+    Entries, table versions and per-report counters in one SQLite file.
+
+    Each thread of each process opens its own connection (SQLite handles
+    must not cross threads, nor a fork of a preloaded Gunicorn master).
+    """
+
+    def __init__(self, path, ttl=3600):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        with conn:
+            for statement in _SCHEMA:
+                conn.execute(statement)
+
+    def _connect(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.conn = sqlite3.connect(self.path, timeout=5)
+            local.pid = os.getpid()
+        return local.conn
+
+    def versions(self, tenant_id, tables):
+        """Snapshot of the versions of ``tables`` as seen by ``tenant_id``"""
+        marks = ','.join('?' * len(tables))
+        rows = self._connect().execute(
+            f'SELECT tenant_id, table_name, version FROM table_versions '
+            f'WHERE tenant_id IN (?, ?) AND table_name IN ({marks}) '
+            f'ORDER BY tenant_id, table_name',
+            (tenant_id, ALL_TENANTS, *tables),
+        ).fetchall()
+        return json.dumps(rows)
+
+    def get(self, tenant_id, report, params, versions):
+        """The cached value, or MISSING when absent, outdated or expired"""
+        row = self._connect().execute(
+            'SELECT versions, created_at, value FROM entries '
+            'WHERE tenant_id = ? AND report = ? AND params = ?',
+            (tenant_id, report, params),
+        ).fetchone()
+        if row is None or row[0] != versions:
+            return MISSING
+        if self.ttl > 0 and row[1] <= time.time() - self.ttl:
+            return MISSING
+        return pickle.loads(row[2])
+
+    def set(self, tenant_id, report, params, tables, versions, value):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO entries '
+                '(tenant_id, report, params, tables, versions, created_at, value) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (tenant_id, report, params, ',' + ','.join(tables) + ',', versions,
+                 time.time(), pickle.dumps(value, pickle.HIGHEST_PROTOCOL)),
+            )
+
+    def bump(self, writes):
+        """Invalidate every entry reading one of the (tenant_id, table) pairs"""
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                'INSERT INTO table_versions (tenant_id, table_name, version) VALUES (?, ?, 1) '
+                'ON CONFLICT (tenant_id, table_name) DO UPDATE SET version = version + 1',
+                sorted(writes),
+            )
+            conn.executemany(
+                "DELETE FROM entries WHERE (tenant_id = ? OR ? = 0) "
+                "AND instr(tables, ',' || ? || ',') > 0",
+                [(tenant_id, tenant_id, table) for tenant_id, table in writes],
+            )
+
+    def record(self, report, hit):
+        column = 'hits' if hit else 'misses'
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                f'INSERT INTO report_stats (report, {column}) VALUES (?, 1) '
+                f'ON CONFLICT (report) DO UPDATE SET {column} = {column} + 1',
+                (report,),
+            )
+
+    def clear(self, tenant_id=None):
+        """Drop the entries of ``tenant_id`` (every tenant when None); counters are kept"""
+        conn = self._connect()
+        with conn:
+            if tenant_id is None:
+                return conn.execute('DELETE FROM entries').rowcount
+            return conn.execute('DELETE FROM entries WHERE tenant_id = ?', (tenant_id,)).rowcount
+
+    def stats(self):
+        """Entry count and hit/miss counters per report, suitable for JSON output"""
+        conn = self._connect()
+        reports = {}
+        for report, hits, misses in conn.execute(
+                'SELECT report, hits, misses FROM report_stats ORDER BY report'):
+            total = hits + misses
+            reports[report] = {
+                'hits': hits,
+                'misses': misses,
+                'hit_rate': round(hits / total, 4) if total else 0.0,
+            }
+        return {
+            'size': conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0],
+            'ttl': self.ttl,
+            'reports': reports,
+        }
+
+
+def init_report_cache(app):
+    """Open the shared report cache when REPORT_CACHE_ENABLED is set"""
+    if not app.config.get('REPORT_CACHE_ENABLED'):
+        app.extensions.pop('report_cache', None)
+        return None
+    store = ReportCacheStore(app.config['REPORT_CACHE_PATH'],
+                             ttl=app.config.get('REPORT_CACHE_TTL', 3600))
+    app.extensions['report_cache'] = store
+    return store
+
+
+def get_report_cache():
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('report_cache')
+
+
+def _params_key(params):
+    return json.dumps({k: v for k, v in params.items() if v not in (None, '')},
+                      sort_keys=True, default=str)
+
+
+def cached_report(report, params, loader):
+    """
+    Return ``loader()`` for ``report`` and the filters in ``params``, served
+    from the shared cache while none of the report's tables changed for the
+    current tenant.  The value must be picklable (ORM column rows are).
+    """
+    tables = REPORT_TABLES[report]
+    store = get_report_cache()
+    tenant_id = TenantMixin.get_current_tenant_id()
+    if store is None or tenant_id is None:
+        return loader()
+
+    key = _params_key(params)
+    try:
+        versions = store.versions(tenant_id, tables)
+        value = store.get(tenant_id, report, key, versions)
+        store.record(report, value is not MISSING)
+    except sqlite3.Error:
+        current_app.logger.exception('Report cache unavailable, computing %s', report)
+        return loader()
+    if value is not MISSING:
+        return value
+
+    value = loader()
+    try:
+        store.set(tenant_id, report, key, tables, versions, value)
+    except sqlite3.Error:
+        current_app.logger.exception('Could not cache %s', report)
+    return value
+
+
+# ---------------------------------------------------------------------------
+# Write tracking
+# ---------------------------------------------------------------------------
+
+def _pending(session):
+    return session.info.setdefault(_PENDING_KEY, set())
+
+
+def _current_tenant():
+    return TenantMixin.get_current_tenant_id() or ALL_TENANTS
+
+
+@event.listens_for(Session, 'after_flush')
+def _record_flush(session, flush_context):
+    if get_report_cache() is None:
+        return
+    for obj in chain(session.new, session.dirty, session.deleted):
+        table = getattr(obj, '__tablename__', None)
+        if table in _WATCHED_TABLES:
+            _pending(session).add((getattr(obj, 'tenant_id', None) or _current_tenant(), table))
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _record_bulk_write(orm_execute_state):
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update
+            or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None or get_report_cache() is None:
+        return
+    table = mapper.local_table.name
+    if table in _WATCHED_TABLES:
+        _pending(orm_execute_state.session).add((_current_tenant(), table))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_writes(session):
+    writes = session.info.pop(_PENDING_KEY, None)
+    store = get_report_cache()
+    if not writes or store is None:
+        return
+    try:
+        store.bump(writes)
+    except sqlite3.Error:
+        current_app.logger.exception('Report cache invalidation failed, clearing it')
+        try:
+            store.clear()
+        except sqlite3.Error:
+            pass
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_writes(session, previous_transaction):
+    # A rolled back SAVEPOINT keeps the pending writes of its outer transaction
+    if not previous_transaction.nested:
+        session.info.pop(_PENDING_KEY, None)
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+report_cache_cli = AppGroup('report-cache', help='Inspect and reset the shared report cache.')
+
+
+def _store_or_exit():
+    store = get_report_cache()
+    if store is None:
+        raise click.ClickException('REPORT_CACHE_ENABLED is not set')
+    return store
+
+
+@report_cache_cli.command('stats')
+def stats_command():
+    """Show cached entries and the hit rate of every report."""
+    stats = _store_or_exit().stats()
+    click.echo(f"{stats['size']} entries")
+    for report, counters in stats['reports'].items():
+        click.echo(f"{report}: {counters['hits']} hits, {counters['misses']} misses "
+                   f"({counters['hit_rate']:.1%})")
+
+
+@report_cache_cli.command('clear')
+@click.option('--tenant', 'tenant_id', type=int, help='Only drop the entries of this tenant.')
+def clear_command(tenant_id):
+    """Drop cached report results."""
+    click.echo(f'{_store_or_exit().clear(tenant_id)} entries dropped')
@@ -1,13 +1,147 @@
 from flask import render_template, redirect, url_for, request, current_app, send_file
 from flask_login import login_required
 from app.auth.decorators import permission_required
+from app.jobs import background_export
+from app.company_settings import get_company_settings
 from app.reports import bp
+from app.reports.exports import stream_query, tabular_format, tabular_response, xlsx_response
+from app.report_cache import cached_report, register_report
+from app.rollups import PURCHASE_KINDS, SALES_KINDS, monthly_rollups, rollup_years
 from app import db
 from app.models import *
-from sqlalchemy import func
-from datetime import datetime, timedelta
+from sqlalchemy import case, func
+from datetime import date, datetime, timedelta
+from itertools import chain
 import io
 
+# ==================== Tabular (CSV / JSON Lines) Helpers ====================
+# Every report answers ?format=csv|jsonl with rows streamed from a column
+# query (see app/reports/exports.py)
+
+# Tables read by the reports whose results are cached (see app/report_cache.py)
+register_report('sales_by_product', Product, SalesInvoice, SalesInvoiceItem)
+register_report('sales_by_customer', Customer, SalesInvoice)
+register_report('purchases_by_supplier', Supplier, PurchaseInvoice)
+register_report('profit_loss', Product, Category, Warehouse, SalesInvoice, SalesInvoiceItem)
+
+MONTH_COLUMNS = ['month_num', 'month_name', 'invoice_count', 'total_amount', 'total_tax']
+
+
+MONTH_NAMES = ['يناير', 'فبراير', 'مارس', 'أبريل', 'مايو', 'يونيو',
+               'يوليو', 'أغسطس', 'سبتمبر', 'أكتوبر', 'نوفمبر', 'ديسمبر']
+
+
+def _months_data(kinds, year):
+    """Twelve MONTH_COLUMNS dicts of ``year`` read from the daily rollups of ``kinds``"""
+    totals = monthly_rollups(kinds, date(year, 1, 1), date(year, 12, 31))
+    months_data = []
+    for month_num, month_name in enumerate(MONTH_NAMES, start=1):
+        month = totals.get((year, month_num))
+        months_data.append({
+            'month_num': month_num,
+            'month_name': month_name,
+            'invoice_count': month.doc_count if month else 0,
+            'total_amount': month.total_amount if month else 0,
+            'total_tax': month.tax_amount if month else 0,
+        })
+    return months_data
+
+
+def _invoice_columns(party):
+    return ['invoice_number', 'invoice_date', party, 'subtotal', 'tax_amount', 'total_amount',
+            'paid_amount', 'remaining_amount', 'payment_status']
+
+
+def _stock_levels(low_only=False):
+    """Active stocked products with their quantity summed over warehouses"""
+    stock = func.coalesce(func.sum(Stock.quantity), 0)
+    query = db.session.query(Product.code, Product.name, stock.label('stock'),
+                             Product.cost_price, Product.min_stock) \
+        .outerjoin(Stock, Stock.product_id == Product.id) \
+        .filter(Product.is_active == True, Product.track_inventory == True) \
+        .group_by(Product.id, Product.code, Product.name, Product.cost_price, Product.min_stock)
+    if low_only:
+        query = query.having(stock <= func.coalesce(Product.min_stock, 0))
+    return query.order_by(Product.name)
+
+
+def _aging_bucket(days_overdue):
+    if days_overdue <= 30:
+        return 'current'
+    if days_overdue <= 60:
+        return '31_60'
+    if days_overdue <= 90:
+        return '61_90'
+    if days_overdue <= 120:
+        return '91_120'
+    return 'over_120'
+
+
+def _ranking_filters():
+    """start_date, end_date, top and percentile of a ranked report, from the request"""
+    top = request.args.get('top', type=int)
+    percentile = request.args.get('percentile', type=float)
+    return {
+        'start_date': request.args.get('start_date') or None,
+        'end_date': request.args.get('end_date') or None,
+        'top': top if top and top > 0 else None,
+        'percentile': min(max(percentile, 0), 100) if percentile else None,
+    }
+
+
+def _ranked_parties(party, invoice, party_key, start_date=None, end_date=None, top=None,
+                    percentile=None):
+    """
+    Active customers or suppliers ranked by the total of their confirmed
+    invoices, in one grouped query of (rank, code, name, invoice_count,
+    total, average, share); share is the percentage of the total of every
+    ranked party.  ``top`` keeps the first N, ``percentile`` the parties
+    whose total is above that percentile of all party totals (80 keeps the
+    top 20%).
+    """
+    total = func.sum(invoice.total_amount)
+    query = db.session.query(
+        party.code.label('code'),
+        party.name.label('name'),
+        func.count(invoice.id).label('invoice_count'),
+        total.label('total'),
+        func.rank().over(order_by=total.desc()).label('rank'),
+        func.cume_dist().over(order_by=total).label('cume_dist'),
+        func.sum(total).over().label('grand_total'),
+    ).join(invoice, party_key == party.id) \
+        .filter(party.is_active == True, invoice.status == 'confirmed')
+    if start_date:
+        query = query.filter(invoice.invoice_date >= datetime.strptime(start_date, '%Y-%m-%d').date())
+    if end_date:
+        query = query.filter(invoice.invoice_date <= datetime.strptime(end_date, '%Y-%m-%d').date())
+    ranked = query.group_by(party.id, party.code, party.name).having(total > 0).subquery()
+
+    query = db.session.query(
+        ranked.c.rank, ranked.c.code, ranked.c.name, ranked.c.invoice_count, ranked.c.total,
+        (ranked.c.total / ranked.c.invoice_count).label('average'),
+        (ranked.c.total * 100.0 / ranked.c.grand_total).label('share'),
+    )
+    if percentile:
+        query = query.filter(ranked.c.cume_dist > percentile / 100)
+    query = query.order_by(ranked.c.rank, ranked.c.name)
+    if top:
+        query = query.limit(top)
+    return query
+
+
+def _party_history(model, party_column, party_id, name):
+    """Stream every invoice of one customer or supplier"""
+    rows = db.session.query(model.invoice_number, model.invoice_date, model.status,
+                            model.payment_status, model.total_amount, model.paid_amount,
+                            model.remaining_amount) \
+        .filter(party_column == party_id) \
+        .order_by(model.invoice_date.desc(), model.id.desc())
+    return tabular_response(tabular_format(), name,
+                            ['invoice_number', 'invoice_date', 'status', 'payment_status',
+                             'total_amount', 'paid_amount', 'remaining_amount'],
+                            stream_query(rows))
+
+
 @bp.route('/')
 @login_required
 @permission_required('reports.view')
@@ -30,17 +164,26 @@ def sales_report():
     if end_date:
         query = query.filter(SalesInvoice.invoice_date <= datetime.strptime(end_date, '%Y-%m-%d').date())
 
+    fmt = tabular_format()
+    if fmt:
+        rows = query.with_entities(
+            SalesInvoice.invoice_number, SalesInvoice.invoice_date, Customer.name,
+            SalesInvoice.subtotal, SalesInvoice.tax_amount, SalesInvoice.total_amount,
+            SalesInvoice.paid_amount, SalesInvoice.remaining_amount, SalesInvoice.payment_status
+        ).outerjoin(Customer, SalesInvoice.customer_id == Customer.id) \
+            .order_by(SalesInvoice.invoice_date, SalesInvoice.id)
+        return tabular_response(fmt, 'sales_report', _invoice_columns('customer'), stream_query(rows))
+
     invoices = query.all()
 
     total_sales = sum(inv.total_amount for inv in invoices)
     total_tax = sum(inv.tax_amount for inv in invoices)
 
     # Get currency settings
-    from app.models import Company
-    company = Company.query.first()
-    currency_code = company.currency if company else current_app.config.get('DEFAULT_CURRENCY', 'EUR')
-    currency_name = current_app.config['CURRENCIES'].get(currency_code, {}).get('name', 'Euro')
-    currency_symbol = current_app.config['CURRENCIES'].get(currency_code, {}).get('symbol', '€')
+    settings = get_company_settings()
+    currency_code = settings.currency_code
+    currency_name = settings.currency_name
+    currency_symbol = settings.currency_symbol
 
     return render_template('reports/sales.html',
                          invoices=invoices,
@@ -67,6 +210,16 @@ def purchases_report():
     if end_date:
         query = query.filter(PurchaseInvoice.invoice_date <= datetime.strptime(end_date, '%Y-%m-%d').date())
 
+    fmt = tabular_format()
+    if fmt:
+        rows = query.with_entities(
+            PurchaseInvoice.invoice_number, PurchaseInvoice.invoice_date, Supplier.name,
+            PurchaseInvoice.subtotal, PurchaseInvoice.tax_amount, PurchaseInvoice.total_amount,
+            PurchaseInvoice.paid_amount, PurchaseInvoice.remaining_amount, PurchaseInvoice.payment_status
+        ).outerjoin(Supplier, PurchaseInvoice.supplier_id == Supplier.id) \
+            .order_by(PurchaseInvoice.invoice_date, PurchaseInvoice.id)
+        return tabular_response(fmt, 'purchases_report', _invoice_columns('supplier'), stream_query(rows))
+
     invoices = query.all()
 
     total_purchases = sum(inv.total_amount for inv in invoices)
@@ -98,6 +251,13 @@ def purchases_report():
 @permission_required('reports.inventory')
 def inventory_report():
     """Inventory report"""
+    fmt = tabular_format()
+    if fmt:
+        rows = ((code, name, stock, cost, stock * (cost or 0))
+                for code, name, stock, cost, _ in stream_query(_stock_levels()))
+        return tabular_response(fmt, 'inventory_report',
+                                ['code', 'name', 'stock', 'cost_price', 'value'], rows)
+
     products = Product.query.filter_by(is_active=True, track_inventory=True).all()
 
     inventory_data = []
@@ -112,10 +272,9 @@ def inventory_report():
     total_value = sum(item['value'] for item in inventory_data)
 
     # Get company settings for currency
-    from app.models import Company
-    company = Company.query.first()
-    currency_code = company.currency if company else current_app.config.get('DEFAULT_CURRENCY', 'SAR')
-    currency_symbol = current_app.config['CURRENCIES'].get(currency_code, {}).get('symbol', 'ر.س')
+    settings = get_company_settings()
+    currency_code = settings.currency_code
+    currency_symbol = settings.currency_symbol
 
     return render_template('reports/inventory.html',
                          inventory_data=inventory_data,
@@ -127,34 +286,31 @@ def inventory_report():
 @login_required
 @permission_required('reports.financial')
 def profit_loss():
-    """Profit and Loss statement"""
+    """Profit and Loss statement, with gross margin by product, category or warehouse"""
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
+    breakdown = request.args.get('breakdown')
+    if breakdown not in PROFIT_BREAKDOWNS:
+        breakdown = None
+
+    fmt = tabular_format()
+    if fmt and breakdown:
+        return tabular_response(fmt, f'profit_loss_by_{breakdown}', PROFIT_BREAKDOWN_COLUMNS,
+                                stream_query(_gross_margin(breakdown, start_date, end_date)))
+
+    total_revenue, total_cogs = cached_report(
+        'profit_loss', {'start_date': start_date, 'end_date': end_date},
+        lambda: _revenue_and_cogs(start_date, end_date))
+    gross_profit = total_revenue - total_cogs
 
-    # Calculate revenue
-    revenue_query = db.session.query(func.sum(SalesInvoice.total_amount)).filter(SalesInvoice.status != 'cancelled')
-    if start_date:
-        revenue_query = revenue_query.filter(SalesInvoice.invoice_date >= datetime.strptime(start_date, '%Y-%m-%d').date())
-    if end_date:
-        revenue_query = revenue_query.filter(SalesInvoice.invoice_date <= datetime.strptime(end_date, '%Y-%m-%d').date())
-
-    total_revenue = revenue_query.scalar() or 0
-
-    # Calculate cost of goods sold (COGS) - from sales invoice items
-    sales_query = SalesInvoice.query.filter(SalesInvoice.status != 'cancelled')
-    if start_date:
-        sales_query = sales_query.filter(SalesInvoice.invoice_date >= datetime.strptime(start_date, '%Y-%m-%d').date())
-    if end_date:
-        sales_query = sales_query.filter(SalesInvoice.invoice_date <= datetime.strptime(end_date, '%Y-%m-%d').date())
-
-    sales_invoices = sales_query.all()
-
-    total_cogs = 0
-    for invoice in sales_invoices:
-        for item in invoice.items:
-            total_cogs += item.product.cost_price * item.quantity
+    if fmt:
+        return tabular_response(fmt, 'profit_loss', ['metric', 'amount'], [
+            ('revenue', total_revenue), ('cogs', total_cogs), ('gross_profit', gross_profit)])
 
-    gross_profit = total_revenue - total_cogs
+    breakdown = breakdown or 'product'
+    margins = cached_report(
+        'profit_loss', {'start_date': start_date, 'end_date': end_date, 'breakdown': breakdown},
+        _gross_margin(breakdown, start_date, end_date).all)
 
     # Get currency settings
     currency_code = current_app.config.get('CURRENCY', 'EUR')
@@ -165,17 +321,96 @@ def profit_loss():
                          total_revenue=total_revenue,
                          total_cogs=total_cogs,
                          gross_profit=gross_profit,
+                         margins=margins,
+                         breakdown=breakdown,
+                         breakdowns=PROFIT_BREAKDOWNS,
                          start_date=start_date,
                          end_date=end_date,
                          currency_code=currency_code,
                          currency_name=currency_name,
                          currency_symbol=currency_symbol)
 
+
+# Gross margin dimensions: the (key, code, name) columns each one groups by
+PROFIT_BREAKDOWNS = {
+    'product': (Product.id, Product.code, Product.name),
+    'category': (Category.id, Category.code, Category.name),
+    'warehouse': (Warehouse.id, Warehouse.code, Warehouse.name),
+}
+PROFIT_BREAKDOWN_COLUMNS = ['code', 'name', 'quantity', 'revenue', 'cogs', 'gross_profit',
+                            'margin']
+
+
+def _item_cost():
+    """Cost of a sold item line: its recorded unit cost, else the current cost price"""
+    return SalesInvoiceItem.quantity * func.coalesce(SalesInvoiceItem.unit_cost,
+                                                     Product.cost_price, 0)
+
+
+def _sales_in_period(query, start_date, end_date):
+    query = query.filter(SalesInvoice.status != 'cancelled')
+    if start_date:
+        query = query.filter(SalesInvoice.invoice_date >= datetime.strptime(start_date, '%Y-%m-%d').date())
+    if end_date:
+        query = query.filter(SalesInvoice.invoice_date <= datetime.strptime(end_date, '%Y-%m-%d').date())
+    return query
+
+
+def _revenue_and_cogs(start_date, end_date):
+    """Revenue and cost of goods sold of the non-cancelled sales in the period"""
+    revenue = _sales_in_period(
+        db.session.query(func.coalesce(func.sum(SalesInvoice.total_amount), 0)),
+        start_date, end_date).scalar()
+    cogs = _sales_in_period(
+        db.session.query(func.coalesce(func.sum(_item_cost()), 0))
+        .select_from(SalesInvoiceItem)
+        .join(SalesInvoice, SalesInvoiceItem.invoice_id == SalesInvoice.id)
+        .join(Product, SalesInvoiceItem.product_id == Product.id),
+        start_date, end_date).scalar()
+    return revenue, cogs
+
+
+def _gross_margin(breakdown, start_date=None, end_date=None):
+    """
+    Quantity, revenue (item line totals), COGS, gross profit and margin %
+    of the sales in the period per product, category or warehouse, in one
+    grouped query, most profitable first.  Items of uncategorised products
+    or of invoices without a warehouse are grouped under a NULL key.
+    """
+    key, code, name = PROFIT_BREAKDOWNS[breakdown]
+    revenue = func.coalesce(func.sum(SalesInvoiceItem.total), 0)
+    cogs = func.coalesce(func.sum(_item_cost()), 0)
+    query = db.session.query(
+        code.label('code'),
+        name.label('name'),
+        func.sum(SalesInvoiceItem.quantity).label('quantity'),
+        revenue.label('revenue'),
+        cogs.label('cogs'),
+        (revenue - cogs).label('gross_profit'),
+        case((revenue != 0, (revenue - cogs) * 100.0 / revenue), else_=None).label('margin'),
+    ).select_from(SalesInvoiceItem) \
+        .join(SalesInvoice, SalesInvoiceItem.invoice_id == SalesInvoice.id) \
+        .join(Product, SalesInvoiceItem.product_id == Product.id)
+    if breakdown == 'category':
+        query = query.outerjoin(Category, Product.category_id == Category.id)
+    elif breakdown == 'warehouse':
+        query = query.outerjoin(Warehouse, SalesInvoice.warehouse_id == Warehouse.id)
+    return _sales_in_period(query, start_date, end_date) \
+        .group_by(key, code, name) \
+        .order_by((revenue - cogs).desc(), name)
+
 @bp.route('/low-stock')
 @login_required
 @permission_required('reports.inventory')
 def low_stock_report():
     """Low stock products report"""
+    fmt = tabular_format()
+    if fmt:
+        rows = ((code, name, stock, min_stock, (min_stock or 0) - stock)
+                for code, name, stock, _, min_stock in stream_query(_stock_levels(low_only=True)))
+        return tabular_response(fmt, 'low_stock',
+                                ['code', 'name', 'current_stock', 'min_stock', 'shortage'], rows)
+
     products = Product.query.filter_by(is_active=True, track_inventory=True).all()
 
     low_stock_products = []
@@ -213,6 +448,20 @@ def stock_movement_report():
     if warehouse_id:
         query = query.filter_by(warehouse_id=warehouse_id)
 
+    fmt = tabular_format()
+    if fmt:
+        rows = query.with_entities(
+            StockMovement.created_at, Product.code, Product.name, Warehouse.name,
+            StockMovement.movement_type, StockMovement.quantity,
+            StockMovement.reference_type, StockMovement.reference_id, StockMovement.notes
+        ).join(Product, StockMovement.product_id == Product.id) \
+            .join(Warehouse, StockMovement.warehouse_id == Warehouse.id) \
+            .order_by(StockMovement.created_at.desc(), StockMovement.id.desc())
+        return tabular_response(fmt, 'stock_movement',
+                                ['created_at', 'product_code', 'product', 'warehouse', 'movement_type',
+                                 'quantity', 'reference_type', 'reference_id', 'notes'],
+                                stream_query(rows))
+
     movements = query.order_by(StockMovement.created_at.desc()).all()
 
     products = Product.query.filter_by(is_active=True).order_by(Product.name).all()
@@ -249,7 +498,15 @@ def sales_by_product():
     if end_date:
         query = query.filter(SalesInvoice.invoice_date <= datetime.strptime(end_date, '%Y-%m-%d').date())
 
-    results = query.group_by(Product.id).order_by(func.sum(SalesInvoiceItem.total).desc()).all()
+    query = query.group_by(Product.id).order_by(func.sum(SalesInvoiceItem.total).desc())
+
+    fmt = tabular_format()
+    if fmt:
+        return tabular_response(fmt, 'sales_by_product',
+                                ['name', 'code', 'total_qty', 'total_amount'], stream_query(query))
+
+    results = cached_report('sales_by_product', {'start_date': start_date, 'end_date': end_date},
+                            query.all)
 
     total_qty = sum(r.total_qty for r in results)
     total_amount = sum(r.total_amount for r in results)
@@ -283,7 +540,15 @@ def sales_by_customer():
     if end_date:
         query = query.filter(SalesInvoice.invoice_date <= datetime.strptime(end_date, '%Y-%m-%d').date())
 
-    results = query.group_by(Customer.id).order_by(func.sum(SalesInvoice.total_amount).desc()).all()
+    query = query.group_by(Customer.id).order_by(func.sum(SalesInvoice.total_amount).desc())
+
+    fmt = tabular_format()
+    if fmt:
+        return tabular_response(fmt, 'sales_by_customer',
+                                ['name', 'code', 'invoice_count', 'total_amount'], stream_query(query))
+
+    results = cached_report('sales_by_customer', {'start_date': start_date, 'end_date': end_date},
+                            query.all)
 
     total_invoices = sum(r.invoice_count for r in results)
     total_amount = sum(r.total_amount for r in results)
@@ -304,55 +569,24 @@ def sales_monthly():
     if not year:
         year = datetime.now().year
 
-    start_date = datetime(year, 1, 1).date()
-    end_date = datetime(year, 12, 31).date()
-
-    invoices = SalesInvoice.query.filter(
-        SalesInvoice.status != 'cancelled',
-        SalesInvoice.invoice_date >= start_date,
-        SalesInvoice.invoice_date <= end_date
-    ).all()
-
-    # Group by month
-    monthly_dict = {}
-    for invoice in invoices:
-        month_num = invoice.invoice_date.month
-        if month_num not in monthly_dict:
-            monthly_dict[month_num] = {'invoice_count': 0, 'total_amount': 0, 'total_tax': 0}
-        monthly_dict[month_num]['invoice_count'] += 1
-        monthly_dict[month_num]['total_amount'] += invoice.total_amount
-        monthly_dict[month_num]['total_tax'] += (invoice.tax_amount or 0)
-
-    month_names = [
-        'يناير', 'فبراير', 'مارس', 'أبريل', 'مايو', 'يونيو',
-        'يوليو', 'أغسطس', 'سبتمبر', 'أكتوبر', 'نوفمبر', 'ديسمبر'
-    ]
-
-    months_data = []
-    for month_num in range(1, 13):
-        data = monthly_dict.get(month_num, {'invoice_count': 0, 'total_amount': 0, 'total_tax': 0})
-        months_data.append({
-            'month_num': month_num,
-            'month_name': month_names[month_num - 1],
-            'invoice_count': data['invoice_count'],
-            'total_amount': data['total_amount'],
-            'total_tax': data['total_tax']
-        })
+    months_data = _months_data(SALES_KINDS, year)
 
     total_invoices = sum(m['invoice_count'] for m in months_data)
     total_sales = sum(m['total_amount'] for m in months_data)
     total_tax = sum(m['total_tax'] for m in months_data)
 
-    from app.models import Company
-    company = Company.query.first()
-    currency_code = company.currency if company else current_app.config.get('DEFAULT_CURRENCY', 'EUR')
-    currency_name = current_app.config['CURRENCIES'].get(currency_code, {}).get('name', 'Euro')
-    currency_symbol = current_app.config['CURRENCIES'].get(currency_code, {}).get('symbol', '€')
+    fmt = tabular_format()
+    if fmt:
+        return tabular_response(fmt, f'sales_monthly_{year}', MONTH_COLUMNS,
+                                [[m[column] for column in MONTH_COLUMNS] for m in months_data])
+
+    settings = get_company_settings()
+    currency_code = settings.currency_code
+    currency_name = settings.currency_name
+    currency_symbol = settings.currency_symbol
 
     # Get available years
-    all_invoices = SalesInvoice.query.filter(SalesInvoice.status != 'cancelled').all()
-    years_set = {inv.invoice_date.year for inv in all_invoices if inv.invoice_date}
-    available_years = sorted(list(years_set), reverse=True) or [datetime.now().year]
+    available_years = rollup_years(SALES_KINDS) or [datetime.now().year]
 
     return render_template('reports/sales_monthly.html',
                          months_data=months_data,
@@ -404,6 +638,12 @@ def purchases_by_product():
     # Order by total amount descending
     query = query.order_by(func.sum(PurchaseInvoiceItem.total).desc())
 
+    fmt = tabular_format()
+    if fmt:
+        return tabular_response(fmt, 'purchases_by_product',
+                                ['product_id', 'name', 'code', 'total_quantity', 'total_amount',
+                                 'invoice_count'], stream_query(query))
+
     products_data = query.all()
 
     # Calculate totals
@@ -467,7 +707,16 @@ def purchases_by_supplier():
     query = query.group_by(Supplier.id, Supplier.name, Supplier.code)
     query = query.order_by(func.sum(PurchaseInvoice.total_amount).desc())
 
-    suppliers_data = query.all()
+    fmt = tabular_format()
+    if fmt:
+        return tabular_response(fmt, 'purchases_by_supplier',
+                                ['supplier_id', 'name', 'code', 'invoice_count', 'total_amount',
+                                 'total_tax'], stream_query(query))
+
+    suppliers_data = cached_report('purchases_by_supplier',
+                                   {'start_date': start_date, 'end_date': end_date,
+                                    'supplier_id': supplier_id},
+                                   query.all)
 
     total_amount = sum(s.total_amount or 0 for s in suppliers_data)
     total_invoices = sum(s.invoice_count or 0 for s in suppliers_data)
@@ -475,11 +724,10 @@ def purchases_by_supplier():
 
     all_suppliers = Supplier.query.filter_by(is_active=True).order_by(Supplier.name).all()
 
-    from app.models import Company
-    company = Company.query.first()
-    currency_code = company.currency if company else current_app.config.get('DEFAULT_CURRENCY', 'SAR')
-    currency_name = current_app.config['CURRENCIES'].get(currency_code, {}).get('name', 'ريال')
-    currency_symbol = current_app.config['CURRENCIES'].get(currency_code, {}).get('symbol', 'ر.س')
+    settings = get_company_settings()
+    currency_code = settings.currency_code
+    currency_name = settings.currency_name
+    currency_symbol = settings.currency_symbol
 
     return render_template('reports/purchases_by_supplier.html',
                          suppliers_data=suppliers_data,
@@ -504,79 +752,26 @@ def purchases_monthly():
     if not year:
         year = datetime.now().year
 
-    # Get all invoices for the year
-    start_date = datetime(year, 1, 1).date()
-    end_date = datetime(year, 12, 31).date()
-
-    invoices = PurchaseInvoice.query.filter(
-        PurchaseInvoice.status != 'cancelled',
-        PurchaseInvoice.invoice_date >= start_date,
-        PurchaseInvoice.invoice_date <= end_date
-    ).all()
-
-    # Group by month
-    monthly_dict = {}
-    for invoice in invoices:
-        month_num = invoice.invoice_date.month
-        if month_num not in monthly_dict:
-            monthly_dict[month_num] = {
-                'invoice_count': 0,
-                'total_amount': 0,
-                'total_tax': 0
-            }
-        monthly_dict[month_num]['invoice_count'] += 1
-        monthly_dict[month_num]['total_amount'] += invoice.total_amount
-        monthly_dict[month_num]['total_tax'] += invoice.tax_amount
-
-    # Create complete 12-month data
-    months_data = []
-    month_names = [
-        'يناير', 'فبراير', 'مارس', 'أبريل', 'مايو', 'يونيو',
-        'يوليو', 'أغسطس', 'سبتمبر', 'أكتوبر', 'نوفمبر', 'ديسمبر'
-    ]
-
-    for month_num in range(1, 13):
-        if month_num in monthly_dict:
-            data = monthly_dict[month_num]
-            months_data.append({
-                'month_num': month_num,
-                'month_name': month_names[month_num - 1],
-                'invoice_count': data['invoice_count'],
-                'total_amount': data['total_amount'],
-                'total_tax': data['total_tax']
-            })
-        else:
-            months_data.append({
-                'month_num': month_num,
-                'month_name': month_names[month_num - 1],
-                'invoice_count': 0,
-                'total_amount': 0,
-                'total_tax': 0
-            })
+    # Twelve months from the daily rollups
+    months_data = _months_data(PURCHASE_KINDS, year)
 
     # Calculate totals
     total_invoices = sum(m['invoice_count'] for m in months_data)
     total_purchases = sum(m['total_amount'] for m in months_data)
     total_tax = sum(m['total_tax'] for m in months_data)
 
+    fmt = tabular_format()
+    if fmt:
+        return tabular_response(fmt, f'purchases_monthly_{year}', MONTH_COLUMNS,
+                                [[m[column] for column in MONTH_COLUMNS] for m in months_data])
+
     # Get currency settings
     currency_code = current_app.config.get('CURRENCY', 'EUR')
     currency_name = current_app.config['CURRENCIES'].get(currency_code, {}).get('name', 'Euro')
     currency_symbol = current_app.config['CURRENCIES'].get(currency_code, {}).get('symbol', '€')
 
     # Get available years
-    all_invoices = PurchaseInvoice.query.filter(
-        PurchaseInvoice.status != 'cancelled'
-    ).all()
-
-    years_set = set()
-    for inv in all_invoices:
-        if inv.invoice_date:
-            years_set.add(inv.invoice_date.year)
-
-    available_years = sorted(list(years_set), reverse=True)
-    if not available_years:
-        available_years = [datetime.now().year]
+    available_years = rollup_years(PURCHASE_KINDS) or [datetime.now().year]
 
     return render_template('reports/purchases_monthly.html',
                          months_data=months_data,
@@ -597,17 +792,25 @@ def purchases_monthly():
 @permission_required('reports.sales')
 def customers_list():
     """Customers list report"""
+    fmt = tabular_format()
+    if fmt:
+        rows = db.session.query(Customer.code, Customer.name, Customer.phone, Customer.email,
+                                Customer.city, Customer.current_balance) \
+            .filter(Customer.is_active == True).order_by(Customer.name)
+        return tabular_response(fmt, 'customers',
+                                ['code', 'name', 'phone', 'email', 'city', 'current_balance'],
+                                stream_query(rows))
+
     customers = Customer.query.filter_by(is_active=True).all()
 
     total_customers = len(customers)
     total_balance = sum(c.current_balance or 0 for c in customers)
     customers_with_sales = sum(1 for c in customers if c.invoices)
 
-    from app.models import Company
-    company = Company.query.first()
-    currency_code = company.currency if company else current_app.config.get('DEFAULT_CURRENCY', 'EUR')
-    currency_name = current_app.config['CURRENCIES'].get(currency_code, {}).get('name', 'Euro')
-    currency_symbol = current_app.config['CURRENCIES'].get(currency_code, {}).get('symbol', '€')
+    settings = get_company_settings()
+    currency_code = settings.currency_code
+    currency_name = settings.currency_name
+    currency_symbol = settings.currency_symbol
 
     return render_template('reports/customers.html',
                          customers=customers,
@@ -624,38 +827,24 @@ def customers_list():
 @permission_required('reports.sales')
 def customers_top():
     """Best customers report - ranked by sales volume"""
-    customers_data = []
-    customers = Customer.query.filter_by(is_active=True).all()
-
-    for customer in customers:
-        total_sales = db.session.query(func.sum(SalesInvoice.total_amount))\
-            .filter(SalesInvoice.customer_id == customer.id)\
-            .filter(SalesInvoice.status == 'confirmed')\
-            .scalar() or 0
-
-        invoice_count = SalesInvoice.query.filter_by(
-            customer_id=customer.id,
-            status='confirmed'
-        ).count()
-
-        if total_sales > 0:
-            customers_data.append({
-                'customer': customer,
-                'total_sales': total_sales,
-                'invoice_count': invoice_count,
-                'average_sale': total_sales / invoice_count if invoice_count > 0 else 0
-            })
+    filters = _ranking_filters()
+    ranked = _ranked_parties(Customer, SalesInvoice, SalesInvoice.customer_id, **filters)
 
-    customers_data.sort(key=lambda x: x['total_sales'], reverse=True)
+    fmt = tabular_format()
+    if fmt:
+        return tabular_response(fmt, 'customers_top',
+                                ['rank', 'code', 'name', 'invoice_count', 'total_sales',
+                                 'average_sale', 'share'],
+                                stream_query(ranked))
 
-    total_sales = sum(c['total_sales'] for c in customers_data)
-    total_invoices = sum(c['invoice_count'] for c in customers_data)
+    customers_data = ranked.all()
+    total_sales = sum(c.total for c in customers_data)
+    total_invoices = sum(c.invoice_count for c in customers_data)
 
-    from app.models import Company
-    company = Company.query.first()
-    currency_code = company.currency if company else current_app.config.get('DEFAULT_CURRENCY', 'EUR')
-    currency_name = current_app.config['CURRENCIES'].get(currency_code, {}).get('name', 'Euro')
-    currency_symbol = current_app.config['CURRENCIES'].get(currency_code, {}).get('symbol', '€')
+    settings = get_company_settings()
+    currency_code = settings.currency_code
+    currency_name = settings.currency_name
+    currency_symbol = settings.currency_symbol
 
     return render_template('reports/customers_top.html',
                          customers_data=customers_data,
@@ -663,7 +852,8 @@ def customers_top():
                          total_invoices=total_invoices,
                          currency_code=currency_code,
                          currency_name=currency_name,
-                         currency_symbol=currency_symbol)
+                         currency_symbol=currency_symbol,
+                         **filters)
 
 
 @bp.route('/customers/balances')
@@ -671,17 +861,25 @@ def customers_top():
 @permission_required('reports.sales')
 def customers_balances():
     """Customer balances report"""
+    fmt = tabular_format()
+    if fmt:
+        rows = db.session.query(Customer.code, Customer.name, Customer.phone, Customer.credit_limit,
+                                Customer.current_balance) \
+            .filter(Customer.is_active == True).order_by(Customer.current_balance.desc())
+        return tabular_response(fmt, 'customers_balances',
+                                ['code', 'name', 'phone', 'credit_limit', 'current_balance'],
+                                stream_query(rows))
+
     customers = Customer.query.filter_by(is_active=True).all()
 
     total_debit = sum(c.current_balance for c in customers if (c.current_balance or 0) > 0)
     total_credit = abs(sum(c.current_balance for c in customers if (c.current_balance or 0) < 0))
     net_balance = sum(c.current_balance or 0 for c in customers)
 
-    from app.models import Company
-    company = Company.query.first()
-    currency_code = company.currency if company else current_app.config.get('DEFAULT_CURRENCY', 'EUR')
-    currency_name = current_app.config['CURRENCIES'].get(currency_code, {}).get('name', 'Euro')
-    currency_symbol = current_app.config['CURRENCIES'].get(currency_code, {}).get('symbol', '€')
+    settings = get_company_settings()
+    currency_code = settings.currency_code
+    currency_name = settings.currency_name
+    currency_symbol = settings.currency_symbol
 
     return render_template('reports/customers_balances.html',
                          customers=customers,
@@ -700,6 +898,10 @@ def customers_history(customer_id):
     """Customer history report - shows all transactions for a specific customer"""
     customer = Customer.query.get_or_404(customer_id)
 
+    if tabular_format():
+        return _party_history(SalesInvoice, SalesInvoice.customer_id, customer.id,
+                              f'customer_{customer.code}_history')
+
     invoices = SalesInvoice.query.filter_by(customer_id=customer_id)\
         .order_by(SalesInvoice.invoice_date.desc()).all()
 
@@ -708,11 +910,10 @@ def customers_history(customer_id):
     total_paid = sum(inv.paid_amount or 0 for inv in invoices)
     total_remaining = sum(inv.remaining_amount or 0 for inv in invoices)
 
-    from app.models import Company
-    company = Company.query.first()
-    currency_code = company.currency if company else current_app.config.get('DEFAULT_CURRENCY', 'EUR')
-    currency_name = current_app.config['CURRENCIES'].get(currency_code, {}).get('name', 'Euro')
-    currency_symbol = current_app.config['CURRENCIES'].get(currency_code, {}).get('symbol', '€')
+    settings = get_company_settings()
+    currency_code = settings.currency_code
+    currency_name = settings.currency_name
+    currency_symbol = settings.currency_symbol
 
     return render_template('reports/customers_history.html',
                          customer=customer,
@@ -733,6 +934,15 @@ def customers_history(customer_id):
 @permission_required('reports.purchases')
 def suppliers_list():
     """Suppliers list report"""
+    fmt = tabular_format()
+    if fmt:
+        rows = db.session.query(Supplier.code, Supplier.name, Supplier.phone, Supplier.email,
+                                Supplier.city, Supplier.current_balance) \
+            .filter(Supplier.is_active == True).order_by(Supplier.name)
+        return tabular_response(fmt, 'suppliers',
+                                ['code', 'name', 'phone', 'email', 'city', 'current_balance'],
+                                stream_query(rows))
+
     suppliers = Supplier.query.filter_by(is_active=True).all()
 
     # Calculate totals
@@ -746,11 +956,10 @@ def suppliers_list():
             suppliers_with_purchases += 1
 
     # Get currency settings
-    from app.models import Company
-    company = Company.query.first()
-    currency_code = company.currency if company else current_app.config.get('DEFAULT_CURRENCY', 'EUR')
-    currency_name = current_app.config['CURRENCIES'].get(currency_code, {}).get('name', 'Euro')
-    currency_symbol = current_app.config['CURRENCIES'].get(currency_code, {}).get('symbol', '€')
+    settings = get_company_settings()
+    currency_code = settings.currency_code
+    currency_name = settings.currency_name
+    currency_symbol = settings.currency_symbol
 
     return render_template('reports/suppliers.html',
                          suppliers=suppliers,
@@ -767,45 +976,27 @@ def suppliers_list():
 @permission_required('reports.purchases')
 def suppliers_top():
     """Best suppliers report - ranked by purchase volume"""
-    # Get all suppliers with their purchase totals
-    suppliers_data = []
-
-    suppliers = Supplier.query.filter_by(is_active=True).all()
+    filters = _ranking_filters()
+    ranked = _ranked_parties(Supplier, PurchaseInvoice, PurchaseInvoice.supplier_id, **filters)
 
-    for supplier in suppliers:
-        # Calculate total purchases for this supplier
-        total_purchases = db.session.query(func.sum(PurchaseInvoice.total_amount))\
-            .filter(PurchaseInvoice.supplier_id == supplier.id)\
-            .filter(PurchaseInvoice.status == 'confirmed')\
-            .scalar() or 0
-
-        # Count invoices
-        invoice_count = PurchaseInvoice.query.filter_by(
-            supplier_id=supplier.id,
-            status='confirmed'
-        ).count()
-
-        if total_purchases > 0:
-            suppliers_data.append({
-                'supplier': supplier,
-                'total_purchases': total_purchases,
-                'invoice_count': invoice_count,
-                'average_purchase': total_purchases / invoice_count if invoice_count > 0 else 0
-            })
+    fmt = tabular_format()
+    if fmt:
+        return tabular_response(fmt, 'suppliers_top',
+                                ['rank', 'code', 'name', 'invoice_count', 'total_purchases',
+                                 'average_purchase', 'share'],
+                                stream_query(ranked))
 
-    # Sort by total purchases (descending)
-    suppliers_data.sort(key=lambda x: x['total_purchases'], reverse=True)
+    suppliers_data = ranked.all()
 
     # Calculate totals
-    total_purchases = sum(s['total_purchases'] for s in suppliers_data)
-    total_invoices = sum(s['invoice_count'] for s in suppliers_data)
+    total_purchases = sum(s.total for s in suppliers_data)
+    total_invoices = sum(s.invoice_count for s in suppliers_data)
 
     # Get currency settings
-    from app.models import Company
-    company = Company.query.first()
-    currency_code = company.currency if company else current_app.config.get('DEFAULT_CURRENCY', 'EUR')
-    currency_name = current_app.config['CURRENCIES'].get(currency_code, {}).get('name', 'Euro')
-    currency_symbol = current_app.config['CURRENCIES'].get(currency_code, {}).get('symbol', '€')
+    settings = get_company_settings()
+    currency_code = settings.currency_code
+    currency_name = settings.currency_name
+    currency_symbol = settings.currency_symbol
 
     return render_template('reports/suppliers_top.html',
                          suppliers_data=suppliers_data,
@@ -813,7 +1004,8 @@ def suppliers_top():
                          total_invoices=total_invoices,
                          currency_code=currency_code,
                          currency_name=currency_name,
-                         currency_symbol=currency_symbol)
+                         currency_symbol=currency_symbol,
+                         **filters)
 
 
 @bp.route('/suppliers/balances')
@@ -821,6 +1013,15 @@ def suppliers_top():
 @permission_required('reports.purchases')
 def suppliers_balances():
     """Supplier balances report"""
+    fmt = tabular_format()
+    if fmt:
+        rows = db.session.query(Supplier.code, Supplier.name, Supplier.phone, Supplier.credit_limit,
+                                Supplier.current_balance) \
+            .filter(Supplier.is_active == True).order_by(Supplier.current_balance.desc())
+        return tabular_response(fmt, 'suppliers_balances',
+                                ['code', 'name', 'phone', 'credit_limit', 'current_balance'],
+                                stream_query(rows))
+
     suppliers = Supplier.query.filter_by(is_active=True).all()
 
     # Calculate totals
@@ -829,11 +1030,10 @@ def suppliers_balances():
     net_balance = sum(s.current_balance or 0 for s in suppliers)
 
     # Get currency settings
-    from app.models import Company
-    company = Company.query.first()
-    currency_code = company.currency if company else current_app.config.get('DEFAULT_CURRENCY', 'EUR')
-    currency_name = current_app.config['CURRENCIES'].get(currency_code, {}).get('name', 'Euro')
-    currency_symbol = current_app.config['CURRENCIES'].get(currency_code, {}).get('symbol', '€')
+    settings = get_company_settings()
+    currency_code = settings.currency_code
+    currency_name = settings.currency_name
+    currency_symbol = settings.currency_symbol
 
     return render_template('reports/suppliers_balances.html',
                          suppliers=suppliers,
@@ -845,6 +1045,45 @@ def suppliers_balances():
                          currency_symbol=currency_symbol)
 
 
+def _cash_flow_lines(start_dt, end_dt):
+    """The movements behind the cash flow report; outflows are negative"""
+    sales = db.session.query(SalesInvoice.invoice_number, SalesInvoice.invoice_date, SalesInvoice.paid_amount) \
+        .filter(SalesInvoice.status == 'confirmed',
+                SalesInvoice.invoice_date >= start_dt, SalesInvoice.invoice_date <= end_dt) \
+        .order_by(SalesInvoice.invoice_date, SalesInvoice.id)
+    receipts = db.session.query(Payment.payment_number, Payment.payment_date, Payment.amount) \
+        .filter(Payment.payment_type == 'receipt', Payment.party_type == 'customer',
+                Payment.status == 'posted',
+                Payment.payment_date >= start_dt, Payment.payment_date <= end_dt) \
+        .order_by(Payment.payment_date, Payment.id)
+    purchases = db.session.query(PurchaseInvoice.invoice_number, PurchaseInvoice.invoice_date,
+                                 PurchaseInvoice.paid_amount) \
+        .filter(PurchaseInvoice.status == 'confirmed',
+                PurchaseInvoice.invoice_date >= start_dt, PurchaseInvoice.invoice_date <= end_dt) \
+        .order_by(PurchaseInvoice.invoice_date, PurchaseInvoice.id)
+    payments = db.session.query(Payment.payment_number, Payment.payment_date, Payment.amount) \
+        .filter(Payment.payment_type == 'payment', Payment.party_type == 'supplier',
+                Payment.status == 'posted',
+                Payment.payment_date >= start_dt, Payment.payment_date <= end_dt) \
+        .order_by(Payment.payment_date, Payment.id)
+    expenses = db.session.query(Expense.expense_number, Expense.expense_date, Expense.expense_category,
+                                Expense.amount) \
+        .filter(Expense.status == 'posted',
+                Expense.expense_date >= start_dt, Expense.expense_date <= end_dt) \
+        .order_by(Expense.expense_date, Expense.id)
+
+    return chain(
+        (('inflow', 'sales_invoice', number, day, '', paid or 0) for number, day, paid in stream_query(sales)),
+        (('inflow', 'customer_receipt', number, day, '', amount) for number, day, amount in stream_query(receipts)),
+        (('outflow', 'purchase_invoice', number, day, '', -(paid or 0))
+         for number, day, paid in stream_query(purchases)),
+        (('outflow', 'supplier_payment', number, day, '', -amount)
+         for number, day, amount in stream_query(payments)),
+        (('outflow', 'expense', number, day, category or 'other', -amount)
+         for number, day, category, amount in stream_query(expenses)),
+    )
+
+
 @bp.route('/cash-flow')
 @login_required
 @permission_required('reports.view')
@@ -863,6 +1102,12 @@ def cash_flow():
     start_dt = datetime.strptime(start_date, '%Y-%m-%d').date()
     end_dt = datetime.strptime(end_date, '%Y-%m-%d').date()
 
+    fmt = tabular_format()
+    if fmt:
+        return tabular_response(fmt, 'cash_flow',
+                                ['direction', 'source', 'reference', 'date', 'category', 'amount'],
+                                _cash_flow_lines(start_dt, end_dt))
+
     # --- Operating Activities: Cash Inflows ---
     # 1. Cash received from customers (paid sales invoices)
     sales_invoices = SalesInvoice.query.filter(
@@ -923,9 +1168,9 @@ def cash_flow():
         expense_by_category[cat] = expense_by_category.get(cat, 0) + e.amount
 
     # Currency settings
-    company = Company.query.first()
-    currency_code = company.currency if company else current_app.config.get('DEFAULT_CURRENCY', 'EUR')
-    currency_symbol = current_app.config['CURRENCIES'].get(currency_code, {}).get('symbol', '€')
+    settings = get_company_settings()
+    currency_code = settings.currency_code
+    currency_symbol = settings.currency_symbol
 
     return render_template('reports/cash_flow.html',
                            start_date=start_date,
@@ -967,26 +1212,32 @@ def accounts_receivable():
         query = query.filter(SalesInvoice.payment_status == 'partial')
     # 'all' => no extra filter
 
+    fmt = tabular_format()
+    if fmt:
+        rows = query.with_entities(
+            SalesInvoice.invoice_number, SalesInvoice.invoice_date, Customer.name,
+            SalesInvoice.total_amount, SalesInvoice.paid_amount, SalesInvoice.remaining_amount,
+            SalesInvoice.payment_status
+        ).outerjoin(Customer, SalesInvoice.customer_id == Customer.id) \
+            .order_by(SalesInvoice.invoice_date.asc(), SalesInvoice.id)
+        lines = ((number, day, customer, total, paid or 0, remaining, (today - day).days,
+                  _aging_bucket((today - day).days), status)
+                 for number, day, customer, total, paid, remaining, status in stream_query(rows))
+        return tabular_response(fmt, 'accounts_receivable',
+                                ['invoice_number', 'invoice_date', 'customer', 'total_amount',
+                                 'paid_amount', 'remaining_amount', 'days_overdue', 'aging_bucket',
+                                 'payment_status'], lines)
+
     invoices = query.order_by(SalesInvoice.invoice_date.asc()).all()
 
     # Enrich with aging info
     invoice_data = []
     for inv in invoices:
         days_overdue = (today - inv.invoice_date).days
-        if days_overdue <= 30:
-            aging_bucket = 'current'
-        elif days_overdue <= 60:
-            aging_bucket = '31_60'
-        elif days_overdue <= 90:
-            aging_bucket = '61_90'
-        elif days_overdue <= 120:
-            aging_bucket = '91_120'
-        else:
-            aging_bucket = 'over_120'
         invoice_data.append({
             'invoice': inv,
             'days_overdue': days_overdue,
-            'aging_bucket': aging_bucket
+            'aging_bucket': _aging_bucket(days_overdue)
         })
 
     # Aging totals
@@ -1009,9 +1260,9 @@ def accounts_receivable():
     customers = Customer.query.filter_by(is_active=True).order_by(Customer.name).all()
 
     # Currency settings
-    company = Company.query.first()
-    currency_code = company.currency if company else current_app.config.get('DEFAULT_CURRENCY', 'EUR')
-    currency_symbol = current_app.config['CURRENCIES'].get(currency_code, {}).get('symbol', '€')
+    settings = get_company_settings()
+    currency_code = settings.currency_code
+    currency_symbol = settings.currency_symbol
 
     return render_template('reports/accounts_receivable.html',
                            invoice_data=invoice_data,
@@ -1035,6 +1286,10 @@ def suppliers_history(supplier_id):
     """Supplier history report - shows all transactions for a specific supplier"""
     supplier = Supplier.query.get_or_404(supplier_id)
 
+    if tabular_format():
+        return _party_history(PurchaseInvoice, PurchaseInvoice.supplier_id, supplier.id,
+                              f'supplier_{supplier.code}_history')
+
     # Get all purchase invoices for this supplier
     invoices = PurchaseInvoice.query.filter_by(supplier_id=supplier_id)\
         .order_by(PurchaseInvoice.invoice_date.desc()).all()
@@ -1046,11 +1301,10 @@ def suppliers_history(supplier_id):
     total_remaining = sum(inv.remaining_amount or 0 for inv in invoices)
 
     # Get currency settings
-    from app.models import Company
-    company = Company.query.first()
-    currency_code = company.currency if company else current_app.config.get('DEFAULT_CURRENCY', 'EUR')
-    currency_name = current_app.config['CURRENCIES'].get(currency_code, {}).get('name', 'Euro')
-    currency_symbol = current_app.config['CURRENCIES'].get(currency_code, {}).get('symbol', '€')
+    settings = get_company_settings()
+    currency_code = settings.currency_code
+    currency_name = settings.currency_name
+    currency_symbol = settings.currency_symbol
 
     return render_template('reports/suppliers_history.html',
                          supplier=supplier,
@@ -1064,135 +1318,129 @@ def suppliers_history(supplier_id):
                          currency_symbol=currency_symbol)
 
 # ==================== Excel Export Routes ====================
+# Streamed through app/reports/exports.py: column queries read in batches,
+# write-only workbooks, spooled output
+
+def _openpyxl_missing(endpoint):
+    """Redirect with a message when openpyxl is not installed"""
+    try:
+        import openpyxl  # noqa: F401
+    except ImportError:
+        from flask import flash
+        flash('openpyxl غير مثبت', 'danger')
+        return redirect(url_for(endpoint))
+    return None
+
 
 @bp.route('/export-excel/sales')
 @login_required
 @permission_required('reports.sales')
+@background_export
 def export_excel_sales():
     """Export sales report to Excel"""
-    try:
-        import openpyxl
-        from openpyxl.styles import Font, PatternFill, Alignment
-    except ImportError:
-        from flask import flash
-        flash('openpyxl غير مثبت', 'danger')
-        return redirect(url_for('reports.sales_report'))
+    missing = _openpyxl_missing('reports.sales_report')
+    if missing:
+        return missing
 
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
 
-    query = SalesInvoice.query.filter_by(status='confirmed')
+    query = (db.session.query(SalesInvoice.invoice_number, SalesInvoice.invoice_date, Customer.name,
+                              SalesInvoice.total_amount, SalesInvoice.paid_amount,
+                              SalesInvoice.remaining_amount, SalesInvoice.payment_status)
+             .outerjoin(Customer, SalesInvoice.customer_id == Customer.id)
+             .filter(SalesInvoice.status == 'confirmed'))
     if start_date:
         query = query.filter(SalesInvoice.invoice_date >= datetime.strptime(start_date, '%Y-%m-%d').date())
     if end_date:
         query = query.filter(SalesInvoice.invoice_date <= datetime.strptime(end_date, '%Y-%m-%d').date())
-    invoices = query.order_by(SalesInvoice.invoice_date.desc()).all()
-
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = 'Sales Report'
-    ws.sheet_view.rightToLeft = True
-
-    header_fill = PatternFill(start_color='1a6b3c', end_color='1a6b3c', fill_type='solid')
-    header_font = Font(color='FFFFFF', bold=True)
+    query = query.order_by(SalesInvoice.invoice_date.desc())
 
-    headers = ['Invoice #', 'Date', 'Customer', 'Total', 'Paid', 'Remaining', 'Status']
-    for col, h in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col, value=h)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = Alignment(horizontal='center')
-
-    for row, inv in enumerate(invoices, 2):
-        ws.cell(row=row, column=1, value=inv.invoice_number)
-        ws.cell(row=row, column=2, value=str(inv.invoice_date))
-        ws.cell(row=row, column=3, value=inv.customer.name if inv.customer else '')
-        ws.cell(row=row, column=4, value=inv.total_amount)
-        ws.cell(row=row, column=5, value=inv.paid_amount)
-        ws.cell(row=row, column=6, value=inv.remaining_amount)
-        ws.cell(row=row, column=7, value=inv.payment_status)
-
-    for col in ws.columns:
-        ws.column_dimensions[col[0].column_letter].width = 18
-
-    buf = io.BytesIO()
-    wb.save(buf)
-    buf.seek(0)
+    rows = ((number, str(invoice_date), customer or '', total, paid, remaining, status)
+            for number, invoice_date, customer, total, paid, remaining, status in stream_query(query))
     filename = f'sales_report_{datetime.now().strftime("%Y%m%d")}.xlsx'
-    return send_file(buf, as_attachment=True, download_name=filename,
-                     mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    return xlsx_response(filename, 'Sales Report',
+                         ['Invoice #', 'Date', 'Customer', 'Total', 'Paid', 'Remaining', 'Status'],
+                         rows, header_color='1a6b3c')
 
 
 @bp.route('/export-excel/purchases')
 @login_required
 @permission_required('reports.purchases')
+@background_export
 def export_excel_purchases():
     """Export purchases report to Excel"""
-    try:
-        import openpyxl
-        from openpyxl.styles import Font, PatternFill, Alignment
-    except ImportError:
-        from flask import flash
-        flash('openpyxl غير مثبت', 'danger')
-        return redirect(url_for('reports.purchases_report'))
+    missing = _openpyxl_missing('reports.purchases_report')
+    if missing:
+        return missing
 
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
 
-    query = PurchaseInvoice.query.filter(PurchaseInvoice.status != 'cancelled')
+    query = (db.session.query(PurchaseInvoice.invoice_number, PurchaseInvoice.invoice_date, Supplier.name,
+                              PurchaseInvoice.total_amount, PurchaseInvoice.paid_amount,
+                              PurchaseInvoice.remaining_amount, PurchaseInvoice.payment_status)
+             .outerjoin(Supplier, PurchaseInvoice.supplier_id == Supplier.id)
+             .filter(PurchaseInvoice.status != 'cancelled'))
     if start_date:
         query = query.filter(PurchaseInvoice.invoice_date >= datetime.strptime(start_date, '%Y-%m-%d').date())
     if end_date:
         query = query.filter(PurchaseInvoice.invoice_date <= datetime.strptime(end_date, '%Y-%m-%d').date())
-    invoices = query.order_by(PurchaseInvoice.invoice_date.desc()).all()
+    query = query.order_by(PurchaseInvoice.invoice_date.desc())
 
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = 'Purchases Report'
-    ws.sheet_view.rightToLeft = True
+    rows = ((number, str(invoice_date), supplier or '', total, paid, remaining, status)
+            for number, invoice_date, supplier, total, paid, remaining, status in stream_query(query))
+    filename = f'purchases_report_{datetime.now().strftime("%Y%m%d")}.xlsx'
+    return xlsx_response(filename, 'Purchases Report',
+                         ['Invoice #', 'Date', 'Supplier', 'Total', 'Paid', 'Remaining', 'Status'],
+                         rows, header_color='154360')
 
-    header_fill = PatternFill(start_color='154360', end_color='154360', fill_type='solid')
-    header_font = Font(color='FFFFFF', bold=True)
 
-    headers = ['Invoice #', 'Date', 'Supplier', 'Total', 'Paid', 'Remaining', 'Status']
-    for col, h in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col, value=h)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = Alignment(horizontal='center')
-
-    for row, inv in enumerate(invoices, 2):
-        ws.cell(row=row, column=1, value=inv.invoice_number)
-        ws.cell(row=row, column=2, value=str(inv.invoice_date))
-        ws.cell(row=row, column=3, value=inv.supplier.name if inv.supplier else '')
-        ws.cell(row=row, column=4, value=inv.total_amount)
-        ws.cell(row=row, column=5, value=inv.paid_amount)
-        ws.cell(row=row, column=6, value=inv.remaining_amount)
-        ws.cell(row=row, column=7, value=inv.payment_status)
-
-    for col in ws.columns:
-        ws.column_dimensions[col[0].column_letter].width = 18
+@bp.route('/export-excel/customers-top')
+@login_required
+@permission_required('reports.sales')
+@background_export
+def export_excel_customers_top():
+    """Export the top customers report to Excel"""
+    missing = _openpyxl_missing('reports.customers_top')
+    if missing:
+        return missing
 
-    buf = io.BytesIO()
-    wb.save(buf)
-    buf.seek(0)
-    filename = f'purchases_report_{datetime.now().strftime("%Y%m%d")}.xlsx'
-    return send_file(buf, as_attachment=True, download_name=filename,
-                     mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    ranked = _ranked_parties(Customer, SalesInvoice, SalesInvoice.customer_id, **_ranking_filters())
+    filename = f'customers_top_{datetime.now().strftime("%Y%m%d")}.xlsx'
+    return xlsx_response(filename, 'Top Customers',
+                         ['Rank', 'Code', 'Customer', 'Invoices', 'Total Sales', 'Average', 'Share %'],
+                         stream_query(ranked), header_color='1a6b3c')
+
+
+@bp.route('/export-excel/suppliers-top')
+@login_required
+@permission_required('reports.purchases')
+@background_export
+def export_excel_suppliers_top():
+    """Export the top suppliers report to Excel"""
+    missing = _openpyxl_missing('reports.suppliers_top')
+    if missing:
+        return missing
+
+    ranked = _ranked_parties(Supplier, PurchaseInvoice, PurchaseInvoice.supplier_id,
+                             **_ranking_filters())
+    filename = f'suppliers_top_{datetime.now().strftime("%Y%m%d")}.xlsx'
+    return xlsx_response(filename, 'Top Suppliers',
+                         ['Rank', 'Code', 'Supplier', 'Invoices', 'Total Purchases', 'Average',
+                          'Share %'],
+                         stream_query(ranked), header_color='154360')
 
 
 @bp.route('/export-excel/cash-flow')
 @login_required
 @permission_required('reports.view')
+@background_export
 def export_excel_cash_flow():
     """Export cash flow report to Excel"""
-    try:
-        import openpyxl
-        from openpyxl.styles import Font, PatternFill, Alignment
-    except ImportError:
-        from flask import flash
-        flash('openpyxl غير مثبت', 'danger')
-        return redirect(url_for('reports.cash_flow'))
+    missing = _openpyxl_missing('reports.cash_flow')
+    if missing:
+        return missing
 
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
@@ -1202,132 +1450,68 @@ def export_excel_cash_flow():
     sd = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else today.replace(day=1)
     ed = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else today
 
-    sales = SalesInvoice.query.filter(
-        SalesInvoice.status == 'confirmed',
-        SalesInvoice.invoice_date >= sd,
-        SalesInvoice.invoice_date <= ed
-    ).all()
-
-    purchases = PurchaseInvoice.query.filter(
-        PurchaseInvoice.status == 'confirmed',
-        PurchaseInvoice.invoice_date >= sd,
-        PurchaseInvoice.invoice_date <= ed
-    ).all()
-
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = 'Cash Flow'
-    ws.sheet_view.rightToLeft = True
-
-    header_fill = PatternFill(start_color='0077b6', end_color='0077b6', fill_type='solid')
-    header_font = Font(color='FFFFFF', bold=True)
-
-    ws.cell(row=1, column=1, value='Cash Flow Report').font = Font(bold=True, size=14)
-    ws.cell(row=2, column=1, value=f'Period: {sd} to {ed}')
-
-    ws.cell(row=4, column=1, value='Type')
-    ws.cell(row=4, column=2, value='Invoice #')
-    ws.cell(row=4, column=3, value='Date')
-    ws.cell(row=4, column=4, value='Party')
-    ws.cell(row=4, column=5, value='Amount')
-    for col in range(1, 6):
-        cell = ws.cell(row=4, column=col)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = Alignment(horizontal='center')
-
-    row = 5
-    for inv in sales:
-        ws.cell(row=row, column=1, value='Inflow (Sales)')
-        ws.cell(row=row, column=2, value=inv.invoice_number)
-        ws.cell(row=row, column=3, value=str(inv.invoice_date))
-        ws.cell(row=row, column=4, value=inv.customer.name if inv.customer else '')
-        ws.cell(row=row, column=5, value=inv.total_amount)
-        row += 1
-
-    for inv in purchases:
-        ws.cell(row=row, column=1, value='Outflow (Purchases)')
-        ws.cell(row=row, column=2, value=inv.invoice_number)
-        ws.cell(row=row, column=3, value=str(inv.invoice_date))
-        ws.cell(row=row, column=4, value=inv.supplier.name if inv.supplier else '')
-        ws.cell(row=row, column=5, value=-inv.total_amount)
-        row += 1
-
-    for col in ws.columns:
-        ws.column_dimensions[col[0].column_letter].width = 20
-
-    buf = io.BytesIO()
-    wb.save(buf)
-    buf.seek(0)
+    sales = (db.session.query(SalesInvoice.invoice_number, SalesInvoice.invoice_date, Customer.name,
+                              SalesInvoice.total_amount)
+             .outerjoin(Customer, SalesInvoice.customer_id == Customer.id)
+             .filter(SalesInvoice.status == 'confirmed',
+                     SalesInvoice.invoice_date >= sd,
+                     SalesInvoice.invoice_date <= ed))
+
+    purchases = (db.session.query(PurchaseInvoice.invoice_number, PurchaseInvoice.invoice_date,
+                                  Supplier.name, PurchaseInvoice.total_amount)
+                 .outerjoin(Supplier, PurchaseInvoice.supplier_id == Supplier.id)
+                 .filter(PurchaseInvoice.status == 'confirmed',
+                         PurchaseInvoice.invoice_date >= sd,
+                         PurchaseInvoice.invoice_date <= ed))
+
+    rows = chain(
+        (('Inflow (Sales)', number, str(invoice_date), party or '', total)
+         for number, invoice_date, party, total in stream_query(sales)),
+        (('Outflow (Purchases)', number, str(invoice_date), party or '', -total)
+         for number, invoice_date, party, total in stream_query(purchases)),
+    )
     filename = f'cash_flow_{datetime.now().strftime("%Y%m%d")}.xlsx'
-    return send_file(buf, as_attachment=True, download_name=filename,
-                     mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    return xlsx_response(filename, 'Cash Flow', ['Type', 'Invoice #', 'Date', 'Party', 'Amount'],
+                         rows, header_color='0077b6',
+                         preamble=[('Cash Flow Report',), (f'Period: {sd} to {ed}',), ()])
 
 
 @bp.route('/export-excel/accounts-receivable')
 @login_required
 @permission_required('reports.sales')
+@background_export
 def export_excel_accounts_receivable():
     """Export accounts receivable report to Excel"""
-    try:
-        import openpyxl
-        from openpyxl.styles import Font, PatternFill, Alignment
-    except ImportError:
-        from flask import flash
-        flash('openpyxl غير مثبت', 'danger')
-        return redirect(url_for('reports.accounts_receivable'))
+    missing = _openpyxl_missing('reports.accounts_receivable')
+    if missing:
+        return missing
 
     customer_id = request.args.get('customer_id', type=int)
     status_filter = request.args.get('status', 'unpaid')
     today = datetime.today().date()
 
-    query = SalesInvoice.query.filter(
-        SalesInvoice.status == 'confirmed',
-        SalesInvoice.remaining_amount > 0
-    )
+    query = (db.session.query(SalesInvoice.invoice_number, SalesInvoice.invoice_date, Customer.name,
+                              SalesInvoice.total_amount, SalesInvoice.paid_amount,
+                              SalesInvoice.remaining_amount, SalesInvoice.payment_status)
+             .outerjoin(Customer, SalesInvoice.customer_id == Customer.id)
+             .filter(SalesInvoice.status == 'confirmed',
+                     SalesInvoice.remaining_amount > 0))
     if customer_id:
         query = query.filter(SalesInvoice.customer_id == customer_id)
     if status_filter == 'unpaid':
         query = query.filter(SalesInvoice.payment_status == 'unpaid')
     elif status_filter == 'partial':
         query = query.filter(SalesInvoice.payment_status == 'partial')
-    invoices = query.order_by(SalesInvoice.invoice_date.asc()).all()
-
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = 'Accounts Receivable'
-    ws.sheet_view.rightToLeft = True
-
-    header_fill = PatternFill(start_color='7b3f00', end_color='7b3f00', fill_type='solid')
-    header_font = Font(color='FFFFFF', bold=True)
-
-    headers = ['Invoice #', 'Date', 'Customer', 'Total', 'Paid', 'Remaining', 'Days Overdue', 'Status']
-    for col, h in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col, value=h)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = Alignment(horizontal='center')
-
-    for row, inv in enumerate(invoices, 2):
-        days = (today - inv.invoice_date).days
-        ws.cell(row=row, column=1, value=inv.invoice_number)
-        ws.cell(row=row, column=2, value=str(inv.invoice_date))
-        ws.cell(row=row, column=3, value=inv.customer.name if inv.customer else '')
-        ws.cell(row=row, column=4, value=inv.total_amount)
-        ws.cell(row=row, column=5, value=inv.paid_amount or 0)
-        ws.cell(row=row, column=6, value=inv.remaining_amount)
-        ws.cell(row=row, column=7, value=days)
-        ws.cell(row=row, column=8, value=inv.payment_status)
-
-    for col in ws.columns:
-        ws.column_dimensions[col[0].column_letter].width = 18
+    query = query.order_by(SalesInvoice.invoice_date.asc())
 
-    buf = io.BytesIO()
-    wb.save(buf)
-    buf.seek(0)
+    rows = ((number, str(invoice_date), customer or '', total, paid or 0, remaining,
+             (today - invoice_date).days, status)
+            for number, invoice_date, customer, total, paid, remaining, status in stream_query(query))
     filename = f'accounts_receivable_{datetime.now().strftime("%Y%m%d")}.xlsx'
-    return send_file(buf, as_attachment=True, download_name=filename,
-                     mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    return xlsx_response(filename, 'Accounts Receivable',
+                         ['Invoice #', 'Date', 'Customer', 'Total', 'Paid', 'Remaining',
+                          'Days Overdue', 'Status'],
+                         rows, header_color='7b3f00')
 
 
 # ==================== PDF Export Routes ====================
@@ -1380,6 +1564,7 @@ def _make_pdf_styles():
 @bp.route('/export-pdf/sales')
 @login_required
 @permission_required('reports.sales')
+@background_export
 def export_pdf_sales():
     """Export sales report to PDF"""
     from reportlab.lib.pagesizes import A4, landscape
@@ -1447,6 +1632,7 @@ def export_pdf_sales():
 @bp.route('/export-pdf/purchases')
 @login_required
 @permission_required('reports.purchases')
+@background_export
 def export_pdf_purchases():
     """Export purchases report to PDF"""
     from reportlab.lib.pagesizes import A4, landscape
@@ -1514,6 +1700,7 @@ def export_pdf_purchases():
 @bp.route('/export-pdf/cash-flow')
 @login_required
 @permission_required('reports.view')
+@background_export
 def export_pdf_cash_flow():
     """Export cash flow report to PDF"""
     from reportlab.lib.pagesizes import A4, landscape
@@ -1584,6 +1771,7 @@ def export_pdf_cash_flow():
 @bp.route('/export-pdf/accounts-receivable')
 @login_required
 @permission_required('reports.sales')
+@background_export
 def export_pdf_accounts_receivable():
     """Export accounts receivable report to PDF"""
     from reportlab.lib.pagesizes import A4, landscape
@@ -1704,6 +1892,7 @@ def _make_pdf_table(title, headers, rows, col_widths=None):
 @bp.route('/export-pdf/sales-by-product')
 @login_required
 @permission_required('reports.sales')
+@background_export
 def export_pdf_sales_by_product():
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
@@ -1730,6 +1919,7 @@ def export_pdf_sales_by_product():
 @bp.route('/export-pdf/sales-by-customer')
 @login_required
 @permission_required('reports.sales')
+@background_export
 def export_pdf_sales_by_customer():
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
@@ -1756,27 +1946,11 @@ def export_pdf_sales_by_customer():
 @bp.route('/export-pdf/sales-monthly')
 @login_required
 @permission_required('reports.sales')
+@background_export
 def export_pdf_sales_monthly():
     year = request.args.get('year', type=int) or datetime.now().year
-    invoices = SalesInvoice.query.filter(
-        SalesInvoice.status != 'cancelled',
-        SalesInvoice.invoice_date >= datetime(year, 1, 1).date(),
-        SalesInvoice.invoice_date <= datetime(year, 12, 31).date()
-    ).all()
-
-    monthly = {}
-    for inv in invoices:
-        m = inv.invoice_date.month
-        monthly.setdefault(m, {'count': 0, 'amount': 0})
-        monthly[m]['count'] += 1
-        monthly[m]['amount'] += inv.total_amount
-
-    month_names = ['يناير','فبراير','مارس','أبريل','مايو','يونيو',
-                   'يوليو','أغسطس','سبتمبر','أكتوبر','نوفمبر','ديسمبر']
-    rows = []
-    for i in range(1, 13):
-        d = monthly.get(i, {'count': 0, 'amount': 0})
-        rows.append([month_names[i-1], str(d['count']), f"{d['amount']:.2f}"])
+    rows = [[m['month_name'], str(m['invoice_count']), f"{m['total_amount']:.2f}"]
+            for m in _months_data(SALES_KINDS, year)]
 
     buf = _make_pdf_table(f'تقرير المبيعات الشهري - {year}',
                           ['الشهر', 'عدد الفواتير', 'الإجمالي'], rows)
@@ -1788,6 +1962,7 @@ def export_pdf_sales_monthly():
 @bp.route('/export-pdf/purchases-by-product')
 @login_required
 @permission_required('reports.purchases')
+@background_export
 def export_pdf_purchases_by_product():
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
@@ -1819,6 +1994,7 @@ def export_pdf_purchases_by_product():
 @bp.route('/export-pdf/purchases-by-supplier')
 @login_required
 @permission_required('reports.purchases')
+@background_export
 def export_pdf_purchases_by_supplier():
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
@@ -1847,27 +2023,11 @@ def export_pdf_purchases_by_supplier():
 @bp.route('/export-pdf/purchases-monthly')
 @login_required
 @permission_required('reports.purchases')
+@background_export
 def export_pdf_purchases_monthly():
     year = request.args.get('year', type=int) or datetime.now().year
-    invoices = PurchaseInvoice.query.filter(
-        PurchaseInvoice.status != 'cancelled',
-        PurchaseInvoice.invoice_date >= datetime(year, 1, 1).date(),
-        PurchaseInvoice.invoice_date <= datetime(year, 12, 31).date()
-    ).all()
-
-    monthly = {}
-    for inv in invoices:
-        m = inv.invoice_date.month
-        monthly.setdefault(m, {'count': 0, 'amount': 0})
-        monthly[m]['count'] += 1
-        monthly[m]['amount'] += inv.total_amount
-
-    month_names = ['يناير','فبراير','مارس','أبريل','مايو','يونيو',
-                   'يوليو','أغسطس','سبتمبر','أكتوبر','نوفمبر','ديسمبر']
-    rows = []
-    for i in range(1, 13):
-        d = monthly.get(i, {'count': 0, 'amount': 0})
-        rows.append([month_names[i-1], str(d['count']), f"{d['amount']:.2f}"])
+    rows = [[m['month_name'], str(m['invoice_count']), f"{m['total_amount']:.2f}"]
+            for m in _months_data(PURCHASE_KINDS, year)]
 
     buf = _make_pdf_table(f'تقرير المشتريات الشهري - {year}',
                           ['الشهر', 'عدد الفواتير', 'الإجمالي'], rows)
@@ -1879,6 +2039,7 @@ def export_pdf_purchases_monthly():
 @bp.route('/export-pdf/inventory')
 @login_required
 @permission_required('reports.inventory')
+@background_export
 def export_pdf_inventory():
     products = Product.query.filter_by(is_active=True, track_inventory=True).all()
     rows = []
@@ -1896,6 +2057,7 @@ def export_pdf_inventory():
 @bp.route('/export-pdf/low-stock')
 @login_required
 @permission_required('reports.inventory')
+@background_export
 def export_pdf_low_stock():
     products = Product.query.filter_by(is_active=True, track_inventory=True).all()
     rows = []
@@ -1914,6 +2076,7 @@ def export_pdf_low_stock():
 @bp.route('/export-pdf/stock-movement')
 @login_required
 @permission_required('reports.inventory')
+@background_export
 def export_pdf_stock_movement():
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
@@ -1942,27 +2105,12 @@ def export_pdf_stock_movement():
 @bp.route('/export-pdf/profit-loss')
 @login_required
 @permission_required('reports.financial')
+@background_export
 def export_pdf_profit_loss():
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
 
-    revenue_query = db.session.query(func.sum(SalesInvoice.total_amount)).filter(
-        SalesInvoice.status != 'cancelled')
-    if start_date:
-        revenue_query = revenue_query.filter(
-            SalesInvoice.invoice_date >= datetime.strptime(start_date, '%Y-%m-%d').date())
-    if end_date:
-        revenue_query = revenue_query.filter(
-            SalesInvoice.invoice_date <= datetime.strptime(end_date, '%Y-%m-%d').date())
-    total_revenue = revenue_query.scalar() or 0
-
-    sales_q = SalesInvoice.query.filter(SalesInvoice.status != 'cancelled')
-    if start_date:
-        sales_q = sales_q.filter(SalesInvoice.invoice_date >= datetime.strptime(start_date, '%Y-%m-%d').date())
-    if end_date:
-        sales_q = sales_q.filter(SalesInvoice.invoice_date <= datetime.strptime(end_date, '%Y-%m-%d').date())
-    total_cogs = sum(item.product.cost_price * item.quantity
-                     for inv in sales_q.all() for item in inv.items)
+    total_revenue, total_cogs = _revenue_and_cogs(start_date, end_date)
     gross_profit = total_revenue - total_cogs
 
     rows = [
@@ -1979,6 +2127,7 @@ def export_pdf_profit_loss():
 @bp.route('/export-pdf/customers-list')
 @login_required
 @permission_required('reports.sales')
+@background_export
 def export_pdf_customers_list():
     customers = Customer.query.filter_by(is_active=True).all()
     rows = [[c.name, c.code or '', c.phone or '', f'{c.current_balance or 0:.2f}'] for c in customers]
@@ -1991,17 +2140,10 @@ def export_pdf_customers_list():
 @bp.route('/export-pdf/customers-top')
 @login_required
 @permission_required('reports.sales')
+@background_export
 def export_pdf_customers_top():
-    customers = Customer.query.filter_by(is_active=True).all()
-    data = []
-    for c in customers:
-        total = db.session.query(func.sum(SalesInvoice.total_amount)).filter(
-            SalesInvoice.customer_id == c.id, SalesInvoice.status == 'confirmed').scalar() or 0
-        count = SalesInvoice.query.filter_by(customer_id=c.id, status='confirmed').count()
-        if total > 0:
-            data.append((c.name, count, total))
-    data.sort(key=lambda x: x[2], reverse=True)
-    rows = [[name, str(cnt), f'{amt:.2f}'] for name, cnt, amt in data]
+    ranked = _ranked_parties(Customer, SalesInvoice, SalesInvoice.customer_id, **_ranking_filters())
+    rows = [[r.name, str(r.invoice_count), f'{r.total:.2f}'] for r in ranked]
     buf = _make_pdf_table('أفضل العملاء', ['العميل', 'عدد الفواتير', 'إجمالي المبيعات'], rows)
     return send_file(buf, as_attachment=True,
                      download_name=f'customers_top_{datetime.now().strftime("%Y%m%d")}.pdf',
@@ -2011,6 +2153,7 @@ def export_pdf_customers_top():
 @bp.route('/export-pdf/customers-balances')
 @login_required
 @permission_required('reports.sales')
+@background_export
 def export_pdf_customers_balances():
     customers = Customer.query.filter_by(is_active=True).all()
     rows = [[c.name, c.code or '', f'{c.current_balance or 0:.2f}'] for c in customers]
@@ -2023,6 +2166,7 @@ def export_pdf_customers_balances():
 @bp.route('/export-pdf/suppliers-list')
 @login_required
 @permission_required('reports.purchases')
+@background_export
 def export_pdf_suppliers_list():
     suppliers = Supplier.query.filter_by(is_active=True).all()
     rows = [[s.name, s.code or '', s.phone or '', f'{s.current_balance or 0:.2f}'] for s in suppliers]
@@ -2035,17 +2179,11 @@ def export_pdf_suppliers_list():
 @bp.route('/export-pdf/suppliers-top')
 @login_required
 @permission_required('reports.purchases')
+@background_export
 def export_pdf_suppliers_top():
-    suppliers = Supplier.query.filter_by(is_active=True).all()
-    data = []
-    for s in suppliers:
-        total = db.session.query(func.sum(PurchaseInvoice.total_amount)).filter(
-            PurchaseInvoice.supplier_id == s.id, PurchaseInvoice.status == 'confirmed').scalar() or 0
-        count = PurchaseInvoice.query.filter_by(supplier_id=s.id, status='confirmed').count()
-        if total > 0:
-            data.append((s.name, count, total))
-    data.sort(key=lambda x: x[2], reverse=True)
-    rows = [[name, str(cnt), f'{amt:.2f}'] for name, cnt, amt in data]
+    ranked = _ranked_parties(Supplier, PurchaseInvoice, PurchaseInvoice.supplier_id,
+                             **_ranking_filters())
+    rows = [[r.name, str(r.invoice_count), f'{r.total:.2f}'] for r in ranked]
     buf = _make_pdf_table('أفضل الموردين', ['المورد', 'عدد الفواتير', 'إجمالي المشتريات'], rows)
     return send_file(buf, as_attachment=True,
                      download_name=f'suppliers_top_{datetime.now().strftime("%Y%m%d")}.pdf',
@@ -2055,6 +2193,7 @@ def export_pdf_suppliers_top():
 @bp.route('/export-pdf/suppliers-balances')
 @login_required
 @permission_required('reports.purchases')
+@background_export
 def export_pdf_suppliers_balances():
     suppliers = Supplier.query.filter_by(is_active=True).all()
     rows = [[s.name, s.code or '', f'{s.current_balance or 0:.2f}'] for s in suppliers]
@@ -0,0 +1,331 @@
+"""
+Daily Rollups
+=============
+
+One ``daily_rollups`` row per (tenant, day, warehouse, kind) holding the
+document count, subtotal, tax, total and cost of goods sold of that day's
+non-cancelled invoices, so monthly and yearly figures read a few hundred
+rollup rows instead of every invoice:
+
+    kind        documents
+    sales       sales invoices entered in app/sales
+    pos         sales invoices written by POS checkout (pos_order_id set)
+    purchases   purchase invoices (no COGS)
+
+Keeping it current:
+    * insert / update / delete events of the invoices and their items
+      record the (source, tenant, day) they touch, the previous day too
+      when an invoice is re-dated; before the session commits, those days
+      are recomputed from the invoice tables inside the same transaction,
+      so the rollups commit and roll back with the documents (confirm,
+      pay, cancel, delete, POS checkout and offline sync alike)
+    * two transactions refreshing the same (source, tenant, day) take turns:
+      on PostgreSQL each takes a transaction-level advisory lock per day
+      (in key order) before aggregating, so the second one, under READ
+      COMMITTED, sees the invoices the first committed and neither hits
+      uq_daily_rollups_key nor writes a duplicate NULL-keyed row; SQLite
+      already serializes writers, and the session has flushed (taken the
+      write lock) before the rollups are computed
+    * rebuild_rollups() recomputes every day (bulk UPDATEs, imports,
+      drift repair); from the shell: ``flask rollups rebuild``.  Migration
+      c5d6e7f8a9b0 backfilled the existing invoices with a frozen copy of
+      the aggregate; a change to the rules below needs its own rebuild
+
+COGS is the item quantity times its unit_cost, the product cost price
+recorded when the sale was written (the current cost price for items
+written before unit_cost existed).
+
+Readers go through the ORM, so the tenant filter of app/tenant_mixin.py
+applies:
+
+    months = monthly_rollups(SALES_KINDS, date(2026, 1, 1), date(2026, 12, 31))
+    months[(2026, 3)].total_amount
+"""
+
+import hashlib
+from datetime import datetime
+from typing import NamedTuple
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, extract, func, inspect, select, text
+from sqlalchemy.orm import Session, object_session
+
+from app import db
+from app.models import (DailyRollup, Product, PurchaseInvoice, PurchaseInvoiceItem, SalesInvoice,
+                        SalesInvoiceItem)
+
+_PENDING_KEY = 'daily_rollups'
+
+SALES_KINDS = ('sales', 'pos')
+PURCHASE_KINDS = ('purchases',)
+
+# Invoice columns a rollup is computed from; other updates leave it alone
+_ROLLUP_COLUMNS = ('tenant_id', 'status', 'invoice_date', 'warehouse_id', 'subtotal',
+                   'tax_amount', 'total_amount')
+
+# rebuild_rollups(tenant_id=ALL_TENANTS): every tenant, null tenant included
+ALL_TENANTS = object()
+
+
+class RollupSource(NamedTuple):
+    """An invoice table and the rollup kinds computed from it"""
+    invoice: type
+    item: type
+    kinds: tuple
+    columns: tuple  # watched invoice columns
+    costed: bool
+
+
+SOURCES = {
+    'sales': RollupSource(SalesInvoice, SalesInvoiceItem, SALES_KINDS,
+                          _ROLLUP_COLUMNS + ('pos_order_id',), costed=True),
+    'purchases': RollupSource(PurchaseInvoice, PurchaseInvoiceItem, PURCHASE_KINDS,
+                              _ROLLUP_COLUMNS, costed=False),
+}
+_SOURCE_OF = {source.invoice: name for name, source in SOURCES.items()}
+_ITEM_SOURCE_OF = {source.item: name for name, source in SOURCES.items()}
+
+
+class RollupTotals(NamedTuple):
+    doc_count: int
+    subtotal: float
+    tax_amount: float
+    total_amount: float
+    cogs: float
+
+
+# ─── Computing ───────────────────────────────────────────────────────────
+
+def _as_day(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _scope(tenant_column, day_column, tenant_id, days):
+    criteria = []
+    if tenant_id is None:
+        criteria.append(tenant_column.is_(None))
+    elif tenant_id is not ALL_TENANTS:
+        criteria.append(tenant_column == tenant_id)
+    if days is not None:
+        criteria.append(day_column.in_(sorted(days)))
+    return criteria
+
+
+def _aggregate(connection, name, tenant_id=ALL_TENANTS, days=None):
+    """{(tenant_id, day, warehouse_id, kind): [count, subtotal, tax, total, cogs]}"""
+    source = SOURCES[name]
+    invoices = source.invoice.__table__
+    # POS invoices are told apart by pos_order_id; IS NULL groups the same on every backend
+    split = (invoices.c.pos_order_id.is_(None),) if source.invoice is SalesInvoice else ()
+    keys = (invoices.c.tenant_id, invoices.c.invoice_date, invoices.c.warehouse_id) + split
+    criteria = [invoices.c.status != 'cancelled',
+                *_scope(invoices.c.tenant_id, invoices.c.invoice_date, tenant_id, days)]
+
+    def rollup_key(row):
+        kind = ('sales' if row[3] else 'pos') if split else source.kinds[0]
+        return row[0], _as_day(row[1]), row[2], kind
+
+    totals = {}
+    rows = connection.execute(
+        select(*keys,
+               func.count(invoices.c.id),
+               func.coalesce(func.sum(invoices.c.subtotal), 0),
+               func.coalesce(func.sum(invoices.c.tax_amount), 0),
+               func.coalesce(func.sum(invoices.c.total_amount), 0))
+        .where(*criteria)
+        .group_by(*keys)
+    )
+    for row in rows:
+        count, subtotal, tax, total = row[len(keys):]
+        totals[rollup_key(row)] = [count, subtotal, tax, total, 0.0]
+
+    if source.costed:
+        items = source.item.__table__
+        products = Product.__table__
+        rows = connection.execute(
+            select(*keys, func.sum(items.c.quantity
+                                   * func.coalesce(items.c.unit_cost, products.c.cost_price, 0)))
+            .select_from(items.join(invoices, items.c.invoice_id == invoices.c.id)
+                         .join(products, items.c.product_id == products.c.id))
+            .where(*criteria)
+            .group_by(*keys)
+        )
+        for row in rows:
+            key = rollup_key(row)
+            if key in totals:
+                totals[key][4] = row[-1] or 0.0
+    return totals
+
+
+def _write(connection, name, totals, tenant_id=ALL_TENANTS, days=None):
+    """Replace the rollups of ``name`` in scope by ``totals``"""
+    rollups = DailyRollup.__table__
+    connection.execute(rollups.delete().where(
+        rollups.c.kind.in_(SOURCES[name].kinds),
+        *_scope(rollups.c.tenant_id, rollups.c.day, tenant_id, days)))
+    if not totals:
+        return
+    now = datetime.utcnow()
+    connection.execute(rollups.insert(), [
+        dict(tenant_id=key[0], day=key[1], warehouse_id=key[2], kind=key[3],
+             doc_count=count, subtotal=subtotal, tax_amount=tax, total_amount=total, cogs=cogs,
+             updated_at=now)
+        for key, (count, subtotal, tax, total, cogs) in totals.items()
+    ])
+
+
+def _lock_days(connection, scopes):
+    """Serialize the refreshes of the same (source, tenant, day) until commit"""
+    if connection.dialect.name != 'postgresql':
+        return
+    keys = sorted(
+        int.from_bytes(hashlib.blake2b(f'daily_rollups:{name}:{tenant_id}:{day}'.encode(),
+                                       digest_size=8).digest(), 'big', signed=True)
+        for (name, tenant_id), days in scopes.items() for day in days
+    )
+    for key in keys:
+        connection.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': key})
+
+
+def refresh_rollups(connection, days, invoices=()):
+    """
+    Recompute the rollups of ``days`` ((source, tenant_id, day) triples) and
+    of the days of ``invoices`` ((source, invoice id) pairs).
+    """
+    days = {(name, tenant_id, _as_day(day)) for name, tenant_id, day in days if day is not None}
+    by_source = {}
+    for name, invoice_id in invoices:
+        by_source.setdefault(name, set()).add(invoice_id)
+    for name, ids in by_source.items():
+        table = SOURCES[name].invoice.__table__
+        rows = connection.execute(
+            select(table.c.tenant_id, table.c.invoice_date).where(table.c.id.in_(sorted(ids))))
+        days.update((name, tenant_id, _as_day(day)) for tenant_id, day in rows)
+
+    scopes = {}
+    for name, tenant_id, day in days:
+        scopes.setdefault((name, tenant_id), set()).add(day)
+    _lock_days(connection, scopes)
+    for (name, tenant_id), tenant_days in scopes.items():
+        totals = _aggregate(connection, name, tenant_id, tenant_days)
+        _write(connection, name, totals, tenant_id, tenant_days)
+
+
+def rebuild_rollups(connection=None, tenant_id=ALL_TENANTS):
+    """Recompute every rollup of one tenant or of all; returns ``{source: rows}``"""
+    if connection is None:
+        connection = db.session.connection()
+    if connection.dialect.name == 'postgresql':
+        # Commit-time refreshes wait for the rebuild instead of interleaving with it
+        connection.execute(text('LOCK TABLE daily_rollups IN SHARE ROW EXCLUSIVE MODE'))
+    counts = {}
+    for name in SOURCES:
+        totals = _aggregate(connection, name, tenant_id)
+        _write(connection, name, totals, tenant_id)
+        counts[name] = len(totals)
+    return counts
+
+
+# ─── Keeping rollups in sync ─────────────────────────────────────────────
+
+def _pending(target):
+    session = object_session(target)
+    if session is None:
+        return None
+    return session.info.setdefault(_PENDING_KEY, {'days': set(), 'invoices': set()})
+
+
+def _record_invoice(target, old_days=()):
+    pending = _pending(target)
+    if pending is not None:
+        name = _SOURCE_OF[type(target)]
+        for day in (target.invoice_date, *old_days):
+            pending['days'].add((name, target.tenant_id, day))
+
+
+def _invoice_written(mapper, connection, target):
+    _record_invoice(target)
+
+
+def _invoice_updated(mapper, connection, target):
+    state = inspect(target)
+    columns = SOURCES[_SOURCE_OF[mapper.class_]].columns
+    if not any(state.attrs[name].history.has_changes() for name in columns):
+        return  # e.g. a payment that only moves paid_amount
+    _record_invoice(target, state.attrs.invoice_date.history.deleted or ())
+
+
+def _item_written(mapper, connection, target):
+    pending = _pending(target)
+    if pending is not None and target.invoice_id is not None:
+        pending['invoices'].add((_ITEM_SOURCE_OF[type(target)], target.invoice_id))
+
+
+for _source in SOURCES.values():
+    event.listen(_source.invoice, 'after_insert', _invoice_written)
+    event.listen(_source.invoice, 'after_update', _invoice_updated)
+    event.listen(_source.invoice, 'after_delete', _invoice_written)
+    for _event in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_source.item, _event, _item_written)
+
+
+@event.listens_for(Session, 'before_commit')
+def _apply_rollups(session):
+    if not (session.info.get(_PENDING_KEY) or session.new or session.dirty or session.deleted):
+        return
+    session.flush()  # so this commit's own flush cannot record days too late
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        refresh_rollups(session.connection(), pending['days'], pending['invoices'])
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_rollups(session, previous_transaction):
+    # A rolled back SAVEPOINT keeps the pending days of its outer transaction
+    if not previous_transaction.nested:
+        session.info.pop(_PENDING_KEY, None)
+
+
+# ─── Reading ─────────────────────────────────────────────────────────────
+
+def monthly_rollups(kinds, since, until=None):
+    """{(year, month): RollupTotals} of the rollups of ``kinds`` dated ``since`` to ``until``"""
+    year = extract('year', DailyRollup.day)
+    month = extract('month', DailyRollup.day)
+    query = db.session.query(
+        year, month,
+        func.sum(DailyRollup.doc_count), func.sum(DailyRollup.subtotal),
+        func.sum(DailyRollup.tax_amount), func.sum(DailyRollup.total_amount),
+        func.sum(DailyRollup.cogs),
+    ).filter(DailyRollup.kind.in_(kinds), DailyRollup.day >= since)
+    if until is not None:
+        query = query.filter(DailyRollup.day <= until)
+    return {
+        (int(y), int(m)): RollupTotals(int(count or 0), float(subtotal or 0), float(tax or 0),
+                                       float(total or 0), float(cogs or 0))
+        for y, m, count, subtotal, tax, total, cogs in query.group_by(year, month).all()
+    }
+
+
+def rollup_years(kinds):
+    """Years having rollups of ``kinds``, newest first"""
+    year = extract('year', DailyRollup.day)
+    rows = (db.session.query(year).filter(DailyRollup.kind.in_(kinds))
+            .distinct().all())
+    return sorted((int(y) for y, in rows), reverse=True)
+
+
+# ─── CLI ─────────────────────────────────────────────────────────────────
+
+rollups_cli = AppGroup('rollups', help='Maintain the daily sales and purchase rollups.')
+
+
+@rollups_cli.command('rebuild')
+@click.option('--tenant', 'tenant_id', type=int, help='Only rebuild this tenant.')
+def rebuild_command(tenant_id):
+    """Recompute the rollups from the invoices (after imports or bulk UPDATEs)."""
+    counts = rebuild_rollups(tenant_id=ALL_TENANTS if tenant_id is None else tenant_id)
+    db.session.commit()
+    for name, count in counts.items():
+        click.echo(f'{name}: {count} rollups')
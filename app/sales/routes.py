@@ -3,11 +3,16 @@ from flask_login import login_required, current_user
 from flask_babel import gettext as _
 from app.sales import bp
 from app import db
-from app.models import Customer, SalesInvoice, SalesInvoiceItem, Product, Warehouse, Stock, StockMovement, BankAccount
+from app.models import Customer, SalesInvoice, SalesInvoiceItem, Product, Warehouse, Stock, BankAccount
 from app.models_sales import Quotation, QuotationItem
 from app.utils.accounting_helper import create_sales_invoice_journal_entry
 from app.utils.bank_helper import create_bank_transaction, reverse_bank_transaction
+from app.utils.document_numbers import next_number
+from app.utils.stock_ledger import StockLedger, InsufficientStock
 from app.auth.decorators import permission_required, any_permission_required
+from app.company_settings import get_company, get_company_settings
+from app.search_index import apply_search, clamp_limit
+from app.summaries import sales_invoice_summary
 from datetime import datetime, timedelta
 
 def _cleanup_old_quotations():
@@ -33,11 +38,7 @@ def customers():
     query = Customer.query
     
     if search:
-        query = query.filter(
-            (Customer.name.contains(search)) |
-            (Customer.code.contains(search)) |
-            (Customer.phone.contains(search))
-        )
+        query = apply_search(query, Customer, 'customer', search)
     
     customers = query.order_by(Customer.created_at.desc()).paginate(
         page=page, per_page=20, error_out=False
@@ -130,14 +131,36 @@ def add_customer_ajax():
             'message': str(e)
         }), 400
 
+@bp.route('/api/customers/search')
+@login_required
+@any_permission_required('sales.customers.view', 'sales.invoices.add', 'pos.access')
+def search_customers():
+    """
+    Ranked customer autocomplete (API endpoint).
+
+    GET ?q=<text>&limit=<n>; matches name, English name, code, phone,
+    mobile and email of active customers.
+    """
+    search = request.args.get('q', '').strip()
+    if not search:
+        return jsonify({'customers': []})
+    limit = clamp_limit(request.args.get('limit', type=int))
+    query = apply_search(Customer.query.filter(Customer.is_active == True), Customer, 'customer', search)
+    customers = query.order_by(Customer.name).limit(limit).all()
+    return jsonify({'customers': [{
+        'id': c.id,
+        'code': c.code,
+        'name': c.name,
+        'name_en': c.name_en,
+        'phone': c.phone,
+        'tax_number': c.tax_number,
+    } for c in customers]})
+
 @bp.route('/invoices')
 @login_required
 @permission_required('sales.invoices.view')
 def invoices():
     """List all sales invoices"""
-    from sqlalchemy import func
-    from app.models import Company
-    from flask import current_app
     page = request.args.get('page', 1, type=int)
     search = request.args.get('search', '')
     status = request.args.get('status', '')
@@ -155,64 +178,24 @@ def invoices():
     )
 
     # --- Chart & summary data (all invoices, no filter) ---
-    all_inv = SalesInvoice.query.all()
-    active_inv = [i for i in all_inv if i.status != 'cancelled']
-    total_count     = len(all_inv)
-    total_amount    = sum(i.total_amount    or 0 for i in active_inv)
-    total_paid      = sum(i.paid_amount     or 0 for i in active_inv)
-    total_remaining = sum(i.remaining_amount or 0 for i in active_inv)
-
-    # Status distribution
-    status_counts = {'draft': 0, 'confirmed': 0, 'paid': 0, 'cancelled': 0}
-    for i in all_inv:
-        if i.status in status_counts:
-            status_counts[i.status] += 1
-
-    # Payment status distribution
-    pay_counts = {'paid': 0, 'partial': 0, 'unpaid': 0}
-    for i in all_inv:
-        if i.payment_status in pay_counts:
-            pay_counts[i.payment_status] += 1
-
-    # Monthly sales last 6 months (including current month)
-    import calendar
-    from datetime import date
-    today = date.today()
-    month_labels, month_data = [], []
-    for m in range(5, -1, -1):
-        month = today.month - m
-        year  = today.year
-        while month <= 0:
-            month += 12
-            year  -= 1
-        first = date(year, month, 1)
-        last  = date(year, month, calendar.monthrange(year, month)[1])
-        total = sum(
-            i.total_amount or 0 for i in all_inv
-            if first <= i.invoice_date <= last and i.status != 'cancelled'
-        )
-        month_labels.append(f"{year}/{month:02d}")
-        month_data.append(round(total, 2))
+    summary = sales_invoice_summary()
 
     # Currency
-    company = Company.query.first()
-    currency_symbol = current_app.config['CURRENCIES'].get(
-        company.currency if company else 'EUR', {}
-    ).get('symbol', '€')
+    currency_symbol = get_company_settings().currency_symbol
 
     return render_template('sales/invoices.html',
                          invoices=invoices,
                          search=search,
                          status=status,
-                         total_count=total_count,
-                         total_amount=total_amount,
-                         total_paid=total_paid,
-                         total_remaining=total_remaining,
-                         status_counts=status_counts,
-                         pay_counts=pay_counts,
-                         month_labels=month_labels,
-                         month_data=month_data,
-                         currency_symbol=currency_symbol)
+                         currency_symbol=currency_symbol,
+                         **summary)
+
+@bp.route('/api/invoices/summary')
+@login_required
+@permission_required('sales.invoices.view')
+def invoices_summary():
+    """Sales invoice totals and chart data (JSON API)."""
+    return jsonify(sales_invoice_summary())
 
 @bp.route('/invoices/add', methods=['GET', 'POST'])
 @login_required
@@ -225,17 +208,7 @@ def add_invoice():
             print("Form data:", request.form)
 
             # Generate invoice number
-            today = datetime.utcnow()
-            prefix = f'INV{today.year}{today.month:02d}'
-            last_invoice = SalesInvoice.query.filter(
-                SalesInvoice.invoice_number.like(f'{prefix}%')
-            ).order_by(SalesInvoice.id.desc()).first()
-
-            if last_invoice:
-                last_num = int(last_invoice.invoice_number[-4:])
-                invoice_number = f'{prefix}{(last_num + 1):04d}'
-            else:
-                invoice_number = f'{prefix}0001'
+            invoice_number = next_number('sales_invoice')
 
             print(f"Generated invoice number: {invoice_number}")
 
@@ -270,11 +243,10 @@ def add_invoice():
                         warehouses = Warehouse.query.filter_by(is_active=True).all()
                         bank_accounts = BankAccount.query.filter_by(is_active=True).all()
                         products_query = Product.query.filter_by(is_active=True, is_sellable=True).all()
-                        from app.models import Company
                         from flask import current_app
-                        company = Company.query.first()
-                        currency_code = company.currency if company else current_app.config.get('DEFAULT_CURRENCY', 'EUR')
-                        currency_symbol = current_app.config['CURRENCIES'].get(currency_code, {}).get('symbol', '€')
+                        settings = get_company_settings()
+                        currency_code = settings.currency_code
+                        currency_symbol = settings.currency_symbol
                         today_str = datetime.utcnow().strftime('%Y-%m-%d')
                         products_list = [{'id': p.id, 'name': p.name, 'code': p.code,
                                           'selling_price': float(p.selling_price) if p.selling_price else 0,
@@ -330,6 +302,7 @@ def add_invoice():
                     description=product.name,
                     quantity=quantity,
                     unit_price=unit_price,
+                    unit_cost=product.cost_price,
                     discount_percentage=discount_percentage,
                     discount_amount=discount_amount,
                     tax_rate=product.tax_rate,
@@ -391,11 +364,10 @@ def add_invoice():
     today = date.today().strftime('%Y-%m-%d')
 
     # Get company settings for currency
-    from app.models import Company
     from flask import current_app
-    company = Company.query.first()
-    currency_code = company.currency if company else current_app.config.get('DEFAULT_CURRENCY', 'SAR')
-    currency_symbol = current_app.config['CURRENCIES'].get(currency_code, {}).get('symbol', 'ر.س')
+    settings = get_company_settings()
+    currency_code = settings.currency_code
+    currency_symbol = settings.currency_symbol
 
     return render_template('sales/add_invoice.html',
                          customers=customers,
@@ -422,9 +394,8 @@ def get_product_stock(product_id, warehouse_id):
 @permission_required('sales.invoices.view')
 def invoice_details(id):
     """View invoice details"""
-    from app.models import Company
     invoice = SalesInvoice.query.get_or_404(id)
-    company = Company.query.first()
+    company = get_company()
     return render_template('sales/invoice_details.html', invoice=invoice, company=company)
 
 @bp.route('/invoices/<int:id>/customer-receipt')
@@ -432,9 +403,8 @@ def invoice_details(id):
 @permission_required('sales.invoices.view')
 def customer_receipt(id):
     """Print customer receipt"""
-    from app.models import Company
     invoice = SalesInvoice.query.get_or_404(id)
-    company = Company.query.first()
+    company = get_company()
     return render_template('sales/customer_receipt.html', invoice=invoice, company=company)
 
 @bp.route('/invoices/<int:id>/warehouse-paper')
@@ -445,6 +415,16 @@ def warehouse_paper(id):
     invoice = SalesInvoice.query.get_or_404(id)
     return render_template('sales/warehouse_paper.html', invoice=invoice)
 
+def _flash_insufficient_stock(invoice, error):
+    """Flash the stock error of an invoice line rejected by the stock ledger"""
+    item = next((i for i in invoice.items if i.product_id == error.product_id), None)
+    name = item.product.name if item else error.product_id
+    if error.available is None:
+        flash(_('Product %(name)s not found in warehouse', name=name), 'error')
+    else:
+        flash(_('Insufficient quantity of %(name)s available. Available: %(qty)s',
+               name=name, qty=error.available), 'error')
+
 @bp.route('/invoices/<int:id>/confirm', methods=['POST', 'GET'])
 @login_required
 @permission_required('sales.invoices.confirm')
@@ -460,40 +440,17 @@ def confirm_invoice(id):
         # Update invoice status
         invoice.status = 'confirmed'
 
-        # Update stock for each item
+        # Update stock for all items under one row lock
+        ledger = StockLedger('sales_invoice', invoice.id,
+                             notes=f'بيع - فاتورة رقم {invoice.invoice_number}')
         for item in invoice.items:
-            # Get stock for this product in the warehouse
-            stock = Stock.query.filter_by(
-                product_id=item.product_id,
-                warehouse_id=invoice.warehouse_id
-            ).first()
-
-            if not stock:
-                flash(_('Product %(name)s not found in warehouse', name=item.product.name), 'error')
-                db.session.rollback()
-                return redirect(url_for('sales.invoice_details', id=id))
-
-            # Check if enough quantity available
-            if stock.quantity < item.quantity:
-                flash(_('Insufficient quantity of %(name)s available. Available: %(qty)s', name=item.product.name, qty=stock.quantity), 'error')
-                db.session.rollback()
-                return redirect(url_for('sales.invoice_details', id=id))
-
-            # Reduce stock quantity
-            stock.quantity -= item.quantity
-
-            # Create stock movement record
-            movement = StockMovement(
-                product_id=item.product_id,
-                warehouse_id=invoice.warehouse_id,
-                movement_type='out',
-                quantity=item.quantity,
-                reference_type='sales_invoice',
-                reference_id=invoice.id,
-                notes=f'بيع - فاتورة رقم {invoice.invoice_number}',
-                user_id=current_user.id
-            )
-            db.session.add(movement)
+            ledger.add(item.product_id, invoice.warehouse_id, -item.quantity)
+        try:
+            ledger.post(require_stock=True)
+        except InsufficientStock as e:
+            _flash_insufficient_stock(invoice, e)
+            db.session.rollback()
+            return redirect(url_for('sales.invoice_details', id=id))
 
         # Update customer balance
         invoice.customer.current_balance += invoice.total_amount
@@ -554,45 +511,17 @@ def complete_sale(id):
         invoice.paid_amount = invoice.total_amount
         invoice.remaining_amount = 0
 
-        # Update stock for each item
+        # Update stock for all items under one row lock
+        ledger = StockLedger('sales_invoice', invoice.id,
+                             notes=f'بيع مكتمل - فاتورة رقم {invoice.invoice_number}')
         for item in invoice.items:
-            print(f"Processing item: {item.product.name}, Quantity: {item.quantity}")
-
-            # Get stock for this product in the warehouse
-            stock = Stock.query.filter_by(
-                product_id=item.product_id,
-                warehouse_id=invoice.warehouse_id
-            ).first()
-
-            if not stock:
-                flash(_('Product %(name)s not found in warehouse', name=item.product.name), 'error')
-                db.session.rollback()
-                return redirect(url_for('sales.invoice_details', id=id))
-
-            # Check if enough quantity available
-            if stock.quantity < item.quantity:
-                flash(_('Insufficient quantity of %(name)s available. Available: %(qty)s',
-                       name=item.product.name, qty=stock.quantity), 'error')
-                db.session.rollback()
-                return redirect(url_for('sales.invoice_details', id=id))
-
-            # Reduce stock quantity
-            old_quantity = stock.quantity
-            stock.quantity -= item.quantity
-            print(f"Stock updated: {item.product.name} - Old: {old_quantity}, New: {stock.quantity}")
-
-            # Create stock movement record
-            movement = StockMovement(
-                product_id=item.product_id,
-                warehouse_id=invoice.warehouse_id,
-                movement_type='out',
-                quantity=item.quantity,
-                reference_type='sales_invoice',
-                reference_id=invoice.id,
-                notes=f'بيع مكتمل - فاتورة رقم {invoice.invoice_number}',
-                user_id=current_user.id
-            )
-            db.session.add(movement)
+            ledger.add(item.product_id, invoice.warehouse_id, -item.quantity)
+        try:
+            ledger.post(require_stock=True)
+        except InsufficientStock as e:
+            _flash_insufficient_stock(invoice, e)
+            db.session.rollback()
+            return redirect(url_for('sales.invoice_details', id=id))
 
         # Update customer balance (no balance since it's paid)
         # Customer balance remains unchanged for cash sales
@@ -649,27 +578,11 @@ def delete_invoice(id):
     try:
         # If invoice was confirmed or paid, restore stock and update customer balance
         if invoice.status in ['confirmed', 'paid']:
+            ledger = StockLedger('sales_invoice_delete', invoice.id,
+                                 notes=f'حذف فاتورة مبيعات رقم {invoice.invoice_number}')
             for item in invoice.items:
-                stock = Stock.query.filter_by(
-                    product_id=item.product_id,
-                    warehouse_id=invoice.warehouse_id
-                ).first()
-
-                if stock:
-                    stock.quantity += item.quantity
-
-                    # Create stock movement record
-                    movement = StockMovement(
-                        product_id=item.product_id,
-                        warehouse_id=invoice.warehouse_id,
-                        movement_type='in',
-                        quantity=item.quantity,
-                        reference_type='sales_invoice_delete',
-                        reference_id=invoice.id,
-                        notes=f'حذف فاتورة مبيعات رقم {invoice.invoice_number}',
-                        user_id=current_user.id
-                    )
-                    db.session.add(movement)
+                ledger.add(item.product_id, invoice.warehouse_id, item.quantity)
+            ledger.post(create_missing=False)
 
             # Update customer balance
             invoice.customer.current_balance -= invoice.total_amount
@@ -719,27 +632,11 @@ def cancel_invoice(id):
     try:
         # If invoice was confirmed, restore stock
         if invoice.status == 'confirmed':
+            ledger = StockLedger('sales_invoice_cancel', invoice.id,
+                                 notes=f'إلغاء بيع - فاتورة رقم {invoice.invoice_number}')
             for item in invoice.items:
-                stock = Stock.query.filter_by(
-                    product_id=item.product_id,
-                    warehouse_id=invoice.warehouse_id
-                ).first()
-
-                if stock:
-                    stock.quantity += item.quantity
-
-                    # Create stock movement record
-                    movement = StockMovement(
-                        product_id=item.product_id,
-                        warehouse_id=invoice.warehouse_id,
-                        movement_type='in',
-                        quantity=item.quantity,
-                        reference_type='sales_invoice_cancel',
-                        reference_id=invoice.id,
-                        notes=f'إلغاء بيع - فاتورة رقم {invoice.invoice_number}',
-                        user_id=current_user.id
-                    )
-                    db.session.add(movement)
+                ledger.add(item.product_id, invoice.warehouse_id, item.quantity)
+            ledger.post(create_missing=False)
 
             # Update customer balance
             invoice.customer.current_balance -= invoice.total_amount
@@ -914,11 +811,10 @@ def add_quotation():
     today = date.today().strftime('%Y-%m-%d')
 
     # Get company settings for currency
-    from app.models import Company
     from flask import current_app
-    company = Company.query.first()
-    currency_code = company.currency if company else current_app.config.get('DEFAULT_CURRENCY', 'SAR')
-    currency_symbol = current_app.config['CURRENCIES'].get(currency_code, {}).get('symbol', 'ر.س')
+    settings = get_company_settings()
+    currency_code = settings.currency_code
+    currency_symbol = settings.currency_symbol
 
     return render_template('sales/add_quotation.html',
                          customers=customers,
@@ -956,17 +852,7 @@ def convert_quotation_to_invoice(id):
 
     try:
         # Generate invoice number
-        today = datetime.utcnow()
-        prefix = f'INV{today.year}{today.month:02d}'
-        last_invoice = SalesInvoice.query.filter(
-            SalesInvoice.invoice_number.like(f'{prefix}%')
-        ).order_by(SalesInvoice.id.desc()).first()
-
-        if last_invoice:
-            last_num = int(last_invoice.invoice_number[-4:])
-            invoice_number = f'{prefix}{(last_num + 1):04d}'
-        else:
-            invoice_number = f'{prefix}0001'
+        invoice_number = next_number('sales_invoice')
 
         # Create invoice from quotation
         invoice = SalesInvoice(
@@ -995,6 +881,7 @@ def convert_quotation_to_invoice(id):
                 description=q_item.description,
                 quantity=q_item.quantity,
                 unit_price=q_item.unit_price,
+                unit_cost=q_item.product.cost_price,
                 discount_percentage=q_item.discount_percentage,
                 discount_amount=(q_item.quantity * q_item.unit_price) * (q_item.discount_percentage / 100),
                 tax_rate=q_item.tax_rate,
@@ -0,0 +1,408 @@
+"""
+Search Index
+============
+
+Full-text search over products, customers, suppliers, sales and purchase
+invoices and journal entries that matches Arabic names regardless of
+hamza/alef forms, taa marbuta, alef maqsura, diacritics and tatweel, and
+English names regardless of case.
+
+Every searchable row has one ``search_documents`` row, partitioned by
+tenant, holding its normalize()d field values plus the title, subtitle
+and date shown and ranked by the global ``/search`` without touching the
+entity tables.  The text is matched by the database:
+
+    sqlite       an FTS5 table with the trigram tokenizer
+                 (``search_documents_fts``, kept in sync by triggers);
+                 results are ranked by bm25().  Terms shorter than three
+                 characters cannot use trigrams and are matched with LIKE
+    postgresql   a pg_trgm GIN index on ``content``, used by the LIKE
+                 filters; results are ranked by similarity()
+    others       LIKE filters only, unranked
+
+Keeping it current:
+    * after_insert / after_update / after_delete events of the registered
+      models collect the changed documents; they are written at the end of
+      the flush, with one statement per flush, so they commit and roll
+      back with the rows
+    * rebuild_search_index() re-creates the documents (bulk UPDATEs,
+      imports); from the shell: ``flask search-index rebuild``.  Migration
+      b4c5d6e7f8a9 indexed the rows that existed before with a frozen copy
+      of normalize() and of the registrations below; changing either calls
+      for a rebuild
+
+Usage:
+    query = apply_search(Product.query, Product, 'product', 'شاى')
+    hits = search_documents('شاى', ['product', 'sales_invoice'], limit=10)
+"""
+
+import re
+import unicodedata
+from datetime import date, datetime, time
+from typing import NamedTuple, Optional, Tuple
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import (bindparam, case, column, event, inspect, literal, literal_column, select,
+                        table)
+from sqlalchemy.orm import Session, object_session
+
+from app import db
+from app.models import (Customer, JournalEntry, Product, PurchaseInvoice, SalesInvoice,
+                        SearchDocument, Supplier)
+from app.tenant_mixin import TenantMixin
+
+FTS_TABLE = 'search_documents_fts'
+
+_PENDING_KEY = 'search_documents'
+
+# Shortest term the trigram tokenizer can match
+TRIGRAM_LENGTH = 3
+
+# Results returned by the autocomplete endpoints
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 50
+
+SQLITE_DDL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "content, content='search_documents', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS search_documents_ai AFTER INSERT ON search_documents BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content); END",
+    "CREATE TRIGGER IF NOT EXISTS search_documents_ad AFTER DELETE ON search_documents BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content); END",
+    "CREATE TRIGGER IF NOT EXISTS search_documents_au AFTER UPDATE ON search_documents BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content); "
+    f"INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content); END",
+)
+POSTGRESQL_DDL = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_search_documents_content_trgm "
+    "ON search_documents USING gin (content gin_trgm_ops)",
+)
+
+# Harakat, Quranic marks, superscript alef and tatweel
+_ARABIC_MARKS = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+_ARABIC_LETTERS = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ة': 'ه', 'ى': 'ي', 'ؤ': 'و', 'ئ': 'ي',
+    **{chr(0x0660 + digit): str(digit) for digit in range(10)},  # ٠-٩
+    **{chr(0x06f0 + digit): str(digit) for digit in range(10)},  # ۰-۹
+})
+
+class Searchable(NamedTuple):
+    """A registered model: ``fields`` are indexed, the first one is the title"""
+    model: type
+    fields: Tuple[str, ...]
+    subtitle: Optional[str] = None
+    date: Optional[str] = None
+
+    def document(self, values):
+        """Document columns from the row's ``values`` by column name"""
+        title = values[self.fields[0]]
+        subtitle = values[self.subtitle] if self.subtitle else None
+        doc_date = values[self.date] if self.date else None
+        if isinstance(doc_date, date) and not isinstance(doc_date, datetime):
+            doc_date = datetime.combine(doc_date, time())
+        return dict(content=document_content(values[field] for field in self.fields),
+                    title=str(title)[:256] if title is not None else None,
+                    subtitle=str(subtitle)[:256] if subtitle is not None else None,
+                    doc_date=doc_date)
+
+    def columns(self):
+        return tuple(dict.fromkeys(self.fields + tuple(c for c in (self.subtitle, self.date) if c)))
+
+
+# entity_type -> Searchable
+SEARCHABLE = {}
+_ENTITY_TYPES = {}
+
+
+def normalize(text):
+    """Fold ``text`` to its search form: unified Arabic letters, no marks, lower case"""
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKC', str(text))
+    text = _ARABIC_MARKS.sub('', text).translate(_ARABIC_LETTERS).casefold()
+    return ' '.join(text.split())
+
+
+def document_content(values):
+    return normalize(' '.join(str(value) for value in values if value))
+
+
+def register_searchable(entity_type, model, fields, subtitle=None, date=None):
+    """Index ``fields`` of ``model`` under ``entity_type``; ``fields[0]`` is the title"""
+    SEARCHABLE[entity_type] = Searchable(model, tuple(fields), subtitle, date)
+    _ENTITY_TYPES[model] = entity_type
+    event.listen(model, 'after_insert', _index_write)
+    event.listen(model, 'after_update', _index_write)
+    event.listen(model, 'after_delete', _index_delete)
+
+
+# ─── Keeping documents in sync ───────────────────────────────────────────
+
+def _write_documents(connection, rows):
+    """Insert or replace documents (one executemany)"""
+    docs = SearchDocument.__table__
+    changed = ('tenant_id', 'content', 'title', 'subtitle', 'doc_date', 'updated_at')
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        statement = insert(docs)
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=['entity_type', 'entity_id'],
+            set_={name: statement.excluded[name] for name in changed}), rows)
+        return
+    for row in rows:
+        updated = connection.execute(
+            docs.update()
+            .where(docs.c.entity_type == row['entity_type'], docs.c.entity_id == row['entity_id'])
+            .values({name: row[name] for name in changed})
+        ).rowcount
+        if not updated:
+            connection.execute(docs.insert().values(**row))
+
+
+def _delete_documents(connection, keys):
+    docs = SearchDocument.__table__
+    connection.execute(
+        docs.delete().where(docs.c.entity_type == bindparam('b_type'),
+                            docs.c.entity_id == bindparam('b_id')),
+        [dict(b_type=entity_type, b_id=entity_id) for entity_type, entity_id in keys]
+    )
+
+
+def _record(target, entity_type, document):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_PENDING_KEY, {})[(entity_type, target.id)] = (
+            None if document is None else dict(document, tenant_id=target.tenant_id))
+
+
+def _index_write(mapper, connection, target):
+    entity_type = _ENTITY_TYPES[mapper.class_]
+    searchable = SEARCHABLE[entity_type]
+    state = inspect(target)
+    if state.persistent and not any(state.attrs[name].history.has_changes()
+                                    for name in searchable.columns() + ('tenant_id',)):
+        return  # an update that leaves the indexed columns alone
+    _record(target, entity_type, searchable.document(
+        {name: getattr(target, name) for name in searchable.columns()}))
+
+
+def _index_delete(mapper, connection, target):
+    _record(target, _ENTITY_TYPES[mapper.class_], None)
+
+
+@event.listens_for(Session, 'after_flush')
+def _flush_documents(session, flush_context):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    now = datetime.utcnow()
+    connection = session.connection()
+    written = [dict(document, entity_type=entity_type, entity_id=entity_id, updated_at=now)
+               for (entity_type, entity_id), document in pending.items() if document is not None]
+    deleted = [key for key, document in pending.items() if document is None]
+    if written:
+        _write_documents(connection, written)
+    if deleted:
+        _delete_documents(connection, deleted)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_documents(session, previous_transaction):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def rebuild_search_index(connection=None, entity_types=None, tenant_id=None, batch_size=1000):
+    """
+    Re-create the documents of ``entity_types`` (default: all), of one
+    tenant or of every tenant; returns ``{entity_type: documents}``.
+    """
+    if connection is None:
+        connection = db.session.connection()
+    docs = SearchDocument.__table__
+    counts = {}
+    for entity_type in entity_types or list(SEARCHABLE):
+        searchable = SEARCHABLE[entity_type]
+        source = searchable.model.__table__
+        names = searchable.columns()
+        delete = docs.delete().where(docs.c.entity_type == entity_type)
+        rows = (select(source.c.id, source.c.tenant_id, *[source.c[name] for name in names])
+                .order_by(source.c.id))
+        if tenant_id is not None:
+            delete = delete.where(docs.c.tenant_id == tenant_id)
+            rows = rows.where(source.c.tenant_id == tenant_id)
+        connection.execute(delete)
+        result = connection.execute(rows)
+        counts[entity_type] = 0
+        while True:
+            batch = result.fetchmany(batch_size)
+            if not batch:
+                break
+            connection.execute(docs.insert(), [
+                dict(searchable.document(dict(zip(names, row[2:]))),
+                     tenant_id=row[1], entity_type=entity_type, entity_id=row[0])
+                for row in batch
+            ])
+            counts[entity_type] += len(batch)
+    return counts
+
+
+# ─── Database side ───────────────────────────────────────────────────────
+
+def create_search_backend(connection):
+    """Create the FTS table / trigram index for the connection's dialect"""
+    ddl = {'sqlite': SQLITE_DDL, 'postgresql': POSTGRESQL_DDL}.get(connection.dialect.name, ())
+    for statement in ddl:
+        connection.exec_driver_sql(statement)
+
+
+def drop_search_backend(connection):
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+@event.listens_for(SearchDocument.__table__, 'after_create')
+def _after_create(target, connection, **kw):
+    create_search_backend(connection)
+
+
+@event.listens_for(SearchDocument.__table__, 'before_drop')
+def _before_drop(target, connection, **kw):
+    drop_search_backend(connection)
+
+
+# ─── Querying ────────────────────────────────────────────────────────────
+
+def _contains(term, prefix=False):
+    escaped = term.replace('/', '//').replace('%', '/%').replace('_', '/_')
+    pattern = f'{escaped}%' if prefix else f'%{escaped}%'
+    return SearchDocument.__table__.c.content.like(pattern, escape='/')
+
+
+def _matches(text, conditions, *columns):
+    """
+    Select ``columns`` and a ``rank`` (lower is better) of the documents
+    containing every term of ``text`` and meeting ``conditions``; None when
+    ``text`` has no terms.
+    """
+    terms = normalize(text).split()
+    if not terms:
+        return None
+    docs = SearchDocument.__table__
+    conditions = list(conditions)
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        trigram_terms = [term for term in terms if len(term) >= TRIGRAM_LENGTH]
+        conditions += [_contains(term) for term in terms if len(term) < TRIGRAM_LENGTH]
+        if trigram_terms:
+            fts = table(FTS_TABLE, column('rowid'))
+            match = ' AND '.join('"%s"' % term.replace('"', '""') for term in trigram_terms)
+            return (select(*columns, literal_column(f'bm25({FTS_TABLE})').label('rank'))
+                    .select_from(docs.join(fts, fts.c.rowid == docs.c.id))
+                    .where(literal_column(FTS_TABLE).op('MATCH')(match), *conditions))
+        rank = literal(0.0)
+    elif dialect == 'postgresql':
+        conditions += [_contains(term) for term in terms]  # served by the trigram index
+        rank = -db.func.similarity(docs.c.content, ' '.join(terms))
+    else:
+        conditions += [_contains(term) for term in terms]
+        rank = literal(0.0)
+    return select(*columns, rank.label('rank')).where(*conditions)
+
+
+def _tenant_conditions(tenant_id):
+    if tenant_id is None:
+        tenant_id = TenantMixin.get_current_tenant_id()
+    if tenant_id is None:
+        return []
+    return [SearchDocument.__table__.c.tenant_id == tenant_id]
+
+
+def search_hits(entity_type, text, tenant_id=None):
+    """
+    Subquery of ``(entity_id, rank)`` for rows of ``entity_type`` containing
+    every term of ``text``; a lower rank is a better match.  None when
+    ``text`` has no terms.
+    """
+    docs = SearchDocument.__table__
+    statement = _matches(text, [docs.c.entity_type == entity_type, *_tenant_conditions(tenant_id)],
+                         docs.c.entity_id)
+    return statement.subquery('search_hits') if statement is not None else None
+
+
+def search_documents(text, entity_types, limit=DEFAULT_LIMIT, tenant_id=None):
+    """
+    Best ``limit`` documents of ``entity_types`` matching ``text``, in one
+    query on the search table alone.  Documents whose title starts with
+    the first term come first (typeahead), then by rank, newest first.
+    Returns ``SearchHit`` rows.
+    """
+    if not entity_types:
+        return []
+    docs = SearchDocument.__table__
+    terms = normalize(text).split()
+    if not terms:
+        return []
+    # content starts with the title field (see register_searchable)
+    prefix = case((_contains(terms[0], prefix=True), 0), else_=1).label('prefix')
+    statement = _matches(text, [docs.c.entity_type.in_(entity_types), *_tenant_conditions(tenant_id)],
+                         docs.c.entity_type, docs.c.entity_id, docs.c.title, docs.c.subtitle,
+                         docs.c.doc_date, prefix)
+    if statement is None:
+        return []
+    hits = statement.subquery('search_hits')
+    return db.session.execute(
+        select(hits.c.entity_type, hits.c.entity_id, hits.c.title, hits.c.subtitle, hits.c.doc_date)
+        .order_by(hits.c.prefix, hits.c.rank, hits.c.doc_date.desc())
+        .limit(limit)
+    ).all()
+
+
+def apply_search(query, model, entity_type, text):
+    """Restrict ``query`` over ``model`` to the matches of ``text``, best first"""
+    hits = search_hits(entity_type, text)
+    if hits is None:
+        return query
+    return query.join(hits, hits.c.entity_id == model.id).order_by(hits.c.rank)
+
+
+def clamp_limit(limit):
+    return max(1, min(limit or DEFAULT_LIMIT, MAX_LIMIT))
+
+
+register_searchable('product', Product, ('name', 'name_en', 'code', 'barcode', 'sku'),
+                    subtitle='code', date='created_at')
+register_searchable('customer', Customer, ('name', 'name_en', 'code', 'phone', 'mobile', 'email'),
+                    subtitle='code', date='created_at')
+register_searchable('supplier', Supplier, ('name', 'name_en', 'code', 'phone', 'mobile', 'email'),
+                    subtitle='code', date='created_at')
+register_searchable('sales_invoice', SalesInvoice, ('invoice_number', 'notes'),
+                    subtitle='status', date='invoice_date')
+register_searchable('purchase_invoice', PurchaseInvoice,
+                    ('invoice_number', 'supplier_invoice_number', 'notes'),
+                    subtitle='status', date='invoice_date')
+register_searchable('journal_entry', JournalEntry, ('entry_number', 'description'),
+                    subtitle='description', date='entry_date')
+
+
+# ─── CLI ─────────────────────────────────────────────────────────────────
+
+search_index_cli = AppGroup('search-index', help='Maintain the full-text search index.')
+
+
+@search_index_cli.command('rebuild')
+@click.option('--type', 'entity_types', multiple=True, type=click.Choice(sorted(SEARCHABLE)),
+              help='Entity type to re-index (repeatable; default: all).')
+@click.option('--tenant', 'tenant_id', type=int, help='Only re-index this tenant.')
+def rebuild_command(entity_types, tenant_id):
+    """Re-index existing rows (after imports or bulk UPDATEs)."""
+    counts = rebuild_search_index(entity_types=list(entity_types) or None, tenant_id=tenant_id)
+    db.session.commit()
+    for entity_type, count in counts.items():
+        click.echo(f'{entity_type}: {count} documents')
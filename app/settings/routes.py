@@ -8,6 +8,7 @@ from app.models_settings import AccountingSettings
 from app.models_accounting import Account, BankAccount
 from app.models_currency import Currency, ExchangeRate
 from app.auth.decorators import admin_required, permission_required, any_permission_required
+from app.permission_cache import bump_permissions_version
 import os
 import shutil
 import zipfile
@@ -406,6 +407,7 @@ def add_role():
 
         db.session.add(role)
         db.session.commit()
+        bump_permissions_version()
 
         flash('تم إضافة الدور بنجاح', 'success')
     except Exception as e:
@@ -426,6 +428,7 @@ def edit_role(id):
         role.description = request.form.get('description')
 
         db.session.commit()
+        bump_permissions_version()
         flash('تم تحديث الدور بنجاح', 'success')
     except Exception as e:
         db.session.rollback()
@@ -448,6 +451,7 @@ def delete_role(id):
 
         db.session.delete(role)
         db.session.commit()
+        bump_permissions_version()
         flash('تم حذف الدور بنجاح', 'success')
     except Exception as e:
         db.session.rollback()
@@ -485,6 +489,7 @@ def update_role_permissions(id):
             added_count += 1
 
         db.session.commit()
+        bump_permissions_version()
 
         current_app.logger.info(f'Added {added_count} new permissions')
 
@@ -549,20 +554,21 @@ def add_permission():
 def profile():
     """User profile"""
     if request.method == 'POST':
-        current_user.full_name = request.form.get('full_name')
-        current_user.full_name_en = request.form.get('full_name_en') or None
-        current_user.email = request.form.get('email')
-        current_user.phone = request.form.get('phone')
-        current_user.language = request.form.get('language', 'ar')
+        user = current_user.get_user()
+        user.full_name = request.form.get('full_name')
+        user.full_name_en = request.form.get('full_name_en') or None
+        user.email = request.form.get('email')
+        user.phone = request.form.get('phone')
+        user.language = request.form.get('language', 'ar')
 
         # Update session language
         from flask import session
-        session['language'] = current_user.language
+        session['language'] = user.language
 
         # Change password if provided
         new_password = request.form.get('new_password')
         if new_password:
-            current_user.set_password(new_password)
+            user.set_password(new_password)
 
         db.session.commit()
         flash('تم تحديث الملف الشخصي بنجاح', 'success')
@@ -595,7 +601,7 @@ def change_language():
             return redirect(request.referrer or url_for('main.index'))
 
         # Update user language
-        current_user.language = language
+        current_user.get_user().language = language
 
         # Update session
         session['language'] = language
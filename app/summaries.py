@@ -0,0 +1,146 @@
+"""
+List Page Summaries
+===================
+
+Header cards and charts of list pages computed with aggregate queries
+instead of loading every row into Python (``SalesInvoice.query.all()``,
+``Product.get_stock()`` per product, one COUNT per category).  The same
+functions back the HTML pages and their JSON chart endpoints:
+
+    sales_invoice_summary()   sales.invoices        /sales/api/invoices/summary
+    product_summary()         inventory.products    /inventory/api/products/summary
+
+Every query goes through the ORM, so the tenant filter of
+app/tenant_mixin.py applies.  Building blocks shared with other
+aggregate views (app/dashboard_stats.py) are public: last_months(),
+monthly_totals() and stock_per_product().  Month series are read from
+the daily rollups of app/rollups.py.
+"""
+
+from datetime import date
+
+from sqlalchemy import and_, case, func
+
+from app import db
+from app.models import Category, Product, SalesInvoice, Stock
+from app.rollups import SALES_KINDS, monthly_rollups
+
+INVOICE_STATUSES = ('draft', 'confirmed', 'paid', 'cancelled')
+PAYMENT_STATUSES = ('paid', 'partial', 'unpaid')
+
+
+def last_months(today, count=6):
+    """(year, month) of the last ``count`` months including today's, oldest first"""
+    months = []
+    for i in range(count - 1, -1, -1):
+        year, month = divmod(today.year * 12 + today.month - 1 - i, 12)
+        months.append((year, month + 1))
+    return months
+
+
+def monthly_totals(kinds, since):
+    """{(year, month): total} of the non-cancelled invoices of ``kinds`` dated ``since`` or later"""
+    return {month: totals.total_amount
+            for month, totals in monthly_rollups(kinds, since).items()}
+
+
+def stock_per_product(*criteria):
+    """
+    Subquery of (min_stock, cost_price, quantity) per product matching
+    ``criteria``; quantity is the stock over all warehouses (0 without rows).
+    """
+    return (
+        db.session.query(
+            Product.min_stock.label('min_stock'),
+            func.coalesce(Product.cost_price, 0).label('cost_price'),
+            func.coalesce(func.sum(Stock.quantity), 0).label('quantity'),
+        )
+        .outerjoin(Stock, Stock.product_id == Product.id)
+        .filter(*criteria)
+        .group_by(Product.id, Product.min_stock, Product.cost_price)
+        .subquery()
+    )
+
+
+def _count_where(condition):
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+
+def sales_invoice_summary(today=None):
+    """Totals, status distributions and 6-month chart of all sales invoices"""
+    today = today or date.today()
+
+    status_counts = dict.fromkeys(INVOICE_STATUSES, 0)
+    pay_counts = dict.fromkeys(PAYMENT_STATUSES, 0)
+    total_count = 0
+    total_amount = total_paid = total_remaining = 0
+
+    rows = (db.session.query(
+                SalesInvoice.status,
+                SalesInvoice.payment_status,
+                func.count(SalesInvoice.id),
+                func.sum(SalesInvoice.total_amount),
+                func.sum(SalesInvoice.paid_amount),
+                func.sum(SalesInvoice.remaining_amount))
+            .group_by(SalesInvoice.status, SalesInvoice.payment_status)
+            .all())
+    for status, payment_status, count, amount, paid, remaining in rows:
+        total_count += count
+        if status in status_counts:
+            status_counts[status] += count
+        if payment_status in pay_counts:
+            pay_counts[payment_status] += count
+        if status != 'cancelled':
+            total_amount += amount or 0
+            total_paid += paid or 0
+            total_remaining += remaining or 0
+
+    months = last_months(today)
+    totals = monthly_totals(SALES_KINDS, date(months[0][0], months[0][1], 1))
+
+    return {
+        'total_count': total_count,
+        'total_amount': total_amount,
+        'total_paid': total_paid,
+        'total_remaining': total_remaining,
+        'status_counts': status_counts,
+        'pay_counts': pay_counts,
+        'month_labels': [f'{year}/{month:02d}' for year, month in months],
+        'month_data': [round(totals.get(key, 0), 2) for key in months],
+    }
+
+
+def product_summary():
+    """Product counts, stock status buckets, stock value and category distribution"""
+    total_products, active_products = db.session.query(
+        func.count(Product.id), _count_where(Product.is_active == True),
+    ).one()
+    active_products = int(active_products)
+
+    stock = stock_per_product(Product.is_active == True)
+    out_of_stock, low_stock, stock_value = db.session.query(
+        _count_where(stock.c.quantity <= 0),
+        _count_where(and_(stock.c.quantity > 0,
+                          stock.c.min_stock != 0,
+                          stock.c.quantity <= stock.c.min_stock)),
+        func.coalesce(func.sum(stock.c.quantity * stock.c.cost_price), 0),
+    ).one()
+
+    categories = (db.session.query(Category.name, func.count(Product.id))
+                  .join(Product, Product.category_id == Category.id)
+                  .filter(Category.is_active == True, Product.is_active == True)
+                  .group_by(Category.id, Category.name)
+                  .order_by(Category.id)
+                  .all())
+
+    return {
+        'total_products': total_products,
+        'active_products': active_products,
+        'inactive_products': total_products - active_products,
+        'low_stock_count': int(low_stock),
+        'out_of_stock_count': int(out_of_stock),
+        'in_stock_count': active_products - int(low_stock) - int(out_of_stock),
+        'total_stock_value': float(stock_value),
+        'cat_labels': [name for name, _ in categories],
+        'cat_data': [count for _, count in categories],
+    }
@@ -0,0 +1,152 @@
+"""
+Tenant Resolution Cache
+=======================
+
+Process-local, TTL-bounded cache used by TenantMiddleware so that a warm
+request resolves its tenant without touching the database.
+
+Entries are stored under three keys (id, subdomain and code) that all point
+to the same read-only TenantSnapshot.  Misses are cached too (as None) so
+unknown subdomains do not hit the database on every request.
+
+Invalidation:
+    * automatic - Tenant after_insert / after_update / after_delete events
+    * explicit  - invalidate_tenant(tenant_or_id) for bulk UPDATEs or scripts
+
+Each Gunicorn worker owns its own cache; changes made in another worker
+become visible after at most TENANT_CACHE_TTL seconds.
+"""
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+
+from app.models_tenant import Tenant
+from app.utils.cache_helper import MISSING, TTLCache
+
+
+class TenantSnapshot:
+    """
+    Immutable, session-independent copy of a Tenant row.
+
+    Exposes the same column attributes as Tenant so it can be stored in
+    g.current_tenant without risking DetachedInstanceError across requests.
+    """
+
+    __slots__ = tuple(Tenant.__table__.columns.keys())
+
+    def __init__(self, tenant):
+        for name in self.__slots__:
+            object.__setattr__(self, name, getattr(tenant, name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('TenantSnapshot is read-only')
+
+    def __repr__(self):
+        return f'<TenantSnapshot {self.code}: {self.name}>'
+
+    def is_feature_enabled(self, feature_name):
+        """Check if a specific feature is enabled for this tenant"""
+        if not self.features_enabled:
+            return False
+        return self.features_enabled.get(feature_name, False)
+
+
+class TenantCache:
+    """Tenant lookups by id, subdomain or code backed by a TTLCache"""
+
+    def __init__(self, max_size=1024, ttl=60):
+        self._cache = TTLCache(max_size=max_size, ttl=ttl)
+
+    def get_by_id(self, tenant_id):
+        return self._lookup('id', tenant_id, lambda: Tenant.query.get(tenant_id))
+
+    def get_by_subdomain(self, subdomain):
+        return self._lookup(
+            'subdomain', subdomain,
+            lambda: Tenant.query.filter_by(subdomain=subdomain).first()
+        )
+
+    def get_by_code(self, code):
+        return self._lookup('code', code, lambda: Tenant.query.filter_by(code=code).first())
+
+    def _lookup(self, kind, value, loader):
+        if value is None:
+            return None
+        snapshot = self._cache.get((kind, value))
+        if snapshot is not MISSING:
+            return snapshot
+
+        tenant = loader()
+        if tenant is None:
+            self._cache.set((kind, value), None)
+            return None
+
+        snapshot = TenantSnapshot(tenant)
+        # Prime every key so the next lookup by any identifier is a hit
+        self._cache.set(('id', snapshot.id), snapshot)
+        self._cache.set(('subdomain', snapshot.subdomain), snapshot)
+        self._cache.set(('code', snapshot.code), snapshot)
+        return snapshot
+
+    def invalidate(self, tenant_id=None, subdomain=None, code=None):
+        """Drop every entry that refers to the given tenant (including cached misses)"""
+        keys = {('id', tenant_id), ('subdomain', subdomain), ('code', code)}
+        return self._cache.delete_where(
+            lambda key, snapshot: key in keys
+            or (snapshot is not None and tenant_id is not None and snapshot.id == tenant_id)
+        )
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        return self._cache.stats()
+
+
+def init_tenant_cache(app):
+    """Create the per-application tenant cache from config"""
+    cache = TenantCache(
+        max_size=app.config.get('TENANT_CACHE_SIZE', 1024),
+        ttl=app.config.get('TENANT_CACHE_TTL', 60),
+    )
+    app.extensions['tenant_cache'] = cache
+    return cache
+
+
+def get_tenant_cache():
+    """Return the tenant cache of the current app, or None outside an app context"""
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('tenant_cache')
+
+
+def invalidate_tenant(tenant):
+    """
+    Explicitly drop a tenant from the cache.
+
+    Args:
+        tenant: Tenant instance or tenant id
+    """
+    cache = get_tenant_cache()
+    if cache is None:
+        return
+    if isinstance(tenant, Tenant):
+        cache.invalidate(tenant_id=tenant.id, subdomain=tenant.subdomain, code=tenant.code)
+    else:
+        cache.invalidate(tenant_id=tenant)
+
+
+@event.listens_for(Tenant, 'after_insert')
+@event.listens_for(Tenant, 'after_update')
+@event.listens_for(Tenant, 'after_delete')
+def _invalidate_on_change(mapper, connection, target):
+    cache = get_tenant_cache()
+    if cache is None:
+        return
+    cache.invalidate(tenant_id=target.id, subdomain=target.subdomain, code=target.code)
+
+    # Renamed subdomain/code: drop the entries stored under the previous values too
+    state = inspect(target)
+    for attr in ('subdomain', 'code'):
+        for old_value in state.attrs[attr].history.deleted or ():
+            cache.invalidate(**{attr: old_value})
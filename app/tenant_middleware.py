@@ -6,11 +6,16 @@ This middleware identifies the current tenant based on:
 1. Subdomain (e.g., company1.example.com)
 2. Session (for logged-in users)
 3. Custom header (for API requests)
+
+Lookups go through the process-local TenantCache (app/tenant_cache.py), so a
+warm request resolves its tenant without any SQL round trip.  g.current_tenant
+holds a read-only TenantSnapshot rather than an ORM instance.
 """
 
 from flask import g, request, session, redirect, url_for, abort
 from app.models_tenant import Tenant
 from app.tenant_mixin import set_current_tenant, clear_current_tenant
+from app.tenant_cache import TenantSnapshot, get_tenant_cache, init_tenant_cache
 import re
 
 
@@ -26,6 +31,7 @@ class TenantMiddleware:
     
     def init_app(self, app):
         """Initialize the middleware with Flask app"""
+        init_tenant_cache(app)
         app.before_request(self.before_request)
         app.after_request(self.after_request)
         app.teardown_request(self.teardown_request)
@@ -151,8 +157,7 @@ class TenantMiddleware:
                 return None
             
             # Look up tenant by subdomain
-            tenant = Tenant.query.filter_by(subdomain=subdomain).first()
-            return tenant
+            return get_tenant_cache().get_by_subdomain(subdomain)
         
         return None
     
@@ -161,7 +166,7 @@ class TenantMiddleware:
         """Get tenant from session"""
         tenant_id = session.get('tenant_id')
         if tenant_id:
-            return Tenant.query.get(tenant_id)
+            return get_tenant_cache().get_by_id(tenant_id)
         return None
     
     @staticmethod
@@ -171,14 +176,14 @@ class TenantMiddleware:
         tenant_id = request.headers.get('X-Tenant-ID')
         if tenant_id:
             try:
-                return Tenant.query.get(int(tenant_id))
+                return get_tenant_cache().get_by_id(int(tenant_id))
             except (ValueError, TypeError):
                 pass
         
         # Check for X-Tenant-Code header
         tenant_code = request.headers.get('X-Tenant-Code')
         if tenant_code:
-            return Tenant.query.filter_by(code=tenant_code).first()
+            return get_tenant_cache().get_by_code(tenant_code)
         
         return None
     
@@ -189,7 +194,7 @@ class TenantMiddleware:
         
         if current_user and current_user.is_authenticated:
             if hasattr(current_user, 'tenant_id') and current_user.tenant_id:
-                return Tenant.query.get(current_user.tenant_id)
+                return get_tenant_cache().get_by_id(current_user.tenant_id)
         
         return None
 
@@ -205,7 +210,7 @@ def get_tenant_url(tenant, path=''):
     Returns:
         Full URL with tenant subdomain
     """
-    if isinstance(tenant, Tenant):
+    if isinstance(tenant, (Tenant, TenantSnapshot)):
         subdomain = tenant.subdomain
     else:
         subdomain = tenant
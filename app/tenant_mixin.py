@@ -5,9 +5,13 @@ Tenant Mixin for Multi-Tenant Support
 This mixin adds tenant_id to models and provides automatic filtering.
 """
 
+from functools import lru_cache
+
 from flask import g, has_request_context
 from sqlalchemy import bindparam, event, true as sa_true
 from sqlalchemy.orm import Query, with_loader_criteria, Session
+from sqlalchemy.orm.util import LoaderCriteriaOption
+from sqlalchemy.sql import visitors
 from app import db
 
 
@@ -112,10 +116,117 @@ def register_tenant_events(model_class):
 
 
 # ---------------------------------------------------------------------------
-# Pre-computed list of (model_class, tenant_id_column) pairs populated in
-# setup_tenant_query_filter() once all mappers have been registered.
+# Pre-computed tenant-aware classes populated in init_tenant_support() once
+# all mappers have been registered.
+#
+#   _tenant_aware_classes   model classes that have a tenant_id column
+#   _bind_names             class -> stable bind parameter name
+#   _mappers_by_table       table name -> mappers persisted to that table
 # ---------------------------------------------------------------------------
 _tenant_aware_classes: list = []
+_bind_names: dict = {}
+_mappers_by_table: dict = {}
+
+# frozenset(table names) -> tuple of tenant-aware classes needing criteria
+_classes_by_tables: dict = {}
+
+
+def _joined_closure(mapper, seen):
+    """Collect ``mapper`` and every mapper reachable through lazy='joined'"""
+    if mapper in seen:
+        return
+    seen.add(mapper)
+    for rel in mapper.relationships:
+        if rel.lazy == 'joined':
+            _joined_closure(rel.mapper, seen)
+
+
+def _statement_tables(statement):
+    """Names of every table referenced by ``statement`` (joins and subqueries included)"""
+    return frozenset(
+        element.fullname
+        for element in visitors.iterate(statement)
+        if element.__visit_name__ == 'table'
+    )
+
+
+def tenant_classes_for(statement):
+    """
+    Return the tenant-aware classes that need criteria for ``statement``.
+
+    These are the classes whose tables appear anywhere in the statement,
+    plus the targets of their joined eager loads (those JOINs are only
+    added at compile time).  The result is cached per table set.
+    """
+    tables = _statement_tables(statement)
+    classes = _classes_by_tables.get(tables)
+    if classes is None:
+        mappers = set()
+        for table in tables:
+            for mapper in _mappers_by_table.get(table, ()):
+                _joined_closure(mapper, mappers)
+        classes = tuple(cls for cls in _tenant_aware_classes
+                        if any(m.class_ is cls for m in mappers))
+        _classes_by_tables[tables] = classes
+    return classes
+
+
+@lru_cache(maxsize=4096)
+def _tenant_criteria(cls, tenant_id):
+    """
+    Build (once) the with_loader_criteria option of ``cls`` for ``tenant_id``.
+
+    The bind parameter name depends only on the class, so the statement
+    cache key is identical for every tenant and SQLAlchemy's compiled
+    cache is shared between them; only the bound value differs.
+    """
+    return with_loader_criteria(
+        cls,
+        cls.tenant_id == bindparam(_bind_names[cls], value=tenant_id),
+        include_aliases=True,
+    )
+
+
+def _covered_classes(statement):
+    """Classes that already carry criteria propagated from the parent load"""
+    return {
+        opt.entity.class_ if opt.entity is not None else opt.root_entity
+        for opt in getattr(statement, '_with_options', ())
+        if isinstance(opt, LoaderCriteriaOption)
+    }
+
+
+def _add_tenant_filter(orm_execute_state):
+    """do_orm_execute listener adding the current tenant's loader criteria"""
+    if (not orm_execute_state.is_select
+            or orm_execute_state.execution_options.get('skip_tenant_filter', False)):
+        return
+
+    # No request context → no tenant filtering (scripts, CLI, tests)
+    if not has_request_context():
+        return
+
+    tid = getattr(g, 'current_tenant_id', None)
+    if tid is None or not _tenant_aware_classes:
+        return
+
+    statement = orm_execute_state.statement
+    classes = tenant_classes_for(statement)
+
+    # Relationship loads inherit the parent's criteria through
+    # propagate_to_loaders=True.  Only the classes the parent query did
+    # not reference still need criteria, and parents that were loaded
+    # unfiltered (skip_tenant_filter) stay unfiltered.
+    if orm_execute_state.is_relationship_load:
+        covered = _covered_classes(statement)
+        if not covered:
+            return
+        classes = [cls for cls in classes if cls not in covered]
+
+    if classes:
+        orm_execute_state.statement = statement.options(
+            *[_tenant_criteria(cls, tid) for cls in classes]
+        )
 
 
 def setup_tenant_query_filter():
@@ -137,42 +248,18 @@ def setup_tenant_query_filter():
     callable) to with_loader_criteria(), one per model class that has a
     tenant_id column.  A non-callable where_criteria bypasses the lambda
     analysis path completely (see SQLAlchemy source LoaderCriteriaOption).
-    """
 
-    @event.listens_for(Session, 'do_orm_execute')
-    def _add_tenant_filter(orm_execute_state):
-        # Only apply to top-level SELECT statements.
-        # Relationship loads inherit the criteria automatically via
-        # propagate_to_loaders=True (the default for with_loader_criteria).
-        if (not orm_execute_state.is_select
-                or orm_execute_state.is_relationship_load
-                or orm_execute_state.execution_options.get('skip_tenant_filter', False)):
-            return
-
-        # No request context → no tenant filtering (scripts, CLI, tests)
-        if not has_request_context():
-            return
+    Performance
+    -----------
+    Only the tenant-aware classes actually referenced by the statement get
+    an option (see tenant_classes_for()), and each (class, tenant) option is
+    built once and reused (see _tenant_criteria()).
 
-        tid = getattr(g, 'current_tenant_id', None)
-        if tid is None:
-            return
-
-        # Build one non-callable with_loader_criteria per tenant-aware class.
-        # Passing a direct BinaryExpression (cls.tenant_id == tid) instead of a
-        # callable avoids SQLAlchemy's lambda caching system entirely, which is
-        # incompatible with Python scalar closure variables in SQLAlchemy 2.x.
-        if not _tenant_aware_classes:
-            return
-
-        options = [
-            with_loader_criteria(
-                cls,
-                cls.tenant_id == bindparam(f'tenant_id_{index}', value=tid),
-                include_aliases=True,
-            )
-            for index, cls in enumerate(_tenant_aware_classes)
-        ]
-        orm_execute_state.statement = orm_execute_state.statement.options(*options)
+    The listener is registered once per process even though create_app()
+    may run several times (tests, CLI).
+    """
+    if not event.contains(Session, 'do_orm_execute', _add_tenant_filter):
+        event.listen(Session, 'do_orm_execute', _add_tenant_filter)
 
 
 def init_tenant_support(app):
@@ -191,6 +278,18 @@ def init_tenant_support(app):
         if (hasattr(mapper.class_, 'tenant_id')
             and getattr(mapper.class_, '__tablename__', None) != 'tenants')
     ]
+    # Not 'tenant_id_N': that is the anonymous name SQLAlchemy gives to
+    # explicit ``Model.tenant_id == x`` filters, and the two would clash.
+    _bind_names.clear()
+    _bind_names.update(
+        (cls, f'tenant_filter_{index}') for index, cls in enumerate(_tenant_aware_classes)
+    )
+    _mappers_by_table.clear()
+    for mapper in db.Model.registry.mappers:
+        for table in mapper.tables:
+            _mappers_by_table.setdefault(table.fullname, []).append(mapper)
+    _classes_by_tables.clear()
+    _tenant_criteria.cache_clear()
 
     # Register automatic query filtering (the main isolation mechanism)
     setup_tenant_query_filter()
@@ -6,7 +6,7 @@ Functions to automatically create journal entries for various transactions
 from app import db
 from app.models_accounting import JournalEntry, JournalEntryItem
 from app.models_settings import AccountingSettings
-from datetime import datetime
+from app.utils.document_numbers import next_number
 
 def create_sales_invoice_journal_entry(invoice):
     """
@@ -26,17 +26,7 @@ def create_sales_invoice_journal_entry(invoice):
         raise ValueError('إعدادات الحسابات المحاسبية غير مكتملة')
     
     # Generate entry number
-    today = datetime.utcnow()
-    prefix = f'JE{today.year}{today.month:02d}'
-    last_entry = JournalEntry.query.filter(
-        JournalEntry.entry_number.like(f'{prefix}%')
-    ).order_by(JournalEntry.id.desc()).first()
-    
-    if last_entry:
-        last_num = int(last_entry.entry_number[-4:])
-        entry_number = f'{prefix}{(last_num + 1):04d}'
-    else:
-        entry_number = f'{prefix}0001'
+    entry_number = next_number('journal_entry')
     
     # Create journal entry
     entry = JournalEntry(
@@ -109,17 +99,7 @@ def create_purchase_invoice_journal_entry(invoice):
         raise ValueError('إعدادات الحسابات المحاسبية غير مكتملة')
     
     # Generate entry number
-    today = datetime.utcnow()
-    prefix = f'JE{today.year}{today.month:02d}'
-    last_entry = JournalEntry.query.filter(
-        JournalEntry.entry_number.like(f'{prefix}%')
-    ).order_by(JournalEntry.id.desc()).first()
-    
-    if last_entry:
-        last_num = int(last_entry.entry_number[-4:])
-        entry_number = f'{prefix}{(last_num + 1):04d}'
-    else:
-        entry_number = f'{prefix}0001'
+    entry_number = next_number('journal_entry')
     
     # Create journal entry
     entry = JournalEntry(
@@ -192,17 +172,7 @@ def create_payment_journal_entry(payment):
         return None
 
     # Generate entry number
-    today = datetime.utcnow()
-    prefix = f'JE{today.year}{today.month:02d}'
-    last_entry = JournalEntry.query.filter(
-        JournalEntry.entry_number.like(f'{prefix}%')
-    ).order_by(JournalEntry.id.desc()).first()
-
-    if last_entry:
-        last_num = int(last_entry.entry_number[-4:])
-        entry_number = f'{prefix}{(last_num + 1):04d}'
-    else:
-        entry_number = f'{prefix}0001'
+    entry_number = next_number('journal_entry')
 
     # Determine cash/bank account
     cash_account_id = payment.bank_account.account_id if payment.bank_account else settings.cash_account_id
@@ -4,6 +4,7 @@ Bank account helper functions
 """
 from app import db
 from app.models_accounting import BankAccount, BankTransaction, Account
+from app.utils.document_numbers import next_number
 from datetime import datetime
 from flask_login import current_user
 
@@ -54,17 +55,7 @@ def create_bank_transaction(bank_account_id, transaction_type, amount, reference
         
         # Generate transaction number
         today = datetime.utcnow()
-        prefix = f'BT{today.year}{today.month:02d}{today.day:02d}'
-        
-        last_trans = BankTransaction.query.filter(
-            BankTransaction.transaction_number.like(f'{prefix}%')
-        ).order_by(BankTransaction.id.desc()).first()
-        
-        if last_trans:
-            last_num = int(last_trans.transaction_number[-4:])
-            trans_number = f'{prefix}{(last_num + 1):04d}'
-        else:
-            trans_number = f'{prefix}0001'
+        trans_number = next_number('bank_transaction', when=today)
         
         # Create transaction record
         transaction = BankTransaction(
@@ -141,17 +132,7 @@ def reverse_bank_transaction(reference_type, reference_id):
 
         # Create reverse transaction
         today = datetime.utcnow()
-        prefix = f'BT{today.year}{today.month:02d}{today.day:02d}'
-
-        last_trans = BankTransaction.query.filter(
-            BankTransaction.transaction_number.like(f'{prefix}%')
-        ).order_by(BankTransaction.id.desc()).first()
-
-        if last_trans:
-            last_num = int(last_trans.transaction_number[-4:])
-            trans_number = f'{prefix}{(last_num + 1):04d}'
-        else:
-            trans_number = f'{prefix}0001'
+        trans_number = next_number('bank_transaction', when=today)
 
         reverse_transaction = BankTransaction(
             transaction_number=trans_number,
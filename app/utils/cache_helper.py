@@ -0,0 +1,107 @@
+"""
+Cache Helper
+Small process-local caches used to keep hot lookups off the database
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+# Sentinel returned by TTLCache.get() when a key is absent or expired.
+# A cached value of None is legitimate (e.g. "no tenant for this subdomain").
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Bounded, thread-safe LRU cache whose entries expire after ``ttl`` seconds.
+
+    The cache is process-local: every Gunicorn worker holds its own copy, so
+    cross-worker staleness is bounded by the TTL while invalidation inside
+    the worker that performed the write is immediate.
+
+    Usage:
+        cache = TTLCache(max_size=1024, ttl=60)
+        value = cache.get(key)
+        if value is MISSING:
+            value = load(key)
+            cache.set(key, value)
+    """
+
+    def __init__(self, max_size=1024, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the cached value for ``key`` or ``MISSING``"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._data[key]
+                self.misses += 1
+                return MISSING
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Store ``value`` under ``key``, evicting the least recently used entry when full"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, key, loader):
+        """Return the cached value for ``key``, calling ``loader()`` on a miss"""
+        value = self.get(key)
+        if value is MISSING:
+            value = loader()
+            self.set(key, value)
+        return value
+
+    def delete(self, key):
+        """Drop ``key`` if present"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_where(self, predicate):
+        """Drop every entry whose (key, value) satisfies ``predicate``"""
+        with self._lock:
+            doomed = [k for k, (_, v) in self._data.items() if predicate(k, v)]
+            for k in doomed:
+                del self._data[k]
+        return len(doomed)
+
+    def clear(self):
+        """Drop every entry (counters are kept)"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """Return hit/miss counters suitable for JSON output"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'max_size': self.max_size,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0,
+        }
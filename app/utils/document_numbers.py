@@ -0,0 +1,259 @@
+"""
+Document Number Allocator
+=========================
+
+Single API for invoice, POS order/session, journal entry and bank
+transaction numbers.  Numbers keep their historical format, e.g.
+``INV2026100001`` (prefix + period + zero padded counter), but are taken
+from a per-tenant, per-series counter row (DocumentSequence) that is
+incremented atomically:
+
+    UPDATE document_sequences SET last_value = last_value + n
+     WHERE tenant_id = ? AND series = ? AND period = ?
+    RETURNING last_value
+
+instead of scanning the documents table with ``LIKE 'PREFIX%'`` and adding
+one, which raced between Gunicorn workers and ended in unique-constraint
+failures.
+
+Gap-free numbering
+------------------
+next_number() increments the counter inside the caller's transaction.  The
+UPDATE holds the counter row lock until the caller commits, and a rollback
+of the document also rolls back the counter, so numbers are never skipped.
+
+Block preallocation
+-------------------
+High-volume POS sessions can pass ``block_scope``/``block_size``: a block
+of numbers is then reserved in its own short transaction and handed out
+from memory, so the counter row is not held for the whole checkout.
+Numbers left in a block when its scope is released (e.g. the session is
+closed) are skipped; use blocks only for series where that is acceptable.
+
+Usage:
+    from app.utils.document_numbers import next_number, next_numbers
+    invoice_number = next_number('sales_invoice')
+    order_numbers = next_numbers('pos_order', 50)
+"""
+
+import threading
+from datetime import datetime
+
+from flask import current_app, g, has_app_context, has_request_context
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models_settings import DocumentSequence
+
+
+class Series:
+    """Number format of a document series and where its documents live"""
+
+    def __init__(self, name, prefix, period_format, width, model, column):
+        self.name = name
+        self.prefix = prefix
+        self.period_format = period_format
+        self.width = width
+        self.model = model
+        self.column = column
+
+    def period(self, when):
+        return when.strftime(self.period_format)
+
+    def format(self, period, value):
+        return f'{self.prefix}{period}{value:0{self.width}d}'
+
+
+# series name -> (prefix, period strftime format, counter width, model, number column)
+SERIES = {
+    'sales_invoice': ('INV', '%Y%m', 4, 'SalesInvoice', 'invoice_number'),
+    'pos_order': ('ORD', '%Y%m%d', 4, 'POSOrder', 'order_number'),
+    'pos_session': ('POS', '%Y%m%d', 3, 'POSSession', 'session_number'),
+    'journal_entry': ('JE', '%Y%m', 4, 'JournalEntry', 'entry_number'),
+    'manual_journal_entry': ('JE', '%Y%m%d', 4, 'JournalEntry', 'entry_number'),
+    'bank_transaction': ('BT', '%Y%m%d', 4, 'BankTransaction', 'transaction_number'),
+}
+
+_series = {}
+
+
+def get_series(name):
+    """Return the Series definition for ``name`` (ValueError if unknown)"""
+    series = _series.get(name)
+    if series is None:
+        if name not in SERIES:
+            raise ValueError(f'Unknown document series: {name}')
+        import app.models as models
+        prefix, period_format, width, model, column = SERIES[name]
+        series = _series[name] = Series(name, prefix, period_format, width,
+                                        getattr(models, model), column)
+    return series
+
+
+def _current_tenant_id():
+    if has_request_context():
+        tenant_id = getattr(g, 'current_tenant_id', None)
+        if tenant_id is None:
+            from flask_login import current_user
+            tenant_id = getattr(current_user, 'tenant_id', None)
+        return tenant_id
+    return None
+
+
+def _seed_value(connection, series, tenant_id, period):
+    """Highest counter already used by documents of this series and period"""
+    column = getattr(series.model, series.column)
+    prefix = f'{series.prefix}{period}'
+    stmt = select(func.max(column)).where(
+        column.like(f'{prefix}%'),
+        func.length(column) == len(prefix) + series.width,
+    )
+    if tenant_id:
+        stmt = stmt.where(series.model.tenant_id == tenant_id)
+    last = connection.execute(stmt).scalar()
+    suffix = last[len(prefix):] if last else ''
+    return int(suffix) if suffix.isdigit() else 0
+
+
+def _increment(connection, key, count):
+    """Atomically add ``count`` to the counter row; return the new value or None"""
+    table = DocumentSequence.__table__
+    where = ((table.c.tenant_id == key[0])
+             & (table.c.series == key[1])
+             & (table.c.period == key[2]))
+    stmt = update(table).where(where).values(
+        last_value=table.c.last_value + count,
+        updated_at=datetime.utcnow(),
+    )
+    if connection.dialect.update_returning:
+        return connection.execute(stmt.returning(table.c.last_value)).scalar()
+    # The UPDATE holds the row lock, so reading it back is still atomic
+    if connection.execute(stmt).rowcount == 0:
+        return None
+    return connection.execute(select(table.c.last_value).where(where)).scalar()
+
+
+def _create_counter(connection, key, seed):
+    """Insert the counter row, tolerating a concurrent insert of the same key"""
+    table = DocumentSequence.__table__
+    values = dict(tenant_id=key[0], series=key[1], period=key[2],
+                  last_value=seed, updated_at=datetime.utcnow())
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        connection.execute(insert(table).values(**values).on_conflict_do_nothing())
+        return
+    try:
+        with connection.begin_nested():
+            connection.execute(table.insert().values(**values))
+    except IntegrityError:
+        pass
+
+
+def _allocate(connection, series, tenant_id, period, count):
+    """Reserve ``count`` numbers; return the last one reserved"""
+    key = (tenant_id or 0, series.name, period)
+    value = _increment(connection, key, count)
+    if value is None:
+        _create_counter(connection, key, _seed_value(connection, series, tenant_id, period))
+        value = _increment(connection, key, count)
+    return value
+
+
+class NumberBlock:
+    """A preallocated, contiguous range of numbers of one series and period"""
+
+    __slots__ = ('period', 'next_value', 'last_value')
+
+    def __init__(self, period, first_value, last_value):
+        self.period = period
+        self.next_value = first_value
+        self.last_value = last_value
+
+    def take(self):
+        if self.next_value > self.last_value:
+            return None
+        value = self.next_value
+        self.next_value += 1
+        return value
+
+
+_blocks_lock = threading.Lock()
+
+
+def _get_blocks():
+    return current_app.extensions.setdefault('document_number_blocks', {})
+
+
+def _reserve_block(series, tenant_id, period, size):
+    # Committed on its own connection: numbers handed out from memory must
+    # never be rolled back together with one of the caller's documents.
+    with db.engine.begin() as connection:
+        last = _allocate(connection, series, tenant_id, period, size)
+    return NumberBlock(period, last - size + 1, last)
+
+
+def next_number(series_name, tenant_id=None, when=None, block_scope=None, block_size=0):
+    """
+    Allocate the next document number of ``series_name``.
+
+    Args:
+        series_name: key of SERIES (e.g. 'sales_invoice', 'pos_order')
+        tenant_id: tenant owning the document (defaults to the current one)
+        when: datetime used for the period part of the number (default: now)
+        block_scope: hashable owner of a preallocated block (e.g. a POS session)
+        block_size: numbers to reserve per block; 0 disables preallocation
+
+    Returns:
+        The formatted number, e.g. 'ORD202610180042'
+    """
+    series = get_series(series_name)
+    if tenant_id is None:
+        tenant_id = _current_tenant_id()
+    period = series.period(when or datetime.utcnow())
+
+    if block_scope is not None and block_size > 1 and has_app_context():
+        key = (tenant_id or 0, series_name, block_scope)
+        with _blocks_lock:
+            blocks = _get_blocks()
+            block = blocks.get(key)
+            value = block.take() if block is not None and block.period == period else None
+            if value is None:
+                block = blocks[key] = _reserve_block(series, tenant_id, period, block_size)
+                value = block.take()
+        return series.format(period, value)
+
+    value = _allocate(db.session.connection(), series, tenant_id, period, 1)
+    return series.format(period, value)
+
+
+def next_numbers(series_name, count, tenant_id=None, when=None):
+    """
+    Allocate ``count`` consecutive numbers of ``series_name`` with a single
+    counter update in the caller's transaction (gap-free like next_number()).
+
+    Returns:
+        List of formatted numbers, oldest first
+    """
+    if count <= 0:
+        return []
+    series = get_series(series_name)
+    if tenant_id is None:
+        tenant_id = _current_tenant_id()
+    period = series.period(when or datetime.utcnow())
+    last = _allocate(db.session.connection(), series, tenant_id, period, count)
+    return [series.format(period, value) for value in range(last - count + 1, last + 1)]
+
+
+def release_blocks(block_scope):
+    """Forget the preallocated blocks of ``block_scope`` (remaining numbers are skipped)"""
+    if not has_app_context():
+        return
+    with _blocks_lock:
+        blocks = _get_blocks()
+        for key in [k for k in blocks if k[2] == block_scope]:
+            del blocks[key]
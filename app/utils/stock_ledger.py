@@ -0,0 +1,239 @@
+"""
+Stock Ledger
+============
+
+Single API for every change of warehouse stock quantities (POS orders,
+sales and purchase invoices, transfers, damaged inventory).
+
+A ledger collects a batch of lines, (product, warehouse, delta) plus
+movement details, and posts them in the caller's transaction:
+
+    1. lock the affected Stock rows, once, in (product_id, warehouse_id)
+       order so concurrent batches cannot deadlock:
+           PostgreSQL/MySQL   SELECT ... ORDER BY ... FOR UPDATE
+           SQLite             BEGIN IMMEDIATE (database write lock)
+    2. create the missing rows (INSERT ... ON CONFLICT DO NOTHING)
+    3. apply the deltas to the locked rows
+    4. insert all StockMovement rows with one executemany INSERT
+
+This replaces the per-line ``Stock.query.filter_by(...).first()`` followed
+by ``stock.quantity -= qty``, which lost updates when two checkouts sold
+the same product at the same time.
+
+available_quantity is kept as quantity - reserved - damaged on every row
+the ledger touches.
+
+Usage:
+    from app.utils.stock_ledger import StockLedger, InsufficientStock
+
+    ledger = StockLedger('sales_invoice', invoice.id, notes=f'Invoice {number}')
+    for item in invoice.items:
+        ledger.add(item.product_id, invoice.warehouse_id, -item.quantity)
+    ledger.post(require_stock=True)
+"""
+
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from flask import has_request_context
+from flask_login import current_user
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models_inventory import Stock, StockMovement
+from app.tenant_mixin import TenantMixin
+
+
+class StockLine(NamedTuple):
+    """One stock change; ``delta`` is positive into the warehouse, negative out of it"""
+    product_id: int
+    warehouse_id: int
+    delta: float
+    movement_type: Optional[str] = None  # default: 'in' / 'out' by the sign of delta
+    notes: Optional[str] = None          # default: the ledger's notes
+    damaged: float = 0.0                 # change of damaged_quantity
+    reference_id: Optional[int] = None   # default: the ledger's reference_id
+
+
+class InsufficientStock(ValueError):
+    """A line would take more than the warehouse holds (``available`` is None without a stock row)"""
+
+    def __init__(self, line, available):
+        self.line = line
+        self.available = available
+        super().__init__(
+            f'Insufficient stock of product {line.product_id} in warehouse '
+            f'{line.warehouse_id}: available {available or 0}, requested {-line.delta}'
+        )
+
+    @property
+    def product_id(self):
+        return self.line.product_id
+
+
+def _acquire_write_lock(connection):
+    """On SQLite take the database write lock before reading the rows to change"""
+    if connection.dialect.name != 'sqlite':
+        return
+    driver_connection = connection.connection.driver_connection
+    # A transaction already open on this connection has written, so it
+    # holds the write lock; pysqlite only opens one before DML statements.
+    if not driver_connection.in_transaction:
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+
+def _insert_missing(connection, tenant_id, keys):
+    """Create zero stock rows for ``keys``, tolerating concurrent inserts"""
+    table = Stock.__table__
+    now = datetime.utcnow()
+    rows = [
+        dict(tenant_id=tenant_id, product_id=product_id, warehouse_id=warehouse_id,
+             quantity=0.0, reserved_quantity=0.0, damaged_quantity=0.0,
+             available_quantity=0.0, last_updated=now)
+        for product_id, warehouse_id in keys
+    ]
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        connection.execute(dialect_insert(table).on_conflict_do_nothing(), rows)
+        return
+    for row in rows:
+        try:
+            with connection.begin_nested():
+                connection.execute(table.insert().values(**row))
+        except IntegrityError:
+            pass
+
+
+class StockLedger:
+    """
+    Batch of stock changes posted atomically in the current transaction.
+
+    Args:
+        reference_type: source document type stored on the movements
+            (e.g. 'pos_order', 'sales_invoice', 'transfer')
+        reference_id: source document id
+        notes: default movement notes
+        tenant_id: tenant of created rows (defaults to the current one)
+        user_id: user recorded on the movements (defaults to current_user)
+    """
+
+    def __init__(self, reference_type, reference_id=None, notes=None, tenant_id=None,
+                 user_id=None):
+        self.reference_type = reference_type
+        self.reference_id = reference_id
+        self.notes = notes
+        self.tenant_id = tenant_id if tenant_id is not None else TenantMixin.get_current_tenant_id()
+        if user_id is None and has_request_context() and current_user.is_authenticated:
+            user_id = current_user.id
+        self.user_id = user_id
+        self.lines = []
+        self._rows = None
+
+    def add(self, product_id, warehouse_id, delta, movement_type=None, notes=None, damaged=0.0,
+            reference_id=None):
+        """Queue a change of ``delta`` units; returns the ledger for chaining"""
+        self.lines.append(StockLine(int(product_id), int(warehouse_id), float(delta),
+                                    movement_type, notes, float(damaged), reference_id))
+        return self
+
+    def keys(self):
+        return sorted({(line.product_id, line.warehouse_id) for line in self.lines})
+
+    def _select(self, keys):
+        product_ids = {product_id for product_id, _ in keys}
+        warehouse_ids = {warehouse_id for _, warehouse_id in keys}
+        rows = (Stock.query
+                .filter(Stock.product_id.in_(product_ids),
+                        Stock.warehouse_id.in_(warehouse_ids))
+                .order_by(Stock.product_id, Stock.warehouse_id)
+                .with_for_update()
+                .populate_existing()
+                .all())
+        wanted = set(keys)
+        return {(row.product_id, row.warehouse_id): row for row in rows
+                if (row.product_id, row.warehouse_id) in wanted}
+
+    def lock(self):
+        """
+        Lock and return the existing Stock rows of the queued lines as
+        ``{(product_id, warehouse_id): Stock}``.  Quantities are re-read
+        from the database, so checks against them are race free until the
+        transaction ends.
+        """
+        if self._rows is None:
+            keys = self.keys()
+            if not keys:
+                self._rows = {}
+                return self._rows
+            _acquire_write_lock(db.session.connection())
+            self._rows = self._select(keys)
+        return self._rows
+
+    def post(self, require_stock=False, create_missing=True):
+        """
+        Apply the queued lines and record their movements.
+
+        Args:
+            require_stock: raise InsufficientStock (before changing
+                anything) when a line would take more than its row holds
+                or its row does not exist
+            create_missing: create missing rows; when False, lines
+                without a row are skipped (no change, no movement)
+
+        Returns:
+            ``{(product_id, warehouse_id): Stock}`` of the changed rows
+        """
+        rows = self.lock()
+
+        if require_stock:
+            remaining = {key: row.quantity or 0 for key, row in rows.items()}
+            for line in self.lines:
+                key = (line.product_id, line.warehouse_id)
+                if key not in remaining:
+                    if line.delta < 0:
+                        raise InsufficientStock(line, None)
+                    continue
+                if line.delta < 0 and remaining[key] + line.delta < 0:
+                    raise InsufficientStock(line, remaining[key])
+                remaining[key] += line.delta
+
+        missing = [key for key in self.keys() if key not in rows]
+        if missing and create_missing:
+            _insert_missing(db.session.connection(), self.tenant_id, missing)
+            rows.update(self._select(missing))
+
+        movements = []
+        now = datetime.utcnow()
+        for line in self.lines:
+            stock = rows.get((line.product_id, line.warehouse_id))
+            if stock is None:
+                continue
+            stock.quantity = (stock.quantity or 0) + line.delta
+            stock.damaged_quantity = max(0.0, (stock.damaged_quantity or 0) + line.damaged)
+            stock.available_quantity = (stock.quantity - (stock.reserved_quantity or 0)
+                                        - stock.damaged_quantity)
+            movements.append(dict(
+                tenant_id=self.tenant_id,
+                product_id=line.product_id,
+                warehouse_id=line.warehouse_id,
+                movement_type=line.movement_type or ('in' if line.delta >= 0 else 'out'),
+                quantity=abs(line.delta),
+                reference_type=self.reference_type,
+                reference_id=(line.reference_id if line.reference_id is not None
+                              else self.reference_id),
+                notes=line.notes if line.notes is not None else self.notes,
+                user_id=self.user_id,
+                created_at=now,
+            ))
+
+        if movements:
+            # Flushes the row updates first (autoflush), then one executemany
+            db.session.execute(insert(StockMovement), movements)
+
+        return {(line.product_id, line.warehouse_id): rows[(line.product_id, line.warehouse_id)]
+                for line in self.lines if (line.product_id, line.warehouse_id) in rows}
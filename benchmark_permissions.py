@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+قياس تكلفة فحص الصلاحيات عند رسم القائمة الجانبية
+Benchmark: sidebar permission checks before/after compiled permission sets
+
+Extracts every current_user.has_*permission(...) call from base.html and
+renders them as one template, once with the legacy linear scan over
+role.permissions and once with the cached frozenset implementation.
+
+Usage:
+    python benchmark_permissions.py [renders] [extra_permissions]
+"""
+
+import re
+import sys
+import time
+import warnings
+
+from sqlalchemy.exc import SAWarning
+
+from app import create_app, db
+from app.models import Permission, Role, User
+
+RENDERS = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+EXTRA_PERMISSIONS = int(sys.argv[2]) if len(sys.argv) > 2 else 150
+
+
+def legacy_has_permission(user, permission_name):
+    """The previous implementation: linear scan over role.permissions"""
+    if user.is_admin:
+        return True
+    if not user.role:
+        return False
+    return any(p.name == permission_name for p in user.role.permissions)
+
+
+def sidebar_template():
+    with open('app/templates/base.html', encoding='utf-8') as f:
+        calls = re.findall(r"current_user\.has_[a-z_]*permissions?\([^)]*\)", f.read())
+    body = ''.join('{%% if %s %%}x{%% endif %%}' % call for call in calls)
+    return body, len(calls)
+
+
+def bench(label, user, template):
+    template.render(current_user=user)  # warm up
+    start = time.perf_counter()
+    for _ in range(RENDERS):
+        template.render(current_user=user)
+    elapsed = time.perf_counter() - start
+    print(f'{label:<10} {elapsed * 1000 / RENDERS:8.4f} ms/render  ({RENDERS} renders)')
+    return elapsed
+
+
+def main():
+    app = create_app('testing')
+    with app.app_context(), app.test_request_context('/'):
+        db.create_all()
+        source, call_count = sidebar_template()
+        names = re.findall(r"'([^']+)'", source)
+        template = app.jinja_env.from_string(source)
+
+        role = Role(name='bench', name_ar='bench')
+        role.permissions = [Permission(name=f'bench.extra.{i}') for i in range(EXTRA_PERMISSIONS)]
+        role.permissions += [Permission(name=n) for n in sorted(set(names))[::2]]
+        user = User(username='bench', email='bench@example.com', role=role, is_admin=False)
+        db.session.add(user)
+        db.session.commit()
+
+        print(f'{call_count} permission checks per render, '
+              f'{len(role.permissions)} permissions on the role')
+
+        original = User.has_permission
+        User.has_permission = legacy_has_permission
+        try:
+            before = bench('before', user, template)
+        finally:
+            User.has_permission = original
+        after = bench('after', user, template)
+        print(f'speed-up   {before / after:8.2f}x')
+
+        db.session.remove()
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', category=SAWarning)
+            db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
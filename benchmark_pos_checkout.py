@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+قياس سرعة إتمام طلب نقطة البيع
+Benchmark: POS checkout throughput for a large cart
+
+Posts the same cart to two views through the test client:
+
+    before   the previous per-line checkout: Product.query.get and
+             Stock.query.filter_by for every line while validating, again
+             while updating stock, Product.query.get again for the invoice
+             items, one ORM insert per item and movement
+    after    pos.create_order (batched fetches, locked stock rows,
+             executemany inserts)
+
+Usage:
+    python benchmark_pos_checkout.py [checkouts] [lines]
+"""
+
+import sys
+import time
+import warnings
+from datetime import datetime, timedelta
+
+from flask import jsonify, request
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.exc import SAWarning
+
+from app import create_app, db
+from app.models import (Company, Customer, POSOrder, POSOrderItem, POSSession, Product,
+                        SalesInvoice, SalesInvoiceItem, Stock, StockMovement, User, Warehouse)
+from app.models_license import License
+from app.models_tenant import Tenant
+from app.utils.datetime_helper import utcnow
+from app.utils.document_numbers import next_number
+
+CHECKOUTS = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+LINES = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+
+def legacy_create_order():
+    """The previous implementation of pos.create_order (per-line queries)"""
+    data = request.get_json()
+    tenant_id = current_user.tenant_id
+    order_number = next_number('pos_order', tenant_id=tenant_id)
+    order = POSOrder(
+        order_number=order_number, session_id=data['session_id'],
+        customer_id=data.get('customer_id'), subtotal=data['subtotal'],
+        discount_amount=data['discount_amount'], tax_amount=data['tax_amount'],
+        total_amount=data['total_amount'], payment_method=data['payment_method'],
+        cash_amount=data['cash_amount'], card_amount=data['card_amount'],
+        change_amount=0, status='completed', tenant_id=tenant_id,
+    )
+    db.session.add(order)
+    db.session.flush()
+    session = POSSession.query.get(data['session_id'])
+
+    for item_data in data['items']:
+        product = Product.query.get(item_data['productId'])
+        if product and product.track_inventory and session:
+            stock_check = Stock.query.filter_by(product_id=item_data['productId'],
+                                                warehouse_id=session.warehouse_id).first()
+            available = stock_check.quantity if stock_check else 0
+            if float(item_data['quantity']) > available:
+                db.session.rollback()
+                return jsonify({'success': False}), 400
+
+    for item_data in data['items']:
+        db.session.add(POSOrderItem(
+            order_id=order.id, product_id=item_data['productId'],
+            quantity=item_data['quantity'], unit_price=item_data['price'],
+            total=item_data['price'] * item_data['quantity'], tenant_id=tenant_id,
+        ))
+        stock = Stock.query.filter_by(product_id=item_data['productId'],
+                                      warehouse_id=session.warehouse_id).first()
+        if stock:
+            stock.quantity -= item_data['quantity']
+            db.session.add(StockMovement(
+                product_id=item_data['productId'], warehouse_id=session.warehouse_id,
+                movement_type='out', quantity=item_data['quantity'],
+                reference_type='pos_order', reference_id=order.id,
+                notes=f'Sale from POS - Order {order_number}',
+                user_id=current_user.id, tenant_id=tenant_id,
+            ))
+
+    invoice_number = next_number('sales_invoice', tenant_id=tenant_id)
+    invoice = SalesInvoice(
+        invoice_number=invoice_number, invoice_date=datetime.utcnow().date(),
+        customer_id=data['customer_id'], warehouse_id=session.warehouse_id,
+        subtotal=data['subtotal'], discount_amount=data['discount_amount'],
+        tax_amount=data['tax_amount'], total_amount=data['total_amount'],
+        paid_amount=data['total_amount'], remaining_amount=0.0,
+        pos_order_id=order.id, user_id=current_user.id, tenant_id=tenant_id, status='paid',
+    )
+    db.session.add(invoice)
+    db.session.flush()
+    for item_data in data['items']:
+        product = Product.query.get(item_data['productId'])
+        item_total = item_data['price'] * item_data['quantity']
+        tax_rate = product.tax_rate if product else 15.0
+        db.session.add(SalesInvoiceItem(
+            invoice_id=invoice.id, product_id=item_data['productId'],
+            description=product.name if product else '', quantity=item_data['quantity'],
+            unit_price=item_data['price'], tax_rate=tax_rate,
+            tax_amount=item_total * (tax_rate / 100), total=item_total, tenant_id=tenant_id,
+        ))
+    db.session.commit()
+    return jsonify({'success': True, 'order_id': order.id, 'order_number': order_number,
+                    'invoice_id': invoice.id, 'invoice_number': invoice_number})
+
+
+def seed():
+    tenant = Tenant(code='BENCH', subdomain='bench', name='Bench', is_active=True)
+    db.session.add(tenant)
+    db.session.flush()
+    t = tenant.id
+    company = Company(tenant_id=t, name='Bench')
+    warehouse = Warehouse(tenant_id=t, name='Main')
+    customer = Customer(tenant_id=t, code='C1', name='Customer')
+    user = User(tenant_id=t, username='cashier', email='cashier@example.com',
+                is_active=True, is_admin=True)
+    user.set_password('Cashier123!')
+    db.session.add_all([company, warehouse, customer, user])
+    db.session.flush()
+    db.session.add(License(tenant_id=t, company_id=company.id, status='active',
+                           end_date=utcnow() + timedelta(days=10)))
+    session = POSSession(tenant_id=t, session_number='POS-BENCH', cashier_id=user.id,
+                         warehouse_id=warehouse.id)
+    products = [Product(tenant_id=t, name=f'Item {i}', code=f'I{i}', selling_price=10)
+                for i in range(LINES)]
+    db.session.add_all([session] + products)
+    db.session.flush()
+    db.session.add_all([Stock(tenant_id=t, product_id=p.id, warehouse_id=warehouse.id,
+                              quantity=1e9) for p in products])
+    db.session.commit()
+    total = 10.0 * LINES
+    return {
+        'session_id': session.id, 'customer_id': customer.id,
+        'subtotal': total, 'discount_amount': 0, 'tax_amount': 0, 'total_amount': total,
+        'payment_method': 'card', 'cash_amount': 0, 'card_amount': total,
+        'items': [{'productId': p.id, 'quantity': 1, 'price': 10.0} for p in products],
+    }
+
+
+def bench(label, client, url, cart):
+    headers = {'Host': 'bench.example.com'}
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+
+    client.post(url, json=cart, headers=headers)  # warm up
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    start = time.perf_counter()
+    try:
+        for _ in range(CHECKOUTS):
+            response = client.post(url, json=cart, headers=headers)
+            assert response.get_json()['success'], response.get_data(as_text=True)
+    finally:
+        elapsed = time.perf_counter() - start
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    print(f'{label:<7} {elapsed * 1e3 / CHECKOUTS:8.1f} ms/checkout  '
+          f'{CHECKOUTS * LINES / elapsed:9.0f} lines/s  '
+          f'{len(statements) / CHECKOUTS:6.0f} queries/checkout')
+    return elapsed
+
+
+def main():
+    app = create_app('testing')
+    app.add_url_rule('/bench/legacy-create-order', 'legacy_create_order',
+                     legacy_create_order, methods=['POST'])
+    with app.app_context():
+        db.create_all()
+        cart = seed()
+        client = app.test_client()
+        client.post('/auth/login', data={'username': 'cashier', 'password': 'Cashier123!'},
+                    headers={'Host': 'bench.example.com'})
+
+        print(f'{CHECKOUTS} checkouts of {LINES} lines')
+        before = bench('before', client, '/bench/legacy-create-order', cart)
+        after = bench('after', client, '/pos/create-order', cart)
+        print(f'speed-up {before / after:7.2f}x')
+
+        db.session.remove()
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', category=SAWarning)
+            db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
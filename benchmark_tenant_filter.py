@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+قياس تكلفة فلتر المستأجر على كل استعلام
+Benchmark: per-query overhead of the tenant loader criteria
+
+Runs a simple ``Product.query.get`` inside a tenant request three ways:
+
+    unfiltered  skip_tenant_filter=True (lower bound)
+    before      the previous listener: one freshly built with_loader_criteria
+                per tenant-aware class on every query
+    after       the cached, statement-scoped options of app.tenant_mixin
+
+Usage:
+    python benchmark_tenant_filter.py [queries]
+"""
+
+import sys
+import time
+import warnings
+
+from flask import g
+from sqlalchemy import bindparam, event
+from sqlalchemy.exc import SAWarning
+from sqlalchemy.orm import Session, with_loader_criteria
+
+from app import create_app, db
+from app import tenant_mixin
+from app.models_inventory import Product
+from app.models_tenant import Tenant
+
+QUERIES = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+
+def legacy_tenant_filter(orm_execute_state):
+    """The previous implementation: every tenant-aware class on every SELECT"""
+    if not orm_execute_state.execution_options.get('legacy_tenant_filter'):
+        return
+    tid = g.current_tenant_id
+    options = [
+        with_loader_criteria(
+            cls,
+            cls.tenant_id == bindparam(f'tenant_id_{index}', value=tid),
+            include_aliases=True,
+        )
+        for index, cls in enumerate(tenant_mixin._tenant_aware_classes)
+    ]
+    orm_execute_state.statement = orm_execute_state.statement.options(*options)
+
+
+def bench(label, product_id, **execution_options):
+    def run():
+        db.session.expunge_all()
+        return Product.query.execution_options(**execution_options).get(product_id)
+
+    for _ in range(100):  # warm up the compiled cache
+        run()
+    start = time.perf_counter()
+    for _ in range(QUERIES):
+        run()
+    elapsed = time.perf_counter() - start
+    print(f'{label:<11} {elapsed * 1e6 / QUERIES:9.1f} us/query  ({QUERIES} queries)')
+    return elapsed
+
+
+def main():
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        tenant = Tenant(code='BENCH', subdomain='bench', name='Bench', is_active=True)
+        db.session.add(tenant)
+        db.session.flush()
+        product = Product(tenant_id=tenant.id, name='Bench', code='B-1')
+        db.session.add(product)
+        db.session.commit()
+        product_id = product.id
+
+        with app.test_request_context('/'):
+            g.current_tenant_id = tenant.id
+            print(f'{len(tenant_mixin._tenant_aware_classes)} tenant-aware classes')
+
+            baseline = bench('unfiltered', product_id, skip_tenant_filter=True)
+            event.listen(Session, 'do_orm_execute', legacy_tenant_filter)
+            try:
+                before = bench('before', product_id,
+                               skip_tenant_filter=True, legacy_tenant_filter=True)
+            finally:
+                event.remove(Session, 'do_orm_execute', legacy_tenant_filter)
+            after = bench('after', product_id)
+
+            print(f'overhead    before {(before - baseline) * 1e6 / QUERIES:9.1f} us/query, '
+                  f'after {(after - baseline) * 1e6 / QUERIES:9.1f} us/query')
+            print(f'speed-up   {before / after:8.2f}x')
+
+        db.session.remove()
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', category=SAWarning)
+            db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
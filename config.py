@@ -67,6 +67,70 @@ class Config:
     
     # Pagination
     ITEMS_PER_PAGE = 20
+
+    # Caching (process-local, per Gunicorn worker)
+    TENANT_CACHE_TTL = int(os.environ.get('TENANT_CACHE_TTL', 60))  # seconds
+    TENANT_CACHE_SIZE = 1024  # max cached tenant keys
+    LICENSE_CACHE_TTL = int(os.environ.get('LICENSE_CACHE_TTL', 30))  # seconds
+    LICENSE_CACHE_SIZE = 1024  # max cached tenants
+    PERMISSION_CACHE_TTL = int(os.environ.get('PERMISSION_CACHE_TTL', 60))  # seconds
+    PERMISSION_CACHE_SIZE = 1024  # max cached roles
+    IDENTITY_CACHE_TTL = int(os.environ.get('IDENTITY_CACHE_TTL', 60))  # seconds
+    IDENTITY_CACHE_SIZE = 4096  # max cached logged-in users
+    # Company/currency settings are always memoized per request; a TTL > 0
+    # additionally shares them across requests of the same tenant
+    COMPANY_SETTINGS_CACHE_TTL = int(os.environ.get('COMPANY_SETTINGS_CACHE_TTL', 60))  # seconds, 0 = off
+    COMPANY_SETTINGS_CACHE_SIZE = 1024
+    # Dashboard aggregates: staleness window of the per-tenant snapshot
+    DASHBOARD_CACHE_TTL = int(os.environ.get('DASHBOARD_CACHE_TTL', 0))  # seconds, 0 = off
+    DASHBOARD_CACHE_SIZE = 1024
+    # POS catalog bodies are keyed by version, so the TTL only bounds memory
+    POS_CATALOG_CACHE_TTL = int(os.environ.get('POS_CATALOG_CACHE_TTL', 300))  # seconds, 0 = off
+    POS_CATALOG_CACHE_SIZE = 256
+    # Barcode/code lookup index: kept current in this worker on commit,
+    # the TTL bounds staleness of changes made by other workers
+    PRODUCT_INDEX_TTL = int(os.environ.get('PRODUCT_INDEX_TTL', 300))  # seconds
+    PRODUCT_INDEX_SIZE = 256  # max indexed tenants
+
+    # Document numbers: POS order numbers reserved per session block
+    # (0 = strictly gap-free, one counter increment per order)
+    POS_NUMBER_BLOCK_SIZE = int(os.environ.get('POS_NUMBER_BLOCK_SIZE', 0))
+
+    # POS bank postings: 'per_order' (one bank transaction per sale) or
+    # 'deferred' (accrued per session and payment method, posted at session
+    # close and, when the interval is > 0, every that many minutes)
+    POS_BANK_SETTLEMENT = os.environ.get('POS_BANK_SETTLEMENT', 'per_order')
+    POS_SETTLEMENT_INTERVAL = int(os.environ.get('POS_SETTLEMENT_INTERVAL', 0))  # minutes, 0 = at close only
+
+    # Global /search: hits returned across all entity types, and the
+    # shortest query searched (typeahead sends every keystroke)
+    SEARCH_RESULTS_LIMIT = int(os.environ.get('SEARCH_RESULTS_LIMIT', 20))
+    SEARCH_MIN_QUERY_LENGTH = int(os.environ.get('SEARCH_MIN_QUERY_LENGTH', 2))
+
+    # Report results: cached per tenant, report and filters in a SQLite file
+    # shared by the workers of this box; commits touching a report's tables
+    # invalidate it, the TTL only bounds writes made outside the ORM
+    REPORT_CACHE_ENABLED = os.environ.get('REPORT_CACHE_ENABLED', 'False') == 'True'
+    REPORT_CACHE_PATH = os.environ.get('REPORT_CACHE_PATH') or os.path.join(basedir, 'report_cache.db')
+    REPORT_CACHE_TTL = int(os.environ.get('REPORT_CACHE_TTL', 3600))  # seconds, 0 = no age limit
+
+    # Report exports: rows fetched per cursor batch, rows sampled for column
+    # widths, and bytes kept in memory before the output spills to disk
+    EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 1000))
+    EXPORT_SAMPLE_ROWS = 200
+    EXPORT_SPOOL_SIZE = int(os.environ.get('EXPORT_SPOOL_SIZE', 8 * 1024 * 1024))
+
+    # Background jobs (flask jobs worker): with JOBS_ENABLED, exports and
+    # backups are queued instead of run inside the web request
+    JOBS_ENABLED = os.environ.get('JOBS_ENABLED', 'False') == 'True'
+    JOBS_RESULT_DIR = os.environ.get('JOBS_RESULT_DIR') or os.path.join(basedir, 'job_results')
+    JOBS_POLL_INTERVAL = float(os.environ.get('JOBS_POLL_INTERVAL', 2))  # seconds
+    JOBS_STALE_AFTER = int(os.environ.get('JOBS_STALE_AFTER', 3600))  # seconds without progress
+    JOBS_MAX_ATTEMPTS = 3
+    JOBS_RESULT_TTL_DAYS = int(os.environ.get('JOBS_RESULT_TTL_DAYS', 7))
+
+    # Offline sync: maximum orders accepted per /pos/sync request
+    POS_SYNC_MAX_ORDERS = int(os.environ.get('POS_SYNC_MAX_ORDERS', 500))
     
     # Currency
     DEFAULT_CURRENCY = 'EUR'
@@ -0,0 +1,38 @@
+"""Add unit_cost to sales invoice and POS order items
+
+Revision ID: a3b4c5d6e7f8
+Revises: f2a3b4c5d6e7
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3b4c5d6e7f8'
+down_revision = 'f2a3b4c5d6e7'
+branch_labels = None
+depends_on = None
+
+TABLES = ('sales_invoice_items', 'pos_order_items')
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    for table in TABLES:
+        if 'unit_cost' not in {c['name'] for c in inspector.get_columns(table)}:
+            with op.batch_alter_table(table, schema=None) as batch_op:
+                batch_op.add_column(sa.Column('unit_cost', sa.Float(), nullable=True))
+    # Existing items keep NULL: their cost at sale time is unknown, so COGS
+    # falls back to the product's current cost price for them
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    for table in TABLES:
+        if 'unit_cost' in {c['name'] for c in inspector.get_columns(table)}:
+            with op.batch_alter_table(table, schema=None) as batch_op:
+                batch_op.drop_column('unit_cost')
@@ -0,0 +1,43 @@
+"""Add order_count to pos_sessions and backfill running totals
+
+Revision ID: a7b8c9d0e1f2
+Revises: f6a7b8c9d0e1
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7b8c9d0e1f2'
+down_revision = 'f6a7b8c9d0e1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('pos_sessions', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('order_count', sa.Integer(), nullable=True, server_default='0'))
+
+    # Order counts of every session; open sessions only got totals at close
+    op.execute(
+        "UPDATE pos_sessions SET order_count = ("
+        "SELECT COUNT(*) FROM pos_orders WHERE pos_orders.session_id = pos_sessions.id "
+        "AND pos_orders.status = 'completed')"
+    )
+    op.execute(
+        "UPDATE pos_sessions SET "
+        "total_sales = (SELECT COALESCE(SUM(total_amount), 0) FROM pos_orders "
+        "WHERE pos_orders.session_id = pos_sessions.id AND pos_orders.status = 'completed'), "
+        "total_cash = (SELECT COALESCE(SUM(cash_amount), 0) FROM pos_orders "
+        "WHERE pos_orders.session_id = pos_sessions.id AND pos_orders.status = 'completed'), "
+        "total_card = (SELECT COALESCE(SUM(card_amount), 0) FROM pos_orders "
+        "WHERE pos_orders.session_id = pos_sessions.id AND pos_orders.status = 'completed') "
+        "WHERE status = 'open'"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('pos_sessions', schema=None) as batch_op:
+        batch_op.drop_column('order_count')
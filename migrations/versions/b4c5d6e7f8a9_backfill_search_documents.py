@@ -0,0 +1,110 @@
+"""Index the existing rows in search_documents
+
+Revision ID: b4c5d6e7f8a9
+Revises: a3b4c5d6e7f8
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+import re
+import unicodedata
+from datetime import date, datetime, time
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4c5d6e7f8a9'
+down_revision = 'a3b4c5d6e7f8'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+# app.search_index.normalize() as of this revision
+_ARABIC_MARKS = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+_ARABIC_LETTERS = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ة': 'ه', 'ى': 'ي', 'ؤ': 'و', 'ئ': 'ي',
+    **{chr(0x0660 + digit): str(digit) for digit in range(10)},
+    **{chr(0x06f0 + digit): str(digit) for digit in range(10)},
+})
+
+
+def _source(name, fields, subtitle, doc_date):
+    """The entity table as of this revision; ``fields[0]`` is the title"""
+    columns = [sa.column(field) for field in dict.fromkeys(fields + (subtitle,))]
+    source = sa.table(name, sa.column('id'), sa.column('tenant_id'), *columns, doc_date)
+    return source, fields, subtitle
+
+
+# entity_type -> (table, indexed fields, subtitle); the last column is the date
+ENTITIES = {
+    'product': _source('products', ('name', 'name_en', 'code', 'barcode', 'sku'), 'code',
+                       sa.column('created_at', sa.DateTime)),
+    'customer': _source('customers', ('name', 'name_en', 'code', 'phone', 'mobile', 'email'),
+                        'code', sa.column('created_at', sa.DateTime)),
+    'supplier': _source('suppliers', ('name', 'name_en', 'code', 'phone', 'mobile', 'email'),
+                        'code', sa.column('created_at', sa.DateTime)),
+    'sales_invoice': _source('sales_invoices', ('invoice_number', 'notes'), 'status',
+                             sa.column('invoice_date', sa.Date)),
+    'purchase_invoice': _source('purchase_invoices',
+                                ('invoice_number', 'supplier_invoice_number', 'notes'), 'status',
+                                sa.column('invoice_date', sa.Date)),
+    'journal_entry': _source('journal_entries', ('entry_number', 'description'), 'description',
+                             sa.column('entry_date', sa.Date)),
+}
+
+search_documents = sa.table(
+    'search_documents',
+    sa.column('tenant_id', sa.Integer), sa.column('entity_type', sa.String),
+    sa.column('entity_id', sa.Integer), sa.column('content', sa.Text),
+    sa.column('title', sa.String), sa.column('subtitle', sa.String),
+    sa.column('doc_date', sa.DateTime), sa.column('updated_at', sa.DateTime),
+)
+
+
+def _normalize(text):
+    text = unicodedata.normalize('NFKC', str(text))
+    text = _ARABIC_MARKS.sub('', text).translate(_ARABIC_LETTERS).casefold()
+    return ' '.join(text.split())
+
+
+def _shown(value):
+    return str(value)[:256] if value is not None else None
+
+
+def upgrade():
+    # Searching reads search_documents alone, so rows written before the
+    # index existed could not be found until they were edited.  This waits
+    # for d0e1f2a3b4c5, which added the title / subtitle / date columns
+    # every document needs, and builds the documents from the entity
+    # columns of this revision rather than from the current models.
+    bind = op.get_bind()
+    now = datetime.utcnow()
+    for entity_type, (source, fields, subtitle) in ENTITIES.items():
+        bind.execute(search_documents.delete().where(
+            search_documents.c.entity_type == entity_type))
+        result = bind.execute(sa.select(source).order_by(source.c.id))
+        while True:
+            batch = result.fetchmany(BATCH_SIZE)
+            if not batch:
+                break
+            documents = []
+            for row in batch:
+                values = row._mapping
+                when = row[-1]
+                if isinstance(when, date) and not isinstance(when, datetime):
+                    when = datetime.combine(when, time())
+                documents.append(dict(
+                    tenant_id=values['tenant_id'], entity_type=entity_type, entity_id=values['id'],
+                    content=_normalize(' '.join(str(values[field]) for field in fields
+                                                if values[field])),
+                    title=_shown(values[fields[0]]), subtitle=_shown(values[subtitle]),
+                    doc_date=when, updated_at=now))
+            bind.execute(search_documents.insert(), documents)
+
+
+def downgrade():
+    # The documents are derived data; c9d0e1f2a3b4 drops them with the table
+    pass
@@ -0,0 +1,48 @@
+"""Add pos_settlement_accruals table
+
+Revision ID: b8c9d0e1f2a3
+Revises: a7b8c9d0e1f2
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8c9d0e1f2a3'
+down_revision = 'a7b8c9d0e1f2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'pos_settlement_accruals' in inspector.get_table_names():
+        return
+
+    op.create_table(
+        'pos_settlement_accruals',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('tenant_id', sa.Integer(), nullable=True),
+        sa.Column('session_id', sa.Integer(), nullable=False),
+        sa.Column('payment_method', sa.String(length=20), nullable=False),
+        sa.Column('bank_account_id', sa.Integer(), nullable=False),
+        sa.Column('amount', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('order_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('settlements', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('settled_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['tenant_id'], ['tenants.id']),
+        sa.ForeignKeyConstraint(['session_id'], ['pos_sessions.id']),
+        sa.ForeignKeyConstraint(['bank_account_id'], ['bank_accounts.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('session_id', 'payment_method', name='uq_pos_accrual_session_method'),
+    )
+    op.create_index('ix_pos_settlement_accruals_tenant_id', 'pos_settlement_accruals', ['tenant_id'])
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'pos_settlement_accruals' in inspector.get_table_names():
+        op.drop_index('ix_pos_settlement_accruals_tenant_id', table_name='pos_settlement_accruals')
+        op.drop_table('pos_settlement_accruals')
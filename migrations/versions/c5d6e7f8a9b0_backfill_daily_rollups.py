@@ -0,0 +1,99 @@
+"""Compute the daily rollups of the existing invoices
+
+Revision ID: c5d6e7f8a9b0
+Revises: b4c5d6e7f8a9
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5d6e7f8a9b0'
+down_revision = 'b4c5d6e7f8a9'
+branch_labels = None
+depends_on = None
+
+# The tables as of this revision; app.rollups keeps the rollups current from here on
+sales_invoices = sa.table(
+    'sales_invoices',
+    sa.column('id', sa.Integer), sa.column('tenant_id', sa.Integer),
+    sa.column('invoice_date', sa.Date), sa.column('warehouse_id', sa.Integer),
+    sa.column('pos_order_id', sa.Integer), sa.column('status', sa.String),
+    sa.column('subtotal', sa.Float), sa.column('tax_amount', sa.Float),
+    sa.column('total_amount', sa.Float),
+)
+sales_invoice_items = sa.table(
+    'sales_invoice_items',
+    sa.column('invoice_id', sa.Integer), sa.column('product_id', sa.Integer),
+    sa.column('quantity', sa.Float), sa.column('unit_cost', sa.Float),
+)
+products = sa.table('products', sa.column('id', sa.Integer), sa.column('cost_price', sa.Float))
+purchase_invoices = sa.table(
+    'purchase_invoices',
+    sa.column('id', sa.Integer), sa.column('tenant_id', sa.Integer),
+    sa.column('invoice_date', sa.Date), sa.column('warehouse_id', sa.Integer),
+    sa.column('status', sa.String), sa.column('subtotal', sa.Float),
+    sa.column('tax_amount', sa.Float), sa.column('total_amount', sa.Float),
+)
+daily_rollups = sa.table(
+    'daily_rollups',
+    sa.column('tenant_id', sa.Integer), sa.column('day', sa.Date),
+    sa.column('warehouse_id', sa.Integer), sa.column('kind', sa.String),
+    sa.column('doc_count', sa.Integer), sa.column('subtotal', sa.Float),
+    sa.column('tax_amount', sa.Float), sa.column('total_amount', sa.Float),
+    sa.column('cogs', sa.Float), sa.column('updated_at', sa.DateTime),
+)
+
+ROLLUP_COLUMNS = ('tenant_id', 'day', 'warehouse_id', 'kind', 'doc_count', 'subtotal',
+                  'tax_amount', 'total_amount', 'cogs', 'updated_at')
+
+
+def _rollups(invoices, kind, cogs, now, *criteria):
+    """One ``kind`` row per (tenant, day, warehouse) of the non-cancelled invoices"""
+    keys = (invoices.c.tenant_id, invoices.c.invoice_date, invoices.c.warehouse_id)
+    return (
+        sa.select(*keys, sa.literal(kind),
+                  sa.func.count(invoices.c.id),
+                  sa.func.coalesce(sa.func.sum(invoices.c.subtotal), 0),
+                  sa.func.coalesce(sa.func.sum(invoices.c.tax_amount), 0),
+                  sa.func.coalesce(sa.func.sum(invoices.c.total_amount), 0),
+                  sa.func.coalesce(sa.func.sum(cogs), 0),
+                  sa.literal(now, sa.DateTime))
+        .where(invoices.c.status != 'cancelled', *criteria)
+        .group_by(*keys)
+    )
+
+
+def upgrade():
+    # Existing invoices predate the rollup events, so without this pass the
+    # dashboard and monthly reports would show nothing before the upgrade.
+    # It runs after a3b4c5d6e7f8 so that COGS can prefer the recorded
+    # unit_cost, falling back to the current cost price as app.rollups does.
+    now = datetime.utcnow()
+    invoice_cogs = (
+        sa.select(sa.func.sum(sales_invoice_items.c.quantity
+                              * sa.func.coalesce(sales_invoice_items.c.unit_cost,
+                                                 products.c.cost_price, 0)))
+        .select_from(sales_invoice_items.join(
+            products, sales_invoice_items.c.product_id == products.c.id))
+        .where(sales_invoice_items.c.invoice_id == sales_invoices.c.id)
+        .scalar_subquery()
+    )
+    pos_order = sales_invoices.c.pos_order_id
+
+    op.execute(daily_rollups.delete())
+    for select in (
+        _rollups(sales_invoices, 'sales', invoice_cogs, now, pos_order.is_(None)),
+        _rollups(sales_invoices, 'pos', invoice_cogs, now, pos_order.isnot(None)),
+        _rollups(purchase_invoices, 'purchases', sa.literal(0.0), now),
+    ):
+        op.execute(daily_rollups.insert().from_select(ROLLUP_COLUMNS, select))
+
+
+def downgrade():
+    # Nothing to undo: f2a3b4c5d6e7 drops daily_rollups with its rows
+    pass
@@ -0,0 +1,53 @@
+"""Add search_documents table and its full-text index
+
+Revision ID: c9d0e1f2a3b4
+Revises: b8c9d0e1f2a3
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c9d0e1f2a3b4'
+down_revision = 'b8c9d0e1f2a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    from app.search_index import create_search_backend
+
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if 'search_documents' not in inspector.get_table_names():
+        op.create_table(
+            'search_documents',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('tenant_id', sa.Integer(), nullable=True),
+            sa.Column('entity_type', sa.String(length=20), nullable=False),
+            sa.Column('entity_id', sa.Integer(), nullable=False),
+            sa.Column('content', sa.Text(), nullable=False),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['tenant_id'], ['tenants.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('entity_type', 'entity_id', name='uq_search_document_entity'),
+        )
+        op.create_index('ix_search_documents_tenant_type', 'search_documents',
+                        ['tenant_id', 'entity_type'])
+
+    # FTS5 table and triggers (SQLite) or pg_trgm index (PostgreSQL); the
+    # existing rows are indexed by ``flask search-index rebuild``
+    create_search_backend(bind)
+
+
+def downgrade():
+    from app.search_index import drop_search_backend
+
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if 'search_documents' in inspector.get_table_names():
+        drop_search_backend(bind)
+        op.drop_index('ix_search_documents_tenant_type', table_name='search_documents')
+        op.drop_table('search_documents')
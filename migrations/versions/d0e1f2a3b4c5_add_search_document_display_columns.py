@@ -0,0 +1,32 @@
+"""Add title, subtitle and doc_date to search_documents
+
+Revision ID: d0e1f2a3b4c5
+Revises: c9d0e1f2a3b4
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd0e1f2a3b4c5'
+down_revision = 'c9d0e1f2a3b4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Documents of suppliers, invoices and journal entries, and the new
+    # columns of existing documents, are filled by ``flask search-index rebuild``
+    with op.batch_alter_table('search_documents', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('title', sa.String(length=256), nullable=True))
+        batch_op.add_column(sa.Column('subtitle', sa.String(length=256), nullable=True))
+        batch_op.add_column(sa.Column('doc_date', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('search_documents', schema=None) as batch_op:
+        batch_op.drop_column('doc_date')
+        batch_op.drop_column('subtitle')
+        batch_op.drop_column('title')
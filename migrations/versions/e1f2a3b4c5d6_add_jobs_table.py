@@ -0,0 +1,58 @@
+"""Add jobs table for the background job queue
+
+Revision ID: e1f2a3b4c5d6
+Revises: d0e1f2a3b4c5
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e1f2a3b4c5d6'
+down_revision = 'd0e1f2a3b4c5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if 'jobs' not in inspector.get_table_names():
+        op.create_table(
+            'jobs',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('tenant_id', sa.Integer(), nullable=True),
+            sa.Column('user_id', sa.Integer(), nullable=True),
+            sa.Column('kind', sa.String(length=50), nullable=False),
+            sa.Column('params', sa.Text(), nullable=False),
+            sa.Column('title', sa.String(length=256), nullable=True),
+            sa.Column('status', sa.String(length=20), nullable=False),
+            sa.Column('progress', sa.Integer(), nullable=True),
+            sa.Column('message', sa.String(length=256), nullable=True),
+            sa.Column('error', sa.Text(), nullable=True),
+            sa.Column('attempts', sa.Integer(), nullable=True),
+            sa.Column('worker', sa.String(length=64), nullable=True),
+            sa.Column('result_path', sa.String(length=512), nullable=True),
+            sa.Column('result_name', sa.String(length=256), nullable=True),
+            sa.Column('result_mimetype', sa.String(length=128), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('started_at', sa.DateTime(), nullable=True),
+            sa.Column('heartbeat_at', sa.DateTime(), nullable=True),
+            sa.Column('finished_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['tenant_id'], ['tenants.id']),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_jobs_tenant_id', 'jobs', ['tenant_id'])
+        op.create_index('ix_jobs_status_created', 'jobs', ['status', 'created_at'])
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if 'jobs' in inspector.get_table_names():
+        op.drop_index('ix_jobs_status_created', table_name='jobs')
+        op.drop_index('ix_jobs_tenant_id', table_name='jobs')
+        op.drop_table('jobs')
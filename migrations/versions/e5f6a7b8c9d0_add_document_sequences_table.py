@@ -0,0 +1,40 @@
+"""Add document_sequences table
+
+Revision ID: e5f6a7b8c9d0
+Revises: d4e5f6a7b8c9
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5f6a7b8c9d0'
+down_revision = 'd4e5f6a7b8c9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'document_sequences' in inspector.get_table_names():
+        return
+
+    op.create_table(
+        'document_sequences',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('tenant_id', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('series', sa.String(length=32), nullable=False),
+        sa.Column('period', sa.String(length=16), nullable=False, server_default=''),
+        sa.Column('last_value', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('tenant_id', 'series', 'period', name='uq_document_sequence'),
+    )
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'document_sequences' in inspector.get_table_names():
+        op.drop_table('document_sequences')
@@ -0,0 +1,49 @@
+"""Add daily_rollups table for time-series reports
+
+Revision ID: f2a3b4c5d6e7
+Revises: e1f2a3b4c5d6
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2a3b4c5d6e7'
+down_revision = 'e1f2a3b4c5d6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if 'daily_rollups' not in inspector.get_table_names():
+        op.create_table(
+            'daily_rollups',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('tenant_id', sa.Integer(), nullable=True),
+            sa.Column('day', sa.Date(), nullable=False),
+            sa.Column('warehouse_id', sa.Integer(), nullable=True),
+            sa.Column('kind', sa.String(length=20), nullable=False),
+            sa.Column('doc_count', sa.Integer(), nullable=False),
+            sa.Column('subtotal', sa.Float(), nullable=False),
+            sa.Column('tax_amount', sa.Float(), nullable=False),
+            sa.Column('total_amount', sa.Float(), nullable=False),
+            sa.Column('cogs', sa.Float(), nullable=False),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['tenant_id'], ['tenants.id']),
+            sa.ForeignKeyConstraint(['warehouse_id'], ['warehouses.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('tenant_id', 'kind', 'day', 'warehouse_id',
+                                name='uq_daily_rollups_key'),
+        )
+    # Rollups of existing invoices are computed by ``flask rollups rebuild``
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if 'daily_rollups' in inspector.get_table_names():
+        op.drop_table('daily_rollups')
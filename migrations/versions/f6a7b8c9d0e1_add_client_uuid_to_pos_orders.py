@@ -0,0 +1,28 @@
+"""Add client_uuid to pos_orders
+
+Revision ID: f6a7b8c9d0e1
+Revises: e5f6a7b8c9d0
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f6a7b8c9d0e1'
+down_revision = 'e5f6a7b8c9d0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('pos_orders', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('client_uuid', sa.String(length=36), nullable=True))
+        batch_op.create_unique_constraint('uq_pos_order_client_uuid_tenant', ['client_uuid', 'tenant_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('pos_orders', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_pos_order_client_uuid_tenant', type_='unique')
+        batch_op.drop_column('client_uuid')
@@ -5,6 +5,7 @@ from datetime import datetime, timedelta
 
 from app import db
 from app.models import Company, SuperAdmin
+from app.license_cache import invalidate_license
 
 
 super_admin_bp = Blueprint('super_admin', __name__, url_prefix='/super-admin')
@@ -49,6 +50,7 @@ def activate(id):
     company.status = "active"
     company.subscription_end = datetime.utcnow() + timedelta(days=30)
     db.session.commit()
+    invalidate_license(company.tenant_id)
     return redirect(url_for('super_admin.dashboard'))
 
 
@@ -58,6 +60,7 @@ def cancel(id):
     company = Company.query.get(id)
     company.status = "cancelled"
     db.session.commit()
+    invalidate_license(company.tenant_id)
     return redirect(url_for('super_admin.dashboard'))
 
 
@@ -70,4 +73,5 @@ def extend(id):
     else:
         company.subscription_end = datetime.utcnow() + timedelta(days=30)
     db.session.commit()
+    invalidate_license(company.tenant_id)
     return redirect(url_for('super_admin.dashboard'))
\ No newline at end of file
@@ -0,0 +1,94 @@
+import unittest
+import warnings
+from contextlib import contextmanager
+
+from flask import g
+from sqlalchemy import event
+from sqlalchemy.exc import SAWarning
+
+from app import create_app, db
+from app.company_settings import get_company, get_company_settings
+from app.models import Company
+from app.models_tenant import Tenant
+
+
+class CompanySettingsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        self.tenant = Tenant(code='COMPSET', subdomain='settings', name='Settings', currency='SAR')
+        db.session.add(self.tenant)
+        db.session.flush()
+        self.company = Company(tenant_id=self.tenant.id, name='Settings Co', currency='EUR')
+        db.session.add(self.company)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', category=SAWarning)
+            db.drop_all()
+        self.ctx.pop()
+
+    def _count_company_queries(self, fn):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            if 'FROM companies' in statement:
+                statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            fn()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        return len(statements)
+
+    @contextmanager
+    def _tenant_request(self):
+        # A fresh app context per request, as in production (g is app-context scoped)
+        with self.app.app_context(), self.app.test_request_context('/'):
+            g.current_tenant_id = self.tenant.id
+            yield
+
+    def _render_money_table(self):
+        template = self.app.jinja_env.from_string(
+            '{{ currency_symbol }}{% for v in values %}{{ v|currency }}{% endfor %}'
+        )
+        return template.render(values=range(80), currency_symbol=get_company_settings().currency_symbol)
+
+    def test_currency_filter_queries_company_once_per_request(self):
+        with self._tenant_request():
+            queries = self._count_company_queries(self._render_money_table)
+        self.assertEqual(queries, 1)
+
+    def test_settings_are_shared_across_requests_of_a_tenant(self):
+        with self._tenant_request():
+            get_company_settings()
+        with self._tenant_request():
+            queries = self._count_company_queries(get_company_settings)
+        self.assertEqual(queries, 0)
+
+    def test_company_update_invalidates_cached_settings(self):
+        with self._tenant_request():
+            self.assertEqual(get_company_settings().currency_symbol, '€')
+
+        self.company.currency = 'USD'
+        db.session.commit()
+
+        with self._tenant_request():
+            self.assertEqual(get_company_settings().currency_code, 'USD')
+
+    def test_symbol_position_follows_language(self):
+        with self._tenant_request():
+            settings = get_company_settings()
+            self.assertIs(get_company(), get_company())
+            self.assertEqual(settings.format_amount(1234.5, 'en'), '€ 1,234.50')
+            self.assertEqual(settings.format_amount('bad', 'ar'), '0.00 €')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+import unittest
+import warnings
+from datetime import date, timedelta
+
+from flask import g
+from sqlalchemy import event
+from sqlalchemy.exc import SAWarning
+
+from app import create_app, db
+from app.dashboard_stats import compute_dashboard_stats, get_dashboard_stats
+from app.models import (Company, Customer, Expense, Product, PurchaseInvoice, SalesInvoice,
+                        SalesInvoiceItem, Stock, Supplier, User, Warehouse)
+from app.models_license import License
+from app.models_tenant import Tenant
+from app.utils.datetime_helper import utcnow
+
+TODAY = date(2026, 1, 15)
+
+
+class DashboardStatsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        self.tenant_id = self._seed_tenant('DASH', scale=1)
+        self.other_tenant_id = self._seed_tenant('OTHER', scale=100)
+        db.session.commit()
+        db.session.expunge_all()
+
+        self.request_ctx = self.app.test_request_context('/')
+        self.request_ctx.push()
+        g.current_tenant_id = self.tenant_id
+
+    def tearDown(self):
+        self.request_ctx.pop()
+        db.session.remove()
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', category=SAWarning)
+            db.drop_all()
+        self.ctx.pop()
+
+    def _seed_tenant(self, code, scale):
+        tenant = Tenant(code=code, subdomain=code.lower(), name=code, is_active=True)
+        db.session.add(tenant)
+        db.session.flush()
+        t = tenant.id
+
+        main, spare = Warehouse(tenant_id=t, name='Main'), Warehouse(tenant_id=t, name='Spare')
+        customer = Customer(tenant_id=t, code='C1', name='Customer')
+        supplier = Supplier(tenant_id=t, code='S1', name='Supplier')
+        low = Product(tenant_id=t, name=f'{code} low', code='P1', cost_price=2.0, min_stock=10)
+        ok = Product(tenant_id=t, name=f'{code} ok', code='P2', cost_price=5.0, min_stock=1)
+        untracked = Product(tenant_id=t, name=f'{code} service', code='P3', cost_price=1.0,
+                            track_inventory=False)
+        db.session.add_all([main, spare, customer, supplier, low, ok, untracked])
+        db.session.flush()
+
+        db.session.add_all([
+            Stock(tenant_id=t, product_id=low.id, warehouse_id=main.id, quantity=3 * scale),
+            Stock(tenant_id=t, product_id=low.id, warehouse_id=spare.id, quantity=4),
+            Stock(tenant_id=t, product_id=ok.id, warehouse_id=main.id, quantity=20 * scale),
+        ])
+
+        def invoice(number, day, total, status='unpaid', items=()):
+            inv = SalesInvoice(tenant_id=t, invoice_number=number, invoice_date=day,
+                               customer_id=customer.id, total_amount=total * scale,
+                               status=status)
+            db.session.add(inv)
+            db.session.flush()
+            for product, qty in items:
+                db.session.add(SalesInvoiceItem(tenant_id=t, invoice_id=inv.id,
+                                                product_id=product.id, quantity=qty,
+                                                unit_price=10))
+
+        invoice('S-1', date(2026, 1, 2), 100, items=[(low, 2), (ok, 1)])
+        invoice('S-2', date(2026, 1, 10), 50, items=[(ok, 3)])
+        invoice('S-3', date(2026, 1, 11), 999, status='cancelled', items=[(ok, 50)])
+        invoice('S-4', date(2025, 12, 20), 70, items=[(low, 1)])
+        invoice('S-5', date(2025, 6, 1), 500)  # outside the chart window
+
+        for number, day, total in (('P-1', date(2026, 1, 5), 40), ('P-2', date(2025, 9, 5), 30)):
+            db.session.add(PurchaseInvoice(tenant_id=t, invoice_number=number, invoice_date=day,
+                                           supplier_id=supplier.id, total_amount=total * scale))
+        db.session.add(Expense(tenant_id=t, expense_number='E-1', expense_date=date(2026, 1, 3),
+                               expense_category='rent', description='Rent', amount=12 * scale))
+        return t
+
+    def test_figures(self):
+        snapshot = compute_dashboard_stats(TODAY)
+        stats = snapshot['stats']
+
+        self.assertEqual(stats['total_products'], 3)
+        self.assertEqual(stats['total_customers'], 1)
+        self.assertEqual(stats['total_suppliers'], 1)
+        self.assertEqual(stats['total_warehouses'], 2)
+        self.assertEqual(stats['low_stock_products'], 1)
+        self.assertEqual(stats['inventory_value'], (3 + 4) * 2.0 + 20 * 5.0)
+        self.assertEqual(stats['sales_this_month'], 150)
+        self.assertEqual(stats['purchases_this_month'], 40)
+        # COGS: 2 * 2.0 + 1 * 5.0 + 3 * 5.0
+        self.assertEqual(stats['profit_this_month'], 150 - 24)
+        self.assertEqual(stats['expenses_this_month'], 12)
+
+        self.assertEqual(snapshot['chart_labels'],
+                         ['أغسطس', 'سبتمبر', 'أكتوبر', 'نوفمبر', 'ديسمبر', 'يناير'])
+        self.assertEqual(snapshot['sales_chart_data'], [0, 0, 0, 0, 70, 150])
+        self.assertEqual(snapshot['purchases_chart_data'], [0, 30, 0, 0, 0, 40])
+        self.assertEqual(snapshot['top_products'], [('DASH ok', 4), ('DASH low', 2)])
+
+    def test_query_count_does_not_grow_with_products(self):
+        for i in range(30):
+            db.session.add(Product(tenant_id=self.tenant_id, name=f'extra {i}', code=f'X{i}'))
+        db.session.commit()
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            compute_dashboard_stats(TODAY)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        self.assertLessEqual(len(statements), 8)
+
+    def test_snapshot_is_cached_per_tenant_when_enabled(self):
+        self.app.extensions['dashboard_cache'].ttl = 60
+        first = get_dashboard_stats(TODAY)
+        db.session.add(Customer(tenant_id=self.tenant_id, code='C2', name='New'))
+        db.session.commit()
+        self.assertIs(get_dashboard_stats(TODAY), first)
+
+        g.current_tenant_id = self.other_tenant_id
+        self.assertEqual(get_dashboard_stats(TODAY)['stats']['sales_this_month'], 15000)
+
+    def test_snapshot_is_recomputed_when_disabled(self):
+        first = get_dashboard_stats(TODAY)
+        db.session.add(Customer(tenant_id=self.tenant_id, code='C2', name='New'))
+        db.session.commit()
+        self.assertEqual(get_dashboard_stats(TODAY)['stats']['total_customers'],
+                         first['stats']['total_customers'] + 1)
+
+    def test_dashboard_page_renders(self):
+        company = Company(tenant_id=self.tenant_id, name='Dash')
+        db.session.add(company)
+        db.session.flush()
+        user = User(tenant_id=self.tenant_id, username='boss', email='boss@example.com',
+                    is_active=True, is_admin=True)
+        user.set_password('Boss123!')
+        db.session.add_all([user, License(tenant_id=self.tenant_id, company_id=company.id,
+                                          status='active', end_date=utcnow() + timedelta(days=10))])
+        db.session.commit()
+
+        client = self.app.test_client()
+        headers = {'Host': 'dash.example.com'}
+        client.post('/auth/login', data={'username': 'boss', 'password': 'Boss123!'},
+                    headers=headers)
+        response = client.get('/dashboard', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('labels: ["', response.get_data(as_text=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
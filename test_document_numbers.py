@@ -0,0 +1,202 @@
+import multiprocessing
+import os
+import tempfile
+import threading
+import unittest
+import warnings
+from datetime import datetime
+
+from sqlalchemy.exc import SAWarning
+
+from app import create_app, db
+from app.models import SalesInvoice
+from app.models_settings import DocumentSequence
+from app.models_tenant import Tenant
+from app.utils.document_numbers import next_number, release_blocks
+from config import TestingConfig, config
+
+WHEN = datetime(2026, 10, 18, 9, 30)
+
+
+class FileDatabaseConfig(TestingConfig):
+    """Shared on-disk SQLite database so threads and processes really race"""
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.environ.get('DOCUMENT_NUMBERS_TEST_DB', '')
+    SQLALCHEMY_ENGINE_OPTIONS = {'connect_args': {'timeout': 60}}
+
+
+config['testing_file_db'] = FileDatabaseConfig
+
+
+def _allocate_many(count, tenant_id, block_size=0):
+    numbers = []
+    for _ in range(count):
+        if block_size:
+            numbers.append(next_number('pos_order', tenant_id=tenant_id, when=WHEN,
+                                       block_scope=('pos_session', 1), block_size=block_size))
+        else:
+            numbers.append(next_number('pos_order', tenant_id=tenant_id, when=WHEN))
+            db.session.commit()
+    return numbers
+
+
+def _process_worker(count, tenant_id, block_size, queue):
+    app = create_app('testing_file_db')
+    with app.app_context():
+        queue.put(_allocate_many(count, tenant_id, block_size))
+        db.session.remove()
+
+
+class DocumentNumbersTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        self.tenant = Tenant(code='DOC', subdomain='doc', name='Doc', is_active=True)
+        db.session.add(self.tenant)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', category=SAWarning)
+            db.drop_all()
+        self.ctx.pop()
+
+    def test_numbers_keep_the_historical_format(self):
+        self.assertEqual(next_number('sales_invoice', tenant_id=self.tenant.id, when=WHEN),
+                         'INV2026100001')
+        self.assertEqual(next_number('pos_order', tenant_id=self.tenant.id, when=WHEN),
+                         'ORD202610180001')
+        self.assertEqual(next_number('pos_session', tenant_id=self.tenant.id, when=WHEN),
+                         'POS20261018001')
+        self.assertEqual(next_number('sales_invoice', tenant_id=self.tenant.id, when=WHEN),
+                         'INV2026100002')
+
+    def test_counter_is_seeded_from_existing_documents(self):
+        db.session.add(SalesInvoice(tenant_id=self.tenant.id, invoice_number='INV2026100041',
+                                    invoice_date=WHEN.date(), customer_id=1))
+        db.session.commit()
+        self.assertEqual(next_number('sales_invoice', tenant_id=self.tenant.id, when=WHEN),
+                         'INV2026100042')
+
+    def test_tenants_and_periods_have_separate_counters(self):
+        other = Tenant(code='DOC2', subdomain='doc2', name='Doc2', is_active=True)
+        db.session.add(other)
+        db.session.commit()
+        next_number('pos_order', tenant_id=self.tenant.id, when=WHEN)
+        self.assertEqual(next_number('pos_order', tenant_id=other.id, when=WHEN),
+                         'ORD202610180001')
+        self.assertEqual(next_number('pos_order', tenant_id=self.tenant.id,
+                                     when=datetime(2026, 10, 19)),
+                         'ORD202610190001')
+
+    def test_rollback_does_not_leave_a_gap(self):
+        next_number('sales_invoice', tenant_id=self.tenant.id, when=WHEN)
+        db.session.commit()
+        next_number('sales_invoice', tenant_id=self.tenant.id, when=WHEN)
+        db.session.rollback()
+        self.assertEqual(next_number('sales_invoice', tenant_id=self.tenant.id, when=WHEN),
+                         'INV2026100002')
+
+    def test_unknown_series_is_rejected(self):
+        with self.assertRaises(ValueError):
+            next_number('nope')
+
+
+class DocumentNumbersConcurrencyTestCase(unittest.TestCase):
+    WORKERS = 4
+    PER_WORKER = 25
+
+    def setUp(self):
+        handle, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        os.environ['DOCUMENT_NUMBERS_TEST_DB'] = self.db_path
+        FileDatabaseConfig.SQLALCHEMY_DATABASE_URI = 'sqlite:///' + self.db_path
+        self.app = create_app('testing_file_db')
+        with self.app.app_context():
+            db.create_all()
+            tenant = Tenant(code='RACE', subdomain='race', name='Race', is_active=True)
+            db.session.add(tenant)
+            db.session.commit()
+            self.tenant_id = tenant.id
+            # Create the counter row up front; the race is on the increment
+            next_number('pos_order', tenant_id=self.tenant_id, when=WHEN)
+            db.session.commit()
+            db.session.remove()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.engine.dispose()
+        os.environ.pop('DOCUMENT_NUMBERS_TEST_DB', None)
+        os.remove(self.db_path)
+
+    def _run_threads(self, block_size=0):
+        results = []
+        lock = threading.Lock()
+
+        def worker():
+            with self.app.app_context():
+                numbers = _allocate_many(self.PER_WORKER, self.tenant_id, block_size)
+                db.session.remove()
+            with lock:
+                results.extend(numbers)
+
+        threads = [threading.Thread(target=worker) for _ in range(self.WORKERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def _run_processes(self, block_size=0):
+        context = multiprocessing.get_context('spawn')
+        queue = context.Queue()
+        processes = [
+            context.Process(target=_process_worker,
+                            args=(self.PER_WORKER, self.tenant_id, block_size, queue))
+            for _ in range(self.WORKERS)
+        ]
+        for process in processes:
+            process.start()
+        results = []
+        for _ in processes:
+            results.extend(queue.get(timeout=120))
+        for process in processes:
+            process.join()
+        return results
+
+    def _last_value(self):
+        with self.app.app_context():
+            value = db.session.query(DocumentSequence.last_value).scalar()
+            db.session.remove()
+        return value
+
+    def test_threads_get_unique_gap_free_numbers(self):
+        numbers = self._run_threads()
+        expected = [f'ORD20261018{n:04d}' for n in range(2, 2 + self.WORKERS * self.PER_WORKER)]
+        self.assertEqual(sorted(numbers), expected)
+
+    def test_processes_get_unique_gap_free_numbers(self):
+        numbers = self._run_processes()
+        expected = [f'ORD20261018{n:04d}' for n in range(2, 2 + self.WORKERS * self.PER_WORKER)]
+        self.assertEqual(sorted(numbers), expected)
+        self.assertEqual(self._last_value(), 1 + self.WORKERS * self.PER_WORKER)
+
+    def test_blocks_are_disjoint_across_processes(self):
+        numbers = self._run_processes(block_size=10)
+        self.assertEqual(len(set(numbers)), len(numbers))
+        # Each process reserved whole blocks of 10
+        self.assertEqual(self._last_value(), 1 + self.WORKERS * 30)
+
+    def test_released_block_is_not_reused(self):
+        with self.app.app_context():
+            first = _allocate_many(3, self.tenant_id, block_size=10)
+            release_blocks(('pos_session', 1))
+            second = _allocate_many(1, self.tenant_id, block_size=10)
+        self.assertEqual(first, ['ORD202610180002', 'ORD202610180003', 'ORD202610180004'])
+        self.assertEqual(second, ['ORD202610180012'])
+
+
+if __name__ == '__main__':
+    unittest.main()
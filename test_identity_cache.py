@@ -0,0 +1,116 @@
+import unittest
+import warnings
+from datetime import timedelta
+
+from flask import g
+from sqlalchemy import event
+from sqlalchemy.exc import SAWarning
+
+from app import create_app, db
+from app.identity_cache import UserIdentity, load_identity
+from app.models import Company, Permission, Role, User
+from app.models_license import License
+from app.models_tenant import Tenant
+from app.permission_cache import bump_permissions_version
+from app.utils.datetime_helper import utcnow
+
+
+class IdentityCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        self.tenant = Tenant(code='COMPID', subdomain='ident', name='Ident', is_active=True)
+        db.session.add(self.tenant)
+        db.session.flush()
+        company = Company(tenant_id=self.tenant.id, name='Ident')
+        db.session.add(company)
+        db.session.flush()
+        self.view = Permission(name='settings.view')
+        self.role = Role(name='clerk', permissions=[self.view])
+        self.user = User(tenant_id=self.tenant.id, username='clerk', email='clerk@example.com',
+                         full_name='Clerk', is_active=True, role=self.role)
+        self.user.set_password('Clerk123!')
+        db.session.add_all([
+            self.user,
+            License(tenant_id=self.tenant.id, company_id=company.id, status='active',
+                    end_date=utcnow() + timedelta(days=10)),
+        ])
+        db.session.commit()
+        self.headers = {'Host': 'ident.example.com'}
+
+    def tearDown(self):
+        db.session.remove()
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', category=SAWarning)
+            db.drop_all()
+        self.ctx.pop()
+
+    def _count_queries(self, fn, table):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            if f'FROM {table}' in statement or f'JOIN {table}' in statement:
+                statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            result = fn()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        return len(statements), result
+
+    def test_identity_snapshot_and_permissions(self):
+        identity = load_identity(self.user.id)
+        self.assertIsInstance(identity, UserIdentity)
+        self.assertEqual(identity.get_id(), str(self.user.id))
+        self.assertTrue(identity.has_permission('settings.view'))
+        self.assertFalse(identity.has_permission('settings.manage'))
+        with self.assertRaises(AttributeError):
+            identity.language = 'en'
+
+    def test_warm_load_issues_no_user_or_permission_queries(self):
+        load_identity(self.user.id)
+        users, _ = self._count_queries(lambda: load_identity(self.user.id), 'users')
+        perms, _ = self._count_queries(lambda: load_identity(self.user.id), 'permissions')
+        self.assertEqual((users, perms), (0, 0))
+
+    def test_other_attributes_load_the_orm_user_once(self):
+        identity = load_identity(self.user.id)
+        with self.app.test_request_context('/'):
+            self.assertEqual(identity.role.name, 'clerk')
+            self.assertTrue(identity.check_password('Clerk123!'))
+            self.assertIs(identity.get_user(), identity.get_user())
+
+    def test_user_update_invalidates_identity(self):
+        load_identity(self.user.id)
+        self.user.language = 'en'
+        db.session.commit()
+        self.assertEqual(load_identity(self.user.id).language, 'en')
+
+    def test_permission_version_bump_refreshes_identity(self):
+        load_identity(self.user.id)
+        self.role.permissions.append(Permission(name='settings.manage'))
+        db.session.commit()
+        bump_permissions_version()
+        self.assertTrue(load_identity(self.user.id).has_permission('settings.manage'))
+
+    def test_user_of_other_tenant_is_not_loaded(self):
+        with self.app.test_request_context('/'):
+            g.current_tenant_id = self.tenant.id + 1
+            self.assertIsNone(load_identity(self.user.id))
+
+    def test_profile_update_goes_through_orm_user(self):
+        self.client.post('/auth/login', data={'username': 'clerk', 'password': 'Clerk123!'},
+                         headers=self.headers)
+        self.client.post('/settings/language/change', data={'language': 'en'},
+                         headers=self.headers)
+        db.session.expire_all()
+        self.assertEqual(db.session.get(User, self.user.id).language, 'en')
+
+
+if __name__ == '__main__':
+    unittest.main()
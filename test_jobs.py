@@ -0,0 +1,164 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import warnings
+from datetime import date, datetime, timedelta
+
+from openpyxl import load_workbook
+from sqlalchemy.exc import SAWarning
+
+from app import create_app, db
+from app.jobs import claim_next, enqueue, purge_jobs, requeue_stale
+from app.models import Company, Customer, Job, SalesInvoice, User
+from app.models_license import License
+from app.models_tenant import Tenant
+from app.utils.datetime_helper import utcnow
+
+HEADERS = {'Host': 'jobs.example.com'}
+
+
+class JobQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.result_dir = tempfile.mkdtemp()
+        self.app.config['JOBS_RESULT_DIR'] = self.result_dir
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        tenant = Tenant(code='JOBS', subdomain='jobs', name='Jobs', is_active=True)
+        db.session.add(tenant)
+        db.session.flush()
+        t = self.tenant_id = tenant.id
+        company = Company(tenant_id=t, name='Jobs')
+        admin = User(tenant_id=t, username='clerk', email='clerk@example.com',
+                     is_active=True, is_admin=True)
+        admin.set_password('Clerk123!')
+        guest = User(tenant_id=t, username='guest', email='guest@example.com', is_active=True)
+        guest.set_password('Guest123!')
+        customer = Customer(tenant_id=t, name='مؤسسة المهام', code='C1')
+        db.session.add_all([company, admin, guest, customer])
+        db.session.flush()
+        self.admin_id = admin.id
+        db.session.add_all([
+            License(tenant_id=t, company_id=company.id, status='active',
+                    end_date=utcnow() + timedelta(days=10)),
+            SalesInvoice(tenant_id=t, invoice_number='INV-1', customer_id=customer.id,
+                         status='confirmed', invoice_date=date.today(), total_amount=50),
+        ])
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', category=SAWarning)
+            db.drop_all()
+        self.ctx.pop()
+        shutil.rmtree(self.result_dir, ignore_errors=True)
+
+    def _login(self, username='clerk', password='Clerk123!'):
+        self.client.post('/auth/login', data={'username': username, 'password': password},
+                         headers=HEADERS)
+
+    def _work(self):
+        # Own app context, hence own session, like a separate worker process
+        with self.app.app_context():
+            result = self.app.test_cli_runner().invoke(args=['jobs', 'worker', '--burst'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        db.session.expire_all()
+        return result.output
+
+    def _status(self, job_id):
+        response = self.client.get(f'/jobs/{job_id}?format=json', headers=HEADERS)
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+
+    def test_export_is_queued_and_run_by_the_worker(self):
+        self._login()
+        response = self.client.get('/reports/export-excel/sales?background=1', headers=HEADERS)
+        job = Job.query.one()
+        job_id = job.id
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.location.endswith(f'/jobs/{job_id}'))
+        self.assertEqual((job.kind, job.status, job.tenant_id), ('export', 'queued', self.tenant_id))
+        self.assertEqual(self._status(job_id)['status'], 'queued')
+
+        self.assertIn('1 jobs run', self._work())
+        status = self._status(job_id)
+        self.assertEqual((status['status'], status['progress']), ('done', 100))
+        self.assertTrue(status['result_name'].startswith('sales_report_'))
+
+        download = self.client.get(status['download_url'], headers=HEADERS)
+        self.assertEqual(download.status_code, 200)
+        rows = list(load_workbook(io.BytesIO(download.data)).active.iter_rows(values_only=True))
+        self.assertEqual(rows[1][:3], ('INV-1', str(date.today()), 'مؤسسة المهام'))
+        page = self.client.get(f'/jobs/{job_id}', headers=HEADERS).get_data(as_text=True)
+        self.assertIn(status['download_url'], page)
+
+    def test_api_clients_get_202_and_jobs_enabled_queues_by_default(self):
+        self._login()
+        response = self.client.get('/reports/export-excel/sales?background=1&format=json',
+                                   headers=HEADERS)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.get_json()['status'], 'queued')
+
+        self.app.config['JOBS_ENABLED'] = True
+        self.assertEqual(self.client.get('/reports/export-excel/sales', headers=HEADERS).status_code, 302)
+        inline = self.client.get('/reports/export-excel/sales?background=0', headers=HEADERS)
+        self.assertEqual(inline.status_code, 200)
+        self.assertEqual(Job.query.count(), 2)
+
+        # The worker runs the view itself instead of queueing it again
+        self._work()
+        self.assertEqual({job.status for job in Job.query}, {'done'})
+
+    def test_failures_are_recorded(self):
+        with self.app.test_request_context():
+            job_id = enqueue('no-such-kind', user_id=self.admin_id, tenant_id=self.tenant_id).id
+        self._work()
+        job = db.session.get(Job, job_id)
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('no-such-kind', job.error)
+
+    def test_other_users_cannot_see_a_job(self):
+        with self.app.test_request_context():
+            job = enqueue('export', user_id=self.admin_id, tenant_id=self.tenant_id)
+        self._login('guest', 'Guest123!')
+        self.assertEqual(self.client.get(f'/jobs/{job.id}?format=json', headers=HEADERS).status_code, 404)
+
+    def test_a_job_is_claimed_once(self):
+        with self.app.test_request_context():
+            job = enqueue('export', tenant_id=self.tenant_id)
+        self.assertEqual(claim_next('a:1'), job.id)
+        self.assertIsNone(claim_next('b:2'))
+        db.session.expire_all()
+        self.assertEqual((job.status, job.worker, job.attempts), ('running', 'a:1', 1))
+
+    def test_stale_jobs_are_requeued_then_failed(self):
+        old = datetime.utcnow() - timedelta(hours=2)
+        retry = Job(kind='export', status='running', attempts=1, heartbeat_at=old)
+        spent = Job(kind='export', status='running', attempts=3, heartbeat_at=old)
+        alive = Job(kind='export', status='running', attempts=1, heartbeat_at=datetime.utcnow())
+        db.session.add_all([retry, spent, alive])
+        db.session.commit()
+
+        self.assertEqual(requeue_stale(), 1)
+        db.session.expire_all()
+        self.assertEqual([retry.status, spent.status, alive.status], ['queued', 'failed', 'running'])
+
+    def test_purge_removes_old_results(self):
+        job = Job(kind='export', status='done', finished_at=datetime.utcnow() - timedelta(days=30))
+        db.session.add(job)
+        db.session.commit()
+        directory = os.path.join(self.result_dir, str(job.id))
+        os.makedirs(directory)
+        self.assertEqual(purge_jobs(7), 1)
+        self.assertFalse(os.path.exists(directory))
+        self.assertEqual(Job.query.count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
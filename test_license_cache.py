@@ -0,0 +1,127 @@
+import unittest
+import warnings
+from datetime import timedelta
+from unittest.mock import patch
+
+from sqlalchemy import event
+from sqlalchemy.exc import SAWarning
+
+from app import create_app, db
+from app.license_cache import get_license_status, invalidate_license
+from app.models import Company, User
+from app.models_license import License
+from app.models_tenant import Tenant
+from app.utils.datetime_helper import utcnow
+
+
+class LicenseCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config.update(STRIPE_WEBHOOK_SECRET='whsec_test')
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        self.client = self.app.test_client()
+        self.cache = self.app.extensions['license_cache']
+
+        self.tenant = Tenant(code='COMPLIC', subdomain='lic', name='Lic', is_active=True)
+        db.session.add(self.tenant)
+        db.session.flush()
+        company = Company(tenant_id=self.tenant.id, name='Lic')
+        db.session.add(company)
+        db.session.flush()
+        user = User(tenant_id=self.tenant.id, username='admin', email='admin@lic.example.com',
+                    is_active=True, is_admin=True)
+        user.set_password('Admin123!')
+        db.session.add(user)
+        self.license = License(
+            tenant_id=self.tenant.id,
+            company_id=company.id,
+            plan='monthly',
+            status='active',
+            stripe_subscription_id='sub_lic',
+            end_date=utcnow() + timedelta(days=10),
+        )
+        db.session.add(self.license)
+        db.session.commit()
+        self.headers = {'Host': 'lic.example.com'}
+
+    def tearDown(self):
+        db.session.remove()
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', category=SAWarning)
+            db.drop_all()
+        self.ctx.pop()
+
+    def _login(self):
+        self.client.post('/auth/login', data={'username': 'admin', 'password': 'Admin123!'},
+                         headers=self.headers)
+
+    def _count_license_queries(self, fn):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            if 'FROM licenses' in statement:
+                statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            result = fn()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        return len(statements), result
+
+    def test_warm_status_is_served_from_cache(self):
+        first, _ = self._count_license_queries(lambda: get_license_status(self.tenant.id))
+        second, status = self._count_license_queries(lambda: get_license_status(self.tenant.id))
+        self.assertEqual(first, 1)
+        self.assertEqual(second, 0)
+        self.assertTrue(status.is_active())
+
+    def test_lapsed_expiry_reloads_and_marks_license_expired(self):
+        get_license_status(self.tenant.id)
+        # Bypass the ORM so the cached entry is not invalidated by events
+        db.session.execute(
+            License.__table__.update().values(end_date=utcnow() - timedelta(days=1))
+        )
+        db.session.commit()
+        invalidate_license(self.tenant.id)
+
+        status = get_license_status(self.tenant.id)
+        db.session.refresh(self.license)
+        self.assertFalse(status.is_active())
+        self.assertEqual(self.license.status, 'expired')
+
+    def test_cached_active_status_with_past_expiry_is_not_trusted(self):
+        status = get_license_status(self.tenant.id)
+        status.expires_at = utcnow() - timedelta(seconds=1)
+
+        queries, reloaded = self._count_license_queries(lambda: get_license_status(self.tenant.id))
+        self.assertEqual(queries, 1)
+        self.assertTrue(reloaded.is_active())
+
+    @patch('app.payment.routes.stripe.Webhook.construct_event')
+    def test_webhook_suspension_invalidates_cached_status(self, mock_construct_event):
+        self.assertTrue(get_license_status(self.tenant.id).is_active())
+        mock_construct_event.return_value = {
+            'type': 'invoice.payment_failed',
+            'data': {'object': {'subscription': 'sub_lic', 'customer': None}},
+        }
+
+        self.client.post('/payment/stripe-webhook', data=b'{}',
+                         headers={'Stripe-Signature': 'sig_test'})
+
+        self.assertFalse(get_license_status(self.tenant.id).is_active())
+
+    def test_inactive_license_redirects_to_upgrade(self):
+        self._login()
+        self.license.status = 'suspended'
+        db.session.commit()
+
+        response = self.client.get('/security/dashboard', headers=self.headers)
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('/billing/upgrade', response.headers['Location'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+import warnings
+
+from sqlalchemy.exc import SAWarning
+
+from app import create_app, db
+from app.models import Permission, Role, RolePermission, User
+from app.permission_cache import bump_permissions_version, get_role_permissions
+
+
+class PermissionCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        self.view = Permission(name='sales.view')
+        self.create = Permission(name='sales.create')
+        self.role = Role(name='cashier', permissions=[self.view])
+        self.user = User(username='cashier', email='cashier@example.com', role=self.role)
+        db.session.add_all([self.create, self.user])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', category=SAWarning)
+            db.drop_all()
+        self.ctx.pop()
+
+    def test_role_permissions_are_a_frozenset(self):
+        names = get_role_permissions(self.role.id)
+        self.assertIsInstance(names, frozenset)
+        self.assertEqual(names, {'sales.view'})
+        self.assertIs(get_role_permissions(self.role.id), names)
+
+    def test_user_permission_checks(self):
+        self.assertTrue(self.user.has_permission('sales.view'))
+        self.assertFalse(self.user.has_permission('sales.create'))
+        self.assertTrue(self.user.has_any_permission('sales.create', 'sales.view'))
+        self.assertFalse(self.user.has_all_permissions('sales.create', 'sales.view'))
+
+    def test_user_without_role_has_no_permissions(self):
+        user = User(username='norole', email='norole@example.com')
+        self.assertFalse(user.has_permission('sales.view'))
+        self.assertFalse(user.has_any_permission('sales.view'))
+
+    def test_bumping_version_picks_up_new_grants(self):
+        self.assertFalse(self.user.has_permission('sales.create'))
+
+        db.session.add(RolePermission(role_id=self.role.id, permission_id=self.create.id))
+        db.session.commit()
+        db.session.expire_all()
+        # Still served from the compiled set until the version is bumped
+        self.assertFalse(self.user.has_permission('sales.create'))
+
+        bump_permissions_version()
+        self.assertTrue(self.user.has_permission('sales.create'))
+
+    def test_changing_user_role_recompiles(self):
+        manager = Role(name='manager', permissions=[self.view, self.create])
+        db.session.add(manager)
+        db.session.commit()
+        self.assertFalse(self.user.has_permission('sales.create'))
+
+        self.user.role = manager
+        db.session.commit()
+        self.assertTrue(self.user.has_permission('sales.create'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+import gzip
+import json
+import unittest
+import warnings
+from datetime import timedelta
+
+from sqlalchemy.exc import SAWarning
+
+from app import create_app, db
+from app.models import Company, POSSession, Product, Stock, User, Warehouse
+from app.models_license import License
+from app.models_tenant import Tenant
+from app.utils.datetime_helper import utcnow
+from app.utils.stock_ledger import StockLedger
+
+HEADERS = {'Host': 'shelf.example.com'}
+
+
+class POSCatalogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        tenant = Tenant(code='SHELF', subdomain='shelf', name='Shelf', is_active=True)
+        db.session.add(tenant)
+        db.session.flush()
+        t = self.tenant_id = tenant.id
+        company = Company(tenant_id=t, name='Shelf')
+        main = Warehouse(tenant_id=t, name='Main')
+        back = Warehouse(tenant_id=t, name='Back')
+        user = User(tenant_id=t, username='cashier', email='cashier@example.com',
+                    is_active=True, is_admin=True)
+        user.set_password('Cashier123!')
+        db.session.add_all([company, main, back, user])
+        db.session.flush()
+        db.session.add(License(tenant_id=t, company_id=company.id, status='active',
+                               end_date=utcnow() + timedelta(days=10)))
+        db.session.add(POSSession(tenant_id=t, session_number='POS-1', cashier_id=user.id,
+                                  warehouse_id=main.id, status='open'))
+        tea = Product(tenant_id=t, name='Tea', code='T1', barcode='628001', selling_price=4.5,
+                      tax_rate=15)
+        milk = Product(tenant_id=t, name='Milk', code='M1', selling_price=2)
+        wrap = Product(tenant_id=t, name='Gift wrap', code='GW', track_inventory=False)
+        hidden = Product(tenant_id=t, name='Internal', code='X1', is_sellable=False)
+        db.session.add_all([tea, milk, wrap, hidden])
+        db.session.flush()
+        db.session.add_all([Stock(tenant_id=t, product_id=tea.id, warehouse_id=main.id, quantity=12),
+                            Stock(tenant_id=t, product_id=tea.id, warehouse_id=back.id, quantity=99)])
+        # Seeded an hour ago, outside the delta overlap window
+        earlier = utcnow() - timedelta(hours=1)
+        Product.query.update({'updated_at': earlier, 'created_at': earlier})
+        Stock.query.update({'last_updated': earlier})
+        hidden.updated_at = earlier + timedelta(minutes=10)  # the latest change
+        db.session.commit()
+        self.main_id, self.back_id = main.id, back.id
+        self.tea_id, self.milk_id, self.wrap_id, self.hidden_id = tea.id, milk.id, wrap.id, hidden.id
+
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'username': 'cashier', 'password': 'Cashier123!'},
+                         headers=HEADERS)
+
+    def tearDown(self):
+        db.session.remove()
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', category=SAWarning)
+            db.drop_all()
+        self.ctx.pop()
+
+    def _catalog(self, since=None, **headers):
+        url = '/pos/catalog' + (f'?since={since}' if since else '')
+        response = self.client.get(url, headers=dict(HEADERS, **headers))
+        self.assertEqual(response.status_code, 200, response.get_data(as_text=True))
+        return response, json.loads(response.get_data())
+
+    def _products(self, data):
+        return {row[0]: dict(zip(data['fields'], row)) for row in data['products']}
+
+    def test_full_catalog_lists_sellable_products_with_session_stock(self):
+        response, data = self._catalog()
+        self.assertTrue(data['full'])
+        products = self._products(data)
+        self.assertEqual(set(products), {self.tea_id, self.milk_id, self.wrap_id})
+        self.assertEqual(products[self.tea_id], {
+            'id': self.tea_id, 'code': 'T1', 'barcode': '628001', 'name': 'Tea',
+            'price': 4.5, 'tax_rate': 15.0, 'stock': 12.0, 'image': None,
+        })
+        self.assertIsNone(products[self.milk_id]['stock'])  # no stock row in Main
+        self.assertIsNone(products[self.wrap_id]['stock'])  # not tracked
+        self.assertEqual(response.headers['Cache-Control'], 'private, no-cache')
+
+    def test_etag_answers_unchanged_catalog_with_304(self):
+        first, data = self._catalog()
+        again = self.client.get('/pos/catalog', headers=dict(HEADERS, **{
+            'If-None-Match': first.headers['ETag']}))
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.get_data(), b'')
+
+        db.session.get(Product, self.milk_id).selling_price = 2.5
+        db.session.commit()
+        changed, changed_data = self._catalog(**{'If-None-Match': first.headers['ETag']})
+        self.assertNotEqual(changed.headers['ETag'], first.headers['ETag'])
+        self.assertNotEqual(changed_data['version'], data['version'])
+
+    def test_delta_returns_changed_products_and_removals(self):
+        _, data = self._catalog()
+        version = data['version']
+
+        _, unchanged = self._catalog(since=version)
+        self.assertEqual((unchanged['full'], unchanged['products'], unchanged['removed']),
+                         (False, [], [self.hidden_id]))  # within the overlap window
+
+        db.session.get(Product, self.wrap_id).is_active = False
+        StockLedger('pos_order', tenant_id=self.tenant_id).add(self.tea_id, self.main_id, -2).post()
+        db.session.commit()
+
+        _, delta = self._catalog(since=version)
+        self.assertFalse(delta['full'])
+        self.assertEqual(self._products(delta)[self.tea_id]['stock'], 10.0)
+        self.assertNotIn(self.milk_id, self._products(delta))
+        self.assertEqual(delta['removed'], [self.wrap_id, self.hidden_id])
+        self.assertNotEqual(delta['version'], version)
+
+    def test_deleted_products_force_a_full_catalog(self):
+        _, data = self._catalog()
+        db.session.delete(db.session.get(Product, self.milk_id))
+        db.session.commit()
+        _, delta = self._catalog(since=data['version'])
+        self.assertTrue(delta['full'])
+        self.assertEqual(set(self._products(delta)), {self.tea_id, self.wrap_id})
+
+    def test_gzip_and_cached_body(self):
+        response = self.client.get('/pos/catalog', headers=dict(HEADERS, **{
+            'Accept-Encoding': 'gzip'}))
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        data = json.loads(gzip.decompress(response.get_data()))
+        self.assertEqual(len(data['products']), 3)
+
+        cache = self.app.extensions['catalog_cache']
+        hits = cache.hits
+        self._catalog()
+        self.assertEqual(cache.hits, hits + 1)
+
+    def test_index_no_longer_embeds_products(self):
+        response = self.client.get('/pos/', headers=HEADERS)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(b'data-product-id="', response.get_data())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,250 @@
+import unittest
+import uuid
+import warnings
+from datetime import timedelta
+
+from sqlalchemy import event, text
+from sqlalchemy.exc import SAWarning
+
+from app import create_app, db
+from app.models import (Company, Customer, POSOrder, POSOrderItem, POSSession, Product,
+                        SalesInvoice, SalesInvoiceItem, Stock, StockMovement, User, Warehouse)
+from app.models_license import License
+from app.models_tenant import Tenant
+from app.utils.datetime_helper import utcnow
+
+HEADERS = {'Host': 'till.example.com'}
+
+
+class POSCheckoutTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        tenant = Tenant(code='TILL', subdomain='till', name='Till', is_active=True)
+        db.session.add(tenant)
+        db.session.flush()
+        t = self.tenant_id = tenant.id
+        company = Company(tenant_id=t, name='Till')
+        warehouse = Warehouse(tenant_id=t, name='Main')
+        user = User(tenant_id=t, username='cashier', email='cashier@example.com',
+                    is_active=True, is_admin=True)
+        user.set_password('Cashier123!')
+        db.session.add_all([company, warehouse, user])
+        db.session.flush()
+        db.session.add(License(tenant_id=t, company_id=company.id, status='active',
+                               end_date=utcnow() + timedelta(days=10)))
+        session = POSSession(tenant_id=t, session_number='POS-1', cashier_id=user.id,
+                             warehouse_id=warehouse.id)
+        self.products = [Product(tenant_id=t, name=f'Item {i}', code=f'I{i}', tax_rate=10)
+                         for i in range(40)]
+        service = Product(tenant_id=t, name='Gift wrap', code='GW', track_inventory=False)
+        db.session.add_all([session, service] + self.products)
+        db.session.flush()
+        db.session.add_all([Stock(tenant_id=t, product_id=p.id, warehouse_id=warehouse.id,
+                                  quantity=100) for p in self.products])
+        db.session.commit()
+        self.session_id, self.warehouse_id, self.service_id = session.id, warehouse.id, service.id
+        self.product_ids = [p.id for p in self.products]
+
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'username': 'cashier', 'password': 'Cashier123!'},
+                         headers=HEADERS)
+
+    def tearDown(self):
+        db.session.remove()
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', category=SAWarning)
+            db.drop_all()
+        self.ctx.pop()
+
+    def _cart(self, items):
+        total = sum(price * quantity for _, quantity, price in items)
+        return {
+            'session_id': self.session_id, 'subtotal': total, 'discount_amount': 0,
+            'tax_amount': 0, 'total_amount': total, 'payment_method': 'cash',
+            'cash_amount': total + 5, 'card_amount': 0,
+            'items': [{'productId': product_id, 'quantity': quantity, 'price': price}
+                      for product_id, quantity, price in items],
+        }
+
+    def test_closing_the_session_releases_its_number_block(self):
+        self.app.config['POS_NUMBER_BLOCK_SIZE'] = 10
+        cart = dict(self._cart([(self.product_ids[0], 1, 5.0)]), session_id=str(self.session_id))
+        response = self.client.post('/pos/create-order', headers=HEADERS, json=cart)
+        self.assertEqual(response.status_code, 200, response.get_json())
+        self.assertEqual(len(self.app.extensions['document_number_blocks']), 1)
+
+        self.client.post(f'/pos/close-session/{self.session_id}', headers=HEADERS,
+                         data={'closing_balance': '5'})
+        self.assertEqual(self.app.extensions['document_number_blocks'], {})
+
+    def test_checkout_writes_order_invoice_and_stock(self):
+        first, second = self.product_ids[:2]
+        response = self.client.post('/pos/create-order', headers=HEADERS, json=self._cart(
+            [(first, 2, 5.0), (second, 1, 20.0), (self.service_id, 1, 3.0), (first, 1, 5.0)]))
+        body = response.get_json()
+        self.assertEqual(response.status_code, 200, body)
+        self.assertTrue(body['success'])
+
+        db.session.remove()
+        order = POSOrder.query.get(body['order_id'])
+        self.assertEqual((order.order_number, order.change_amount), (body['order_number'], 5))
+        self.assertEqual(POSOrderItem.query.filter_by(order_id=order.id).count(), 4)
+
+        invoice = SalesInvoice.query.get(body['invoice_id'])
+        self.assertEqual((invoice.invoice_number, invoice.pos_order_id, invoice.status),
+                         (body['invoice_number'], order.id, 'paid'))
+        self.assertEqual(invoice.customer.code, 'WALK-IN')
+        items = SalesInvoiceItem.query.filter_by(invoice_id=invoice.id).order_by(SalesInvoiceItem.id).all()
+        self.assertEqual([(i.description, i.total, round(i.tax_amount, 2)) for i in items],
+                         [('Item 0', 10, 1), ('Item 1', 20, 2), ('Gift wrap', 3, 0.45),
+                          ('Item 0', 5, 0.5)])
+        self.assertTrue(all(i.tenant_id == self.tenant_id for i in items))
+
+        quantities = {s.product_id: s.quantity for s in Stock.query}
+        self.assertEqual((quantities[first], quantities[second]), (97, 99))
+        movements = StockMovement.query.filter_by(reference_type='pos_order',
+                                                  reference_id=order.id).count()
+        self.assertEqual(movements, 3)  # the untracked service has no stock row
+
+    def test_insufficient_stock_writes_nothing(self):
+        first = self.product_ids[0]
+        response = self.client.post('/pos/create-order', headers=HEADERS,
+                                    json=self._cart([(first, 60, 1.0), (first, 60, 1.0)]))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.get_json()['success'])
+
+        db.session.remove()
+        self.assertEqual(POSOrder.query.count(), 0)
+        self.assertEqual(SalesInvoice.query.count(), 0)
+        self.assertEqual(Customer.query.count(), 0)
+        self.assertEqual(Stock.query.filter_by(product_id=first).one().quantity, 100)
+
+    def test_query_count_does_not_grow_with_cart_size(self):
+        def count_queries(lines):
+            statements = []
+            listener = lambda *args: statements.append(args[2])
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            try:
+                response = self.client.post('/pos/create-order', headers=HEADERS, json=self._cart(
+                    [(product_id, 1, 1.0) for product_id in self.product_ids[:lines]]))
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', listener)
+            self.assertTrue(response.get_json()['success'])
+            return len(statements)
+
+        count_queries(1)  # creates the walk-in customer
+        self.assertEqual(count_queries(5), count_queries(40))
+
+
+    def _sync(self, orders):
+        response = self.client.post('/pos/sync', headers=HEADERS, json={'orders': orders})
+        self.assertEqual(response.status_code, 200, response.get_data(as_text=True))
+        return response.get_json()['results']
+
+    def _queued(self, items):
+        return dict(self._cart(items), client_uuid=str(uuid.uuid4()))
+
+    def test_sync_places_orders_and_reports_each_result(self):
+        first, second = self.product_ids[:2]
+        orders = [self._queued([(first, 60, 1.0)]),
+                  self._queued([(first, 50, 1.0), (second, 1, 2.0)]),  # only 40 left
+                  self._queued([(second, 3, 2.0)]),
+                  {'client_uuid': 'not-a-uuid'}]
+        results = self._sync(orders)
+
+        self.assertEqual([r['status'] for r in results],
+                         ['created', 'rejected', 'created', 'rejected'])
+        self.assertIn('Item 0', results[1]['error'])
+        self.assertEqual(results[0]['client_uuid'], orders[0]['client_uuid'])
+
+        db.session.remove()
+        order = POSOrder.query.get(results[2]['order_id'])
+        self.assertEqual(order.client_uuid, orders[2]['client_uuid'])
+        self.assertEqual(SalesInvoice.query.get(results[2]['invoice_id']).pos_order_id, order.id)
+        numbers = sorted(r['order_number'] for r in results if r['status'] == 'created')
+        self.assertEqual(numbers[1][-4:], '0002')  # rejected orders leave no gap
+        quantities = {s.product_id: s.quantity for s in Stock.query}
+        self.assertEqual((quantities[first], quantities[second]), (40, 97))
+        self.assertEqual(StockMovement.query.filter_by(reference_id=order.id).count(), 1)
+
+    def test_sync_is_idempotent(self):
+        first = self.product_ids[0]
+        orders = [self._queued([(first, 1, 1.0)]), self._queued([(first, 2, 1.0)])]
+        created = self._sync(orders)
+        self.assertEqual([r['status'] for r in created], ['created', 'created'])
+
+        resent = self._sync(orders + [orders[0]])
+        self.assertEqual([r['status'] for r in resent], ['duplicate'] * 3)
+        self.assertEqual([r['order_id'] for r in resent],
+                         [created[0]['order_id'], created[1]['order_id'], created[0]['order_id']])
+        self.assertEqual(resent[1]['invoice_number'], created[1]['invoice_number'])
+
+        db.session.remove()
+        self.assertEqual(POSOrder.query.count(), 2)
+        self.assertEqual(Stock.query.filter_by(product_id=first).one().quantity, 97)
+
+    def test_sync_duplicate_lookup_uses_the_index(self):
+        plan = db.session.execute(text(
+            "EXPLAIN QUERY PLAN SELECT id FROM pos_orders "
+            "WHERE client_uuid IN ('a', 'b') AND tenant_id = 1"
+        )).fetchall()
+        self.assertIn('INDEX', ' '.join(row[-1] for row in plan))
+
+    def test_sync_query_count_does_not_grow_with_orders(self):
+        def count_queries(orders):
+            statements = []
+            listener = lambda *args: statements.append(args[2])
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            try:
+                results = self._sync([self._queued([(product_id, 1, 1.0)])
+                                      for product_id in self.product_ids[:orders]])
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', listener)
+            self.assertEqual({r['status'] for r in results}, {'created'})
+            # SQLite has no ordered multi-row RETURNING, so the ORM inserts
+            # orders and invoices one by one there; other backends batch them
+            return len([s for s in statements
+                        if not s.startswith(('INSERT INTO pos_orders', 'INSERT INTO sales_invoices'))])
+
+        count_queries(1)  # creates the walk-in customer and the counters
+        self.assertEqual(count_queries(3), count_queries(30))
+
+    def test_session_totals_are_kept_by_each_order(self):
+        first, second = self.product_ids[:2]
+        self.client.post('/pos/create-order', headers=HEADERS, json=self._cart([(first, 2, 5.0)]))
+        self._sync([self._queued([(second, 1, 20.0)]), self._queued([(first, 500, 1.0)])])
+
+        totals = self.client.get(f'/pos/session/{self.session_id}/totals', headers=HEADERS).get_json()
+        self.assertEqual((totals['order_count'], totals['total_sales'], totals['total_cash'],
+                          totals['total_card']), (2, 30, 40, 0))
+        self.assertEqual(totals['expected_cash'], 40)
+
+    def test_close_reconciles_totals_with_one_query(self):
+        first = self.product_ids[0]
+        for quantity in (1, 2, 3):
+            self.client.post('/pos/create-order', headers=HEADERS,
+                             json=self._cart([(first, quantity, 10.0)]))
+        db.session.execute(text('UPDATE pos_sessions SET total_sales = 999, order_count = 7'))
+        db.session.commit()
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            self.client.post(f'/pos/close-session/{self.session_id}', headers=HEADERS,
+                             data={'closing_balance': '75'})
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        self.assertEqual(len([s for s in statements if 'FROM pos_orders' in s]), 1)
+
+        db.session.remove()
+        session = db.session.get(POSSession, self.session_id)
+        self.assertEqual((session.status, session.order_count, session.total_sales,
+                          session.total_cash), ('closed', 3, 60, 75))
+
+if __name__ == '__main__':
+    unittest.main()
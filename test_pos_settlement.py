@@ -0,0 +1,174 @@
+import unittest
+import uuid
+import warnings
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, text
+from sqlalchemy.exc import SAWarning
+
+from app import create_app, db
+from app.models import (Account, BankAccount, BankTransaction, Company, POSSession,
+                        POSSettlementAccrual, Product, User, Warehouse)
+from app.models_license import License
+from app.models_tenant import Tenant
+from app.pos.settlement import _pending, _settle, settle_session
+from app.utils.datetime_helper import utcnow
+
+HEADERS = {'Host': 'settle.example.com'}
+
+
+class POSSettlementTestCase(unittest.TestCase):
+    MODE = 'deferred'
+    INTERVAL = 0
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['POS_BANK_SETTLEMENT'] = self.MODE
+        self.app.config['POS_SETTLEMENT_INTERVAL'] = self.INTERVAL
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        tenant = Tenant(code='SETTLE', subdomain='settle', name='Settle', is_active=True)
+        db.session.add(tenant)
+        db.session.flush()
+        t = tenant.id
+        company = Company(tenant_id=t, name='Settle')
+        warehouse = Warehouse(tenant_id=t, name='Main')
+        account = Account(tenant_id=t, code='1102', name='Bank', account_type='asset')
+        user = User(tenant_id=t, username='cashier', email='cashier@example.com',
+                    is_active=True, is_admin=True)
+        user.set_password('Cashier123!')
+        product = Product(tenant_id=t, name='Tea', code='T1', track_inventory=False)
+        db.session.add_all([company, warehouse, account, user, product])
+        db.session.flush()
+        bank = BankAccount(tenant_id=t, account_name='Till bank', account_id=account.id)
+        db.session.add_all([bank, License(tenant_id=t, company_id=company.id, status='active',
+                                          end_date=utcnow() + timedelta(days=10))])
+        db.session.flush()
+        session = POSSession(tenant_id=t, session_number='POS-1', cashier_id=user.id,
+                             warehouse_id=warehouse.id, bank_account_id=bank.id)
+        db.session.add(session)
+        db.session.commit()
+        self.session_id, self.bank_id, self.account_id = session.id, bank.id, account.id
+        self.product_id = product.id
+
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'username': 'cashier', 'password': 'Cashier123!'},
+                         headers=HEADERS)
+
+    def tearDown(self):
+        db.session.remove()
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', category=SAWarning)
+            db.drop_all()
+        self.ctx.pop()
+
+    def _sell(self, amount, method='cash'):
+        response = self.client.post('/pos/create-order', headers=HEADERS, json={
+            'session_id': self.session_id, 'subtotal': amount, 'discount_amount': 0,
+            'tax_amount': 0, 'total_amount': amount, 'payment_method': method,
+            'cash_amount': amount if method == 'cash' else 0,
+            'card_amount': amount if method == 'card' else 0,
+            'items': [{'productId': self.product_id, 'quantity': 1, 'price': amount}],
+        })
+        self.assertTrue(response.get_json()['success'], response.get_data(as_text=True))
+
+    def _balances(self):
+        db.session.expire_all()
+        return (db.session.get(BankAccount, self.bank_id).current_balance,
+                db.session.get(Account, self.account_id).debit_balance)
+
+
+class DeferredSettlementTestCase(POSSettlementTestCase):
+    def test_sales_accrue_until_the_session_closes(self):
+        self._sell(10)
+        self._sell(20, 'card')
+        self._sell(5)
+
+        self.assertEqual(self._balances(), (0, 0))
+        self.assertEqual(BankTransaction.query.count(), 0)
+        accruals = {a.payment_method: (a.amount, a.order_count)
+                    for a in POSSettlementAccrual.query}
+        self.assertEqual(accruals, {'cash': (15, 2), 'card': (20, 1)})
+
+        self.client.post(f'/pos/close-session/{self.session_id}', headers=HEADERS,
+                         data={'closing_balance': '15'})
+        self.assertEqual(self._balances(), (35, 35))
+        transactions = BankTransaction.query.order_by(BankTransaction.amount).all()
+        self.assertEqual([(t.amount, t.reference_type, t.reference_id) for t in transactions],
+                         [(15, 'pos_session', self.session_id), (20, 'pos_session', self.session_id)])
+        self.assertEqual({(a.amount, a.order_count, a.settlements)
+                          for a in POSSettlementAccrual.query}, {(0, 0, 1)})
+
+    def test_checkout_does_not_touch_the_bank_rows(self):
+        self._sell(1)
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            self._sell(2)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        self.assertFalse([s for s in statements if 'bank_accounts' in s or 'accounts SET' in s])
+
+    def test_orders_synced_after_close_are_posted_per_order(self):
+        self._sell(10)
+        self.client.post(f'/pos/close-session/{self.session_id}', headers=HEADERS,
+                         data={'closing_balance': '10'})
+        response = self.client.post('/pos/sync', headers=HEADERS, json={'orders': [{
+            'client_uuid': str(uuid.uuid4()), 'session_id': self.session_id, 'subtotal': 7,
+            'discount_amount': 0, 'tax_amount': 0, 'total_amount': 7, 'payment_method': 'cash',
+            'cash_amount': 7, 'card_amount': 0,
+            'items': [{'productId': self.product_id, 'quantity': 1, 'price': 7}],
+        }]})
+        self.assertEqual(response.get_json()['results'][0]['status'], 'created')
+
+        self.assertEqual(self._balances(), (17, 17))
+        self.assertEqual(sorted((t.amount, t.reference_type) for t in BankTransaction.query),
+                         [(7, 'pos_order'), (10, 'pos_session')])
+        self.assertEqual({(a.amount, a.order_count) for a in POSSettlementAccrual.query}, {(0, 0)})
+
+    def test_a_settlement_cannot_be_claimed_twice(self):
+        self._sell(10)
+        with self.app.test_request_context('/'):
+            read_by_other_settler = _pending().one()
+            self.assertEqual(len(settle_session(db.session.get(POSSession, self.session_id))), 1)
+            self.assertIsNone(_settle(read_by_other_settler, datetime.utcnow()))
+            db.session.commit()
+        self.assertEqual(self._balances(), (10, 10))
+        self.assertEqual(BankTransaction.query.count(), 1)
+
+
+class IntervalSettlementTestCase(POSSettlementTestCase):
+    INTERVAL = 15
+
+    def test_due_accruals_are_settled_by_the_next_checkout(self):
+        self._sell(10)
+        self.assertEqual(self._balances(), (0, 0))
+
+        db.session.execute(text('UPDATE pos_settlement_accruals SET settled_at = :when'),
+                           {'when': datetime.utcnow() - timedelta(minutes=20)})
+        db.session.commit()
+        self._sell(4)
+        self.assertEqual(self._balances(), (14, 14))
+        self._sell(1)
+        self.assertEqual(self._balances(), (14, 14))  # the next one waits again
+        self.assertEqual(BankTransaction.query.count(), 1)
+
+
+class PerOrderSettlementTestCase(POSSettlementTestCase):
+    MODE = 'per_order'
+
+    def test_each_order_is_posted(self):
+        self._sell(10)
+        self._sell(20, 'card')
+        self.assertEqual(self._balances(), (30, 30))
+        self.assertEqual([t.reference_type for t in BankTransaction.query], ['pos_order'] * 2)
+        self.assertEqual(POSSettlementAccrual.query.count(), 0)
+
+
+del POSSettlementTestCase
+
+if __name__ == '__main__':
+    unittest.main()
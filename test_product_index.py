@@ -0,0 +1,192 @@
+import unittest
+import warnings
+from datetime import timedelta
+
+from flask import g
+from sqlalchemy import event
+from sqlalchemy.exc import SAWarning
+
+from app import create_app, db
+from app.models import Company, Product, User
+from app.models_license import License
+from app.models_tenant import Tenant
+from app.product_index import get_product_index, invalidate_product_index, lookup_products
+from app.utils.datetime_helper import utcnow
+
+HEADERS = {'Host': 'scan.example.com'}
+
+
+class ProductIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        tenant = Tenant(code='SCAN', subdomain='scan', name='Scan', is_active=True)
+        other = Tenant(code='OTHER', subdomain='other', name='Other', is_active=True)
+        db.session.add_all([tenant, other])
+        db.session.flush()
+        self.tenant_id, self.other_id = tenant.id, other.id
+        tea = Product(tenant_id=tenant.id, name='Tea', code='T1', barcode='628001',
+                      selling_price=4.5, tax_rate=15)
+        retired = Product(tenant_id=tenant.id, name='Old tea', code='T0', barcode='628000',
+                          is_active=False)
+        foreign = Product(tenant_id=other.id, name='Coffee', code='C1', barcode='628009')
+        db.session.add_all([tea, retired, foreign])
+        db.session.commit()
+        self.tea_id = tea.id
+
+        self.request_ctx = self.app.test_request_context('/')
+        self.request_ctx.push()
+        g.current_tenant_id = self.tenant_id
+
+    def tearDown(self):
+        self.request_ctx.pop()
+        db.session.remove()
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', category=SAWarning)
+            db.drop_all()
+        self.ctx.pop()
+
+    def _count_queries(self, func):
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            result = func()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        return result, len(statements)
+
+    def test_lookup_by_barcode_and_code(self):
+        results = lookup_products(['628001', 'T1', ' 628001 ', 'T0', '628009', 'nope'])
+        self.assertEqual(results['628001'].id, self.tea_id)
+        self.assertEqual(results['T1'], results['628001'])
+        self.assertEqual(results[' 628001 '].id, self.tea_id)
+        self.assertIsNone(results['T0'])       # inactive
+        self.assertIsNone(results['628009'])   # other tenant
+        self.assertIsNone(results['nope'])
+        self.assertEqual((results['T1'].price, results['T1'].tax_rate), (4.5, 15))
+
+    def test_index_is_built_once(self):
+        _, first = self._count_queries(lambda: lookup_products(['628001']))
+        self.assertEqual(first, 1)
+        _, second = self._count_queries(lambda: lookup_products(['628001'] * 500))
+        self.assertEqual(second, 0)
+
+    def test_committed_changes_are_applied_without_rebuilding(self):
+        index = get_product_index()
+        tea = db.session.get(Product, self.tea_id)
+        tea.barcode = '628002'
+        tea.selling_price = 5
+        milk = Product(tenant_id=self.tenant_id, name='Milk', code='M1', barcode='628003')
+        db.session.add(milk)
+        db.session.commit()
+
+        self.assertIs(get_product_index(), index)
+        self.assertIsNone(index.lookup('628001'))
+        self.assertEqual(index.lookup('628002').price, 5)
+        self.assertEqual(index.lookup('628003').name, 'Milk')
+
+        db.session.delete(milk)
+        db.session.get(Product, self.tea_id).is_active = False
+        db.session.commit()
+        self.assertIsNone(index.lookup('M1'))
+        self.assertIsNone(index.lookup('T1'))
+        self.assertEqual(len(index), 0)
+
+    def test_duplicated_barcode_resolves_to_the_lowest_id(self):
+        index = get_product_index()
+        green = Product(tenant_id=self.tenant_id, name='Green tea', code='T2', barcode='628001')
+        db.session.add(green)
+        db.session.commit()
+        green_id = green.id
+        self.assertEqual(index.lookup('628001').id, self.tea_id)
+
+        # Editing the other holder does not take the barcode over
+        db.session.get(Product, green_id).selling_price = 6
+        db.session.commit()
+        self.assertEqual(index.lookup('628001').id, self.tea_id)
+        invalidate_product_index(self.tenant_id)
+        self.assertEqual(get_product_index().lookup('628001').id, self.tea_id)
+
+        index = get_product_index()
+        db.session.get(Product, self.tea_id).is_active = False
+        db.session.commit()
+        self.assertEqual(index.lookup('628001').id, green_id)
+        db.session.delete(db.session.get(Product, green_id))
+        db.session.commit()
+        self.assertIsNone(index.lookup('628001'))
+
+    def test_rolled_back_changes_are_discarded(self):
+        index = get_product_index()
+        db.session.add(Product(tenant_id=self.tenant_id, name='Ghost', code='G1'))
+        db.session.get(Product, self.tea_id).name = 'Renamed'
+        db.session.flush()
+        db.session.rollback()
+        db.session.commit()
+        self.assertIsNone(index.lookup('G1'))
+        self.assertEqual(index.lookup('T1').name, 'Tea')
+
+    def test_explicit_invalidation(self):
+        index = get_product_index()
+        Product.query.filter_by(id=self.tea_id).update({'code': 'T9'})
+        db.session.commit()
+        self.assertEqual(index.lookup('T1').id, self.tea_id)  # bulk UPDATE skips events
+        invalidate_product_index(self.tenant_id)
+        self.assertEqual(lookup_products(['T9'])['T9'].id, self.tea_id)
+
+
+class ProductLookupRouteTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        tenant = Tenant(code='SCAN', subdomain='scan', name='Scan', is_active=True)
+        db.session.add(tenant)
+        db.session.flush()
+        company = Company(tenant_id=tenant.id, name='Scan')
+        user = User(tenant_id=tenant.id, username='clerk', email='clerk@example.com',
+                    is_active=True, is_admin=True)
+        user.set_password('Clerk123!')
+        tea = Product(tenant_id=tenant.id, name='Tea', code='T1', barcode='628001')
+        db.session.add_all([company, user, tea])
+        db.session.flush()
+        db.session.add(License(tenant_id=tenant.id, company_id=company.id, status='active',
+                               end_date=utcnow() + timedelta(days=10)))
+        db.session.commit()
+        self.tea_id = tea.id
+
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'username': 'clerk', 'password': 'Clerk123!'},
+                         headers=HEADERS)
+
+    def tearDown(self):
+        db.session.remove()
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', category=SAWarning)
+            db.drop_all()
+        self.ctx.pop()
+
+    def test_single_and_bulk_lookup(self):
+        response = self.client.get('/inventory/api/lookup?code=628001', headers=HEADERS)
+        self.assertEqual(response.status_code, 200)
+        product = response.get_json()['products']['628001']
+        self.assertEqual((product['id'], product['code'], product['name']), (self.tea_id, 'T1', 'Tea'))
+
+        response = self.client.post('/inventory/api/lookup', headers=HEADERS,
+                                    json={'codes': ['T1', 'missing']})
+        products = response.get_json()['products']
+        self.assertEqual(products['T1']['id'], self.tea_id)
+        self.assertIsNone(products['missing'])
+
+    def test_lookup_requires_codes(self):
+        response = self.client.get('/inventory/api/lookup', headers=HEADERS)
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import json
+import unittest
+import warnings
+from datetime import date, timedelta
+
+from sqlalchemy.exc import SAWarning
+
+from app import create_app, db
+from app.models import (Category, Company, Customer, DailyRollup, POSOrderItem, POSSession, Product,
+                        SalesInvoice, SalesInvoiceItem, Stock, User, Warehouse)
+from app.models_license import License
+from app.models_tenant import Tenant
+from app.utils.datetime_helper import utcnow
+
+HEADERS = {'Host': 'margin.example.com'}
+
+
+class ProfitLossTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        tenant = Tenant(code='MRG', subdomain='margin', name='Margin', is_active=True)
+        db.session.add(tenant)
+        db.session.flush()
+        t = self.tenant_id = tenant.id
+        company = Company(tenant_id=t, name='Margin')
+        user = User(tenant_id=t, username='clerk', email='clerk@example.com',
+                    is_active=True, is_admin=True)
+        user.set_password('Clerk123!')
+        category = Category(tenant_id=t, name='Tools', code='TL')
+        warehouse = Warehouse(tenant_id=t, name='Main', code='W1')
+        customer = Customer(tenant_id=t, name='Customer', code='C1')
+        db.session.add_all([company, user, category, warehouse, customer])
+        db.session.flush()
+        widget = Product(tenant_id=t, name='Widget', code='P1', cost_price=4,
+                         category_id=category.id)
+        gadget = Product(tenant_id=t, name='Gadget', code='P2', cost_price=10)
+        db.session.add_all([widget, gadget])
+        db.session.flush()
+        db.session.add_all([
+            License(tenant_id=t, company_id=company.id, status='active',
+                    end_date=utcnow() + timedelta(days=10)),
+            Stock(tenant_id=t, product_id=widget.id, warehouse_id=warehouse.id, quantity=50),
+            POSSession(tenant_id=t, session_number='POS-1', cashier_id=user.id,
+                       warehouse_id=warehouse.id),
+        ])
+        # Written before unit_cost was recorded: costed at the current price
+        invoice = SalesInvoice(tenant_id=t, invoice_number='INV-1', customer_id=customer.id,
+                               status='confirmed', invoice_date=date.today(), total_amount=60)
+        invoice.items.append(SalesInvoiceItem(tenant_id=t, product_id=gadget.id, quantity=3,
+                                              unit_price=20, total=60))
+        db.session.add(invoice)
+        db.session.commit()
+        self.widget_id, self.warehouse_id = widget.id, warehouse.id
+
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'username': 'clerk', 'password': 'Clerk123!'},
+                         headers=HEADERS)
+
+    def tearDown(self):
+        db.session.remove()
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', category=SAWarning)
+            db.drop_all()
+        self.ctx.pop()
+
+    def _jsonl(self, query):
+        response = self.client.get(f'/reports/profit-loss?format=jsonl{query}', headers=HEADERS)
+        self.assertEqual(response.status_code, 200)
+        return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    def _sell_widgets(self):
+        session_id = POSSession.query.one().id
+        response = self.client.post('/pos/create-order', headers=HEADERS, json={
+            'session_id': session_id, 'subtotal': 20, 'discount_amount': 0, 'tax_amount': 0,
+            'total_amount': 20, 'payment_method': 'cash', 'cash_amount': 20, 'card_amount': 0,
+            'items': [{'productId': self.widget_id, 'quantity': 2, 'price': 10}],
+        })
+        self.assertEqual(response.status_code, 200, response.get_json())
+
+    def test_cogs_uses_the_cost_recorded_at_sale_time(self):
+        self._sell_widgets()
+        self.assertEqual({i.unit_cost for i in POSOrderItem.query}, {4})
+        self.assertEqual(SalesInvoiceItem.query.filter_by(product_id=self.widget_id).one().unit_cost, 4)
+
+        Product.query.filter_by(id=self.widget_id).update({'cost_price': 9})
+        db.session.commit()
+        totals = {row['metric']: row['amount'] for row in self._jsonl('')}
+        self.assertEqual(totals, {'revenue': 80, 'cogs': 38, 'gross_profit': 42})
+
+        # The rollups cost the sale the same way
+        pos = DailyRollup.query.filter_by(kind='pos').one()
+        self.assertEqual(pos.cogs, 8)
+
+    def test_gross_margin_by_product_category_and_warehouse(self):
+        self._sell_widgets()
+        products = self._jsonl('&breakdown=product')
+        self.assertEqual([(r['code'], r['quantity'], r['revenue'], r['cogs'], r['gross_profit'])
+                          for r in products],
+                         [('P2', 3, 60, 30, 30), ('P1', 2, 20, 8, 12)])
+        self.assertAlmostEqual(products[1]['margin'], 60)
+
+        categories = self._jsonl('&breakdown=category')
+        self.assertEqual({r['name']: r['cogs'] for r in categories}, {'Tools': 8, None: 30})
+
+        warehouses = self._jsonl('&breakdown=warehouse')
+        self.assertEqual({r['name']: r['revenue'] for r in warehouses}, {'Main': 20, None: 60})
+
+        since = (date.today() + timedelta(days=1)).isoformat()
+        self.assertEqual(self._jsonl(f'&breakdown=product&start_date={since}'), [])
+
+    def test_page_shows_the_selected_breakdown(self):
+        self._sell_widgets()
+        page = self.client.get('/reports/profit-loss?breakdown=category', headers=HEADERS)
+        self.assertEqual(page.status_code, 200)
+        html = page.get_data(as_text=True)
+        self.assertIn('Tools', html)
+        self.assertIn('60.00%', html)  # Tools: (20 - 8) / 20
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,183 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import warnings
+from datetime import date, timedelta
+
+from sqlalchemy import insert, text
+from sqlalchemy.exc import SAWarning
+
+from app import create_app, db
+from app.models import Company, Customer, Product, SalesInvoice, SalesInvoiceItem, User
+from app.models_license import License
+from app.models_tenant import Tenant
+from app.report_cache import ReportCacheStore, get_report_cache, init_report_cache
+from app.utils.cache_helper import MISSING
+from app.utils.datetime_helper import utcnow
+
+HEADERS = {'Host': 'cache.example.com'}
+
+
+class ReportCacheStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = ReportCacheStore(os.path.join(self.directory, 'cache.db'), ttl=60)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_entries_follow_the_versions_of_their_tables(self):
+        tables = ('sales_invoices',)
+        versions = self.store.versions(1, tables)
+        self.store.set(1, 'report', '{}', tables, versions, [(1, 'a')])
+        self.assertEqual(self.store.get(1, 'report', '{}', self.store.versions(1, tables)), [(1, 'a')])
+
+        self.store.bump({(2, 'sales_invoices'), (1, 'customers')})
+        self.assertEqual(self.store.get(1, 'report', '{}', self.store.versions(1, tables)), [(1, 'a')])
+
+        # A write of unknown tenant (0) outdates every tenant
+        self.store.bump({(0, 'sales_invoices')})
+        self.assertIs(self.store.get(1, 'report', '{}', self.store.versions(1, tables)), MISSING)
+        self.assertEqual(self.store.stats()['size'], 0)
+
+    def test_entries_computed_before_a_write_are_never_served(self):
+        tables = ('sales_invoices',)
+        versions = self.store.versions(1, tables)
+        self.store.bump({(1, 'sales_invoices')})  # commit lands while the report runs
+        self.store.set(1, 'report', '{}', tables, versions, 'stale')
+        self.assertIs(self.store.get(1, 'report', '{}', self.store.versions(1, tables)), MISSING)
+
+    def test_ttl_bounds_the_age_of_an_entry(self):
+        self.store.set(1, 'report', '{}', ('t',), '[]', 'value')
+        self.store.ttl = 0.01
+        time.sleep(0.02)
+        self.assertIs(self.store.get(1, 'report', '{}', '[]'), MISSING)
+
+
+class ReportCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.directory = tempfile.mkdtemp()
+        self.app.config.update(REPORT_CACHE_ENABLED=True,
+                               REPORT_CACHE_PATH=os.path.join(self.directory, 'cache.db'))
+        init_report_cache(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        tenant = Tenant(code='CACHE', subdomain='cache', name='Cache', is_active=True)
+        other = Tenant(code='OTHER', subdomain='other', name='Other', is_active=True)
+        db.session.add_all([tenant, other])
+        db.session.flush()
+        t = self.tenant_id = tenant.id
+        self.other_id = other.id
+        company = Company(tenant_id=t, name='Cache')
+        user = User(tenant_id=t, username='clerk', email='clerk@example.com',
+                    is_active=True, is_admin=True)
+        user.set_password('Clerk123!')
+        customer = Customer(tenant_id=t, name='Cached Customer', code='C1')
+        foreign = Customer(tenant_id=other.id, name='Other Customer', code='X1')
+        db.session.add_all([company, user, customer, foreign])
+        db.session.flush()
+        self.invoice = SalesInvoice(tenant_id=t, invoice_number='INV-1', customer_id=customer.id,
+                                    status='confirmed', invoice_date=date.today(), total_amount=100)
+        self.foreign_id = foreign.id
+        db.session.add_all([
+            License(tenant_id=t, company_id=company.id, status='active',
+                    end_date=utcnow() + timedelta(days=10)),
+            self.invoice,
+        ])
+        db.session.commit()
+
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'username': 'clerk', 'password': 'Clerk123!'},
+                         headers=HEADERS)
+
+    def tearDown(self):
+        db.session.remove()
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', category=SAWarning)
+            db.drop_all()
+        self.ctx.pop()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _totals(self, query=''):
+        response = self.client.get(f'/reports/profit-loss?format=jsonl{query}', headers=HEADERS)
+        self.assertEqual(response.status_code, 200)
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        return {line['metric']: line['amount'] for line in lines}
+
+    def _revenue(self, query=''):
+        return self._totals(query)['revenue']
+
+    def _counters(self, report):
+        return get_report_cache().stats()['reports'][report]
+
+    def test_results_are_cached_until_a_commit_touches_their_tables(self):
+        self.assertEqual(self._revenue(), 100)
+        # Writes outside the ORM are only picked up after REPORT_CACHE_TTL
+        db.session.execute(text('UPDATE sales_invoices SET total_amount = 500'))
+        db.session.commit()
+        self.assertEqual(self._revenue(), 100)
+        self.assertEqual(self._counters('profit_loss'),
+                         {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+        self.invoice.total_amount = 250
+        db.session.commit()
+        self.assertEqual(self._revenue(), 250)
+        self.assertEqual(self._counters('profit_loss')['misses'], 2)
+
+    def test_filters_and_tenants_are_cached_apart(self):
+        since = date.today().isoformat()
+        self.assertEqual(self._revenue(), 100)
+        self.assertEqual(self._revenue(f'&start_date={since}'), 100)
+        self.assertEqual(self._counters('profit_loss')['misses'], 2)
+
+        # Another tenant's sale does not outdate this tenant's entries
+        db.session.add(SalesInvoice(tenant_id=self.other_id, invoice_number='INV-X',
+                                    customer_id=self.foreign_id, status='confirmed',
+                                    invoice_date=date.today(), total_amount=7))
+        db.session.commit()
+        self.assertEqual(self._revenue(), 100)
+        self.assertEqual(self._counters('profit_loss')['hits'], 1)
+
+    def test_bulk_updates_invalidate_and_rollbacks_do_not(self):
+        self.assertEqual(self._revenue(), 100)
+        self.invoice.total_amount = 999
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(self._revenue(), 100)
+        self.assertEqual(self._counters('profit_loss')['hits'], 1)
+
+        SalesInvoice.query.update({'total_amount': 40})
+        db.session.commit()
+        self.assertEqual(self._revenue(), 40)
+
+    def test_bulk_inserts_invalidate(self):
+        product = Product(tenant_id=self.tenant_id, name='Widget', code='P1', cost_price=4)
+        db.session.add(product)
+        db.session.commit()
+        self.assertEqual(self._totals()['cogs'], 0)
+
+        db.session.execute(insert(SalesInvoiceItem), [
+            {'tenant_id': self.tenant_id, 'invoice_id': self.invoice.id, 'product_id': product.id,
+             'quantity': 5, 'unit_price': 20, 'unit_cost': 4, 'total': 100},
+        ])
+        db.session.commit()
+        self.assertEqual(self._totals()['cogs'], 20)
+
+    def test_html_reports_and_health_share_the_counters(self):
+        for _ in range(2):
+            page = self.client.get('/reports/sales-by-customer', headers=HEADERS)
+            self.assertEqual(page.status_code, 200)
+            self.assertIn('Cached Customer', page.get_data(as_text=True))
+        self.assertEqual(self._counters('sales_by_customer')['hits'], 1)
+        caches = self.client.get('/health').get_json()['caches']
+        self.assertEqual(caches['report_cache']['reports']['sales_by_customer']['misses'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,209 @@
+import csv
+import io
+import json
+import unittest
+import warnings
+from datetime import date, timedelta
+
+from openpyxl import load_workbook
+from sqlalchemy.exc import SAWarning
+
+from app import create_app, db
+from app.models import (Company, Customer, Expense, Product, PurchaseInvoice, SalesInvoice, Stock,
+                        Supplier, User, Warehouse)
+from app.models_license import License
+from app.models_tenant import Tenant
+from app.reports.exports import column_widths
+from app.utils.datetime_helper import utcnow
+
+HEADERS = {'Host': 'export.example.com'}
+
+
+class ColumnWidthsTestCase(unittest.TestCase):
+    def test_widths_fit_sampled_values_within_bounds(self):
+        widths = column_widths(['#', 'Customer'], [(1, 'x' * 30), (2, None), (3, 'y' * 100)])
+        self.assertEqual(widths, [10, 60])
+        self.assertEqual(column_widths(['Name'], [('abcdefghijklmnop',)]), [18])
+
+
+class ReportExportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['EXPORT_BATCH_SIZE'] = 2
+        self.app.config['EXPORT_SAMPLE_ROWS'] = 3
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        tenant = Tenant(code='EXP', subdomain='export', name='Export', is_active=True)
+        other = Tenant(code='OTHER', subdomain='other', name='Other', is_active=True)
+        db.session.add_all([tenant, other])
+        db.session.flush()
+        t = tenant.id
+        company = Company(tenant_id=t, name='Export')
+        user = User(tenant_id=t, username='clerk', email='clerk@example.com',
+                    is_active=True, is_admin=True)
+        user.set_password('Clerk123!')
+        customer = Customer(tenant_id=t, name='مؤسسة التصدير', code='C1')
+        supplier = Supplier(tenant_id=t, name='Supply Co', code='S1')
+        foreign = Customer(tenant_id=other.id, name='Other customer', code='X1')
+        db.session.add_all([company, user, customer, supplier, foreign])
+        db.session.flush()
+
+        today = date.today()
+        self.today = today
+        db.session.add(License(tenant_id=t, company_id=company.id, status='active',
+                               end_date=utcnow() + timedelta(days=10)))
+        for n in range(5):
+            db.session.add(SalesInvoice(
+                tenant_id=t, invoice_number=f'INV-{n}', customer_id=customer.id, status='confirmed',
+                invoice_date=today - timedelta(days=n), total_amount=100 + n, paid_amount=n,
+                remaining_amount=100, payment_status='unpaid' if n % 2 == 0 else 'partial'))
+        db.session.add_all([
+            SalesInvoice(tenant_id=t, invoice_number='INV-DRAFT', customer_id=customer.id,
+                         invoice_date=today, total_amount=1),
+            SalesInvoice(tenant_id=other.id, invoice_number='INV-OTHER', customer_id=foreign.id,
+                         status='confirmed', invoice_date=today, total_amount=9),
+            PurchaseInvoice(tenant_id=t, invoice_number='PUR-1', supplier_id=supplier.id,
+                            status='confirmed', invoice_date=today, total_amount=40,
+                            paid_amount=40, payment_status='paid'),
+        ])
+        db.session.commit()
+
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'username': 'clerk', 'password': 'Clerk123!'},
+                         headers=HEADERS)
+
+    def tearDown(self):
+        db.session.remove()
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', category=SAWarning)
+            db.drop_all()
+        self.ctx.pop()
+
+    def _sheet(self, url):
+        response = self.client.get(url, headers=HEADERS)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype,
+                         'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        return load_workbook(io.BytesIO(response.data)).active
+
+    def test_sales_export_streams_every_row(self):
+        ws = self._sheet('/reports/export-excel/sales')
+        rows = list(ws.iter_rows(values_only=True))
+        self.assertEqual(rows[0], ('Invoice #', 'Date', 'Customer', 'Total', 'Paid', 'Remaining', 'Status'))
+        self.assertEqual([row[0] for row in rows[1:]], [f'INV-{n}' for n in range(5)])
+        self.assertEqual(rows[1], ('INV-0', str(self.today), 'مؤسسة التصدير', 100, 0, 100, 'unpaid'))
+        self.assertTrue(ws.sheet_view.rightToLeft)
+        self.assertTrue(ws['A1'].font.bold)
+        self.assertEqual(ws.column_dimensions['C'].width, len('مؤسسة التصدير') + 2)
+
+    def test_purchases_and_date_filter(self):
+        rows = list(self._sheet('/reports/export-excel/purchases').iter_rows(values_only=True))
+        self.assertEqual(rows[1][:3], ('PUR-1', str(self.today), 'Supply Co'))
+
+        since = (self.today - timedelta(days=1)).isoformat()
+        rows = list(self._sheet(f'/reports/export-excel/sales?start_date={since}').iter_rows(values_only=True))
+        self.assertEqual([row[0] for row in rows[1:]], ['INV-0', 'INV-1'])
+
+    def test_cash_flow_keeps_title_and_period_above_the_header(self):
+        since = (self.today - timedelta(days=10)).isoformat()
+        ws = self._sheet(f'/reports/export-excel/cash-flow?start_date={since}')
+        self.assertEqual(ws['A1'].value, 'Cash Flow Report')
+        self.assertEqual(ws['A1'].font.size, 14)
+        self.assertTrue(ws['A2'].value.startswith('Period: '))
+        self.assertEqual(ws['A4'].value, 'Type')
+        rows = list(ws.iter_rows(min_row=5, values_only=True))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[-1], ('Outflow (Purchases)', 'PUR-1', str(self.today), 'Supply Co', -40))
+
+    def test_accounts_receivable_days_overdue(self):
+        rows = list(self._sheet('/reports/export-excel/accounts-receivable?status=partial')
+                    .iter_rows(values_only=True))
+        self.assertEqual([(row[0], row[6]) for row in rows[1:]], [('INV-3', 3), ('INV-1', 1)])
+
+
+class TabularExportTestCase(ReportExportTestCase):
+    def setUp(self):
+        super().setUp()
+        tenant_id = Customer.query.filter_by(code='C1').one().tenant_id
+        warehouse = Warehouse(tenant_id=tenant_id, name='Main', code='W1')
+        tea = Product(tenant_id=tenant_id, name='شاي', code='P1', cost_price=2, min_stock=10)
+        rice = Product(tenant_id=tenant_id, name='Rice', code='P2', cost_price=5, min_stock=1)
+        db.session.add_all([warehouse, tea, rice])
+        db.session.flush()
+        db.session.add_all([
+            Stock(tenant_id=tenant_id, product_id=tea.id, warehouse_id=warehouse.id, quantity=3),
+            Stock(tenant_id=tenant_id, product_id=rice.id, warehouse_id=warehouse.id, quantity=4),
+            Expense(tenant_id=tenant_id, expense_number='EXP-1', expense_date=self.today,
+                    expense_category='rent', description='Rent', amount=15),
+        ])
+        db.session.commit()
+
+    def _get(self, url):
+        response = self.client.get(url, headers=HEADERS)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        self.assertIn('attachment;', response.headers['Content-Disposition'])
+        return response
+
+    def _csv(self, url):
+        text = self._get(url).get_data().decode('utf-8')
+        self.assertTrue(text.startswith('\ufeff'))
+        return list(csv.reader(io.StringIO(text[1:])))
+
+    def _jsonl(self, url):
+        response = self._get(url)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    def test_sales_csv_keeps_arabic_and_batches_rows(self):
+        rows = self._csv('/reports/sales?format=csv')
+        self.assertEqual(rows[0][:3], ['invoice_number', 'invoice_date', 'customer'])
+        self.assertEqual([row[0] for row in rows[1:]], [f'INV-{n}' for n in range(4, -1, -1)])
+        self.assertEqual(rows[-1][2], 'مؤسسة التصدير')
+
+        text = self._get('/reports/sales?format=csv&bom=0').get_data(as_text=True)
+        self.assertTrue(text.startswith('invoice_number,'))
+
+    def test_sales_jsonl_uses_column_keys(self):
+        lines = self._jsonl('/reports/sales?format=jsonl')
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(lines[0]['invoice_date'], (self.today - timedelta(days=4)).isoformat())
+        self.assertEqual(lines[-1]['customer'], 'مؤسسة التصدير')
+        self.assertNotIn('INV-OTHER', {line['invoice_number'] for line in lines})
+
+    def test_aggregate_reports(self):
+        self.assertEqual(self._jsonl('/reports/sales-by-customer?format=jsonl'),
+                         [{'name': 'مؤسسة التصدير', 'code': 'C1', 'invoice_count': 6, 'total_amount': 511}])  # drafts count
+        top = self._jsonl('/reports/customers/top?format=jsonl')
+        self.assertEqual(top[0]['average_sale'], 102)
+        months = self._jsonl(f'/reports/purchases-monthly?format=jsonl&year={self.today.year}')
+        self.assertEqual(len(months), 12)
+        self.assertEqual(months[self.today.month - 1]['total_amount'], 40)
+
+    def test_stock_reports(self):
+        inventory = self._jsonl('/reports/inventory?format=jsonl')
+        self.assertEqual([(line['code'], line['stock'], line['value']) for line in inventory],
+                         [('P2', 4, 20), ('P1', 3, 6)])
+        self.assertEqual(self._jsonl('/reports/low-stock?format=jsonl'),
+                         [{'code': 'P1', 'name': 'شاي', 'current_stock': 3, 'min_stock': 10, 'shortage': 7}])
+
+    def test_cash_flow_and_receivables(self):
+        since = (self.today - timedelta(days=10)).isoformat()
+        lines = self._jsonl(f'/reports/cash-flow?format=jsonl&start_date={since}')
+        self.assertEqual([(line['source'], line['amount']) for line in lines[-2:]],
+                         [('purchase_invoice', -40), ('expense', -15)])
+        self.assertEqual(sum(line['amount'] for line in lines), 10 - 40 - 15)
+
+        rows = self._csv('/reports/accounts-receivable?format=csv&status=all')
+        self.assertEqual(rows[0][-3:], ['days_overdue', 'aging_bucket', 'payment_status'])
+        self.assertEqual(len(rows), 6)
+
+    def test_unknown_format_renders_the_page(self):
+        response = self.client.get('/reports/sales?format=xml', headers=HEADERS)
+        self.assertEqual(response.mimetype, 'text/html')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,254 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+import warnings
+from datetime import date, timedelta
+
+from sqlalchemy.exc import SAWarning
+
+from app import create_app, db
+from app.models import (Company, Customer, DailyRollup, POSSession, Product, PurchaseInvoice,
+                        SalesInvoice, SalesInvoiceItem, Stock, Supplier, User, Warehouse)
+from app.models_license import License
+from app.models_tenant import Tenant
+from app.rollups import rebuild_rollups
+from app.utils.datetime_helper import utcnow
+from config import TestingConfig, config
+
+HEADERS = {'Host': 'rollup.example.com'}
+
+
+class SharedDatabaseConfig(TestingConfig):
+    """
+    A database every thread connects to on its own: ROLLUPS_TEST_DATABASE_URL
+    (e.g. a scratch PostgreSQL database) or a temporary SQLite file
+    """
+    SQLALCHEMY_DATABASE_URI = os.environ.get('ROLLUPS_TEST_DATABASE_URL') or \
+        'sqlite:///' + os.path.join(tempfile.gettempdir(), f'rollups_race_{os.getpid()}.db')
+    SQLALCHEMY_ENGINE_OPTIONS = ({} if os.environ.get('ROLLUPS_TEST_DATABASE_URL')
+                                 else {'connect_args': {'timeout': 60}})
+
+
+config['testing_rollups_shared'] = SharedDatabaseConfig
+
+
+class DailyRollupTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        tenant = Tenant(code='ROLL', subdomain='rollup', name='Rollup', is_active=True)
+        db.session.add(tenant)
+        db.session.flush()
+        t = self.tenant_id = tenant.id
+        company = Company(tenant_id=t, name='Rollup')
+        user = User(tenant_id=t, username='clerk', email='clerk@example.com',
+                    is_active=True, is_admin=True)
+        user.set_password('Clerk123!')
+        warehouse = Warehouse(tenant_id=t, name='Main')
+        customer = Customer(tenant_id=t, name='Customer', code='C1')
+        supplier = Supplier(tenant_id=t, name='Supplier', code='S1')
+        product = Product(tenant_id=t, name='Widget', code='W1', cost_price=4)
+        db.session.add_all([company, user, warehouse, customer, supplier, product])
+        db.session.flush()
+        db.session.add_all([
+            License(tenant_id=t, company_id=company.id, status='active',
+                    end_date=utcnow() + timedelta(days=10)),
+            Stock(tenant_id=t, product_id=product.id, warehouse_id=warehouse.id, quantity=50),
+            POSSession(tenant_id=t, session_number='POS-1', cashier_id=user.id,
+                       warehouse_id=warehouse.id),
+        ])
+        db.session.commit()
+        self.warehouse_id, self.customer_id = warehouse.id, customer.id
+        self.supplier_id, self.product_id = supplier.id, product.id
+        self.today = date.today()
+
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'username': 'clerk', 'password': 'Clerk123!'},
+                         headers=HEADERS)
+
+    def tearDown(self):
+        db.session.remove()
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', category=SAWarning)
+            db.drop_all()
+        self.ctx.pop()
+
+    def _invoice(self, number, total, quantity=3, day=None, status='draft'):
+        invoice = SalesInvoice(tenant_id=self.tenant_id, invoice_number=number,
+                               customer_id=self.customer_id, warehouse_id=self.warehouse_id,
+                               invoice_date=day or self.today, status=status,
+                               subtotal=total, tax_amount=total / 10, total_amount=total)
+        invoice.items.append(SalesInvoiceItem(tenant_id=self.tenant_id, product_id=self.product_id,
+                                              quantity=quantity, unit_price=total / quantity,
+                                              total=total))
+        db.session.add(invoice)
+        db.session.commit()
+        return invoice
+
+    def _rollups(self):
+        db.session.expire_all()
+        return sorted((r.kind, r.day, r.warehouse_id, r.doc_count, r.total_amount, r.cogs)
+                      for r in DailyRollup.query)
+
+    def test_invoice_lifecycle_keeps_the_day_current(self):
+        invoice = self._invoice('INV-1', 100)
+        self._invoice('INV-2', 50, quantity=1)
+        self.assertEqual(self._rollups(),
+                         [('sales', self.today, self.warehouse_id, 2, 150, 16)])
+
+        invoice.status = 'confirmed'
+        invoice.paid_amount = 100
+        db.session.commit()
+        self.assertEqual(self._rollups()[0][3:], (2, 150, 16))
+
+        invoice.status = 'cancelled'
+        db.session.commit()
+        self.assertEqual(self._rollups()[0][3:], (1, 50, 4))
+
+        # Re-dating moves the invoice out of its old day
+        yesterday = self.today - timedelta(days=1)
+        other = SalesInvoice.query.filter_by(invoice_number='INV-2').one()
+        other.invoice_date = yesterday
+        db.session.commit()
+        self.assertEqual(self._rollups(), [('sales', yesterday, self.warehouse_id, 1, 50, 4)])
+
+        db.session.delete(other)
+        db.session.commit()
+        self.assertEqual(self._rollups(), [])
+
+    def test_rolled_back_changes_leave_rollups_alone(self):
+        invoice = self._invoice('INV-1', 100)
+        invoice.total_amount = 999
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(self._rollups()[0][3:], (1, 100, 12))
+
+    def test_pos_checkout_and_purchases_get_their_own_kinds(self):
+        session_id = POSSession.query.one().id
+        response = self.client.post('/pos/create-order', headers=HEADERS, json={
+            'session_id': session_id, 'subtotal': 20, 'discount_amount': 0, 'tax_amount': 0,
+            'total_amount': 20, 'payment_method': 'cash', 'cash_amount': 20, 'card_amount': 0,
+            'items': [{'productId': self.product_id, 'quantity': 2, 'price': 10}],
+        })
+        self.assertEqual(response.status_code, 200, response.get_json())
+        db.session.add(PurchaseInvoice(tenant_id=self.tenant_id, invoice_number='PUR-1',
+                                       supplier_id=self.supplier_id, warehouse_id=self.warehouse_id,
+                                       status='confirmed', invoice_date=self.today, total_amount=70))
+        db.session.commit()
+        self.assertEqual(self._rollups(), [
+            ('pos', self.today, self.warehouse_id, 1, 20, 8),
+            ('purchases', self.today, self.warehouse_id, 1, 70, 0),
+        ])
+
+    def test_rebuild_repairs_drift(self):
+        self._invoice('INV-1', 100)
+        DailyRollup.query.delete()
+        Product.query.filter_by(id=self.product_id).update({'cost_price': 5})
+        db.session.commit()
+        self.assertEqual(self._rollups(), [])
+
+        result = self.app.test_cli_runner().invoke(
+            args=['rollups', 'rebuild', '--tenant', str(self.tenant_id)])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('sales: 1 rollups', result.output)
+        self.assertEqual(self._rollups()[0][3:], (1, 100, 15))
+
+    def test_monthly_reports_read_the_rollups(self):
+        self._invoice('INV-1', 100)
+        self._invoice('INV-2', 50, status='cancelled')
+        response = self.client.get(f'/reports/sales-monthly?year={self.today.year}&format=jsonl',
+                                   headers=HEADERS)
+        months = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual(len(months), 12)
+        month = months[self.today.month - 1]
+        self.assertEqual((month['invoice_count'], month['total_amount'], month['total_tax']),
+                         (1, 100, 10))
+
+        page = self.client.get('/reports/purchases-monthly', headers=HEADERS)
+        self.assertEqual(page.status_code, 200)
+
+
+class ConcurrentRollupTestCase(unittest.TestCase):
+    """Sales of one tenant and day committed from several connections at once"""
+    WORKERS = 4
+    PER_WORKER = 6
+
+    def setUp(self):
+        self.app = create_app('testing_rollups_shared')
+        with self.app.app_context():
+            db.drop_all()
+            db.create_all()
+            tenant = Tenant(code='RACE', subdomain='race', name='Race', is_active=True)
+            db.session.add(tenant)
+            db.session.flush()
+            warehouse = Warehouse(tenant_id=tenant.id, name='Main')
+            customer = Customer(tenant_id=tenant.id, name='Customer', code='C1')
+            product = Product(tenant_id=tenant.id, name='Widget', code='W1', cost_price=4)
+            db.session.add_all([warehouse, customer, product])
+            db.session.commit()
+            self.ids = (tenant.id, warehouse.id, customer.id, product.id)
+            db.session.remove()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            with warnings.catch_warnings():
+                warnings.filterwarnings('ignore', category=SAWarning)
+                db.drop_all()
+            db.engine.dispose()
+        uri = self.app.config['SQLALCHEMY_DATABASE_URI']
+        if uri.startswith('sqlite:///') and os.path.exists(uri[len('sqlite:///'):]):
+            os.remove(uri[len('sqlite:///'):])
+
+    def _sell(self, worker):
+        tenant_id, warehouse_id, customer_id, product_id = self.ids
+        with self.app.app_context():
+            try:
+                for n in range(self.PER_WORKER):
+                    # Alternate with invoices without a warehouse (NULL rollup key)
+                    invoice = SalesInvoice(
+                        tenant_id=tenant_id, invoice_number=f'INV-{worker}-{n}',
+                        customer_id=customer_id, warehouse_id=warehouse_id if n % 2 else None,
+                        invoice_date=date.today(), status='confirmed',
+                        subtotal=10, tax_amount=0, total_amount=10)
+                    invoice.items.append(SalesInvoiceItem(tenant_id=tenant_id, product_id=product_id,
+                                                          quantity=1, unit_price=10, total=10))
+                    db.session.add(invoice)
+                    db.session.commit()
+            except Exception as e:
+                self.errors.append(e)
+            finally:
+                db.session.remove()
+
+    def test_concurrent_commits_keep_the_day_exact(self):
+        self.errors = []
+        threads = [threading.Thread(target=self._sell, args=(worker,))
+                   for worker in range(self.WORKERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.errors, [])
+
+        with self.app.app_context():
+            rows = sorted((r.warehouse_id is None, r.doc_count, r.total_amount, r.cogs)
+                          for r in DailyRollup.query)
+            half = self.WORKERS * self.PER_WORKER // 2
+            expected = [(False, half, half * 10, half * 4), (True, half, half * 10, half * 4)]
+            self.assertEqual(rows, expected)
+
+            # Nothing for a rebuild to repair
+            rebuild_rollups()
+            db.session.commit()
+            self.assertEqual(sorted((r.warehouse_id is None, r.doc_count, r.total_amount, r.cogs)
+                                    for r in DailyRollup.query), expected)
+            db.session.remove()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,281 @@
+import unittest
+import warnings
+from datetime import timedelta
+
+from flask import g
+from sqlalchemy import insert
+from sqlalchemy.exc import SAWarning
+
+from app import create_app, db
+from app.models import (Company, Customer, JournalEntry, Product, SalesInvoice, SearchDocument,
+                        Supplier, User)
+from app.models_license import License
+from app.models_tenant import Tenant
+from app.search_index import apply_search, normalize, rebuild_search_index
+from app.utils.datetime_helper import utcnow
+
+HEADERS = {'Host': 'find.example.com'}
+
+
+class NormalizeTestCase(unittest.TestCase):
+    def test_arabic_variants_fold_together(self):
+        self.assertEqual(normalize('أَحْمَد'), normalize('احمد'))
+        self.assertEqual(normalize('إسلام آمال'), 'اسلام امال')
+        self.assertEqual(normalize('مدرسة'), normalize('مدرسه'))
+        self.assertEqual(normalize('مصطفى'), 'مصطفي')
+        self.assertEqual(normalize('شـــاي'), 'شاي')
+        self.assertEqual(normalize('مسؤول'), 'مسوول')
+
+    def test_latin_text_and_digits(self):
+        self.assertEqual(normalize('  Green  TEA '), 'green tea')
+        self.assertEqual(normalize('رقم ١٢٣'), 'رقم 123')
+        self.assertEqual(normalize(None), '')
+
+
+class SearchIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        tenant = Tenant(code='FIND', subdomain='find', name='Find', is_active=True)
+        other = Tenant(code='OTHER', subdomain='other', name='Other', is_active=True)
+        db.session.add_all([tenant, other])
+        db.session.flush()
+        self.tenant_id = tenant.id
+        db.session.add_all([
+            Product(tenant_id=tenant.id, name='شاي أخضر', name_en='Green tea', code='P1'),
+            Product(tenant_id=tenant.id, name='قهوة عربية', code='P2', barcode='6281000'),
+            Product(tenant_id=tenant.id, name='Tea', code='P3'),
+            Product(tenant_id=tenant.id, name='Herbal infusion with a hint of tea flavour', code='P4'),
+            Product(tenant_id=other.id, name='شاي أحمر', code='X1'),
+            Customer(tenant_id=tenant.id, name='مؤسسة الإسراء', code='C1', phone='0550001111'),
+            Customer(tenant_id=tenant.id, name='Ahmed Trading', code='C2'),
+        ])
+        db.session.commit()
+
+        self.request_ctx = self.app.test_request_context('/')
+        self.request_ctx.push()
+        g.current_tenant_id = self.tenant_id
+
+    def tearDown(self):
+        self.request_ctx.pop()
+        db.session.remove()
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', category=SAWarning)
+            db.drop_all()
+        self.ctx.pop()
+
+    def _products(self, text):
+        return [p.code for p in apply_search(Product.query, Product, 'product', text)]
+
+    def _customers(self, text):
+        return [c.code for c in apply_search(Customer.query, Customer, 'customer', text)]
+
+    def test_arabic_spelling_variants_match(self):
+        self.assertEqual(self._products('شاى اخضر'), ['P1'])
+        self.assertEqual(self._products('قهوه'), ['P2'])
+        self.assertEqual(self._customers('موسسه الاسراء'), ['C1'])
+
+    def test_codes_phones_and_english_names(self):
+        self.assertEqual(self._products('628100'), ['P2'])
+        self.assertEqual(self._products('GREEN'), ['P1'])
+        self.assertEqual(self._customers('0001111'), ['C1'])
+        self.assertEqual(self._customers('ahmed'), ['C2'])
+
+    def test_short_terms_are_matched(self):
+        self.assertEqual(self._products('p2'), ['P2'])
+
+    def test_results_are_ranked(self):
+        self.assertEqual(self._products('tea')[0], 'P3')
+        self.assertEqual(set(self._products('tea')), {'P1', 'P3', 'P4'})
+
+    def test_other_tenants_are_not_searched(self):
+        self.assertEqual(self._products('احمر'), [])
+
+    def test_changes_follow_the_rows(self):
+        product = Product.query.filter_by(code='P2').one()
+        product.name = 'كاكاو'
+        db.session.commit()
+        self.assertEqual(self._products('قهوه'), [])
+        self.assertEqual(self._products('كاكاو'), ['P2'])
+
+        db.session.delete(product)
+        db.session.commit()
+        self.assertEqual(self._products('كاكاو'), [])
+        self.assertEqual(SearchDocument.query.filter_by(entity_type='product').count(), 3)
+
+    def test_rolled_back_rows_are_not_indexed(self):
+        db.session.add(Product(tenant_id=self.tenant_id, name='Ghost', code='G1'))
+        db.session.flush()
+        self.assertEqual(self._products('ghost'), ['G1'])
+        db.session.rollback()
+        self.assertEqual(self._products('ghost'), [])
+
+    def test_rebuild_indexes_rows_written_without_events(self):
+        db.session.execute(insert(Product.__table__).values(
+            tenant_id=self.tenant_id, name='ماء معدني', code='P9'))
+        db.session.commit()
+        self.assertEqual(self._products('ماء'), [])
+        self.assertEqual(rebuild_search_index(entity_types=['product']), {'product': 6})
+        db.session.commit()
+        self.assertEqual(self._products('ماء'), ['P9'])
+
+
+class SearchRouteTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        tenant = Tenant(code='FIND', subdomain='find', name='Find', is_active=True)
+        db.session.add(tenant)
+        db.session.flush()
+        company = Company(tenant_id=tenant.id, name='Find')
+        user = User(tenant_id=tenant.id, username='clerk', email='clerk@example.com',
+                    is_active=True, is_admin=True)
+        user.set_password('Clerk123!')
+        db.session.add_all([
+            company, user,
+            Product(tenant_id=tenant.id, name='شاي أخضر', code='P1', selling_price=4),
+            Product(tenant_id=tenant.id, name='شاي قديم', code='P0', is_active=False),
+            Product(tenant_id=tenant.id, name='قهوة', code='P2'),
+            Customer(tenant_id=tenant.id, name='مؤسسة الإسراء', code='C1'),
+            Customer(tenant_id=tenant.id, name='Ahmed Trading', code='C2'),
+        ])
+        db.session.flush()
+        db.session.add(License(tenant_id=tenant.id, company_id=company.id, status='active',
+                               end_date=utcnow() + timedelta(days=10)))
+        db.session.commit()
+
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'username': 'clerk', 'password': 'Clerk123!'},
+                         headers=HEADERS)
+
+    def tearDown(self):
+        db.session.remove()
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', category=SAWarning)
+            db.drop_all()
+        self.ctx.pop()
+
+    def test_product_autocomplete(self):
+        response = self.client.get('/inventory/api/products/search?q=شاى', headers=HEADERS)
+        self.assertEqual(response.status_code, 200)
+        products = response.get_json()['products']
+        self.assertEqual([(p['code'], p['price']) for p in products], [('P1', 4)])  # active only
+
+        response = self.client.get('/inventory/api/products/search?q=', headers=HEADERS)
+        self.assertEqual(response.get_json(), {'products': []})
+
+    def test_customer_autocomplete(self):
+        response = self.client.get('/sales/api/customers/search?q=الاسراء', headers=HEADERS)
+        self.assertEqual([c['code'] for c in response.get_json()['customers']], ['C1'])
+
+    def test_list_pages_use_the_index(self):
+        page = self.client.get('/inventory/products?search=شاى', headers=HEADERS).get_data(as_text=True)
+        self.assertIn('P1', page)
+        self.assertNotIn('قهوة', page)
+
+        page = self.client.get('/sales/customers?search=موسسه', headers=HEADERS).get_data(as_text=True)
+        self.assertIn('C1', page)
+        self.assertNotIn('Ahmed Trading', page)
+
+
+class GlobalSearchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        tenant = Tenant(code='FIND', subdomain='find', name='Find', is_active=True)
+        other = Tenant(code='OTHER', subdomain='other', name='Other', is_active=True)
+        db.session.add_all([tenant, other])
+        db.session.flush()
+        t = self.tenant_id = tenant.id
+        company = Company(tenant_id=t, name='Find')
+        admin = User(tenant_id=t, username='clerk', email='clerk@example.com',
+                     is_active=True, is_admin=True)
+        admin.set_password('Clerk123!')
+        guest = User(tenant_id=t, username='guest', email='guest@example.com', is_active=True)
+        guest.set_password('Guest123!')
+        customer = Customer(tenant_id=t, name='مؤسسة النور', code='C1')
+        db.session.add_all([company, admin, guest, customer,
+                            Supplier(tenant_id=t, name='شركة النور للتوريدات', code='S1'),
+                            Product(tenant_id=t, name='مصباح نور', code='P1'),
+                            Product(tenant_id=t, name='Light bulb', code='P2'),
+                            Customer(tenant_id=other.id, name='النور الاخر', code='X1')])
+        db.session.flush()
+        db.session.add_all([
+            License(tenant_id=t, company_id=company.id, status='active',
+                    end_date=utcnow() + timedelta(days=10)),
+            SalesInvoice(tenant_id=t, invoice_number='INV-2026-0042', customer_id=customer.id,
+                         notes='توريد مصابيح النور'),
+            JournalEntry(tenant_id=t, entry_number='JE-0042', description='قيد افتتاحي'),
+        ])
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', category=SAWarning)
+            db.drop_all()
+        self.ctx.pop()
+
+    def _login(self, username, password):
+        self.client.post('/auth/login', data={'username': username, 'password': password},
+                         headers=HEADERS)
+
+    def _search(self, query, **params):
+        response = self.client.get('/search', headers=HEADERS,
+                                   query_string=dict(params, q=query, format='json'))
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()['results']
+
+    def test_hits_across_entity_types(self):
+        self._login('clerk', 'Clerk123!')
+        results = self._search('نور')
+        self.assertEqual({(r['type'], r['title']) for r in results}, {
+            ('customer', 'مؤسسة النور'), ('supplier', 'شركة النور للتوريدات'),
+            ('product', 'مصباح نور'), ('sales_invoice', 'INV-2026-0042'),
+        })
+        self.assertEqual(sorted(r['type'] for r in self._search('0042')),
+                         ['journal_entry', 'sales_invoice'])
+        invoice = self._search('inv-2026')[0]
+        self.assertEqual(invoice['url'], f"/sales/invoices/{invoice['id']}")
+
+    def test_title_prefix_matches_come_first(self):
+        self._login('clerk', 'Clerk123!')
+        self.assertEqual(self._search('light')[0]['title'], 'Light bulb')
+        self.assertEqual(self._search('je-00')[0]['type'], 'journal_entry')
+
+    def test_limit_type_filter_and_page(self):
+        self._login('clerk', 'Clerk123!')
+        self.assertEqual(len(self._search('نور', limit=2)), 2)
+        self.assertEqual([r['type'] for r in self._search('نور', type='supplier')], ['supplier'])
+        self.assertEqual(self._search('ن'), [])  # shorter than SEARCH_MIN_QUERY_LENGTH
+        page = self.client.get('/search?q=النور', headers=HEADERS).get_data(as_text=True)
+        self.assertIn('شركة النور للتوريدات', page)
+
+    def test_only_permitted_types_are_searched(self):
+        self._login('guest', 'Guest123!')
+        self.assertEqual(self._search('نور'), [])
+
+    def test_backfill_command(self):
+        SearchDocument.query.delete()
+        db.session.commit()
+        result = self.app.test_cli_runner().invoke(args=['search-index', 'rebuild',
+                                                         '--tenant', str(self.tenant_id)])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('supplier: 1 documents', result.output)
+        self.assertIn('customer: 1 documents', result.output)
+        self._login('clerk', 'Clerk123!')
+        self.assertEqual(len(self._search('نور')), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,215 @@
+import os
+import tempfile
+import threading
+import unittest
+import warnings
+from datetime import timedelta
+
+from sqlalchemy import event
+from sqlalchemy.exc import SAWarning
+
+from app import create_app, db
+from app.models import Company, Product, Stock, StockMovement, User, Warehouse
+from app.models_license import License
+from app.models_tenant import Tenant
+from app.utils.datetime_helper import utcnow
+from app.utils.stock_ledger import InsufficientStock, StockLedger
+from config import TestingConfig, config
+
+
+class LedgerFileDatabaseConfig(TestingConfig):
+    """On-disk SQLite database shared by the racing threads"""
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SQLALCHEMY_ENGINE_OPTIONS = {'connect_args': {'timeout': 60}}
+
+
+config['testing_stock_ledger'] = LedgerFileDatabaseConfig
+
+
+class StockLedgerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        self.tenant = Tenant(code='STK', subdomain='stk', name='Stock', is_active=True)
+        db.session.add(self.tenant)
+        db.session.flush()
+        t = self.tenant.id
+        self.main = Warehouse(tenant_id=t, name='Main')
+        self.spare = Warehouse(tenant_id=t, name='Spare')
+        self.tea = Product(tenant_id=t, name='Tea', code='T1')
+        self.milk = Product(tenant_id=t, name='Milk', code='M1')
+        db.session.add_all([self.main, self.spare, self.tea, self.milk])
+        db.session.flush()
+        db.session.add(Stock(tenant_id=t, product_id=self.tea.id, warehouse_id=self.main.id,
+                             quantity=10, reserved_quantity=1, damaged_quantity=0))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', category=SAWarning)
+            db.drop_all()
+        self.ctx.pop()
+
+    def _stock(self, product, warehouse):
+        return Stock.query.filter_by(product_id=product.id, warehouse_id=warehouse.id).first()
+
+    def test_post_applies_lines_and_records_movements(self):
+        ledger = StockLedger('pos_order', 7, notes='Order 7', tenant_id=self.tenant.id)
+        ledger.add(self.tea.id, self.main.id, -3)
+        ledger.add(self.tea.id, self.main.id, -2)
+        ledger.add(self.milk.id, self.spare.id, 4, notes='restock')
+        ledger.post()
+        db.session.commit()
+
+        tea = self._stock(self.tea, self.main)
+        self.assertEqual(tea.quantity, 5)
+        self.assertEqual(tea.available_quantity, 4)
+        milk = self._stock(self.milk, self.spare)
+        self.assertEqual((milk.quantity, milk.tenant_id), (4, self.tenant.id))
+
+        movements = StockMovement.query.order_by(StockMovement.id).all()
+        self.assertEqual([(m.movement_type, m.quantity, m.notes) for m in movements],
+                         [('out', 3, 'Order 7'), ('out', 2, 'Order 7'), ('in', 4, 'restock')])
+        self.assertTrue(all(m.reference_type == 'pos_order' and m.reference_id == 7
+                            and m.tenant_id == self.tenant.id for m in movements))
+
+    def test_movements_are_inserted_in_one_statement(self):
+        ledger = StockLedger('sales_invoice', 1)
+        for _ in range(20):
+            ledger.add(self.tea.id, self.main.id, -0.5)
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            ledger.post()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        inserts = [s for s in statements if s.startswith('INSERT INTO stock_movements')]
+        self.assertEqual(len(inserts), 1)
+        # BEGIN IMMEDIATE, SELECT, UPDATE, INSERT
+        self.assertLessEqual(len(statements), 4)
+        self.assertEqual(StockMovement.query.count(), 20)
+
+    def test_require_stock_rejects_the_batch(self):
+        ledger = StockLedger('sales_invoice', 1)
+        ledger.add(self.tea.id, self.main.id, -6)
+        ledger.add(self.tea.id, self.main.id, -6)
+        with self.assertRaises(InsufficientStock) as caught:
+            ledger.post(require_stock=True)
+        self.assertEqual((caught.exception.product_id, caught.exception.available), (self.tea.id, 4))
+        db.session.rollback()
+        self.assertEqual(self._stock(self.tea, self.main).quantity, 10)
+        self.assertEqual(StockMovement.query.count(), 0)
+
+        ledger = StockLedger('sales_invoice', 1).add(self.milk.id, self.main.id, -1)
+        with self.assertRaises(InsufficientStock) as caught:
+            ledger.post(require_stock=True)
+        self.assertIsNone(caught.exception.available)
+
+    def test_lines_without_rows_can_be_skipped(self):
+        ledger = StockLedger('sales_invoice_cancel', 1)
+        ledger.add(self.tea.id, self.main.id, 1)
+        ledger.add(self.milk.id, self.main.id, 1)
+        ledger.post(create_missing=False)
+        db.session.commit()
+        self.assertEqual(self._stock(self.tea, self.main).quantity, 11)
+        self.assertIsNone(self._stock(self.milk, self.main))
+        self.assertEqual(StockMovement.query.count(), 1)
+
+    def test_damaged_quantity_is_tracked(self):
+        StockLedger('damaged', 3).add(self.tea.id, self.main.id, -2, movement_type='damaged',
+                                      damaged=2).post()
+        db.session.commit()
+        tea = self._stock(self.tea, self.main)
+        self.assertEqual((tea.quantity, tea.damaged_quantity, tea.available_quantity), (8, 2, 5))
+        self.assertEqual(StockMovement.query.one().movement_type, 'damaged')
+
+    def test_stock_transfer_route(self):
+        company = Company(tenant_id=self.tenant.id, name='Stock')
+        db.session.add(company)
+        db.session.flush()
+        user = User(tenant_id=self.tenant.id, username='keeper', email='keeper@example.com',
+                    is_active=True, is_admin=True)
+        user.set_password('Keeper123!')
+        db.session.add_all([user, License(tenant_id=self.tenant.id, company_id=company.id,
+                                          status='active', end_date=utcnow() + timedelta(days=10))])
+        db.session.commit()
+        tea_id, main_id, spare_id = self.tea.id, self.main.id, self.spare.id
+
+        client = self.app.test_client()
+        headers = {'Host': 'stk.example.com'}
+        client.post('/auth/login', data={'username': 'keeper', 'password': 'Keeper123!'},
+                    headers=headers)
+        client.post('/inventory/transfer', headers=headers, data={
+            'product_id': tea_id, 'from_warehouse_id': main_id,
+            'to_warehouse_id': spare_id, 'quantity': '4',
+        })
+
+        db.session.remove()
+        quantities = {s.warehouse_id: s.quantity
+                      for s in Stock.query.filter_by(product_id=tea_id)}
+        self.assertEqual(quantities, {main_id: 6, spare_id: 4})
+        self.assertEqual(StockMovement.query.filter_by(reference_type='transfer').count(), 2)
+
+
+class StockLedgerConcurrencyTestCase(unittest.TestCase):
+    THREADS = 4
+    SALES = 15
+
+    def setUp(self):
+        handle, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        LedgerFileDatabaseConfig.SQLALCHEMY_DATABASE_URI = 'sqlite:///' + self.db_path
+        self.app = create_app('testing_stock_ledger')
+        with self.app.app_context():
+            db.create_all()
+            warehouse = Warehouse(name='Main')
+            product = Product(name='Tea', code='T1')
+            db.session.add_all([warehouse, product])
+            db.session.flush()
+            db.session.add(Stock(product_id=product.id, warehouse_id=warehouse.id, quantity=1000))
+            db.session.commit()
+            self.key = (product.id, warehouse.id)
+            db.session.remove()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.engine.dispose()
+        os.remove(self.db_path)
+
+    def test_concurrent_checkouts_do_not_lose_updates(self):
+        errors = []
+
+        def checkout():
+            with self.app.app_context():
+                try:
+                    for _ in range(self.SALES):
+                        # Read the row into the session first, as the routes did
+                        Stock.query.filter_by(product_id=self.key[0]).first()
+                        StockLedger('pos_order').add(*self.key, -1).post(require_stock=True)
+                        db.session.commit()
+                except Exception as e:  # pragma: no cover - reported below
+                    errors.append(e)
+                finally:
+                    db.session.remove()
+
+        threads = [threading.Thread(target=checkout) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        with self.app.app_context():
+            self.assertEqual(Stock.query.one().quantity, 1000 - self.THREADS * self.SALES)
+            self.assertEqual(StockMovement.query.count(), self.THREADS * self.SALES)
+            db.session.remove()
+
+
+if __name__ == '__main__':
+    unittest.main()
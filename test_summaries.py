@@ -0,0 +1,162 @@
+import unittest
+import warnings
+from datetime import date, timedelta
+
+from flask import g
+from sqlalchemy import event
+from sqlalchemy.exc import SAWarning
+
+from app import create_app, db
+from app.models import (Category, Company, Customer, Product, SalesInvoice, Stock, User,
+                        Warehouse)
+from app.models_license import License
+from app.models_tenant import Tenant
+from app.summaries import product_summary, sales_invoice_summary
+from app.utils.datetime_helper import utcnow
+
+TODAY = date(2026, 2, 10)
+
+
+class SummariesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        self.tenant_id = self._seed_tenant('SUM', scale=1)
+        self.other_tenant_id = self._seed_tenant('ELSE', scale=100)
+        db.session.commit()
+        db.session.expunge_all()
+
+        self.request_ctx = self.app.test_request_context('/')
+        self.request_ctx.push()
+        g.current_tenant_id = self.tenant_id
+
+    def tearDown(self):
+        self.request_ctx.pop()
+        db.session.remove()
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', category=SAWarning)
+            db.drop_all()
+        self.ctx.pop()
+
+    def _seed_tenant(self, code, scale):
+        tenant = Tenant(code=code, subdomain=code.lower(), name=code, is_active=True)
+        db.session.add(tenant)
+        db.session.flush()
+        t = tenant.id
+
+        warehouse = Warehouse(tenant_id=t, name='Main')
+        customer = Customer(tenant_id=t, code='C1', name='Customer')
+        drinks = Category(tenant_id=t, name=f'{code} drinks')
+        food = Category(tenant_id=t, name=f'{code} food')
+        empty = Category(tenant_id=t, name=f'{code} empty')
+        db.session.add_all([warehouse, customer, drinks, food, empty])
+        db.session.flush()
+
+        in_stock = Product(tenant_id=t, name='in', code='P1', category_id=drinks.id,
+                           cost_price=2.0, min_stock=5)
+        low = Product(tenant_id=t, name='low', code='P2', category_id=drinks.id,
+                      cost_price=3.0, min_stock=10)
+        out = Product(tenant_id=t, name='out', code='P3', category_id=food.id, cost_price=4.0)
+        no_rows = Product(tenant_id=t, name='none', code='P4')
+        inactive = Product(tenant_id=t, name='old', code='P5', category_id=food.id,
+                           cost_price=9.0, is_active=False)
+        db.session.add_all([in_stock, low, out, no_rows, inactive])
+        db.session.flush()
+        db.session.add_all([
+            Stock(tenant_id=t, product_id=in_stock.id, warehouse_id=warehouse.id,
+                  quantity=20 * scale),
+            Stock(tenant_id=t, product_id=low.id, warehouse_id=warehouse.id, quantity=4),
+            Stock(tenant_id=t, product_id=out.id, warehouse_id=warehouse.id, quantity=0),
+            Stock(tenant_id=t, product_id=inactive.id, warehouse_id=warehouse.id, quantity=50),
+        ])
+
+        for number, day, total, paid, status, payment in (
+            ('S-1', date(2026, 2, 1), 100, 100, 'paid', 'paid'),
+            ('S-2', date(2026, 2, 3), 50.555, 20, 'confirmed', 'partial'),
+            ('S-3', date(2026, 1, 20), 70, 0, 'confirmed', 'unpaid'),
+            ('S-4', date(2026, 1, 21), 999, 0, 'cancelled', 'unpaid'),
+            ('S-5', date(2025, 9, 30), 30, 0, 'draft', 'unpaid'),
+            ('S-6', date(2025, 8, 31), 500, 0, 'confirmed', 'unpaid'),  # outside the chart
+        ):
+            db.session.add(SalesInvoice(
+                tenant_id=t, invoice_number=number, invoice_date=day, customer_id=customer.id,
+                total_amount=total * scale, paid_amount=paid * scale,
+                remaining_amount=(total - paid) * scale, status=status, payment_status=payment,
+            ))
+        return t
+
+    def test_sales_invoice_summary(self):
+        summary = sales_invoice_summary(TODAY)
+
+        self.assertEqual(summary['total_count'], 6)
+        self.assertAlmostEqual(summary['total_amount'], 100 + 50.555 + 70 + 30 + 500)
+        self.assertAlmostEqual(summary['total_paid'], 120)
+        self.assertAlmostEqual(summary['total_remaining'], 30.555 + 70 + 30 + 500)
+        self.assertEqual(summary['status_counts'],
+                         {'draft': 1, 'confirmed': 3, 'paid': 1, 'cancelled': 1})
+        self.assertEqual(summary['pay_counts'], {'paid': 1, 'partial': 1, 'unpaid': 4})
+        self.assertEqual(summary['month_labels'],
+                         ['2025/09', '2025/10', '2025/11', '2025/12', '2026/01', '2026/02'])
+        self.assertEqual(summary['month_data'], [30, 0, 0, 0, 70, 150.56])
+
+    def test_product_summary(self):
+        summary = product_summary()
+
+        self.assertEqual(summary['total_products'], 5)
+        self.assertEqual(summary['active_products'], 4)
+        self.assertEqual(summary['inactive_products'], 1)
+        self.assertEqual(summary['low_stock_count'], 1)
+        self.assertEqual(summary['out_of_stock_count'], 2)
+        self.assertEqual(summary['in_stock_count'], 1)
+        self.assertEqual(summary['total_stock_value'], 20 * 2.0 + 4 * 3.0)
+        self.assertEqual(summary['cat_labels'], ['SUM drinks', 'SUM food'])
+        self.assertEqual(summary['cat_data'], [2, 1])
+
+    def test_query_count_does_not_grow_with_rows(self):
+        for i in range(30):
+            db.session.add(Product(tenant_id=self.tenant_id, name=f'extra {i}', code=f'X{i}'))
+        db.session.commit()
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            sales_invoice_summary(TODAY)
+            product_summary()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        self.assertLessEqual(len(statements), 5)
+
+    def test_summary_endpoints(self):
+        company = Company(tenant_id=self.tenant_id, name='Sum')
+        db.session.add(company)
+        db.session.flush()
+        user = User(tenant_id=self.tenant_id, username='boss', email='boss@example.com',
+                    is_active=True, is_admin=True)
+        user.set_password('Boss123!')
+        db.session.add_all([user, License(tenant_id=self.tenant_id, company_id=company.id,
+                                          status='active', end_date=utcnow() + timedelta(days=10))])
+        db.session.commit()
+
+        client = self.app.test_client()
+        headers = {'Host': 'sum.example.com'}
+        client.post('/auth/login', data={'username': 'boss', 'password': 'Boss123!'},
+                    headers=headers)
+
+        response = client.get('/sales/api/invoices/summary', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['total_count'], 6)
+
+        response = client.get('/inventory/api/products/summary', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['cat_data'], [2, 1])
+
+        for url in ('/sales/invoices', '/inventory/products'):
+            self.assertEqual(client.get(url, headers=headers).status_code, 200, url)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import unittest
+import warnings
+from datetime import timedelta
+
+from sqlalchemy import event
+from sqlalchemy.exc import SAWarning
+
+from app import create_app, db
+from app.models_tenant import Tenant
+from app.tenant_cache import TenantSnapshot, invalidate_tenant
+from app.utils.cache_helper import MISSING, TTLCache
+from app.utils.datetime_helper import utcnow
+
+
+class TTLCacheTestCase(unittest.TestCase):
+    def test_lru_eviction_and_counters(self):
+        cache = TTLCache(max_size=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)  # evicts 'b' (least recently used)
+
+        self.assertIs(cache.get('b'), MISSING)
+        self.assertEqual(cache.get('c'), 3)
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']), (2, 1, 1))
+
+    def test_expired_entries_are_misses(self):
+        cache = TTLCache(max_size=2, ttl=60)
+        cache.set('a', None, ttl=-1)
+        self.assertIs(cache.get('a'), MISSING)
+
+
+class TenantCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        self.client = self.app.test_client()
+        self.cache = self.app.extensions['tenant_cache']
+
+        self.tenant = Tenant(
+            code='COMP001',
+            subdomain='alpha',
+            name='Alpha',
+            is_active=True,
+            trial_ends_at=utcnow() + timedelta(days=30),
+        )
+        db.session.add(self.tenant)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', category=SAWarning)
+            db.drop_all()
+        self.ctx.pop()
+
+    def _count_tenant_queries(self, fn):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            if 'FROM tenants' in statement:
+                statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            fn()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        return len(statements)
+
+    def _get_login(self):
+        return self.client.get('/auth/login', headers={'Host': 'alpha.example.com'})
+
+    def test_warm_request_resolves_tenant_without_sql(self):
+        self.assertGreater(self._count_tenant_queries(self._get_login), 0)
+        self.assertEqual(self._count_tenant_queries(self._get_login), 0)
+        self.assertGreaterEqual(self.cache.stats()['hits'], 1)
+
+    def test_lookup_by_any_key_shares_one_snapshot(self):
+        snapshot = self.cache.get_by_subdomain('alpha')
+        self.assertIsInstance(snapshot, TenantSnapshot)
+        self.assertIs(self.cache.get_by_id(self.tenant.id), snapshot)
+        self.assertIs(self.cache.get_by_code('COMP001'), snapshot)
+        with self.assertRaises(AttributeError):
+            snapshot.is_active = False
+
+    def test_deactivating_tenant_invalidates_cache(self):
+        self._get_login()
+        self.tenant.is_active = False
+        db.session.commit()
+
+        response = self._get_login()
+        self.assertEqual(response.status_code, 403)
+
+    def test_renamed_subdomain_drops_old_key(self):
+        self.assertIsNotNone(self.cache.get_by_subdomain('alpha'))
+        self.tenant.subdomain = 'beta'
+        db.session.commit()
+
+        self.assertIsNone(self.cache.get_by_subdomain('alpha'))
+        self.assertEqual(self.cache.get_by_subdomain('beta').id, self.tenant.id)
+
+    def test_negative_lookup_is_cleared_when_tenant_is_created(self):
+        self.assertIsNone(self.cache.get_by_subdomain('gamma'))
+        db.session.add(Tenant(code='COMP002', subdomain='gamma', name='Gamma'))
+        db.session.commit()
+        self.assertIsNotNone(self.cache.get_by_subdomain('gamma'))
+
+    def test_explicit_invalidation(self):
+        self.cache.get_by_id(self.tenant.id)
+        invalidate_tenant(self.tenant.id)
+        self.assertEqual(len(self.cache._cache), 0)
+
+    def test_health_exposes_cache_counters(self):
+        self._get_login()
+        payload = self.client.get('/health').get_json()
+        self.assertIn('tenant_cache', payload['caches'])
+        self.assertIn('hits', payload['caches']['tenant_cache'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+import warnings
+
+from flask import g
+from sqlalchemy import event
+from sqlalchemy.exc import SAWarning
+
+from app import create_app, db
+from app.models_inventory import Category, Product, Stock
+from app.models_tenant import Tenant
+from app.tenant_mixin import tenant_classes_for
+
+
+class TenantFilterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        self.tenant_a = Tenant(code='TA', subdomain='ta', name='A', is_active=True)
+        self.tenant_b = Tenant(code='TB', subdomain='tb', name='B', is_active=True)
+        db.session.add_all([self.tenant_a, self.tenant_b])
+        db.session.flush()
+        self.category_b = Category(tenant_id=self.tenant_b.id, name='B cat')
+        db.session.add(self.category_b)
+        db.session.flush()
+        self.product_a = Product(tenant_id=self.tenant_a.id, name='A1', code='P1')
+        # Inconsistent row pointing at another tenant's category
+        self.product_a2 = Product(tenant_id=self.tenant_a.id, name='A2', code='P2',
+                                  category_id=self.category_b.id)
+        self.product_b = Product(tenant_id=self.tenant_b.id, name='B1', code='P1',
+                                 category_id=self.category_b.id)
+        db.session.add_all([self.product_a, self.product_a2, self.product_b])
+        db.session.commit()
+        self.tenant_a_id, self.tenant_b_id = self.tenant_a.id, self.tenant_b.id
+        self.product_b_id = self.product_b.id
+        db.session.expunge_all()
+        self.request_ctx = None
+
+    def tearDown(self):
+        if self.request_ctx is not None:
+            self.request_ctx.pop()
+        db.session.remove()
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', category=SAWarning)
+            db.drop_all()
+        self.ctx.pop()
+
+    def _as_tenant(self, tenant_id):
+        self.request_ctx = self.app.test_request_context('/')
+        self.request_ctx.push()
+        g.current_tenant_id = tenant_id
+
+    def _capture(self, fn):
+        executions = []
+
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            executions.append((statement, context.cache_hit))
+
+        event.listen(db.engine, 'after_cursor_execute', after_cursor_execute)
+        try:
+            fn()
+        finally:
+            event.remove(db.engine, 'after_cursor_execute', after_cursor_execute)
+        return executions
+
+    def test_only_referenced_classes_get_criteria(self):
+        self.assertEqual(tenant_classes_for(Product.query.statement), (Product,))
+        joined = Product.query.join(Category).statement
+        self.assertEqual(set(tenant_classes_for(joined)), {Product, Category})
+        nested = Product.query.filter(Product.id.in_(db.session.query(Stock.product_id)))
+        self.assertEqual(set(tenant_classes_for(nested.statement)), {Product, Stock})
+
+    def test_queries_are_isolated(self):
+        self._as_tenant(self.tenant_a_id)
+        self.assertEqual({p.name for p in Product.query.all()}, {'A1', 'A2'})
+        self.assertIsNone(Product.query.get(self.product_b_id))
+        self.assertEqual(Product.query.join(Category).count(), 0)
+
+        statements = self._capture(lambda: Product.query.all())
+        self.assertEqual(statements[0][0].count('tenant_id = ?'), 1)
+
+    def test_lazy_load_of_unreferenced_class_is_filtered(self):
+        self._as_tenant(self.tenant_a_id)
+        product = Product.query.filter_by(code='P2').one()
+        self.assertIsNone(product.category)
+
+    def test_unfiltered_parent_keeps_unfiltered_lazy_loads(self):
+        self._as_tenant(self.tenant_a_id)
+        product = (Product.query.execution_options(skip_tenant_filter=True)
+                   .filter_by(tenant_id=self.tenant_b_id).one())
+        self.assertEqual(product.category.name, 'B cat')
+
+    def test_compiled_statement_is_shared_between_tenants(self):
+        self._as_tenant(self.tenant_a_id)
+        first = self._capture(lambda: Product.query.filter_by(code='P1').all())
+        g.current_tenant_id = self.tenant_b_id
+        db.session.expunge_all()
+        rows = []
+        second = self._capture(lambda: rows.extend(Product.query.filter_by(code='P1').all()))
+
+        self.assertEqual([p.name for p in rows], ['B1'])
+        self.assertEqual(first[0][0], second[0][0])
+        self.assertIs(second[0][1], db.engine.dialect.CACHE_HIT)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import io
+import json
+import unittest
+import warnings
+from datetime import date, timedelta
+
+from openpyxl import load_workbook
+from sqlalchemy.exc import SAWarning
+
+from app import create_app, db
+from app.models import Company, Customer, PurchaseInvoice, SalesInvoice, Supplier, User
+from app.models_license import License
+from app.models_tenant import Tenant
+from app.utils.datetime_helper import utcnow
+
+HEADERS = {'Host': 'ranked.example.com'}
+
+
+class TopPartiesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        tenant = Tenant(code='RANK', subdomain='ranked', name='Ranked', is_active=True)
+        other = Tenant(code='OTHER', subdomain='other', name='Other', is_active=True)
+        db.session.add_all([tenant, other])
+        db.session.flush()
+        t = tenant.id
+        company = Company(tenant_id=t, name='Ranked')
+        user = User(tenant_id=t, username='clerk', email='clerk@example.com',
+                    is_active=True, is_admin=True)
+        user.set_password('Clerk123!')
+        customers = [Customer(tenant_id=t, name=f'Customer {n}', code=f'C{n}') for n in range(1, 5)]
+        inactive = Customer(tenant_id=t, name='Gone', code='C9', is_active=False)
+        foreign = Customer(tenant_id=other.id, name='Foreign', code='X1')
+        supplier = Supplier(tenant_id=t, name='Supply Co', code='S1')
+        db.session.add_all([company, user, *customers, inactive, foreign, supplier])
+        db.session.flush()
+
+        self.today = today = date.today()
+        old = today - timedelta(days=40)
+        invoices = [
+            # Customer 1: 300 over two invoices, one of them old
+            (customers[0], 100, today), (customers[0], 200, old),
+            (customers[1], 250, today),
+            (customers[2], 100, today),
+            (customers[3], 50, today),
+            (inactive, 1000, today),
+            (foreign, 5000, today),
+        ]
+        db.session.add(License(tenant_id=t, company_id=company.id, status='active',
+                               end_date=utcnow() + timedelta(days=10)))
+        for n, (customer, total, day) in enumerate(invoices):
+            db.session.add(SalesInvoice(tenant_id=customer.tenant_id, invoice_number=f'INV-{n}',
+                                        customer_id=customer.id, status='confirmed',
+                                        invoice_date=day, total_amount=total))
+        db.session.add_all([
+            SalesInvoice(tenant_id=t, invoice_number='INV-DRAFT', customer_id=customers[3].id,
+                         invoice_date=today, total_amount=999),
+            PurchaseInvoice(tenant_id=t, invoice_number='PUR-1', supplier_id=supplier.id,
+                            status='confirmed', invoice_date=today, total_amount=40),
+        ])
+        db.session.commit()
+
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'username': 'clerk', 'password': 'Clerk123!'},
+                         headers=HEADERS)
+
+    def tearDown(self):
+        db.session.remove()
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', category=SAWarning)
+            db.drop_all()
+        self.ctx.pop()
+
+    def _jsonl(self, url):
+        response = self.client.get(url, headers=HEADERS)
+        self.assertEqual(response.status_code, 200)
+        return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    def test_customers_are_ranked_in_one_query(self):
+        rows = self._jsonl('/reports/customers/top?format=jsonl')
+        self.assertEqual([(r['rank'], r['code'], r['total_sales']) for r in rows],
+                         [(1, 'C1', 300), (2, 'C2', 250), (3, 'C3', 100), (4, 'C4', 50)])
+        self.assertEqual((rows[0]['invoice_count'], rows[0]['average_sale']), (2, 150))
+        self.assertAlmostEqual(rows[1]['share'], 250 * 100 / 700)
+
+    def test_top_percentile_and_period(self):
+        top = self._jsonl('/reports/customers/top?format=jsonl&top=2')
+        self.assertEqual([r['code'] for r in top], ['C1', 'C2'])
+        # Shares stay relative to every ranked customer
+        self.assertAlmostEqual(sum(r['share'] for r in top), 550 * 100 / 700)
+
+        upper = self._jsonl('/reports/customers/top?format=jsonl&percentile=50')
+        self.assertEqual([r['code'] for r in upper], ['C1', 'C2'])
+
+        since = (self.today - timedelta(days=7)).isoformat()
+        recent = self._jsonl(f'/reports/customers/top?format=jsonl&start_date={since}')
+        self.assertEqual([(r['code'], r['total_sales']) for r in recent],
+                         [('C2', 250), ('C1', 100), ('C3', 100), ('C4', 50)])
+        self.assertEqual([r['rank'] for r in recent], [1, 2, 2, 4])
+
+    def test_page_and_exports_share_the_ranking(self):
+        page = self.client.get('/reports/customers/top?top=3', headers=HEADERS)
+        self.assertEqual(page.status_code, 200)
+        html = page.get_data(as_text=True)
+        self.assertIn('Customer 3', html)
+        self.assertNotIn('Customer 4', html)
+        self.assertNotIn('Foreign', html)
+
+        response = self.client.get('/reports/export-excel/customers-top?top=3', headers=HEADERS)
+        self.assertEqual(response.status_code, 200)
+        rows = list(load_workbook(io.BytesIO(response.data)).active.iter_rows(values_only=True))
+        self.assertEqual([row[2] for row in rows[1:]], ['Customer 1', 'Customer 2', 'Customer 3'])
+
+    def test_suppliers(self):
+        rows = self._jsonl('/reports/suppliers/top?format=jsonl')
+        self.assertEqual([(r['rank'], r['code'], r['total_purchases'], r['share']) for r in rows],
+                         [(1, 'S1', 40, 100)])
+        self.assertEqual(self.client.get('/reports/suppliers/top', headers=HEADERS).status_code, 200)
+        excel = self.client.get('/reports/export-excel/suppliers-top', headers=HEADERS)
+        self.assertEqual(excel.status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()